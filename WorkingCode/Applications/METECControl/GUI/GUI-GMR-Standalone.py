@@ -6,6 +6,7 @@ from Applications.METECControl.GUI.ConfigWrapper import Configs, ConfigWrapper
 from Applications.METECControl.GUI.RefactoredWidgets.MetecMainWindow import MainWindow
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Commands import CommandClass, CommandMethod, CommandLevels
+from Framework.BaseClasses.BoundedQueue import COALESCE, GUI_QUEUE_SIZE
 from Framework.BaseClasses.Destination import QueuedDestination
 from Framework.BaseClasses.Events import EventTypes, EventPayload
 from Framework.BaseClasses.Package import Package
@@ -32,8 +33,11 @@ class GUIInterface(Subscriber, Worker, CommandClass, QueuedDestination):
     def __init__(self, archiver=None, commandManager=None, dataManager=None, eventManager=None,
                  name="MainGUI", updateInterval=10, # milliseconds
                  readerSummaryFile=None, epSummaryFile=None, fmSummaryFile=None, gcSummaryFile=None, experimentConfig=None,
-                 **kwargs):
-        super().__init__(name=name, archiver=archiver, commandManager=commandManager, dataManager=dataManager, eventManager=eventManager, **kwargs)
+                 queueSize=GUI_QUEUE_SIZE, overflowPolicy=COALESCE, **kwargs):
+        # the display only needs the latest reading of each source, so readings that arrive faster than the GUI updates
+        # replace the ones still queued instead of piling up.
+        super().__init__(name=name, archiver=archiver, commandManager=commandManager, dataManager=dataManager, eventManager=eventManager,
+                         queueSize=queueSize, overflowPolicy=overflowPolicy, **kwargs)
         # ThreadedDestination.__init__(self, name=name)
         # CommandClass.__init__(self, name=name, commandManager=commandManager)
         # Subscriber.__init__(self, name=name, archiver=archiver,
@@ -198,40 +202,48 @@ class GUIInterface(Subscriber, Worker, CommandClass, QueuedDestination):
         if not md is None and not sourceInfo is None:
             sourceInfo['metadata'] = md
 
+        # a block package carries many samples; they are added under one acquisition of the source's lock.
+        if cu.isBlock(package.payload):
+            samples = package.payload.rows()
+        else:
+            # copy the payload so that we can make changes if necessary.
+            samples = [copy.deepcopy(package.payload)]
         with self.getThreadLock(package.source):
-            if sourceInfo['initialized']:
-                self.incrementIndex(package.source)
-            # iterate through the payload, initializing keys if necessary and adding values to the array.
+            for sample in samples:
+                self._addSample(package.source, sourceInfo, md, sample)
+
+    def _addSample(self, sourceName, sourceInfo, md, pldCopy):
+        """Add one sample to the source's arrays. Called holding the source's thread lock."""
+        if sourceInfo['initialized']:
+            self.incrementIndex(sourceName)
+        # iterate through the payload, initializing keys if necessary and adding values to the array.
+        if not 'timestamp' in pldCopy:
+            pldCopy['timestamp'] = tu.nowEpoch()
+
+        for key, val in pldCopy.items():
+            # set metadata for the field and register it if it isn't already.
+            if not self.isFieldRegistered(sourceName, key):
+                try:
+                    fieldType = md[key]
+                    if 'type' in fieldType:
+                        fieldType = fieldType['type']
+                    if not type(fieldType) is type:
+                        raise TypeError(f'Expecting type of fieldType to be a type (must be castable)')
+                except Exception as e:
+                    fieldType = type(pldCopy[key])
+                self.initializeField(sourceName, fieldName=key, fieldType=fieldType)
+
+            # Add data to the growing np array.
+            startIndex, endIndex = self.getIndex(sourceName)
+            npArray = sourceInfo['fields'][key]['array']
+            npArray[endIndex] = val
 
-            # copy the payload so that we can make changes if necessary.
-            pldCopy = copy.deepcopy(package.payload)
-            if not 'timestamp' in pldCopy:
-                pldCopy['timestamp'] = tu.nowEpoch()
-
-            for key, val in pldCopy.items():
-                # set metadata for the field and register it if it isn't already.
-                if not self.isFieldRegistered(package.source, key):
-                    try:
-                        fieldType = md[key]
-                        if 'type' in fieldType:
-                            fieldType = fieldType['type']
-                        if not type(fieldType) is type:
-                            raise TypeError(f'Expecting type of fieldType to be a type (must be castable)')
-                    except Exception as e:
-                        fieldType = type(pldCopy[key])
-                    self.initializeField(package.source, fieldName=key, fieldType=fieldType)
-
-                # Add data to the growing np array.
-                startIndex, endIndex = self.getIndex(package.source)
-                npArray = sourceInfo['fields'][key]['array']
-                npArray[endIndex] = val
-
-            # successfully added values to the growing array and made sure all fields were initialized. Increment the index
-            # if the source has been initialized, or set initialized to True (important for addressing purposes).
-            if sourceInfo['initialized']:
-                pass
-            else:
-                sourceInfo['initialized'] = True
+        # successfully added values to the growing array and made sure all fields were initialized. Increment the index
+        # if the source has been initialized, or set initialized to True (important for addressing purposes).
+        if sourceInfo['initialized']:
+            pass
+        else:
+            sourceInfo['initialized'] = True
 
     ####################################################################################################################
     ################################# Methods for locking/unlocking resources via GUI. #################################
@@ -5,6 +5,8 @@ import logging
 import datetime
 import pytz
 
+from Framework.Archive.Catalog import ArchiveCatalog, CATALOG_NAME
+
 # relevant paths for slope/offset of all readers for the MET data. Should be changed RARELY.
 readerRecordPath = "D:\\SVNs\\METEC_SVN\\Facility Operations\\ConfigurationAndCalibrationRecords\\ReaderRecords\\SiteConfig-20240115.json"
 # folder in which all archives will be checked
@@ -16,73 +18,23 @@ dateStart = "20240409_000000" # start time IN LOCAL that will begin the search
 dateEnd = '20240410_000000' # end time IN LOCAL that will end the search.
 startDT = datetime.datetime.strptime(dateStart, "%Y%m%d_%H%M%S").astimezone(pytz.timezone('America/Denver'))
 startEpoch = startDT.timestamp()
-dayBeforeStartDT = startDT-datetime.timedelta(days=1) # subtracting one day to make sure all relevant data is fetched.
 endDT = datetime.datetime.strptime(dateEnd, "%Y%m%d_%H%M%S").astimezone(pytz.timezone('America/Denver'))
 endEpoch = endDT.timestamp()
 met1OutputPath = outputFolder.joinpath(f'{startDT.strftime("%Y%m%d")}-{endDT.strftime("%Y%m%d")}_MET-1.csv')
 met2OutputPath = outputFolder.joinpath(f'{startDT.strftime("%Y%m%d")}-{endDT.strftime("%Y%m%d")}_MET-2.csv')
 
-allMet1Paths = []
-allMet2Paths = []
-
-for singleFolder in rootFolderPath.iterdir():
-    try:
-        folderDate = datetime.datetime.strptime(singleFolder.name, '%Y-%m-%d_%H-%M-%S').astimezone(pytz.timezone('UTC'))
-        if dayBeforeStartDT < folderDate and folderDate < endDT: # using dayBefore... to include data that might have been in the previous day before rollover.
-            dataFolder = singleFolder.joinpath('data')
-            # find all paths in the data folder associated with the correponsing met stations.
-            met1DataPaths = list(filter(lambda x: "MET-1" in x.name and not 'corr' in x.name and '.csv' in x.name, dataFolder.iterdir()))
-            met2DataPaths = list(filter(lambda x: "MET-2" in x.name and not 'corr' in x.name and '.csv' in x.name, dataFolder.iterdir()))
-            allMet1Paths = [*allMet1Paths, *met1DataPaths]
-            allMet2Paths = [*allMet2Paths, *met2DataPaths]
-    except Exception as e:
-        logging.exception(f'Could not parse data in folder {singleFolder} due to exception {e}')
-
-met1DFs = []
-met2DFs = []
-
-allMet1Paths.sort(key=lambda x: int(x.name.split('_')[1].split('.')[0])) # sort based on the UTC timestamp appended to the name. (EX: MET-1.LJ-1_{TIMESTAMP}.csv
-allMet2Paths.sort(key=lambda x: int(x.name.split('_')[1].split('.')[0])) # sort based on the UTC timestamp appended to the name. (EX: MET-2.LJ-1_{TIMESTAMP}.csv
-
-for met1DataPath in allMet1Paths:
-    try:
-        with met1DataPath.open(mode='r', newline='') as f:
-            headerDF = pd.read_csv(f,nrows=0)
-        with met1DataPath.open(mode='r', newline='') as f: # originally had these 'opens' happen at the same time, but it skipped data.
-            df = pd.read_csv(f,skiprows=2, names=[h for h in headerDF.keys()])
-            df.dropna(how="any", inplace=True)
-            met1DFs.append(pd.concat([headerDF,df]))
-        del headerDF
-        del df
-    except Exception as e:
-        logging.error(f'Could not load in file {str(met1DataPath)} due to exception {e}')
-
-for met2DataPath in allMet2Paths:
-    try:
-        with met2DataPath.open(mode='r', newline='') as f:
-            headerDF = pd.read_csv(f,nrows=0)
-        with met2DataPath.open(mode='r', newline='') as f: # originally had these 'opens' happen at the same time, but it skipped data.
-            df = pd.read_csv(f,skiprows=2, names=[h for h in headerDF.keys()])
-            df.dropna(how="any", inplace=True)
-        met2DFs.append(pd.concat([headerDF,df]))
-        del headerDF
-        del df
-    except Exception as e:
-        logging.error(f'Could not load in file {str(met2DataPath)} due to exception {e}')
+# index of the data files of every archive under rootFolderPath, by channel and time span. It is kept in the output
+# folder, so later runs only index the files that are new or have grown.
+catalog = ArchiveCatalog(rootFolderPath, catalogPath=outputFolder.joinpath(CATALOG_NAME))
 
-finalMET1DF = pd.concat(met1DFs)
-for df in met1DFs:
-    del df
-del met1DFs
+# only the files with rows between the start and end are read, whichever archive (before or after rollover) they are in.
+finalMET1DF = catalog.read('MET-1.LJ-1', startEpoch, endEpoch)
+finalMET1DF.dropna(how="any", inplace=True)
 finalMET1DF.set_index('timestamp', inplace=True)
-finalMET1DF = finalMET1DF.loc[finalMET1DF.index.to_series().between(startEpoch, endEpoch)]
 
-finalMET2DF = pd.concat(met2DFs)
-for df in met2DFs:
-    del df
-del met2DFs
+finalMET2DF = catalog.read('MET-2.LJ-1', startEpoch, endEpoch)
+finalMET2DF.dropna(how="any", inplace=True)
 finalMET2DF.set_index('timestamp', inplace=True)
-finalMET2DF = finalMET2DF.loc[finalMET2DF.index.to_series().between(startEpoch, endEpoch)]
 
 with open(readerRecordPath) as readerJson:
     rr = json.load(readerJson)
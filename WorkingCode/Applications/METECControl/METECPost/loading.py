@@ -23,6 +23,7 @@ from Applications.METECControl.METECPost import Helpers as hp
 
 N_PARTITIONS = 1
 PARTITION_SIZE = "1000MB"
+LOAD_CHUNK_ROWS = 100000 # rows of a channel read from the archive at a time.
 
 tempFilePath = pathlib.Path(__file__).parent.joinpath('tempFiles')
 fileByChannelPath = tempFilePath.joinpath('channels')
@@ -236,16 +237,17 @@ def saveArchiveDFs(archive):
     for channelName, channelIO in archive.channelMap.items():
         if not isCorrected(channelName) and ChannelType.Data in channelIO.typeMap:
             try:
-                allChanDFs = archive.read(channelName, channelType=ChannelType.Data, asDF=True)
-                if len(allChanDFs) > 1:
-                    channelDF = pd.concat(allChanDFs)
-                else:
-                    channelDF = allChanDFs[0]
+                # read the channel a chunk at a time (the next chunks are read while this one is trimmed), so only the
+                # rows that are kept are held in memory.
+                chanChunks = []
+                for chunk in archive.iterRead(channelName, channelType=ChannelType.Data, asDF=True, chunkSize=LOAD_CHUNK_ROWS):
+                    chunk = chunk.dropna(how='all', axis=0) # drop any na rows.
+                    chunk['timestamp'] = chunk['timestamp'].astype(int)
+                    chanChunks.append(chunk.drop_duplicates(subset=['timestamp'], keep="first"))
+                channelDF = pd.concat(chanChunks)
                 # added these next 2 lines to try and get around dumb "ACannot convert NA/INF to int issue.
                 # if not len(channelDF.dropna(how="all").index) == 0:
                 #     channelDF = channelDF.dropna(how='all')
-                channelDF.dropna(how='all', axis=0, inplace=True) # drop any na rows.
-                channelDF['timestamp'] = channelDF['timestamp'].astype(int)
                 dropped = channelDF.drop_duplicates(subset=['timestamp'], keep="first")
                 indexedDF = dropped.set_index('timestamp')
 
@@ -20,10 +20,11 @@ import pathlib
 import socket
 from copy import deepcopy
 from enum import Enum
-from threading import RLock, Timer
+from threading import RLock, Thread, Timer
 
 import Utils.TimeUtils as tu
 from Applications.METECControl.Readers.Modbus import Modbus as MB
+from Applications.METECControl.Readers.ModbusFormat import BlockDecoder
 from Framework.BaseClasses import Commands
 from Framework.BaseClasses import Events
 from Framework.BaseClasses.Channels import ChannelType
@@ -65,7 +66,7 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
     """
     def __init__(self, archiver, commandManager, dataManager, eventManager,
                  name=None, deviceType=None, totalizer=False, IP=None, port=502,
-                 readInterval=1,
+                 readInterval=1, pollingEngine=None,
                  **kwargs):
         """ Upon instantiation, this device will create a TCP modbus connection that will be used for communication with
         the device.
@@ -82,6 +83,8 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
             IP address for this device
         port : int
             Port that this device uses. 502 is the default TCP port.
+        pollingEngine : PollingEngine
+            If given, reads are sent by this engine together with those of the other devices on it, see PollingEngine.
         """
         super().__init__(name=name, archiver=archiver, commandManager=commandManager, dataManager=dataManager, eventManager=eventManager, readInterval=readInterval, **kwargs)
         self.name = name
@@ -89,6 +92,8 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
         self.port = port
         self.modbus = MB(IP=IP, port=port,
                          connType=socket.SOCK_STREAM, modbusEndian=">", deviceEndian=">", maxReadReg=127, name=name)
+        self.pollingEngine = pollingEngine
+        self._reconnect = None
         self.UID = 247
         self.setpoint = 0
         self.addr_offset = -1
@@ -248,6 +253,11 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
                         numReg = (addr + self.modbus.getNumRegisters(dataType))-startAddr
                     self.readAllBuffers[startAddr]['command'] = self.modbus.makeReadCommand(startAddr, numReg,  uid=self.UID, func=4)
                     self.readAllBuffers[startAddr]['response'] = self.modbus.makeReadResponse(numReg)
+            # one decoder per block unpacks all of its registers at once.
+            for startAddr, bufferProps in self.readAllBuffers.items():
+                bufferProps['decoder'] = BlockDecoder.fromRegisters(
+                    startAddr, [(regAddr, self.pins[regName]['data_type'], regName)
+                                for regAddr, regNames in bufferProps['registers'].items() for regName in regNames])
         self.buffersSet = True
         return True
 
@@ -308,35 +318,65 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
             all of the buffers that were read (name: value pair in the dictionary)
         """
         with self.lock:
-            retData = {}
             timestamp = tu.DTtoEpoch(datetime.datetime.utcnow())
-            retData['timestamp'] = timestamp
-            retData['source'] = self.name
             try:
                 self.connect()
                 if not self.connected:
                     return {}
-                for startAddr, bufferProps in self.readAllBuffers.items():
-                    self.modbus.sendRecv(bufferProps['command'], bufferProps['response'])
-                    data = {}
-                    for regAddr, regNames in bufferProps['registers'].items():
-                        for regName in regNames:
-                            fmt = ">" + (2*(regAddr-startAddr))*"x" + self.modbus.TYPE_MAP[self.pins[regName]['data_type']]
-                            data[regName] = self.modbus.extractData(fmt, bufferProps['response'])
-                            if data[regName] == False:
-                                cmd = bufferProps['command']
-                                resp = bufferProps['response']
-                                logging.exception(f'{self.name} error in sending packet {cmd}, got a response {resp}')
-                            if type(data[regName]) is tuple:
-                                data[regName] = data[regName][0]
-                    if data:
-                        retData = {**retData, **data}
-                return retData
+                requests = self._readRequests()
+                answered = self.modbus.transact(list(requests.values()))
+                responses = {startAddr: response for (startAddr, (command, response)), ok
+                             in zip(requests.items(), answered) if ok}
+                return self.pollResult(responses, timestamp)
             except ConnectionResetError:
                 self.disconnect()
                 self.connect()
                 return {}
 
+    def _readRequests(self):
+        return {startAddr: (bufferProps['command'], bufferProps['response']) for startAddr, bufferProps in self.readAllBuffers.items()}
+
+    def pollRequests(self):
+        """ The read commands of one read, for a PollingEngine, or None while the device is not connected. Connecting
+        (TCP) can take up to the modbus timeout, so it is done on its own thread rather than in the poll.
+
+        :return: {startAddr: (commandBuffer, responseBuffer)}
+        """
+        if not self.buffersSet:
+            self.setBuffers()
+        if not self.connected:
+            if self._reconnect is None or not self._reconnect.is_alive():
+                self._reconnect = Thread(target=self.connect, name=f'{self.name}-connect', daemon=True)
+                self._reconnect.start()
+            return None
+        return self._readRequests()
+
+    def pollResult(self, responses, timestamp=None, error=None):
+        """ Extract the named registers from the responses of one read.
+
+        :param responses: {startAddr: responseBuffer}, the buffer None (or missing) if there was no response.
+        :param timestamp: the time the read was sent. Now if None.
+        :param error: the exception, if the poll failed. A connection error disconnects, to connect again on the next
+            poll.
+        :return: retData, as read.
+        """
+        if isinstance(error, ConnectionError):
+            self.disconnect()
+        retData = {}
+        retData['timestamp'] = timestamp if timestamp else tu.DTtoEpoch(datetime.datetime.utcnow())
+        retData['source'] = self.name
+        for startAddr, response in responses.items():
+            if response is None:
+                continue
+            bufferProps = self.readAllBuffers[startAddr]
+            data = bufferProps['decoder'].decode(response)
+            if data is None:
+                cmd = bufferProps['command']
+                logging.error(f'{self.name} error in sending packet {cmd}, got a response {response}')
+            else:
+                retData.update(data)
+        return retData
+
     def getReaderMetadata(self, sourceName=None):
         """ A function providing all the relevant metadata about this object.
 
@@ -588,10 +628,7 @@ class AlicatMFCReader(IntervalReader, Commands.CommandClass, Destination):
         statusMostResponse = self.pins["DEVICE_STATUS_MOST"]["read_buffers"]["response"]
         statusLeastRequest = self.pins["DEVICE_STATUS_LEAST"]["read_buffers"]["request"]
         statusLeastResponse = self.pins["DEVICE_STATUS_LEAST"]["read_buffers"]["response"]
-        self.modbus.sendData(statusLeastRequest)
-        self.modbus.recvData(statusLeastResponse)
-        self.modbus.sendData(statusMostRequest)
-        self.modbus.recvData(statusMostResponse)
+        self.modbus.transact([(statusLeastRequest, statusLeastResponse), (statusMostRequest, statusMostResponse)])
         leastFmt = self.modbus.DEVICE_ENDIAN + self.modbus.TYPE_MAP[self.pins["DEVICE_STATUS_LEAST"]["data_type"]]
         leastData = self.modbus.extractData(leastFmt, self.pins["DEVICE_STATUS_LEAST"]["read_buffers"]["response"])
         mostFmt = self.modbus.DEVICE_ENDIAN + self.modbus.TYPE_MAP[self.pins["DEVICE_STATUS_LEAST"]["data_type"]]
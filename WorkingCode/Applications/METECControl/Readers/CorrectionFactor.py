@@ -3,10 +3,11 @@ import queue
 
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Commands import CommandClass, CommandMethod
-from Framework.BaseClasses.Package import Package
+from Framework.BaseClasses.Package import BlockPayload, Package
 from Framework.BaseClasses.Registration.FrameworkRegistration import FrameworkObject
 from Framework.BaseClasses.Subscriber import Subscriber
 from Framework.BaseClasses.Worker import Worker
+from Utils import ClassUtils as cu
 from Utils import FileUtils as fUtils
 
 
@@ -68,7 +69,9 @@ class CorrectionFactor(CommandClass, Subscriber, Worker):
                 if self.correctSources.get(package.source, False):
                     pl = package.payload
                     source, corrPl = self.correctPayload(package.source, pl)
-                    pkg = Package(source, payload=corrPl, channelType=ChannelType.Data)
+                    # a block's package is stamped with its first sample.
+                    pkg = Package(source, timestamp=corrPl.timestamp if cu.isBlock(corrPl) else None, payload=corrPl,
+                                  channelType=ChannelType.Data)
                     sl = list(sorted(corrPl.keys()))
                     if 'source' in sl:
                         sl.remove('source')
@@ -79,8 +82,16 @@ class CorrectionFactor(CommandClass, Subscriber, Worker):
 
     @CommandMethod
     def correctPayload(self, source, pl):
-        correctedPL = {}
+        """ Correct the fields of a payload of source. A BlockPayload is corrected sample by sample, into a BlockPayload
+        of the corrected source. """
         devInfo = self.getInfoFromSource(source)
+        if cu.isBlock(pl):
+            rows = [self._correctRow(devInfo, row) for row in pl.rows()]
+            return f'{source}{self.correctionTag}', BlockPayload.fromRows(f'{source}{self.correctionTag}', rows)
+        return f'{source}{self.correctionTag}', self._correctRow(devInfo, pl)
+
+    def _correctRow(self, devInfo, pl):
+        correctedPL = {}
         for singleFieldName, data in pl.items():
             if singleFieldName == 'source':
                 pass
@@ -97,7 +108,7 @@ class CorrectionFactor(CommandClass, Subscriber, Worker):
                     data = data - gnd
                 corrData = corrMethod(self, deviceInfo, data)
                 correctedPL[f'{singleFieldName}'] = corrData
-        return f'{source}{self.correctionTag}', correctedPL
+        return correctedPL
 
     @CommandMethod
     def getSourceMD(self, source):
@@ -24,6 +24,7 @@ from copy import deepcopy
 from enum import Enum
 
 from Applications.METECControl.Readers.Modbus import Modbus as MB
+from Applications.METECControl.Readers.ModbusFormat import BlockDecoder
 from Framework.BaseClasses import Events
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Commands import CommandClass, CommandMethod
@@ -31,7 +32,7 @@ from Framework.BaseClasses.Destination import Destination
 from Framework.BaseClasses.Package import Package
 # from Framework.BaseClasses.Readers.Reader import Reader
 from Framework.BaseClasses.Readers.IntervalReader import IntervalReader
-from Utils import TimeUtils, Errors
+from Utils import TimeUtils
 
 LJ_REGISTERS_FILE = pathlib.Path(pathlib.Path(__file__).parent).joinpath("ljPins", "pins_to_registers.csv")
 LJ_DIO_FILE       = pathlib.Path(pathlib.Path(__file__).parent).joinpath("ljPins", "pin_to_dio.csv")
@@ -54,7 +55,7 @@ class LabJack(IntervalReader, CommandClass, Destination):
     def __init__(self, archiver, commandManager, dataManager, eventManager,
                  name=None, IP=None, port=52362,
                  fields=None, controller=None, processGroup=None, upstreamGSH=None,
-                 blocking=True, qtimeout=None, readPipe=None, readInterval = 1,
+                 blocking=True, qtimeout=None, readPipe=None, readInterval = 1, pollingEngine=None,
                  **kwargs):
         super().__init__(name=name, dataManager=dataManager, commandManager=commandManager, readInterval=readInterval, readPipe=readPipe, **kwargs)
 
@@ -63,6 +64,7 @@ class LabJack(IntervalReader, CommandClass, Destination):
         self.LJLock = threading.RLock()
         self.IP = IP
         self.modbus = MB(IP, port, name=name, connType=socket.SOCK_DGRAM)
+        self.pollingEngine = pollingEngine
         self.blocking=blocking
         self.qtimeout=qtimeout
         self.port = port
@@ -75,6 +77,7 @@ class LabJack(IntervalReader, CommandClass, Destination):
         self.deviceConfiguration = []
         self.writeBuffers = {}
         self.readAllBuffers = {}
+        self._decoders = None # {commandKey: BlockDecoder} of readAllBuffers, compiled on the first read.
         self.connected = False
 
         self.pinsConfig = self.importPinConfig(LJ_REGISTERS_FILE)
@@ -134,18 +137,21 @@ class LabJack(IntervalReader, CommandClass, Destination):
             recvBuffer = bytearray(13)
             connected = self.modbus.sendRecv(sendBuffer, recvBuffer)
 
-            # todo: log this (instead of sending an event?)
-            if self.connected and (not connected):
-                msg = f'Labjack {self.getName()} at IP:Port ({self.IP}:{self.port}) was connected but is now disconnected'
-                discPld = Events.EventPayload(self.getName(), eventType=Events.EventTypes.Disconnected, msg = msg)
-                discPkg = Package(self.getName(), payload=discPld, channelType=ChannelType.Event)
-                if self.eventManager:
-                    self.eventManager.accept(discPkg)
-                else:
-                    self.logger.error(msg)
-            self.connected = connected
+            self._setConnected(connected)
             return self.connected
 
+    def _setConnected(self, connected):
+        # todo: log this (instead of sending an event?)
+        if self.connected and (not connected):
+            msg = f'Labjack {self.getName()} at IP:Port ({self.IP}:{self.port}) was connected but is now disconnected'
+            discPld = Events.EventPayload(self.getName(), eventType=Events.EventTypes.Disconnected, msg = msg)
+            discPkg = Package(self.getName(), payload=discPld, channelType=ChannelType.Event)
+            if self.eventManager:
+                self.eventManager.accept(discPkg)
+            else:
+                self.logger.error(msg)
+        self.connected = connected
+
     @CommandMethod
     def disconnect(self):
         """ A wrapper for the modbus disconnect method. """
@@ -187,63 +193,96 @@ class LabJack(IntervalReader, CommandClass, Destination):
         query returns no data values, the key/value pair is omitted from this return dictionary (Though the metadata will
         be present in a getReaderMetadata command)
         """
-        # TODO: make checks to ensure proper TID in receiving buffer matches the command buffer.
-        ret = {}
         # TODO: go over connect functionality for this and Alicat. Want to connect every time?
         # TODO: adjust functionality to account for errors in reading from modbus. IE don't break if the modbus throws an error.
         #   either do a try catch or look into locking.
         with self.lock:
             self.connect()
             if not self.connected:
-                return ret
+                return {}
 
             #send configuration information for each pin that needs it.
             self._configurePins()
 
-            for commandKey in self.readAllBuffers.keys():
-                commandBuffer = self.readAllBuffers[commandKey]["command"]
-                responseBuffer = self.readAllBuffers[commandKey]["response"]
-                format = self.readAllBuffers[commandKey]["format"]
-                try:
-                    self.modbus.setTID(commandBuffer, LabJack.tid)
-                    self.increaseTID()
-                except Errors.BufferError:
-                    self.logger.debug(msg="TID {} not set for buffer {} on device {}".format(LabJack.tid, commandBuffer, self.getName()))
-
-                sendRecvSuccess = self.modbus.sendRecv(commandBuffer, responseBuffer)
-                if sendRecvSuccess:
-
-                    # check commandID and responseTID against each other to make sure that they match.
-                    comtid = resptid = tidSuccess = 1
-                    try:
-                        comtid = self.modbus.getTID(commandBuffer)
-                        resptid = self.modbus.getTID(responseBuffer)
-                    except Exception as e:
-                        tidSuccess = 0
-                    if not (comtid == resptid) or (tidSuccess == 0):
-                        self.logger.debug(
-                        'Response transaction didn\'t match for command TID: {} on labjack {}'.format(comtid, self.getName()))
-
-                    # extract the data and parse it, associating each piece of data in the buffer with the corresponding
-                    # device/field.
-                    data = self.modbus.extractData(format, responseBuffer)
-                    deviceNames = self.readAllBuffers[commandKey]["devices"]
-
-                    if data:
-                        if self.readAllBuffers[commandKey]['start_address_name'] == 'DIO_STATE':
-                            # unpack the data if it is within the DIO state register. When creating the buffers, the
-                            # DIO_STATE register is read alone, without reading the surrounding registers.
-                            # TODO: Make sure this is the case
-                            for deviceName in deviceNames:
-                                ret[deviceName] = self.dioStateReader(data, deviceName)
-                        else:
-                            ret = {**ret, **dict(zip(deviceNames, data))}
+            # all blocks are sent before their responses are waited for, and each response is matched to its command
+            # by TID (see Modbus.transact).
+            requests = self._readRequests()
+            answered = self.modbus.transact(list(requests.values()))
+            responses = {commandKey: responseBuffer for (commandKey, (commandBuffer, responseBuffer)), ok
+                         in zip(requests.items(), answered) if ok}
+            return self.pollResult(responses)
+
+    def _readRequests(self):
+        if self._decoders is None:
+            self._compileDecoders()
+        return {commandKey: (buffers['command'], buffers['response']) for commandKey, buffers in self.readAllBuffers.items()}
+
+    def _compileDecoders(self):
+        """Compile the decoder of each read block, which unpacks all of its values at once. Redone after addDevice."""
+        decoders = {}
+        for commandKey, buffers in self.readAllBuffers.items():
+            if buffers['start_address_name'] == 'DIO_STATE':
+                decoders[commandKey] = BlockDecoder.fromFormat(buffers['format'], ['DIO_STATE'])
+            else:
+                decoders[commandKey] = BlockDecoder.fromFormat(buffers['format'], buffers['devices'])
+        self._decoders = decoders
+
+    def pollRequests(self):
+        """ The read commands of one read, for a PollingEngine. Does not block on a device that is not answering: the
+        socket (UDP) is connected without the product ID check of connect, and whether the labjack is connected is
+        decided by pollResult from whether it answered. Pins are configured, as in read, once it has.
 
-            # if ret is empty, return it. Otherwise, attach a timestamp and source to the data within the ret dictionary.
-            if not ret:
-                return ret
-            ret["timestamp"] = TimeUtils.nowEpoch()
+        :return: {commandKey: (commandBuffer, responseBuffer)}
+        """
+        if not self.connected:
+            self.modbus.connect()
+        else:
+            self._configurePins()
+        return self._readRequests()
+
+    def pollResult(self, responses, timestamp=None, error=None):
+        """ Extract the reading from the responses of one read, as read does.
+
+        :param responses: {commandKey: responseBuffer}, the buffer None (or missing) if there was no response.
+        :param timestamp: the time the read was sent. Now if None.
+        :param error: the exception, if the poll failed.
+        :return: A dictionary of the timestamp and the values of all data received, as read.
+        """
+        ret = {}
+        received = False
+        if self._decoders is None:
+            self._compileDecoders()
+        for commandKey, responseBuffer in responses.items():
+            if responseBuffer is None:
+                continue
+            received = True
+            decoder = self._decoders[commandKey]
+            # extract the data and parse it, associating each piece of data in the buffer with the corresponding
+            # device/field.
+            if self.readAllBuffers[commandKey]['start_address_name'] == 'DIO_STATE':
+                # unpack the data if it is within the DIO state register. When creating the buffers, the
+                # DIO_STATE register is read alone, without reading the surrounding registers.
+                # TODO: Make sure this is the case
+                data = decoder.unpack(responseBuffer)
+                if data:
+                    for deviceName in self.readAllBuffers[commandKey]["devices"]:
+                        ret[deviceName] = self.dioStateReader(data, deviceName)
+            else:
+                data = decoder.decode(responseBuffer)
+                if data:
+                    ret.update(data)
+                elif data is None:
+                    self.logger.error(f'{self.getName()} received a modbus error in response {responseBuffer}')
+        if responses and not received:
+            self._setConnected(False)
+        elif received:
+            self._setConnected(True)
+
+        # if ret is empty, return it. Otherwise, attach a timestamp and source to the data within the ret dictionary.
+        if not ret:
             return ret
+        ret["timestamp"] = timestamp if timestamp else TimeUtils.nowEpoch()
+        return ret
 
     def importPinConfig(self, configPath):
         with self.LJLock:
@@ -388,6 +427,7 @@ class LabJack(IntervalReader, CommandClass, Destination):
         device = dict(**device, **(self._getPinProperties(pin)))
         if not 'pin' in device.keys():
             return False
+        self._decoders = None
         self._configureThermocouple(device)
 
         #Make read/write buffers
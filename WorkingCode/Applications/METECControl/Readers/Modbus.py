@@ -1,11 +1,45 @@
+import itertools
 import logging
 import socket
 import struct as s
 import threading
+import time
 
 import Utils.Errors as Errors
 from Applications.METECControl.Readers.ModbusFormat import ModbusFormat as MF
 
+MBAP_HEADER = s.Struct('>HHH') # tid, pid, length. length counts the bytes that follow it (uid, func and data).
+MBAP_PREFIX = MBAP_HEADER.size
+MIN_FRAME = 8 # bytes. header and function code.
+MAX_FRAME = 260 # bytes. Largest Modbus TCP frame, the 7 byte header and a 253 byte PDU.
+RECV_SIZE = 4096 # bytes read from a socket at once.
+TID_LIMIT = 2**16
+MAX_IN_FLIGHT = 16 # transactions sent ahead of their responses by transact.
+
+
+def takeFrames(buffer, limit=None):
+    """ Remove the complete MBAP frames from the front of buffer (a bytearray of received stream data), up to limit of
+    them, leaving a partial frame at the end in place.
+
+    :return: (frames, lostSync). lostSync is True if buffer held something that was not a frame header, in which case
+        buffer is emptied, to resync on the data received next.
+    """
+    frames = []
+    offset = 0
+    lostSync = False
+    while len(buffer) - offset >= MBAP_PREFIX and (limit is None or len(frames) < limit):
+        size = MBAP_PREFIX + MBAP_HEADER.unpack_from(buffer, offset)[2]
+        if size < MIN_FRAME or size > MAX_FRAME:
+            lostSync = True
+            offset = len(buffer)
+            break
+        if len(buffer) - offset < size:
+            break
+        frames.append(bytes(buffer[offset:offset+size]))
+        offset += size
+    del buffer[:offset]
+    return frames, lostSync
+
 
 class Modbus(MF):
     """
@@ -33,11 +67,15 @@ class Modbus(MF):
         Close the current socket and set self.sock to None.
     sendRecv(sendBuffer, recvBuffer)
         Send the sendBuffer through a socket to the device, and receive the reponse into recvBuffer.
+    transact(pairs)
+        Send many commands at once and receive each response into its recvBuffer, matched by transaction ID.
     sendData(sendBuffer, resetConnection=False)
         Send the sendBuffer through a socket to the device. If resetConnection is set to true, it will make a new socket
         after this has occurred.
     recvData(recvBuffer, resetConnection=False)
         Receive data from the current socket into the recvBuffer. If resetConnection is true, run disconnect() then reconnect()
+    newTID()
+        The next transaction ID of this connection.
     getHeader(buffer)
         Extract the header (7 bytes) from the specified buffer.
     setHeader(buffer, tid=None, pid=None, length=None, uid=None, func=None)
@@ -112,6 +150,9 @@ class Modbus(MF):
         self.MAX_READ_REG = maxReadReg
         self.sock.settimeout(self.timeout)
         self.lock = threading.RLock()
+        self._tids = itertools.count()
+        self.streamBuffer = bytearray() # TCP data received after the end of the last frame taken.
+        self.staleFrames = 0 # responses dropped because their TID was not one being waited for.
 
     def makeReadCommand(self, startAddr, numreg, tid=None, pid=None, uid=None, func=None):
         """ A function that creates a read command for a modbus device.
@@ -166,7 +207,7 @@ class Modbus(MF):
         startAddress, numRegs = s.unpack_from(">"+MF.READ_COM_FMT, readCommand, MF.RCOM_START_ADDR_OFFSET)
         readResponse = bytearray(readCommand[:s.calcsize(MF.HEADER_FMT)])+bytearray(1+numRegs*2)
         s.pack_into(MF.RRESP_NUM_REG_FMT, readResponse, MF.RRESP_NUM_REG_OFFSET, min(2*numRegs,255))
-        s.pack_into(MF.LEN_FMT, readResponse, MF.LEN_OFFSET, len(readResponse)-6)
+        s.pack_into(">"+MF.LEN_FMT, readResponse, MF.LEN_OFFSET, len(readResponse)-6)
         return readResponse, startAddress, numRegs
 
     @staticmethod
@@ -301,6 +342,7 @@ class Modbus(MF):
         :return: True if the modbus was able to connect. False if the operation failed and the modbus could not connect.
         """
         with self.lock:
+            self.streamBuffer = bytearray()
             try:
                 conn = self.sock.connect_ex((self.IP, self.port))
                 if conn == 0:
@@ -355,17 +397,57 @@ class Modbus(MF):
     def sendRecv(self, sendBuffer, recvBuffer):
         """ A function to send a modbus command from sendBuffer and receive the response into the recvBuffer.
 
+        The command is given a new TID, and only the response with that TID is taken; see transact.
+
         :param sendBuffer: The buffer to be sent to the modbus device.
         :param recvBuffer:
         :type sendBuffer: bytearray
 
         :return: True if the data was sent and received, False if either send or receive didn't succeed."""
-        sent = self.sendData(sendBuffer)
-        recv = self.recvData(recvBuffer)
-        if True and (sent and recv):
-            return True
-        return False
+        return self.transact([(sendBuffer, recvBuffer)])[0]
+
+    def transact(self, pairs):
+        """ Send the commands of pairs, [(sendBuffer, recvBuffer)], and receive the response of each into its
+        recvBuffer.
+
+        Up to MAX_IN_FLIGHT commands are sent before their responses are waited for, so a read of many blocks takes
+        about one round trip rather than one per block. Each command is given a new TID, and responses are matched to
+        commands by it, so a late response to an earlier command that timed out is dropped (and counted in
+        staleFrames) rather than taken as the answer to the next one. All the responses must come within timeout
+        seconds.
 
+        :return: a list of True or False for each pair, whether its command was sent and answered.
+        """
+        with self.lock:
+            results = [False] * len(pairs)
+            pending = {} # tid: index of the pair.
+            toSend = iter(enumerate(pairs))
+            deadline = time.monotonic() + self.timeout
+            while True:
+                for i, (sendBuffer, recvBuffer) in toSend:
+                    tid = self.newTID()
+                    self.setTID(sendBuffer, tid)
+                    if self.sendData(sendBuffer):
+                        pending[tid] = i
+                    if len(pending) >= MAX_IN_FLIGHT:
+                        break
+                if not pending:
+                    return results
+                frame = self._recvFrame(deadline)
+                if frame is None:
+                    return results
+                i = pending.pop(self.getTID(frame), None)
+                if i is None:
+                    self.staleFrames += 1
+                    logging.debug(f'{self.name} dropped a response with TID {self.getTID(frame)}, which was not waited for.')
+                    continue
+                recvBuffer = pairs[i][1]
+                n = min(len(frame), len(recvBuffer))
+                recvBuffer[:n] = frame[:n]
+                results[i] = True
+
+    def newTID(self):
+        return next(self._tids) % TID_LIMIT
 
     def sendData(self, sendBuffer):
         """ Send a buffer over the socket to a modbus device.
@@ -398,18 +480,53 @@ class Modbus(MF):
         :return: True if operation succeeded, False if operation failed.
         """
         with self.lock:
+            frame = self._recvFrame(time.monotonic() + self.timeout)
+            if frame is None:
+                return False
+            n = min(len(frame), len(recvBuffer))
+            recvBuffer[:n] = frame[:n]
+            return True
+
+    def _recvFrame(self, deadline):
+        """ Receive the next whole frame, or None if there is none by deadline (monotonic time) or the socket failed.
+
+        Over TCP, a frame may come in pieces or several in one recv. Data is buffered until the MBAP header's length
+        field says the frame is complete, and what follows it is kept for the next call, so a response that was timed
+        out on is still found whole (and dropped by its TID) rather than read as part of the next one.
+        """
+        while True:
+            if self.connType == socket.SOCK_STREAM:
+                frames, lostSync = takeFrames(self.streamBuffer, 1)
+                if lostSync:
+                    logging.warning(f'{self.name} dropped received data that was not a Modbus frame.')
+                if frames:
+                    return frames[0]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
             try:
-                self.sock.recv_into(recvBuffer)
+                self.sock.settimeout(remaining)
+                data = self.sock.recv(RECV_SIZE)
             except socket.timeout:
-                return False
+                return None
             except OSError as e:
                 # logging.exception(f'Unable to receive buffer from modbus connection to IP:port ({self.IP}:{self.port})'
                 #                   f' due to OSError {e})', exc_info=True)
-                return False
+                return None
             except Exception as e:
                 # logging.exception(f"Modbus connection to ({self.IP}:{self.port}) unable to receive into buffer due to exception: {e}")
-                return False
-            return True
+                return None
+            finally:
+                try:
+                    self.sock.settimeout(self.timeout)
+                except OSError:
+                    pass
+            if self.connType == socket.SOCK_STREAM:
+                if not data:
+                    return None # closed by the device.
+                self.streamBuffer += data
+            elif len(data) >= MIN_FRAME:
+                return data
 
     """
     Functions for making, altering, and receiving information from the modbus header. 
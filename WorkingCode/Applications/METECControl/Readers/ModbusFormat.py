@@ -101,3 +101,70 @@ class ModbusFormat():
         except:
             logging.exception(msg="Could not find listed type in type map", exc_info=True)
             return False
+
+
+class BlockDecoder():
+    """ Unpacks every value in the response to a read of one block of registers, with structs compiled once when the
+    block is set up rather than a format string built and parsed per value per read.
+
+    The values are laid out in as few structs as they fit in; normally one, with pad bytes ('x') over the registers
+    between them. A value that overlaps the one before it (IE two names for the same register) starts another.
+
+    :param fields: [(byteOffset, fmt, name)], the struct format of each value and its offset in bytes from the start of
+        the block's data.
+    """
+    __slots__ = ['segments', 'names', 'offset']
+
+    def __init__(self, fields, endian='>', offset=ModbusFormat.RRESP_DATA_OFFSET):
+        self.offset = offset
+        self.names = []
+        self.segments = [] # (Struct, byte offset in the response)
+        segmentStart, fmt, end = 0, '', 0
+        for byteOffset, valueFmt, name in sorted(fields, key=lambda field: field[0]):
+            if fmt and byteOffset < end:
+                self.segments.append((s.Struct(endian + fmt), offset + segmentStart))
+                segmentStart, fmt, end = byteOffset, '', byteOffset
+            elif not fmt:
+                segmentStart, end = byteOffset, byteOffset
+            fmt += 'x' * (byteOffset - end) + valueFmt
+            end = byteOffset + s.calcsize(endian + valueFmt)
+            self.names.append(name)
+        if fmt:
+            self.segments.append((s.Struct(endian + fmt), offset + segmentStart))
+
+    @classmethod
+    def fromFormat(cls, fmt, names, offset=ModbusFormat.RRESP_DATA_OFFSET):
+        """A decoder of a block whose values are all laid out by fmt (with its endian), named in order by names."""
+        decoder = cls([], offset=offset)
+        decoder.segments = [(s.Struct(fmt), offset)]
+        decoder.names = list(names)
+        return decoder
+
+    @classmethod
+    def fromRegisters(cls, startAddr, registers, endian='>'):
+        """ A decoder of the block of registers starting at startAddr.
+
+        :param registers: [(address, dataType, name)], dataType a key of TYPE_MAP or a struct format.
+        """
+        return cls([(2 * (addr - startAddr), ModbusFormat.TYPE_MAP.get(dataType, dataType), name)
+                    for addr, dataType, name in registers], endian)
+
+    def unpack(self, buffer):
+        """The values of the block in buffer, in order, or None if it is an exception response (the high bits of the
+        function code are set)."""
+        if buffer[ModbusFormat.FUNC_OFFSET] & 0xE0:
+            return None
+        if len(self.segments) == 1:
+            struct, offset = self.segments[0]
+            return struct.unpack_from(buffer, offset)
+        values = ()
+        for struct, offset in self.segments:
+            values += struct.unpack_from(buffer, offset)
+        return values
+
+    def decode(self, buffer):
+        """{name: value} of the block in buffer, or None if it is an exception response."""
+        values = self.unpack(buffer)
+        if values is None:
+            return None
+        return dict(zip(self.names, values))
@@ -0,0 +1,501 @@
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import ExitStack
+
+from Applications.METECControl.Readers.Modbus import MBAP_HEADER, MIN_FRAME, RECV_SIZE, takeFrames
+from Framework.Pipes.ReadScheduler import getSharedScheduler, HISTORY_LENGTH
+from Utils import TimeUtils as tu
+
+"""
+.. _polling-engine:
+
+#################
+Polling Engine
+#################
+
+Reads many Modbus devices at once from one I/O thread. Read sequentially, a device's read blocks are one round trip
+after another, and a device that does not answer holds its reader for the whole socket timeout per block. The engine
+instead writes the read commands of every device at the tick, all blocks of a device back to back on its (kept open)
+socket, and waits on all the sockets together with a selector. Each command is given a new transaction ID (TID) by
+its Modbus object, and responses are matched to commands by TID, so they may come back in any order; a response with a
+TID that is not outstanding (IE the late answer to a command that already timed out) is counted as stale and dropped.
+TCP responses are split into frames by the length field of their MBAP header (see Modbus.takeFrames), since one recv
+may hold several responses or part of one. The partial frame left over is kept in the Modbus object's streamBuffer,
+which its own blocking calls share.
+
+submit(modbus, requests) sends the requests {key: (commandBuffer, responseBuffer)} of one device and returns a Future
+of the DevicePoll, whose responses map each key to its filled responseBuffer, or None if it was not answered within the
+timeout (the device's Modbus timeout unless one is given).
+
+Readers can also be polled on a tick. A ReadPipe whose source has a pollingEngine registers with it (addPipe) instead
+of scheduling its own reads; the readers of one interval are then polled together by one ReadScheduler job, each
+reading sent through its pipe as if read() had returned it. Such a reader provides:
+
+    modbus: the Modbus object of the device.
+    lock: held from pollRequests until pollResult, so commands do not use the socket while a poll is out.
+    pollRequests(): the requests of one read, or None to skip the tick (IE while the device is not connected). Should
+        not block, or the devices after it in the tick are held up.
+    pollResult(responses, timestamp=None, error=None): the reading made from the responses. timestamp is the time the
+        commands were sent, error the exception if the connection failed.
+
+The lag of each poll (time the commands went out - scheduled tick), its latency (time the last response came in, or
+the timeout, - time the commands went out) and unanswered (timeouts) and stale responses are counted per device, see
+getStats.
+
+If the I/O thread fails, the polls that are out and waiting to be sent are finished with an error, and the engine is
+stopped as by stop(), so later submits raise instead of waiting on a thread that is gone. Callers wait for a poll at most
+its timeout plus RESULT_GRACE seconds.
+"""
+
+RESULT_GRACE = 1.0 # seconds past a poll's timeout that a caller waits for the I/O thread to finish it.
+
+class DevicePoll():
+    """ The read requests of one device, sent together. Result of the Future returned by PollingEngine.submit."""
+    __slots__ = ['name', 'modbus', 'requests', 'responses', 'pending', 'tids', 'timeout', 'due', 'deadline',
+                 'sentAt', 'sentMono', 'error', 'future']
+
+    def __init__(self, modbus, requests, timeout, due=None):
+        self.name = modbus.name if modbus.name else f'{modbus.IP}:{modbus.port}'
+        self.modbus = modbus
+        self.requests = requests
+        self.responses = {key: None for key in requests}
+        self.pending = len(requests)
+        self.tids = []
+        self.timeout = timeout
+        self.due = due # monotonic time of the tick the poll is for, if it is on one.
+        self.deadline = None
+        self.sentAt = None # epoch time the commands were sent.
+        self.sentMono = None
+        self.error = None
+        self.future = Future()
+
+    def unanswered(self):
+        return [key for key, response in self.responses.items() if response is None]
+
+
+class DeviceStats():
+    """Counters of the polls of one device. Times are seconds."""
+    __slots__ = ['polls', 'timeouts', 'stale', 'errors', 'totalLag', 'maxLag', 'lagged', 'totalLatency', 'maxLatency',
+                 'history']
+
+    def __init__(self):
+        self.polls = 0
+        self.timeouts = 0
+        self.stale = 0
+        self.errors = 0
+        self.totalLag = 0.0
+        self.maxLag = 0.0
+        self.lagged = 0 # polls that were on a tick, the ones with a lag.
+        self.totalLatency = 0.0
+        self.maxLatency = 0.0
+        self.history = deque(maxlen=HISTORY_LENGTH) # (lag, latency) of recent polls, lag None if not on a tick.
+
+    def toDict(self):
+        return {
+            'polls': self.polls,
+            'timeouts': self.timeouts,
+            'stale': self.stale,
+            'errors': self.errors,
+            'meanLag': self.totalLag / self.lagged if self.lagged else 0.0,
+            'maxLag': self.maxLag,
+            'meanLatency': self.totalLatency / self.polls if self.polls else 0.0,
+            'maxLatency': self.maxLatency,
+            'history': list(self.history)
+        }
+
+
+class Connection():
+    """The engine's view of the socket of one Modbus object. Only used by the I/O thread."""
+    def __init__(self, modbus):
+        self.modbus = modbus
+        self.name = modbus.name if modbus.name else f'{modbus.IP}:{modbus.port}'
+        self.stream = modbus.connType == socket.SOCK_STREAM
+        self.sock = None
+        self.fd = None # the fd sock was registered under, or None if it is not registered.
+        self.outstanding = {} # tid: (poll, key)
+
+    def send(self, command):
+        if self.stream:
+            self.sock.sendall(command)
+        else:
+            self.sock.sendto(command, (self.modbus.IP, self.modbus.port))
+
+
+class PollGroup():
+    """The pipes polled on one interval, by one scheduled job."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.pipes = [] # replaced rather than changed, so a tick can go through it without a lock.
+        self.job = None
+
+
+class PollingEngine():
+    """ One I/O thread that sends the Modbus reads of many devices at once and matches their responses by TID.
+
+    :param timeout: seconds a poll waits for its responses. If None, the timeout of each device's Modbus object.
+    :param scheduler: the ReadScheduler that ticks the polls of registered pipes. The shared one if None.
+    """
+    def __init__(self, name='PollingEngine', timeout=None, scheduler=None, logger=None):
+        self.name = name
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self.groups = {} # interval: PollGroup
+        self.stats = {} # device name: DeviceStats
+        self._selector = selectors.DefaultSelector()
+        self._wakeRecv, self._wakeSend = socket.socketpair()
+        self._wakeRecv.setblocking(False)
+        self._wakeSend.setblocking(False)
+        self._selector.register(self._wakeRecv, selectors.EVENT_READ, None)
+        self._incoming = deque()
+        self._connections = {} # modbus: Connection
+        self._active = [] # polls sent and waiting for responses.
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, modbus, requests, timeout=None, due=None):
+        """ Send the read requests {key: (commandBuffer, responseBuffer)} of one device. The TID of each command is set
+        by the engine, and its response is copied into responseBuffer.
+
+        :param due: monotonic time of the tick the poll is for, to count how late the commands went out.
+        :return: a Future of the DevicePoll.
+        """
+        return self.submitMany([(modbus, requests)], timeout, due)[0]
+
+    def submitMany(self, devices, timeout=None, due=None):
+        """ Send the read requests of many devices, [(modbus, requests)], as submit. They are handed to the I/O thread
+        together, so it sends them all in one go.
+
+        :return: a list of Futures of the DevicePolls.
+        """
+        polls = [DevicePoll(modbus, requests, self._timeout(modbus, timeout), due) for modbus, requests in devices]
+        with self.lock:
+            if self._stopped:
+                raise RuntimeError(f'Polling engine {self.name} has been stopped.')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._incoming.extend(polls)
+        self._wake()
+        return [poll.future for poll in polls]
+
+    def poll(self, modbus, requests, timeout=None):
+        """Send the requests of one device and wait for them. Returns the DevicePoll. Raises
+        concurrent.futures.TimeoutError if the I/O thread has not finished the poll RESULT_GRACE seconds after its
+        timeout."""
+        return self.submit(modbus, requests, timeout).result(self._timeout(modbus, timeout) + RESULT_GRACE)
+
+    def _timeout(self, modbus, timeout=None):
+        return timeout if timeout else (self.timeout if self.timeout else modbus.timeout)
+
+    def stop(self):
+        """Stop ticking and end the I/O thread. Polls that are out are finished with their responses so far."""
+        self._stopTicking()
+        self._wake()
+
+    def _stopTicking(self):
+        """Refuse new polls and cancel the jobs that tick the registered pipes."""
+        with self.lock:
+            self._stopped = True
+            groups, self.groups = self.groups, {}
+        for group in groups.values():
+            group.job.cancel()
+
+    def getStats(self, name=None):
+        """ Return {deviceName: {polls, timeouts, stale, errors, meanLag, maxLag, meanLatency, maxLatency, history}}, or
+        the stats of the device named name. history is the (lag, latency) of recent polls."""
+        with self.lock:
+            if not name is None:
+                stats = self.stats.get(name)
+                return stats.toDict() if stats else None
+            return {deviceName: stats.toDict() for deviceName, stats in self.stats.items()}
+
+    def _deviceStats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.stats.setdefault(name, DeviceStats())
+        return stats
+
+    """
+    Polling the sources of ReadPipes on a tick.
+    """
+    def addPipe(self, pipe):
+        """ Poll pipe.source every pipe.freq seconds, with the other sources on that interval. Returns the ScheduledJob
+        that ticks them."""
+        with self.lock:
+            if self._stopped:
+                raise RuntimeError(f'Polling engine {self.name} has been stopped.')
+            group = self.groups.get(pipe.freq)
+            if group is None:
+                group = PollGroup(pipe.freq)
+                scheduler = self.scheduler if self.scheduler else getSharedScheduler()
+                # the first tick is an interval away, so the other pipes of the group can register before it.
+                group.job = scheduler.schedule(f'{self.name}-{pipe.freq}', pipe.freq, lambda: self._tick(group),
+                                               startDelay=pipe.freq)
+                self.groups[pipe.freq] = group
+            group.pipes = group.pipes + [pipe]
+            return group.job
+
+    def removePipe(self, pipe):
+        with self.lock:
+            for interval, group in list(self.groups.items()):
+                if pipe in group.pipes:
+                    group.pipes = [p for p in group.pipes if not p is pipe]
+                    if not group.pipes:
+                        scheduler = self.scheduler if self.scheduler else getSharedScheduler()
+                        scheduler.cancel(group.job)
+                        del self.groups[interval]
+
+    def _tick(self, group):
+        job = group.job
+        due = job.firedAt if not job.firedAt is None else time.monotonic()
+        with ExitStack() as held:
+            pipes, devices = [], []
+            for pipe in group.pipes:
+                if pipe.terminate or pipe.isTimeToStop():
+                    continue
+                reader = pipe.source
+                try:
+                    held.enter_context(reader.lock)
+                    requests = reader.pollRequests()
+                    if requests:
+                        pipes.append(pipe)
+                        devices.append((reader.modbus, requests))
+                except Exception as e:
+                    self.logger.exception(f'Polling engine {self.name} could not poll {reader.getName()}: {e!r}')
+            futures = self.submitMany(devices, due=due)
+            # the polls went out together, so all of them are waited for until the latest of their deadlines.
+            deadline = time.monotonic() + max((self._timeout(modbus) for modbus, requests in devices), default=0)
+            for pipe, (modbus, requests), future in zip(pipes, devices, futures):
+                try:
+                    poll = future.result(max(0.0, deadline - time.monotonic()) + RESULT_GRACE)
+                    responses, timestamp, error = poll.responses, poll.sentAt, poll.error
+                except FutureTimeout:
+                    responses, timestamp = {key: None for key in requests}, None
+                    error = TimeoutError(f'Polling engine {self.name} did not finish the poll of {pipe.source.getName()}.')
+                try:
+                    reading = pipe.source.pollResult(responses, timestamp=timestamp, error=error)
+                    pipe.handleReading(reading)
+                except Exception as e:
+                    self.logger.exception(f'Polling engine {self.name} could not handle the poll of '
+                                          f'{pipe.source.getName()}: {e!r}')
+
+    """
+    The I/O thread.
+    """
+    def _wake(self):
+        try:
+            self._wakeSend.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass # already has a wake up waiting.
+
+    def _run(self):
+        try:
+            while not self._stopped:
+                self._sendIncoming()
+                timeout = None
+                if self._active:
+                    timeout = max(0.0, min(poll.deadline for poll in self._active) - time.monotonic())
+                for key, events in self._selector.select(timeout):
+                    if key.data is None:
+                        self._drainWake()
+                    else:
+                        self._receive(key.data)
+                self._expire()
+        except Exception as e:
+            self.logger.exception(f'Polling engine {self.name} I/O thread failed: {e!r}')
+        finally:
+            self._shutdown()
+
+    def _drainWake(self):
+        try:
+            while self._wakeRecv.recv(512):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _sendIncoming(self):
+        # the commands of all waiting polls go out before any socket is registered with the selector, so the devices
+        # sent to last do not also wait on those system calls. Responses that come in meanwhile wait in their sockets.
+        if not self._incoming:
+            return
+        toEpoch = tu.nowEpoch() - time.monotonic()
+        sent = []
+        while self._incoming:
+            conn = self._send(self._incoming.popleft(), toEpoch)
+            if conn:
+                sent.append(conn)
+        for conn in sent:
+            self._register(conn)
+
+    def _connection(self, modbus):
+        conn = self._connections.get(modbus)
+        if conn is None:
+            conn = self._connections[modbus] = Connection(modbus)
+        if not conn.sock is modbus.sock:
+            # the device reconnected with a new socket; whatever was out on the old one will not be answered.
+            self._closeConnection(conn, ConnectionResetError(f'Modbus connection {conn.name} was replaced.'))
+            conn.sock = modbus.sock
+        return conn
+
+    def _send(self, poll, toEpoch):
+        """Send the commands of poll. Returns its Connection, to be registered, or None if sending failed.
+
+        :param toEpoch: epoch - monotonic time, so sentAt is had without reading the clock again.
+        """
+        conn = self._connection(poll.modbus)
+        poll.sentMono = time.monotonic()
+        poll.sentAt = poll.sentMono + toEpoch
+        poll.deadline = poll.sentMono + poll.timeout
+        self._active.append(poll)
+        try:
+            for key, (command, response) in poll.requests.items():
+                tid = poll.modbus.newTID()
+                poll.modbus.setTID(command, tid)
+                conn.outstanding[tid] = (poll, key)
+                poll.tids.append(tid)
+                conn.send(command)
+            return conn
+        except (OSError, ValueError) as e:
+            self._closeConnection(conn, e)
+            poll.error = e
+            self._finish(poll)
+            return None
+
+    def _register(self, conn):
+        """Watch the socket of conn for the responses to its outstanding commands."""
+        if not conn.fd is None or not conn.outstanding:
+            return
+        try:
+            conn.fd = conn.sock.fileno()
+            self._selector.register(conn.fd, selectors.EVENT_READ, conn)
+        except (OSError, ValueError) as e:
+            conn.fd = None
+            self._closeConnection(conn, e)
+
+    def _receive(self, conn):
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except (BlockingIOError, socket.timeout, InterruptedError):
+            return
+        except OSError as e:
+            self._closeConnection(conn, e)
+            return
+        if not conn.stream:
+            self._match(conn, data)
+            return
+        if not data:
+            self._closeConnection(conn, ConnectionResetError(f'Modbus connection {conn.name} was closed by the device.'))
+            return
+        conn.modbus.streamBuffer += data
+        frames, lostSync = takeFrames(conn.modbus.streamBuffer)
+        if lostSync:
+            self.logger.warning(f'Polling engine {self.name} dropped data from {conn.name} that was not a Modbus frame.')
+            self._deviceStats(conn.name).errors += 1
+        for frame in frames:
+            self._match(conn, frame)
+
+    def _match(self, conn, frame):
+        if len(frame) < MIN_FRAME:
+            self._deviceStats(conn.name).stale += 1
+            return
+        entry = conn.outstanding.pop(MBAP_HEADER.unpack_from(frame)[0], None)
+        if entry is None:
+            self._deviceStats(conn.name).stale += 1
+            return
+        poll, key = entry
+        response = poll.requests[key][1]
+        n = min(len(frame), len(response))
+        response[:n] = frame[:n]
+        poll.responses[key] = response
+        poll.pending -= 1
+        if poll.pending == 0:
+            self._finish(poll)
+
+    def _expire(self):
+        now = time.monotonic()
+        for poll in [poll for poll in self._active if poll.deadline <= now]:
+            self._finish(poll)
+
+    def _finish(self, poll):
+        if not poll in self._active:
+            return
+        self._active.remove(poll)
+        conn = self._connections.get(poll.modbus)
+        if conn:
+            for tid in poll.tids:
+                entry = conn.outstanding.get(tid)
+                if entry and entry[0] is poll:
+                    del conn.outstanding[tid]
+            if not conn.outstanding:
+                # idle sockets are not watched, so blocking calls on them (IE configuration writes) get their responses.
+                self._unregister(conn)
+        stats = self._deviceStats(poll.name)
+        latency = time.monotonic() - poll.sentMono
+        stats.polls += 1
+        stats.timeouts += len(poll.unanswered()) if poll.error is None else 0
+        stats.errors += 0 if poll.error is None else 1
+        stats.totalLatency += latency
+        stats.maxLatency = max(stats.maxLatency, latency)
+        lag = None
+        if not poll.due is None:
+            lag = poll.sentMono - poll.due
+            stats.lagged += 1
+            stats.totalLag += lag
+            stats.maxLag = max(stats.maxLag, lag)
+        stats.history.append((lag, latency))
+        poll.future.set_result(poll)
+
+    def _unregister(self, conn):
+        if not conn.fd is None:
+            try:
+                self._selector.unregister(conn.fd)
+            except (KeyError, ValueError):
+                pass
+            conn.fd = None
+
+    def _closeConnection(self, conn, error):
+        """Finish the polls that are out on conn with error, and stop watching its socket."""
+        for poll, key in list(conn.outstanding.values()):
+            poll.error = error
+            self._finish(poll)
+        conn.outstanding = {}
+        conn.modbus.streamBuffer = bytearray()
+        self._unregister(conn)
+
+    def _shutdown(self):
+        # also when the I/O thread failed, so that nothing is submitted that it will never send.
+        self._stopTicking()
+        error = RuntimeError(f'Polling engine {self.name} was stopped.')
+        for poll in list(self._active):
+            poll.error = error
+            self._finish(poll)
+        with self.lock:
+            incoming = list(self._incoming)
+            self._incoming.clear()
+        for poll in incoming:
+            poll.error = error
+            poll.future.set_result(poll)
+        self._selector.close()
+        self._wakeRecv.close()
+        self._wakeSend.close()
+
+
+_sharedEngine = None
+_sharedLock = threading.Lock()
+
+
+def getSharedEngine():
+    """An engine that readers can share, so that all of their devices are polled from one thread."""
+    global _sharedEngine
+    with _sharedLock:
+        if _sharedEngine is None:
+            _sharedEngine = PollingEngine('SharedPollingEngine')
+        return _sharedEngine
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+
+import pandas as pd
+from Framework.Archive.ChannelIO import getFormatterClass
+from Framework.Archive.ColdStorage import indexPath, plainName, segmentExists, segmentPath
+from Framework.Archive.Converters import metadataFromCSV
+from Framework.Archive.Formatters import READ_CHUNK_ROWS
+from Framework.Archive.GenerateChannelMap import extFormatters, mdFromFile, parseFileName
+from Framework.Archive.ReadAhead import readAhead, DEFAULT_PREFETCH
+from Framework.BaseClasses.Channels import ChannelType
+from Utils import FileUtils as fUtils
+from Utils.TimeUtils import MIN_EPOCH, MAX_EPOCH
+
+"""
+.. _archive-catalog:
+
+#################
+Archive Catalog
+#################
+
+Rollover splits the history of a site into many archive directories under one base directory. The catalog indexes the
+data files of every archive under the base directory by channel and the time span of their rows, and keeps that index
+in a json file in the base directory (CATALOG_NAME). A refresh only re-reads the ends of files that are new or have
+changed since they were indexed.
+
+A read of a channel across archives only opens the files whose time span overlaps the requested range, reads them on a
+small pool of threads, and returns them in time order, either as one DataFrame/list of rows or one file at a time.
+"""
+
+CATALOG_NAME = 'ArchiveCatalog.json'
+CATALOG_VERSION = 1
+DEFAULT_READERS = 4 # files read at once.
+DATA_EXTS = ['.csv', '.npb']
+
+
+class ArchiveCatalog():
+    """ Index of the data files of every archive under baseDir.
+
+    :param baseDir: directory holding the archives, IE the baseDir of a DirectoryArchiver. If baseDir is itself an
+        archive, only it is indexed.
+    :param catalogPath: where the index is kept. Defaults to CATALOG_NAME in baseDir.
+    :param readers: number of files read in parallel.
+    :param refresh: refresh the index on creation.
+    """
+    def __init__(self, baseDir, catalogPath=None, readers=DEFAULT_READERS, refresh=True, loggerName=None):
+        self.logger = logging.getLogger(loggerName)
+        self.baseDir = os.path.abspath(baseDir)
+        self.catalogPath = catalogPath if catalogPath else os.path.join(self.baseDir, CATALOG_NAME)
+        self.readers = max(1, int(readers))
+        self.lock = RLock()
+        self.entries = {} # path relative to baseDir: entry
+        self._channels = {} # channelName: entries sorted by start, rebuilt when the entries change.
+        self.load()
+        if refresh:
+            self.refresh()
+
+    def load(self):
+        """Load the persisted index, if there is one of the current version."""
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.catalogPath):
+                try:
+                    with open(self.catalogPath, 'r') as catalogFile:
+                        saved = json.load(catalogFile)
+                    if saved.get('version') == CATALOG_VERSION:
+                        self.entries = {entry['path']: entry for entry in saved['files']}
+                except Exception as e:
+                    self.logger.warning(f'Could not load archive catalog {self.catalogPath}, rebuilding it: {e}')
+            self._buildChannels()
+
+    def save(self):
+        with self.lock:
+            saved = {'version': CATALOG_VERSION, 'files': sorted(self.entries.values(), key=lambda e: e['path'])}
+            fUtils.atomicWrite(self.catalogPath, json.dumps(saved, indent=1))
+
+    def _buildChannels(self):
+        channels = {}
+        for entry in self.entries.values():
+            if entry['start'] is None:
+                continue # no rows in this file.
+            channels.setdefault(entry['channel'], []).append(entry)
+        for channelEntries in channels.values():
+            channelEntries.sort(key=lambda e: (e['start'], e['path']))
+        self._channels = channels
+
+    def archives(self):
+        """Return the paths of the archives under baseDir, IE every directory that has a data folder."""
+        if os.path.isdir(os.path.join(self.baseDir, 'data')):
+            return [self.baseDir]
+        archives = []
+        for entry in sorted(os.scandir(self.baseDir), key=lambda e: e.name):
+            if entry.is_dir() and os.path.isdir(os.path.join(entry.path, 'data')):
+                archives.append(entry.path)
+        return archives
+
+    def refresh(self):
+        """ Bring the index up to date with the files on disk, and save it if anything changed.
+
+        :return: number of files that were (re)indexed.
+        """
+        with self.lock:
+            found = {}
+            indexed = 0
+            for archivePath in self.archives():
+                dataDir = os.path.join(archivePath, 'data')
+                # compressed files are indexed under the name of the file they hold.
+                files = set(filter(None, map(plainName, os.listdir(dataDir))))
+                for file in files:
+                    longChannel, ext = os.path.splitext(file)
+                    if not ext in DATA_EXTS:
+                        continue
+                    if ext == '.csv' and longChannel + '.npb' in files:
+                        continue # the csv was converted to a block file, which is read instead.
+                    path = os.path.join(dataDir, file)
+                    relPath = os.path.relpath(path, self.baseDir)
+                    if not segmentExists(path):
+                        continue # removed since the listing.
+                    stat = os.stat(segmentPath(path))
+                    entry = self.entries.get(relPath)
+                    if entry is None or not (entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime):
+                        try:
+                            entry = self._indexFile(archivePath, path, stat)
+                        except Exception as e:
+                            self.logger.error(f'Could not add {path} to the archive catalog: {e}')
+                            continue
+                        indexed += 1
+                    found[relPath] = entry
+            changed = indexed or not found.keys() == self.entries.keys()
+            self.entries = found
+            self._buildChannels()
+            if changed:
+                self.save()
+            return indexed
+
+    def _indexFile(self, archivePath, path, stat):
+        longChannel, ext = os.path.splitext(os.path.basename(path))
+        channelName, fileTS = parseFileName(longChannel, None)
+        entry = {
+            'path': os.path.relpath(path, self.baseDir),
+            'archive': os.path.basename(archivePath),
+            'channel': channelName,
+            'formatter': extFormatters.get(ext, 'IndexedCSVFormatter'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'start': None,
+            'end': None
+        }
+        start, end = self._openFormatter(entry).timeSpan()
+        entry['start'], entry['end'] = start, end
+        return entry
+
+    def _metadata(self, entry):
+        """Metadata of a file, from the archive's metadata folder, or the header rows of a csv if it is not there."""
+        path = os.path.join(self.baseDir, entry['path'])
+        longChannel = os.path.splitext(os.path.basename(path))[0]
+        mdPath, md = mdFromFile(os.path.join(os.path.dirname(os.path.dirname(path)), 'metadata'), longChannel)
+        if md is None and os.path.splitext(path)[1] == '.csv':
+            md, nHeaderRows = metadataFromCSV(path)
+        return md
+
+    def _openFormatter(self, entry):
+        path = os.path.join(self.baseDir, entry['path'])
+        fmtClass = getFormatterClass(entry['formatter'])
+        return fmtClass(entry['channel'], ChannelType.Data, self._metadata(entry), None, readOnly=True, path=path,
+                        idxCsvPath=indexPath(path))
+
+    def channels(self):
+        with self.lock:
+            return sorted(self._channels.keys())
+
+    def span(self, channel):
+        """Return the (first, last) timestamp of a channel across every archive, or (None, None) if it has no rows."""
+        with self.lock:
+            entries = self._channels.get(channel)
+            if not entries:
+                return None, None
+            return entries[0]['start'], max(entry['end'] for entry in entries)
+
+    def files(self, channel, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """Return the entries of the files of channel that have rows between minTS and maxTS, in time order."""
+        with self.lock:
+            return [entry for entry in self._channels.get(channel, [])
+                    if entry['start'] <= maxTS and entry['end'] >= minTS]
+
+    def _readFile(self, entry, minTS, maxTS, asDF):
+        return self._openFormatter(entry).read(minTS, maxTS, asDF=asDF)
+
+    def iterRead(self, channel, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, asDF=True):
+        """ Yield the reading of each file of channel between minTS and maxTS, in time order.
+
+        Up to readers files are read ahead in parallel while the caller consumes the earlier ones.
+        """
+        entries = self.files(channel, minTS, maxTS)
+        with ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='catalog-reader') as pool:
+            pending = deque()
+            for entry in entries:
+                pending.append(pool.submit(self._readFile, entry, minTS, maxTS, asDF))
+                if len(pending) >= self.readers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def iterChunks(self, channel, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, chunkSize=READ_CHUNK_ROWS, asDF=True,
+                   prefetch=DEFAULT_PREFETCH):
+        """ Yield the rows of channel between minTS and maxTS in chunks of at most chunkSize rows, in time order.
+
+        Unlike iterRead, a file is never read whole, so memory stays bounded by prefetch chunks however long the range.
+        """
+        def chunks():
+            for entry in self.files(channel, minTS, maxTS):
+                yield from self._openFormatter(entry).iterRead(minTS, maxTS, chunkSize, asDF=asDF)
+        return readAhead(chunks(), prefetch, name=f'catalog-read-{channel}')
+
+    def read(self, channel, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, asDF=True):
+        """ Read channel between minTS and maxTS across every archive.
+
+        :return: one DataFrame if asDF, otherwise a list of row dicts.
+        """
+        readings = list(self.iterRead(channel, minTS, maxTS, asDF))
+        if asDF:
+            readings = [df for df in readings if len(df)]
+            if not readings:
+                return pd.DataFrame()
+            return pd.concat(readings, ignore_index=True)
+        return [row for reading in readings for row in reading]
+
+
+ARGS_METADATA = {
+    'description': 'Index the archives under a base directory and list the time span of every channel.',
+    'args': [
+        {'name_or_flags': ['-b', '--baseDir'],
+         'required': True,
+         'help': 'Directory holding the archives.'},
+        {'name_or_flags': ['-c', '--catalog'],
+         'default': None,
+         'help': f'Path of the index. Defaults to {CATALOG_NAME} in the base directory.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    catalog = ArchiveCatalog(args.baseDir, args.catalog, refresh=False)
+    indexed = catalog.refresh()
+    print(f'Indexed {indexed} files, {len(catalog.entries)} in catalog {catalog.catalogPath}')
+    for channel in catalog.channels():
+        start, end = catalog.span(channel)
+        print(f'{channel}: {len(catalog.files(channel))} files, {start} to {end}')
+
+
+if __name__ == '__main__':
+    main()
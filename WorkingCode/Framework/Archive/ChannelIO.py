@@ -1,15 +1,19 @@
+import bisect
+import copy
 import csv
+import io
 import logging
 import os
 import pathlib
 import shutil
 from datetime import datetime
+from threading import RLock
 
 from Framework.Archive.Formatters import IndexedCSVFormatter, JSONFormatter, NullFormatter, LoggerFormatter, \
-    LineJSONFormatter
+    LineJSONFormatter, DEFAULT_FLUSH_POLICIES, UNBUFFERED, FORMATTERS, READ_CHUNK_ROWS
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Metadata import Metadata
-from Utils import ClassUtils as cu
+from Utils import ClassUtils as cu, FileUtils as fUtils
 from Utils.TimeUtils import MIN_EPOCH, MAX_EPOCH, EpochtoDT, DTtoEpoch, nowEpoch
 
 
@@ -25,6 +29,7 @@ class ChannelExistsError(Exception):
 MAN_DATE_FMT = '%m/%d/%Y'
 MAN_TIME_FMT = '%H:%M:%S'
 MAN_TIME_FMT_FRAC = '%H:%M:%S.%f'
+MAN_JOURNAL_EXT = '.journal'
 
 """
 .. _archiver-channel-type:
@@ -52,7 +57,8 @@ class Manifest():
     """ A manifest is a record of what files are valid from startTime to endTime
 
     Assumptions:
-        - records are listed in chronological based on their start timestamps
+        - records are listed in chronological based on their start timestamps (see _starts, which is used to find the
+          record that covers a timestamp by bisection).
         - no two manifest records can have overlapping timestamps.
             * One may have the same end timestamp as another's start timestamp, however.
     """
@@ -60,92 +66,150 @@ class Manifest():
     def __init__(self, archiver, channelInfo, manifestPath, loggerName):
         self.logger = logging.getLogger(loggerName)
         self.manifestPath = manifestPath
+        self.journalPath = manifestPath + MAN_JOURNAL_EXT
         self.archiver = archiver
         self.channelInfo = channelInfo
+        self.lock = RLock()
         self._manifest = []
+        self._starts = [] # start timestamp of each record in _manifest, kept sorted alongside it for bisect lookups.
+        self._dirty = False # records changed since the manifest file was last written.
+        self._dict = None # cached result of toDict, cleared when the records change.
         # used for the user to understand what headers are required in the manifest.
         self.headers = {"RecordDate":"UTC", "RecordTime":"UTC", "Filename":"filepath", "Notes":""}
         self.ogDirPath = None  # path to the original directory which held the file. Used as relative reference with 'Filename' field.
 
-    def dump(self):
-        if not self.archiver.isReadonly():
+    def isJournaled(self):
+        """ In journal mode, each new record is appended to the journal file as it is added, and the manifest file is
+        only rewritten (and the journal emptied) when the archiver saves. See readManifest. """
+        try:
+            return self.archiver.manifestJournal
+        except AttributeError:
+            return False
+
+    def isDirty(self):
+        return self._dirty
+
+    def markDirty(self):
+        """Flag the records as changed, so the manifest file is rewritten on the next dump and toDict is rebuilt."""
+        with self.lock:
+            self._dirty = True
+            self._dict = None
+        try:
+            self.channelInfo.markDirty()
+        except AttributeError:
+            pass
+
+    def _toRow(self, manifestRecord):
+        return {
+            'RecordDate': manifestRecord.RecordDate,
+            'RecordTime': manifestRecord.RecordTime,
+            'Filename': manifestRecord.formatter.getPath(),
+            'Notes': manifestRecord.Notes
+        }
+
+    def dump(self, force=False):
+        """ Rewrite the manifest file if its records changed since it was last written (or if force).
+
+        The file is replaced in one rename, and any journal is removed after, as its records are now in the file.
+
+        :return: True if the file was written.
+        """
+        if self.archiver.isReadonly():
+            return False
+        with self.lock:
+            if not (self._dirty or force):
+                return False
+            mf = io.StringIO()
+            w = csv.DictWriter(mf, fieldnames=self.headers.keys())
+            w.writeheader()
+            w.writerow(self.headers)
+            for manifestRecord in self._manifest:
+                w.writerow(self._toRow(manifestRecord))
             if not os.path.exists(os.path.dirname(self.manifestPath)):
                 os.makedirs(os.path.dirname(self.manifestPath))
-            with open(self.manifestPath, 'w', newline='') as mf:
-                w = csv.DictWriter(mf, fieldnames=self.headers.keys())
-                w.writeheader()
-                w.writerow(self.headers)
-                for manifestRecord in self._manifest:
-                    manDict = manifestRecord.toDict()
-                    rowToWrite = {
-                        'RecordDate': manDict['RecordDate'],
-                        'RecordTime': manDict['RecordTime'],
-                        'Filename': manDict['Filename'],
-                        'Notes': manDict['Notes']
-                    }
-                    w.writerow(rowToWrite)
+            fUtils.atomicWrite(self.manifestPath, mf.getvalue(), newline='')
+            if os.path.exists(self.journalPath):
+                os.remove(self.journalPath)
+            self._dirty = False
+            return True
+
+    def _journal(self, manifestRecord):
+        """Append manifestRecord to the journal file, and sync it to disk, as it will not be in the manifest file until the next dump."""
+        if not os.path.exists(os.path.dirname(self.journalPath)):
+            os.makedirs(os.path.dirname(self.journalPath))
+        with open(self.journalPath, 'a', newline='') as jf:
+            csv.DictWriter(jf, fieldnames=self.headers.keys()).writerow(self._toRow(manifestRecord))
+            jf.flush()
+            os.fsync(jf.fileno())
 
     def toDict(self):
-        manRecords = []
-        for singleRecord in self._manifest:
-            manRecords.append(singleRecord.toDict())
-        d = {
-            'manifestPath': self.manifestPath,
-            '_manifest': manRecords
-        }
-        return d
+        with self.lock:
+            d = self._dict
+            if d is None:
+                manRecords = []
+                for singleRecord in self._manifest:
+                    manRecords.append(singleRecord.toDict())
+                d = {
+                    'manifestPath': self.manifestPath,
+                    '_manifest': manRecords
+                }
+                self._dict = d
+            # a copy, so that callers cannot change the cached dict.
+            return copy.deepcopy(d)
 
     def addManifestRecord(self, manifestRecord):
         """Add a ManifestRecord to the current manifest.
+
+        The manifest file is not rewritten here, but on the archiver's next save (see dump). In journal mode the record
+        is appended to the journal right away.
         """
-        # get the previous manifest. Used lated to set its timestamp.
-        prevManifest = self.getManifestRecord(manifestRecord.startTS())
-        if not self._manifest:
-            # case 1: manifest is empty.
-            self._manifest.append(manifestRecord)
-        else:
-            if manifestRecord in self._manifest:
-                return True
-            for singleRecord in self._manifest: # TODO: Pick up here, not implemented is breaking program. Same timestamp is an issue.
-                if singleRecord.startTS() == manifestRecord.startTS() and not (singleRecord is manifestRecord):
-                    # records have conflicting/the same record timestamps
-                    raise NotImplementedError
-            self._manifest.append(manifestRecord)
-            self._manifest = list(sorted(self._manifest, key=lambda x: x.startTS()))
-        # set the end timestamp of the previous record to be the start timestamp of this record.
-        if not prevManifest == manifestRecord and not (prevManifest is None):
-            prevManifest.updateEndTimestamp(manifestRecord.startTS())
-        # If a record exists after this one, set the end timestamp of this record to be the start timestamp of the next.
-        manIdx = self._manifest.index(manifestRecord)
-        try:
-            manifestRecord.updateEndTimestamp(self._manifest[manIdx+1].startTS())
-        except IndexError:
-            # no manifest record after this one; it is the latest.
-            manifestRecord.updateEndTimestamp(MAX_EPOCH)
-        self.dump()
-        return True
+        with self.lock:
+            startTS = manifestRecord.startTS()
+            # get the previous manifest. Used lated to set its timestamp.
+            prevManifest = self.getManifestRecord(startTS)
+            manIdx = bisect.bisect_left(self._starts, startTS)
+            if manIdx < len(self._starts) and self._starts[manIdx] == startTS:
+                if self._manifest[manIdx] is manifestRecord:
+                    return True
+                # TODO: Pick up here, not implemented is breaking program. Same timestamp is an issue.
+                # records have conflicting/the same record timestamps
+                raise NotImplementedError
+            self._manifest.insert(manIdx, manifestRecord)
+            self._starts.insert(manIdx, startTS)
+            # set the end timestamp of the previous record to be the start timestamp of this record.
+            if not prevManifest == manifestRecord and not (prevManifest is None):
+                prevManifest.updateEndTimestamp(startTS)
+                # the previous record will no longer be written to; release its file handles.
+                prevManifest.close()
+            # If a record exists after this one, set the end timestamp of this record to be the start timestamp of the next.
+            try:
+                manifestRecord.updateEndTimestamp(self._starts[manIdx+1])
+            except IndexError:
+                # no manifest record after this one; it is the latest.
+                manifestRecord.updateEndTimestamp(MAX_EPOCH)
+            self.markDirty()
+            if self.isJournaled() and not self.archiver.isReadonly():
+                self._journal(manifestRecord)
+            return True
 
     def getManifestRecords(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
-        manifestsInRange = list(filter(lambda x: minTS <= x.startTS() and x.startTS() <= maxTS, self._manifest))
-        if not manifestsInRange:
-            return [] # return empty list of manifests; record range is out of manifest range.
-        ## Fetch the latest record that overlaps minTS if it exists.
-        firstRecord = manifestsInRange[0]
-        firstRecordIndex = self._manifest.index(firstRecord)
-        if firstRecordIndex > 0 and firstRecord.startTS() > minTS :
-            # need to get the record previous and insert it into the beginning of the returned records.
-            manifestsInRange.insert(0, self._manifest[firstRecordIndex-1])
-        return manifestsInRange
+        """Return the records that cover any part of minTS to maxTS, in chronological order."""
+        # under the lock, as addManifestRecord inserts into _starts and _manifest one after the other.
+        with self.lock:
+            # first record: the one in effect at minTS (the last to start at or before it), or the first if none has.
+            firstIdx = max(bisect.bisect_right(self._starts, minTS) - 1, 0)
+            lastIdx = bisect.bisect_right(self._starts, maxTS)
+            return self._manifest[firstIdx:lastIdx]
 
     def getManifestRecord(self, ts=None):
         """return the most recent manifest before the specified timestamp."""
         if ts is None:
             ts = nowEpoch()
-        manifestsBeforeTS = list(filter(lambda x: x.startTS() <= ts, self._manifest))
-        if not manifestsBeforeTS:
-            return None
-        manifestsBeforeTS = sorted(manifestsBeforeTS, key=lambda x: x.startTS())
-        return manifestsBeforeTS[-1]
+        with self.lock:
+            manIdx = bisect.bisect_right(self._starts, ts) - 1
+            if manIdx < 0:
+                return None
+            return self._manifest[manIdx]
 
 class ManifestRecord():
     def __init__(self, RecordDate, RecordTime, Notes=None, formatter=None, loggerName=None):
@@ -156,6 +220,8 @@ class ManifestRecord():
         self.EndTime = None
         self.Notes = Notes
         self.formatter = formatter
+        self._startKey = None
+        self._startTS = None
 
     def toDict(self):
         d = {
@@ -180,8 +246,17 @@ class ManifestRecord():
     def setEndTime(self, endTime):
         self.EndTime = endTime
 
+    def close(self):
+        if self.formatter:
+            self.formatter.close()
+
     def startTS(self):
-        return manDTtoEpoch(self.RecordDate, self.RecordTime)
+        # parsing the date and time is slow, and the start is looked up on every write, so keep the last result.
+        key = (self.RecordDate, self.RecordTime)
+        if not self._startKey == key:
+            self._startTS = manDTtoEpoch(self.RecordDate, self.RecordTime)
+            self._startKey = key
+        return self._startTS
 
     def endTS(self):
         if (not self.EndDate is None):
@@ -202,6 +277,8 @@ class ChannelIO():
         self.archiveStartTS = self.archiver.getStartTS()
         self.channelName = channelName
         self.typeMap = {}
+        self._version = 0 # incremented whenever a manifest of this channel changes, see toDict.
+        self._dict = None # (version, dict) of the last toDict.
         if importConfig:
             self.logger.debug(f'Channel IO received external config to import.')
             self.importExternalConfig(importConfig, overwrite)
@@ -242,7 +319,7 @@ class ChannelIO():
                     recPath = fmtDef['path']
                     recPath = self._replaceBasepath(recPath)
                     #todo: rectify this with idxCSV, either get rid of idx or check if there is an idx file.
-                    fmtInst = CHANNEL_TYPE_MAP[channelType]['formatter'](self.channelName, channelType, md, self, readOnly=self.archiver.isReadonly(), path=recPath)
+                    fmtInst = getFormatterClass(fmtDef.get('formatter', CHANNEL_TYPE_MAP[channelType]['formatter']))(self.channelName, channelType, md, self, readOnly=self.archiver.isReadonly(), path=recPath)
                     manRecord = ManifestRecord(RecordDate=manRecordDef['RecordDate'], RecordTime=manRecordDef['RecordTime'],
                                                Notes=manRecordDef.get('Notes',''), formatter=fmtInst, loggerName=self.loggerName)
                     manifest.addManifestRecord(manRecord)
@@ -274,7 +351,7 @@ class ChannelIO():
                 else:
                     recPath = fmtDef['csvPath']
                 recPath = self._replaceBasepath(recPath)
-                fmtInst = CHANNEL_TYPE_MAP[channelType]['formatter'](self.channelName, channelType, md, self, readOnly=self.archiver.isReadonly(), path=recPath)
+                fmtInst = getFormatterClass(fmtDef.get('formatter', CHANNEL_TYPE_MAP[channelType]['formatter']))(self.channelName, channelType, md, self, readOnly=self.archiver.isReadonly(), path=recPath)
 
                 # add a new manifest to the current manifest, and then
                 manifest = Manifest(self.archiver, self, self.newAbsolutePath(ChannelType.Manifest), self.loggerName)
@@ -306,9 +383,19 @@ class ChannelIO():
                 return os.path.join(*[*baseSplit, *allsplitPaths[i:]])
         return None
 
+    def markDirty(self):
+        self._version += 1
+
+    def isDirty(self):
+        return any(channelInfo['manifest'].isDirty() for channelInfo in list(self.typeMap.values()))
+
     def toDict(self):
+        # the archiver serializes every channel on each save, so the result is kept until one of the manifests changes.
+        version = self._version
+        if self._dict and self._dict[0] == version:
+            return copy.deepcopy(self._dict[1])
         serTypeMap = {}
-        for channelType, channelDict in self.typeMap.items():
+        for channelType, channelDict in list(self.typeMap.items()):
             serManifest = channelDict['manifest'].toDict()
             serDict = {'manifest': serManifest}
             serTypeMap[channelType] = serDict
@@ -316,7 +403,8 @@ class ChannelIO():
             'channelName': self.channelName,
             'typeMap': serTypeMap
         }
-        return mapping
+        self._dict = (version, mapping)
+        return copy.deepcopy(mapping)
 
     def getManifestPath(self, channelType):
         # archiveBase / archive / manifests / [channelTypeDir] / channelName.manifest
@@ -350,11 +438,14 @@ class ChannelIO():
                     pass
         return locks
 
-    def dump(self):
+    def dump(self, force=False):
+        """Rewrite the manifest files of this channel that have changed (or all of them if force). Returns the number written."""
+        written = 0
         if not self.archiver.isReadonly():
-            for channelType, channelInfo in self.typeMap.items():
+            for channelType, channelInfo in list(self.typeMap.items()):
                 manifest = channelInfo['manifest']
-                manifest.dump()
+                written += manifest.dump(force)
+        return written
 
     def close(self):
         for channelType, channelInfo in self.typeMap.items():
@@ -362,10 +453,36 @@ class ChannelIO():
             for singleMR in mrs:
                 singleMR.formatter.close()
 
+    def flush(self, force=True):
+        """Flush the buffered rows of every formatter in this channel. If force is False, only flush rows that are due."""
+        for channelType, channelInfo in self.typeMap.items():
+            mrs = channelInfo['manifest'].getManifestRecords()
+            for singleMR in mrs:
+                singleMR.formatter.flush(force)
+
+    def getFlushPolicy(self, channelType):
+        try:
+            return self.archiver.getFlushPolicy(channelType)
+        except AttributeError:
+            return DEFAULT_FLUSH_POLICIES.get(channelType, UNBUFFERED)
+
+    def getFormatterClass(self, channelType, formatterName=None):
+        """ Return the formatter class for a channelType of this channel.
+
+        If formatterName is supplied (IE from a saved manifest record), that formatter is used. Otherwise the archiver
+        decides, which allows a channel to be configured with a formatter other than the default of its channel type.
+        """
+        if formatterName:
+            return getFormatterClass(formatterName)
+        try:
+            return self.archiver.getFormatterClass(self.channelName, channelType)
+        except AttributeError:
+            return CHANNEL_TYPE_MAP[channelType]['formatter']
+
     def addROFile(self, name, channelType, metadata=None, path=None):
         now = nowEpoch()
         d, t = manEpochToDT(now)
-        fmtDef = CHANNEL_TYPE_MAP[channelType]['formatter']
+        fmtDef = self.getFormatterClass(channelType)
         fmtInst = fmtDef(name, channelType, metadata, self, readOnly=True, timestamp=now, path=path)
         mr = ManifestRecord(d, t, formatter=fmtInst)
         try:
@@ -386,7 +503,7 @@ class ChannelIO():
             if mr:
                 formatter = mr.formatter
             else:
-                formatter = cTypeDef['formatter'](self.channelName, channelType, None, self, readOnly=self.archiver.isReadonly(),path=fromPath)
+                formatter = self.getFormatterClass(channelType)(self.channelName, channelType, None, self, readOnly=self.archiver.isReadonly(),path=fromPath)
                 d, t = manEpochToDT(timestamp)
                 mr = ManifestRecord(d, t, None, formatter)
                 man.addManifestRecord(mr)
@@ -415,6 +532,7 @@ class ChannelIO():
                         fromPath = localPath
                 if self.archiver.isReadonly():
                     formatter.setPath(formatter.importPath(self, channelType, readOnly=self.archiver.isReadonly(), timestamp=timestamp, path=fromPath))
+                    man.markDirty()
                 else:
                     shutil.copy(fromPath, formatter.getPath())
 
@@ -436,9 +554,10 @@ class ChannelIO():
             raise ChannelExistsError(f'Channel with channelType {channelType} already exists for channel named {self.channelName}')
         man = Manifest(self.archiver, self, self.getManifestPath(channelType), self.loggerName)
         self.typeMap[channelType] = {'manifest':man}
+        self.markDirty()
         if createFirstEntry:
             d, t = manEpochToDT(timestamp)
-            formatter = CHANNEL_TYPE_MAP[channelType]['formatter'](self.channelName, channelType, metadata, self, readOnly=self.archiver.isReadonly())
+            formatter = self.getFormatterClass(channelType)(self.channelName, channelType, metadata, self, readOnly=self.archiver.isReadonly())
             mr = ManifestRecord(d, t, None, formatter)
             man.addManifestRecord(mr)
 
@@ -479,6 +598,25 @@ class ChannelIO():
                          f'but channel type {channelType} does not exist.')
         return allReads
 
+    def iterRead(self, channelType, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, chunkSize=READ_CHUNK_ROWS, asDF=False):
+        """ Yield the readings between minTS and maxTS in chunks of at most chunkSize rows, going through the manifest
+        records in time order. A chunk never spans two records, as their fields may differ. """
+        ci = self.getChannelInfo(channelType)
+        if not ci:
+            self.logger.info(f'A read of channel type {channelType} was attempted on Channel name {self.channelName} '
+                             f'but channel type {channelType} does not exist.')
+            return
+        for singleRecord in ci['manifest'].getManifestRecords(minTS, maxTS):
+            try:
+                if channelType == ChannelType.Data:
+                    chunks = singleRecord.formatter.iterRead(minTS, maxTS, chunkSize, asDF=asDF)
+                else:
+                    chunks = singleRecord.formatter.iterRead(minTS, maxTS, chunkSize)
+                for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                self.logger.error(f'Bad read on channel {self.channelName}: {e}')
+
     def readAll(self, minTS, maxTS):
         channelReads = {}
         for channelType, channelInfo in self.typeMap.items():
@@ -502,7 +640,10 @@ class ChannelIO():
         if manifestRecord:
             if metadata and (not metadata == manifestRecord.formatter.metadata):
                 self.updateChannel(timestamp, channelType, newMetadata=metadata)
-            manifestRecord.formatter.writeRow(record)
+            if cu.isBlock(record):
+                manifestRecord.formatter.writeBlock(record)
+            else:
+                manifestRecord.formatter.writeRow(record)
             return True
         else:
             # no record of the appropriate manifest record exists. Either there are none yet, or this record is before the first record.
@@ -513,6 +654,42 @@ class ChannelIO():
     def _writePackage(self, package):
         self._write(package.payload, package.channelType, package.timestamp, package.metadata)
 
+    def writePackages(self, packages, structureLock=None):
+        """ Write a batch of packages, coalescing consecutive rows bound for the same file into one writeRows call.
+
+        A package that needs a new manifest record (IE its channel type has no record yet, or its metadata changed) is
+        written on its own, while holding structureLock if one is supplied. A block package goes to its formatter's
+        writeBlock, in order with the rows around it.
+        """
+        rows, formatter = [], None
+        for package in packages:
+            ci = self.getChannelInfo(package.channelType)
+            mr = ci['manifest'].getManifestRecord(package.timestamp) if ci else None
+            if mr is None or (package.metadata and not package.metadata == mr.formatter.metadata):
+                if rows:
+                    formatter.writeRows(rows)
+                rows, formatter = [], None
+                try:
+                    if structureLock is None:
+                        self._writePackage(package)
+                    else:
+                        with structureLock:
+                            self._writePackage(package)
+                except Exception as e:
+                    # only this package is lost, as when packages are written one at a time.
+                    self.logger.error(f'Could not write package to channel {self.channelName}: {e!r}')
+                continue
+            if not mr.formatter is formatter or cu.isBlock(package.payload):
+                if rows:
+                    formatter.writeRows(rows)
+                rows, formatter = [], mr.formatter
+            if cu.isBlock(package.payload):
+                formatter.writeBlock(package.payload)
+                continue
+            rows.append(package.payload)
+        if rows:
+            formatter.writeRows(rows)
+
     def getPath(self, channelType, timestamp=None):
         if timestamp is None:
             timestamp = nowEpoch()
@@ -526,13 +703,17 @@ class ChannelIO():
             return os.path.join(self.archiver.getArchivePath(timestamp), fName)
         return None
 
-    def newRelativePath(self, channelType, ts, subpath=None, name=None):
-        """ return a relative filepath from the archive base (of the form '/[subdir]/[subpath]/[name]_[ts][.ext])'"""
+    def newRelativePath(self, channelType, ts, subpath=None, name=None, ext=None):
+        """ return a relative filepath from the archive base (of the form '/[subdir]/[subpath]/[name]_[ts][.ext])'
+
+        ext overrides the extension of the channel type, for formatters that do not write the default file type."""
         chanDef = CHANNEL_TYPE_MAP[channelType]
         if name is None:
             name = self.channelName
-        if chanDef['ext']:
-            fileName = "".join([name, f"_{int(ts)}", f"{chanDef['ext']}"])
+        if ext is None:
+            ext = chanDef['ext']
+        if ext:
+            fileName = "".join([name, f"_{int(ts)}", f"{ext}"])
         else:
             fileName = "".join([name, f"_{int(ts)}"])
         if subpath is None:
@@ -540,10 +721,10 @@ class ChannelIO():
         else:
             return os.path.join(chanDef['subdir'], subpath, fileName)
 
-    def newAbsolutePath(self, channelType, timestamp=None, create=True):
+    def newAbsolutePath(self, channelType, timestamp=None, create=True, ext=None):
         if timestamp is None:
             timestamp = nowEpoch()
-        fName = self.newRelativePath(channelType, timestamp)
+        fName = self.newRelativePath(channelType, timestamp, ext=ext)
         fPath = os.path.join(self.archiver.getArchivePath(timestamp), fName)
         if not os.path.exists(fPath) and create:
             if not os.path.exists(os.path.dirname(fPath)):
@@ -573,23 +754,20 @@ class ChannelIO():
         ci = self.getChannelInfo(channelType)
         man = ci['manifest']
         d, t = manEpochToDT(timestamp)
-        formatter = CHANNEL_TYPE_MAP[channelType]['formatter'](self.channelName, channelType, newMetadata, self,
+        formatter = self.getFormatterClass(channelType)(self.channelName, channelType, newMetadata, self,
                                                              readOnly=self.archiver.isReadonly(), timestamp=timestamp)
         manifestRecord = ManifestRecord(d, t, Notes, formatter)
         man.addManifestRecord(manifestRecord)
 
     def importManifest(self, channelType, manifestFile):
-        with open(manifestFile, 'r') as mf:
-            r = csv.DictReader(mf)
-            next(r)
-            for line in r:
-                fName = line['Filename']
-                d = line['RecordDate']
-                t = line['RecordTime']
-                notes = line['Notes']
-                fullOGFilename = os.path.abspath(os.path.join(os.path.dirname(manifestFile), fName))
-                self._updateManifest(channelType, manDTtoEpoch(d, t), None, notes)
-                self.copy(channelType, manDTtoEpoch(d, t), fullOGFilename)
+        for line in readManifest(manifestFile):
+            fName = line['Filename']
+            d = line['RecordDate']
+            t = line['RecordTime']
+            notes = line['Notes']
+            fullOGFilename = os.path.abspath(os.path.join(os.path.dirname(manifestFile), fName))
+            self._updateManifest(channelType, manDTtoEpoch(d, t), None, notes)
+            self.copy(channelType, manDTtoEpoch(d, t), fullOGFilename)
 
     def getMetadata(self, timestamp=None):
         if ChannelType.Data in self.typeMap.keys():
@@ -611,6 +789,38 @@ class ChannelIO():
         else:
             return None
 
+def readManifest(manifestFile):
+    """ Read the record lines of a manifest file, along with those of its journal (if the archive that wrote it stopped
+    before rewriting the manifest).
+
+    :return: list of {'RecordDate', 'RecordTime', 'Filename', 'Notes'} dicts in chronological order. A journal line
+        replaces a manifest line with the same record date and time.
+    """
+    lines = {}
+    if os.path.exists(manifestFile):
+        with open(manifestFile, 'r', newline='') as mf:
+            r = csv.DictReader(mf)
+            next(r, None) # skip the row of units.
+            for line in r:
+                lines[(line['RecordDate'], line['RecordTime'])] = line
+    journalFile = manifestFile + MAN_JOURNAL_EXT
+    if os.path.exists(journalFile):
+        with open(journalFile, 'r', newline='') as jf:
+            for line in csv.DictReader(jf, fieldnames=['RecordDate', 'RecordTime', 'Filename', 'Notes']):
+                if line['RecordTime'] is None:
+                    continue # partial line, the archive stopped while writing it.
+                lines[(line['RecordDate'], line['RecordTime'])] = line
+    return sorted(lines.values(), key=lambda line: manDTtoEpoch(line['RecordDate'], line['RecordTime']))
+
+def getFormatterClass(formatterName):
+    """Return the formatter class of the given name (IE 'NumpyBlockFormatter'), or the class itself if one is passed."""
+    if type(formatterName) is str:
+        try:
+            return FORMATTERS[formatterName]
+        except KeyError:
+            raise ValueError(f'No formatter named {formatterName}. Choices are {list(FORMATTERS.keys())}')
+    return formatterName
+
 def manDTtoEpoch(date, time):
     if date == 'current' and time == 'current':
         return MAX_EPOCH
@@ -0,0 +1,298 @@
+import bisect
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+
+from Utils import FileUtils as fUtils
+
+"""
+.. _cold-storage:
+
+#################
+Cold Storage
+#################
+
+Files of an archive that will not be written again (IE once the archiver has rolled over to a new directory) can be
+compressed in place. A file is compressed as a series of gzip members ("frames"), each holding a run of whole rows, so
+the compressed file is still an ordinary gzip file (zcat, pandas, etc can read it) but can also be read from any
+position by decompressing only the frame that holds it. Frames start at the offsets of the file's index (.idx) where
+there is one, merged up to FRAME_BYTES, so the index offsets of the original file remain valid.
+
+X.csv is replaced by:
+    X.csv.gz        the frames.
+    X.csv.frames    csv of (offset in X.csv, offset in X.csv.gz) of every frame, ending with the sizes of both files.
+
+The formatters open their files with openSegment, which reads whichever of the two forms exists. Manifests, the DA
+config, and the channel map keep referring to X.csv.
+"""
+
+COMPRESSED_EXT = '.gz'
+FRAMES_EXT = '.frames'
+FRAME_BYTES = 256 * 1024 # uncompressed bytes in a frame, at least. Frames only end at an index offset or row end.
+DEFAULT_LEVEL = 6
+# folders of an archive whose files are compressed, and the extensions of the files that are.
+COLD_FOLDERS = {
+    'data': ['.csv', '.npb'],
+    'events': ['.json'],
+    'commands': ['.json'],
+    'logs': ['.log']
+}
+IDX_EXT = '.idx'
+BLOCK_IDX_EXT = '.blk.idx' # index of a block file (.npb), apart from the .idx of a csv of the same name.
+
+
+def compressedPath(path):
+    return path + COMPRESSED_EXT
+
+def framesPath(path):
+    return path + FRAMES_EXT
+
+def isCompressed(path):
+    """True if path has been replaced by its compressed form."""
+    return not os.path.exists(path) and os.path.exists(compressedPath(path)) and os.path.exists(framesPath(path))
+
+def plainName(fileName):
+    """ Return the name of the plain file that fileName holds, so directory listings can treat X.csv.gz as X.csv.
+    Returns None for frames tables and files still being compressed, which hold no data of their own."""
+    if fileName.endswith(FRAMES_EXT) or fileName.endswith('.tmp'):
+        return None
+    if fileName.endswith(COMPRESSED_EXT):
+        return fileName[:-len(COMPRESSED_EXT)]
+    return fileName
+
+def segmentExists(path):
+    return os.path.exists(path) or isCompressed(path)
+
+def segmentPath(path):
+    """Return the path of the file on disk that holds path, IE path itself or its compressed form."""
+    if not os.path.exists(path) and isCompressed(path):
+        return compressedPath(path)
+    return path
+
+def openSegment(path, mode='r', **kwargs):
+    """ Open path for reading, in text ('r') or binary ('rb') mode, whether it is plain or compressed.
+
+    Offsets (seek/tell) are those of the plain file in either case.
+    """
+    if os.path.exists(path) or not isCompressed(path):
+        return open(path, mode, **kwargs)
+    raw = io.BufferedReader(FramedReader(path))
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw, **kwargs)
+
+
+def readFrames(path):
+    """Return ([plain offset of each frame], [compressed offset of each frame], plain size, compressed size)."""
+    starts, frameOffsets = [], []
+    with open(framesPath(path), 'r', newline='') as framesFile:
+        rdr = csv.reader(framesFile)
+        next(rdr)
+        rows = [(int(offset), int(frameOffset)) for offset, frameOffset in rdr]
+    for offset, frameOffset in rows[:-1]:
+        starts.append(offset)
+        frameOffsets.append(frameOffset)
+    size, compressedSize = rows[-1]
+    return starts, frameOffsets, size, compressedSize
+
+
+class FramedReader(io.RawIOBase):
+    """ Raw, seekable reader of a compressed file, positioned as the plain file. Keeps the last frame it decompressed,
+    so reading forward through a file decompresses each frame once."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.starts, self.frameOffsets, self.size, self.compressedSize = readFrames(path)
+        self._file = open(compressedPath(path), 'rb')
+        self._pos = 0
+        self._frame = None
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _loadFrame(self, frame):
+        start = self.frameOffsets[frame]
+        end = self.frameOffsets[frame + 1] if frame + 1 < len(self.frameOffsets) else self.compressedSize
+        self._file.seek(start)
+        self._buffer = gzip.decompress(self._file.read(end - start))
+        self._frame = frame
+
+    def readinto(self, b):
+        if self._pos >= self.size or not self.starts:
+            return 0
+        frame = bisect.bisect_right(self.starts, self._pos) - 1
+        if not frame == self._frame:
+            self._loadFrame(frame)
+        within = self._pos - self.starts[frame]
+        chunk = self._buffer[within:within + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def indexPath(path):
+    """Path of the index of the data file path: X.blk.idx for a block file X.npb, X.idx for anything else."""
+    base, ext = os.path.splitext(path)
+    return base + (BLOCK_IDX_EXT if ext == '.npb' else IDX_EXT)
+
+def _idxOffsets(path):
+    """Offsets recorded in the index alongside path, if it has one."""
+    idxPath = indexPath(path)
+    offsets = []
+    if os.path.exists(idxPath):
+        with open(idxPath, 'r', newline='') as idxFile:
+            for line in csv.DictReader(idxFile):
+                try:
+                    offsets.append(int(line['offset']))
+                except (TypeError, ValueError, KeyError):
+                    continue
+    return offsets
+
+def _frameBounds(path, size, frameBytes):
+    """Choose the plain offsets at which frames start: index offsets (or line ends) at least frameBytes apart."""
+    bounds = [0]
+    candidates = sorted(set(o for o in _idxOffsets(path) if 0 < o < size))
+    if candidates:
+        for offset in candidates:
+            if offset - bounds[-1] >= frameBytes:
+                bounds.append(offset)
+        return bounds
+    # no index: end frames at the first line end after every frameBytes.
+    with open(path, 'rb') as plain:
+        while True:
+            plain.seek(bounds[-1] + frameBytes)
+            plain.readline()
+            offset = plain.tell()
+            if offset >= size:
+                return bounds
+            bounds.append(offset)
+
+def compressFile(path, level=DEFAULT_LEVEL, frameBytes=FRAME_BYTES, removePlain=True):
+    """ Compress path into frames (see the module notes), then remove path.
+
+    The frames table and compressed file are written under temporary names and renamed into place, and path is only
+    removed after both exist, so a reader always finds one complete form of the file.
+
+    :return: {'path', 'bytesIn', 'bytesOut', 'seconds'}
+    """
+    start = time.perf_counter()
+    size = os.path.getsize(path)
+    bounds = _frameBounds(path, size, frameBytes)
+    frameOffsets = []
+    tmpPath = compressedPath(path) + '.tmp'
+    with open(path, 'rb') as plain, open(tmpPath, 'wb') as compressed:
+        for i, frameStart in enumerate(bounds):
+            frameEnd = bounds[i + 1] if i + 1 < len(bounds) else size
+            frameOffsets.append(compressed.tell())
+            plain.seek(frameStart)
+            compressed.write(gzip.compress(plain.read(frameEnd - frameStart), compresslevel=level, mtime=0))
+        compressedSize = compressed.tell()
+    table = io.StringIO()
+    w = csv.writer(table)
+    w.writerow(['offset', 'frameOffset'])
+    w.writerows(zip(bounds, frameOffsets))
+    w.writerow([size, compressedSize])
+    fUtils.atomicWrite(framesPath(path), table.getvalue(), newline='')
+    os.replace(tmpPath, compressedPath(path))
+    if removePlain:
+        os.remove(path)
+    return {'path': path, 'bytesIn': size, 'bytesOut': compressedSize, 'seconds': time.perf_counter() - start}
+
+def decompressFile(path):
+    """Restore the plain form of a compressed file, and remove the compressed form."""
+    with gzip.open(compressedPath(path), 'rb') as compressed:
+        data = compressed.read()
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as plain:
+        plain.write(data)
+    os.replace(tmpPath, path)
+    os.remove(compressedPath(path))
+    os.remove(framesPath(path))
+
+def summarize(results, seconds=None):
+    """Totals of a list of compressFile results: files, bytesIn, bytesOut, ratio (in/out), MB/s."""
+    bytesIn = sum(r['bytesIn'] for r in results)
+    bytesOut = sum(r['bytesOut'] for r in results)
+    if seconds is None:
+        seconds = sum(r['seconds'] for r in results)
+    return {
+        'files': len(results),
+        'bytesIn': bytesIn,
+        'bytesOut': bytesOut,
+        'ratio': bytesIn / bytesOut if bytesOut else 0.0,
+        'seconds': seconds,
+        'MBps': bytesIn / 1e6 / seconds if seconds else 0.0
+    }
+
+def compactArchive(archivePath, level=DEFAULT_LEVEL, frameBytes=FRAME_BYTES, logger=None):
+    """ Compress the files of a closed archive (see COLD_FOLDERS). The archive must no longer be written to.
+
+    :return: summary of the pass, see summarize. It is also logged.
+    """
+    logger = logger if logger else logging.getLogger(__name__)
+    start = time.perf_counter()
+    results = []
+    for folder, exts in COLD_FOLDERS.items():
+        folderPath = os.path.join(archivePath, folder)
+        if not os.path.isdir(folderPath):
+            continue
+        for file in sorted(os.listdir(folderPath)):
+            path = os.path.join(folderPath, file)
+            if not os.path.splitext(file)[1] in exts or not os.path.isfile(path) or not os.path.getsize(path):
+                continue
+            try:
+                results.append(compressFile(path, level, frameBytes))
+            except Exception as e:
+                logger.error(f'Could not compress {path}: {e}')
+    summary = summarize(results, time.perf_counter() - start)
+    logger.info(f'Compacted archive {archivePath}: {summary["files"]} files, {summary["bytesIn"]} -> '
+                f'{summary["bytesOut"]} bytes (ratio {summary["ratio"]:.2f}) at {summary["MBps"]:.1f} MB/s')
+    return summary
+
+
+ARGS_METADATA = {
+    'description': 'Compress the files of closed archives, or restore them.',
+    'args': [
+        {'name_or_flags': ['-a', '--archive'],
+         'nargs': '+',
+         'required': True,
+         'help': 'Paths of the archives to compress. They must no longer be written to.'},
+        {'name_or_flags': ['-l', '--level'],
+         'default': DEFAULT_LEVEL,
+         'type': int,
+         'help': 'gzip compression level, 1 (fastest) to 9 (smallest).'}
+    ]
+}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = fUtils.getArgs(ARGS_METADATA)
+    for archivePath in args.archive:
+        compactArchive(archivePath, args.level)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import logging
+import os
+
+import pandas as pd
+from Framework.Archive.ColdStorage import indexPath, openSegment
+from Framework.Archive.Formatters import NumpyBlockFormatter, FlushPolicy, DEFAULT_FLUSH_ROWS
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import METADATA_TYPE_MAP, Metadata
+from Utils import FileUtils as fUtils
+
+DEFAULT_BLOCK_ROWS = DEFAULT_FLUSH_ROWS * 100 # rows per block when converting a whole file at once.
+
+
+def _isNumber(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def metadataFromCSV(csvPath):
+    """ Rebuild the metadata of a csv written by the IndexedCSVFormatter from its header rows.
+
+    :return: (metadata, number of header rows after the field names)
+    """
+    with openSegment(csvPath, 'r') as csvFile:
+        fieldNames = csvFile.readline().strip().split(',')
+        headerRows = []
+        line = csvFile.readline()
+        # the added header rows (type, units, etc) come before the first row with a numeric timestamp.
+        while line and not _isNumber(line.split(',')[fieldNames.index('timestamp')]):
+            headerRows.append(line.strip().split(','))
+            line = csvFile.readline()
+    types = next((row for row in headerRows if all(t in METADATA_TYPE_MAP for t in row)), None)
+    if types is None:
+        types = ['float' if name == 'timestamp' else 'string' for name in fieldNames]
+    return Metadata(**dict(zip(fieldNames, types))), len(headerRows)
+
+
+def csvToBlocks(csvPath, blockPath=None, metadata=None, blockRows=DEFAULT_BLOCK_ROWS):
+    """ Convert a data csv (and its readings) to a NumpyBlockFormatter file.
+
+    :param csvPath: path to the csv written by the IndexedCSVFormatter.
+    :param blockPath: output path. Defaults to the csv path with the .npb extension. The block index is written
+        alongside it as .blk.idx, so the .idx of the csv is left to it.
+    :param metadata: metadata of the channel. If None, the types are read from the header rows of the csv.
+    :param blockRows: number of rows in each block.
+    :return: the path of the block file.
+    """
+    base = os.path.splitext(csvPath)[0]
+    if blockPath is None:
+        blockPath = base + '.npb'
+    idxPath = indexPath(blockPath)
+    csvMetadata, nHeaderRows = metadataFromCSV(csvPath)
+    if metadata is None:
+        metadata = csvMetadata
+    for p in [blockPath, idxPath]:
+        open(p, 'w').close()
+    formatter = NumpyBlockFormatter(os.path.basename(base), ChannelType.Data, metadata, None, path=blockPath,
+                                    idxCsvPath=idxPath, flushPolicy=FlushPolicy(maxRows=blockRows, maxAge=float('inf')))
+    skip = list(range(1, nHeaderRows + 1))
+    for chunk in pd.read_csv(csvPath, skiprows=skip, chunksize=blockRows):
+        formatter.writeColumns(chunk)
+    formatter.close()
+    logging.info(f'Converted {csvPath} ({os.path.getsize(csvPath)} bytes) to {blockPath} ({os.path.getsize(blockPath)} bytes).')
+    return blockPath
+
+
+def convertArchiveToBlocks(archivePath, removeCSV=False, blockRows=DEFAULT_BLOCK_ROWS):
+    """ Convert every data csv of an archive to block files. makeMapFromFiles reads the block file in place of a csv
+    of the same name, so the csv may be kept (removeCSV=False) as a fallback.
+
+    :return: list of the converted block paths.
+    """
+    dataDir = os.path.join(archivePath, 'data')
+    converted = []
+    for file in sorted(os.listdir(dataDir)):
+        if not os.path.splitext(file)[1] == '.csv':
+            continue
+        csvPath = os.path.join(dataDir, file)
+        try:
+            converted.append(csvToBlocks(csvPath, blockRows=blockRows))
+        except Exception as e:
+            logging.error(f'Could not convert {csvPath} to blocks: {e}')
+            continue
+        if removeCSV:
+            os.remove(csvPath)
+    return converted
+
+
+ARGS_METADATA = {
+    'description': 'Convert the data csv files of an archive to numpy block files.',
+    'args': [
+        {'name_or_flags': ['-a', '--archive'],
+         'default': None,
+         'help': 'Path to the archive to be converted'},
+        {'name_or_flags': ['-f', '--file'],
+         'default': None,
+         'help': 'Path to a single data csv to be converted.'},
+        {'name_or_flags': ['-b', '--blockRows'],
+         'default': DEFAULT_BLOCK_ROWS,
+         'type': int,
+         'help': 'Number of rows in each block.'},
+        {'name_or_flags': ['-r', '--removeCSV'],
+         'action': 'store_true',
+         'default': False,
+         'help': 'Remove the csv files once converted.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    if args.file:
+        csvToBlocks(args.file, blockRows=args.blockRows)
+    if args.archive:
+        convertArchiveToBlocks(args.archive, args.removeCSV, args.blockRows)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,18 @@ import logging
 import os
 import pathlib
 import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 import pandas as pd
-from Framework.Archive.ChannelIO import ChannelIO, CHANNEL_TYPE_MAP
+from Framework.Archive.ChannelIO import ChannelIO, ChannelExistsError, CHANNEL_TYPE_MAP, getFormatterClass
+from Framework.Archive.ColdStorage import compactArchive, DEFAULT_LEVEL
+from Framework.Archive.Formatters import FlushPolicy, DEFAULT_FLUSH_POLICIES, UNBUFFERED, READ_CHUNK_ROWS
 from Framework.Archive.GenerateChannelMap import getChannelMap
 from Framework.Archive.Logger import LoggingReader
+from Framework.Archive.ReadAhead import readAhead, DEFAULT_PREFETCH
 from Framework.Archive.RolloverManager import RolloverManager
+from Framework.Archive.WriteBehind import WriteBehindPool, DEFAULT_WRITERS
 from Framework.BaseClasses.Archiver import Archiver
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Destination import ThreadedDestination
@@ -42,8 +47,29 @@ VERSIONS = {
 
 
 DEFAULT_TEMPLATE = "_%Y-%m-%d_%H-%M-%S"
-class ChannelExistsError(Exception):
-    pass
+
+class LogWriteFilter(logging.Filter):
+    """ Drops the archiver's own log records made by a thread while that thread is writing a Log package.
+
+    The LoggingReader hands every log record to the archiver, so logging while a log is written would recurse. Only the
+    writing thread is silenced; the other writer threads keep logging."""
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    @contextmanager
+    def writingLog(self, isLog=True):
+        if not isLog:
+            yield
+            return
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+
+    def filter(self, record):
+        return not getattr(self._local, 'depth', 0)
 
 # todo: load from manifests.
 # todo: Test readonly and rollover functionality in unitTests
@@ -77,6 +103,9 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
                         rolloverCriteria='time', rolloverInterval = 86400, checkROInterval = 5,
                         readonly=False,
                         configFiles: list = None, manifests: list = None, originalArchiveDir=None,
+                        flushPolicies: dict = None, flushInterval = 1, channelFormatters: dict = None,
+                        writeBehind=True, writerThreads=DEFAULT_WRITERS, maxQueueDepth=None,
+                        manifestJournal=False, compressClosed=False, compressLevel=DEFAULT_LEVEL,
                         **kwargs): # todo: do something with utcStartHMS
 
         # note: the following lines up to _configureLogger should be kept in this order.
@@ -84,6 +113,10 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         super().__init__(name=name, **kwargs)
         self._configureLogger(name, logConfigFilepath)
         self.ArchiverLock = threading.RLock()
+        # serializes the writes of _saveDAConfig. Never held while taking the ArchiverLock.
+        self.saveLock = threading.Lock()
+        self._saveCount = 0 # number of the last record taken by _saveDAConfig.
+        self._savedCount = 0 # number of the last record written.
         # ThreadedDestination.__init__(self, name=name, **kwargs)
         # Archiver.__init__(self, name=name)
         self.subThreadStopper = threading.Event()
@@ -102,9 +135,35 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
             'readonly': readonly,
             'configFiles': configFiles,
             'manifests': manifests,
-            'originalArchiveDir': originalArchiveDir
+            'originalArchiveDir': originalArchiveDir,
+            'flushPolicies': flushPolicies,
+            'flushInterval': flushInterval,
+            'channelFormatters': channelFormatters,
+            'writeBehind': writeBehind,
+            'writerThreads': writerThreads,
+            'maxQueueDepth': maxQueueDepth,
+            'manifestJournal': manifestJournal,
+            'compressClosed': compressClosed,
+            'compressLevel': compressLevel
         }
         self.readonly = readonly  # marks if the archiver is readonly/should not save any incoming information
+        # how often (seconds) buffered rows are checked against their flush policy's maxAge.
+        self.flushInterval = flushInterval
+        self.flushPolicies = self._importFlushPolicies(flushPolicies)
+        self.channelFormatters = self._importChannelFormatters(channelFormatters)
+        # packages are queued per channel and written by the pool's writer threads, see handlePackage.
+        self.writeBehind = writeBehind
+        self.writePool = WriteBehindPool(f'Archiver\'{name}\'', self._writeBatch, writerThreads, maxQueueDepth,
+                                         logger=self.logger)
+        # manifests are rewritten by the save thread when they change. With manifestJournal, new manifest records are
+        # also appended to a journal as they are added, so they survive the archiver stopping before its next save.
+        self.manifestJournal = manifestJournal
+        # with compressClosed, the previous archive is compressed (see ColdStorage) on a background thread after each
+        # rollover. The summary of each pass is kept in compactionStats.
+        self.compressClosed = compressClosed
+        self.compressLevel = compressLevel
+        self.compactionStats = []
+        self._compactionThreads = []
 
         self.archiveStartTS = tu.nowEpoch()
         self.template = template  # template for the name of the archive. Intended to be some datetime format.
@@ -164,6 +223,62 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         self.rolloverThreadName = f'Archiver\'{self.name}\'-rollover-thread'
         self.saveThread = RepeaterThread(self.subThreadStopper, self.logger, name=self.saveThreadName, target=self._repeatedSave, interval=5)
         self.rolloverThread = RepeaterThread(self.subThreadStopper, self.logger, name=self.rolloverThreadName, target=self._rolloverCheck, interval=self.checkROInterval)
+        self.flushThreadName = f'Archiver\'{self.name}\'-flush-thread'
+        self.flushThread = RepeaterThread(self.subThreadStopper, self.logger, name=self.flushThreadName, target=self._repeatedFlush, interval=self.flushInterval)
+
+    def _importFlushPolicies(self, flushPolicies=None):
+        """ Merge the user supplied flush policies over the defaults.
+
+        :param flushPolicies: {channelType: policy} where channelType is a ChannelType or its name (IE 'Data'), and policy
+            is a FlushPolicy or a dict of its kwargs (IE {'maxRows': 500, 'maxAge': 5, 'fsync': False}).
+        :return: {ChannelType: FlushPolicy}
+        """
+        policies = dict(DEFAULT_FLUSH_POLICIES)
+        if flushPolicies:
+            for channelType, policyDef in flushPolicies.items():
+                if type(channelType) is str:
+                    channelType = ChannelType[channelType]
+                policies[channelType] = FlushPolicy.fromDef(policyDef)
+        return policies
+
+    def getFlushPolicy(self, channelType):
+        return self.flushPolicies.get(channelType, UNBUFFERED)
+
+    def _importChannelFormatters(self, channelFormatters=None):
+        """ Set up the formatters of channels that should not use the default formatter of their channel type.
+
+        :param channelFormatters: {channelName: formatter} where formatter is a formatter name (IE 'NumpyBlockFormatter'),
+            which is applied to the Data channel type, or a dict of {channelType: formatter name}.
+        :return: {channelName: {ChannelType: formatter name}}
+        """
+        formatters = {}
+        if channelFormatters:
+            for channelName, fmtDef in channelFormatters.items():
+                if not type(fmtDef) is dict:
+                    fmtDef = {ChannelType.Data: fmtDef}
+                for channelType, formatterName in fmtDef.items():
+                    self.setChannelFormatter(channelName, channelType, formatterName, formatters)
+        return formatters
+
+    def setChannelFormatter(self, channelName, channelType, formatter, formatters=None):
+        """ Use formatter (a formatter name or class) for the channelType of channelName. Applies to files created after this call."""
+        if formatters is None:
+            formatters = self.channelFormatters
+        if type(channelType) is str:
+            channelType = ChannelType[channelType]
+        if not type(formatter) is str:
+            formatter = formatter.__name__
+        getFormatterClass(formatter) # raise early if there is no formatter of that name.
+        formatters.setdefault(channelName, {})[channelType] = formatter
+        # keep the init record serializable and current, so that the archive reopens with the same formatters.
+        self.initRecord['channelFormatters'] = {name: {cType.name: fmt for cType, fmt in fmts.items()}
+                                                for name, fmts in formatters.items()}
+
+    def getFormatterClass(self, channelName, channelType):
+        formatterName = self.channelFormatters.get(channelName, {}).get(channelType)
+        if formatterName:
+            return getFormatterClass(formatterName)
+        return CHANNEL_TYPE_MAP[channelType]['formatter']
 
     def _importFromArchive(self, archiveDirectory):
         if os.path.exists(archiveDirectory):
@@ -175,6 +290,8 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         self.LR = LoggingReader(archiver=self, commandManager=None, dataManager=None, eventManager=None,
                                 logConfigChannelName=loggingConfig, name='_'.join([name, 'logger']))
         self.logger = logging.getLogger(name)
+        self.logFilter = LogWriteFilter()
+        self.logger.addFilter(self.logFilter)
 
     def getChannels(self):
         cMap = {}
@@ -203,21 +320,46 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         if not self.isReadonly():
             self.saveThread.start()
             self.rolloverThread.start()
+            self.flushThread.start()
         ThreadedDestination.start(self)
 
     def end(self):
         """Method that ends functionality of Archiver. Will stop repeatedly saving as well as checking for rollover. """
         self.logger.info(f'end() method called for Directory Archiver {self.name}')
+        # write everything still queued before closing. Not under the ArchiverLock, which the writers may need.
+        self.writePool.stop()
         with self.ArchiverLock:
             self.subThreadStopper.set()
             self._saveDAConfig()
             self.LR.end()
+            self.logger.removeFilter(self.logFilter)
             ThreadedDestination.end(self)
+            # flush all buffered rows and release file handles. Formatters will reopen their files if written to again.
+            self._closeAll()
 
     def _closeAll(self):
         for channelName, channelIO in self.channelMap.items():
             channelIO.close()
 
+    def getWriteStats(self):
+        """ Monitoring counters of the write behind queues.
+
+        :return: {'depth', 'dropped', 'errors', 'written', 'maxLatency', 'channels': {channelName: counters}}, where
+            depth is the number of packages waiting to be written and latencies are seconds from queueing to written.
+        """
+        return self.writePool.getStats()
+
+    def drain(self, channelName=None, timeout=None):
+        """Wait until the queued packages of channelName (or all channels if None) are written. False on timeout."""
+        return self.writePool.drain(channelName, timeout)
+
+    def flush(self, force=True):
+        """Flush buffered rows of all channels to disk. If force is False, only rows due per their flush policy are written."""
+        with self.ArchiverLock:
+            channels = list(self.channelMap.values())
+        for channelIO in channels:
+            channelIO.flush(force)
+
     def getArchiveName(self):
         with self.ArchiverLock:
             return self.archiveName
@@ -317,35 +459,62 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         self._saveDAConfig()
 
     def _saveDAConfig(self):
-        """ updates the DAConfig.json file with the most up to date time, dir size, and channel infomation
+        """ updates the DAConfig.json file with the most up to date time, dir size, and channel infomation, and rewrites
+        the manifests that have changed since the last save.
+
+        The record is copied under the ArchiverLock, but serialized and written outside of it, so that the writers are
+        not held up by the save. Both files are replaced by a rename, so they are never seen half written. The writes are
+        serialized by the saveLock, and a record is skipped if a newer one was written first, so that concurrent saves
+        (IE end and the save thread) cannot leave an older record last.
 
         :return:
         """
+        size = self._calcSize()
         with self.ArchiverLock:
             configCio = self.channelMap[self.archiveConfigName]
             self.archiveInfo['lastUpdate'] = tu.nowDT()
-            self.archiveInfo['size'] = self._calcSize()
-            if not self.readonly:
-                configCio.delete(ChannelType.DirConfig)
-                configCio.write(self.archiveRecord, ChannelType.DirConfig)
+            self.archiveInfo['size'] = size
+            stats = self.writePool.getStats()
+            self.archiveInfo['writeBehind'] = {k: stats[k] for k in ['depth', 'dropped', 'errors', 'written', 'maxLatency']}
+            channels = list(self.channelMap.items())
+            record = {
+                'archiveInfo': dict(self.archiveInfo),
+                'initRecord': dict(self.initRecord),
+                'channelMap': {channelName: channelIO.toDict() for channelName, channelIO in channels}
+            }
+            self._saveCount += 1
+            saveCount = self._saveCount
+        if not self.readonly:
+            with self.saveLock:
+                if saveCount < self._savedCount:
+                    return
+                for channelName, channelIO in channels:
+                    channelIO.dump()
+                configCio.write(record, ChannelType.DirConfig)
+                self._savedCount = saveCount
 
     def _calcSize(self):
         """Recursively calculate the current size of the directory and all files within the archive. """
         # todo: scalability check on this calcsize method, if it takes too much time to calculate.
         with self.ArchiverLock:
-            def size(dir):
-                total = 0
-                for entry in os.scandir(dir):
-                    if os.path.isdir(entry):
+            archivePath = self.getArchivePath()
+        # walk the directory without the lock; files (IE the temporary files of a save) may come and go meanwhile.
+        def size(dir):
+            total = 0
+            for entry in os.scandir(dir):
+                try:
+                    if entry.is_dir():
                         total += size(entry)
-                    elif os.path.isfile(entry):
-                        total += os.path.getsize(entry)
-                return total
-            try:
-                return size(self.getArchivePath())
-            except Exception as e:
-                self.logger.exception(f'Could not calculate the size of the directory due to error {e}')
-                return 0
+                    elif entry.is_file():
+                        total += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+            return total
+        try:
+            return size(archivePath)
+        except Exception as e:
+            self.logger.exception(f'Could not calculate the size of the directory due to error {e}')
+            return 0
 
     def _addUniqueTag(self, path):
         """Adds a unique tag to the end of the path/file/dirname if it exists"""
@@ -369,7 +538,7 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         # answer: start of current archive.
         return self.archiveStartTS
 
-    def createChannel(self, name, channelType, metadata=None, copyFromPath=None, subPath=None, fileName=None, createFirstEntry=True, timestamp=None):
+    def createChannel(self, name, channelType, metadata=None, copyFromPath=None, subPath=None, fileName=None, createFirstEntry=True, timestamp=None, formatter=None):
         """ Create a new channel in the channel map (or adds channelType to the current CHannelIO Object
 
         # todo: possible error with multiple channels being created on a channel that already exists when receiving a package.
@@ -381,12 +550,16 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         :param copyFromPath: If supplied, will copy this file into the directory archiver.
         :param createFirstEntry: If marked True, will write/create the first file. Otherwise, will wait to receive a package to write the file.
         :param timestamp: The designated timestamp with which this channelType/name combo was created. Defaults to now.
+        :param formatter: name of the formatter to use for this channelType (IE 'NumpyBlockFormatter'). Defaults to the
+            formatter of the channel type.
         :return:
         """
         if timestamp is None:
             timestamp = tu.nowEpoch()
 
         with self.ArchiverLock:
+            if formatter:
+                self.setChannelFormatter(name, channelType, formatter)
             if metadata and channelType == ChannelType.Data:
                 self.createChannel(name, ChannelType.Metadata, metadata, createFirstEntry=createFirstEntry, timestamp=timestamp)
                 cio = self.channelMap.get(name)
@@ -418,7 +591,10 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
     def handlePackage(self, package):
         """ Accepts an incoming pacakge and writes it to the archive.
 
-        If the channel doesn't exist, create it. If the
+        If the channel doesn't exist, create it. With writeBehind (the default), the package is then queued on its
+        channel and written by the write pool, so the calling thread does not wait on the disk and the ArchiverLock is
+        only taken for structural changes (creating channels, config file updates). Otherwise it is written
+        immediately while holding the ArchiverLock.
 
         If the channel is a Log, then turn off logging while this is being written to avoid recursion.
 
@@ -426,28 +602,75 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         :return:
         """
         # todo: Change all readers to put metadata in their packages.
-        with self.ArchiverLock:
-            if not self.readonly:
+        if self.readonly:
+            return
+        if not self.writeBehind:
+            with self.ArchiverLock:
                 try:
-                    md = None
-                    source = package.source
-                    if package.channelType == ChannelType.Command:
-                        self._handleCommand(package)
-                    if package.channelType == ChannelType.Event:
-                        self._handleEvent(package)
-                    if package.channelType == ChannelType.Data:
-                        md = package.metadata
-                    if package.channelType == ChannelType.Metadata and (cu.isMetadata(package.payload) or type(package.payload) is dict):
-                        md = {k: type(package.payload[k]) for k in package.payload.keys()}
-                    elif package.channelType == ChannelType.Log:
-                        self.logger.disabled = True # disabling this as a way to avoid infinite recursion when logging a log.
-                    self.createChannel(package.source, channelType=package.channelType, metadata=md, timestamp=package.timestamp)
-                    cio = self.channelMap.get(source)
-                    cio.write(package)
+                    self._prepareChannel(package)
+                    with self.logFilter.writingLog(package.channelType == ChannelType.Log):
+                        self.channelMap.get(package.source).write(package)
+                except Exception as e:
+                    self.logger.error(f'Directory Archiver Encountered an error: {e}')
+            return
+        try:
+            self._prepareChannel(package)
+            self.writePool.put(package.source, package) # drops are counted by the pool, see getWriteStats.
+        except Exception as e:
+            self.logger.error(f'Directory Archiver Encountered an error: {e}')
+
+    def handlePackages(self, packages):
+        """ Handle a batch of packages taken from the input queue.
+
+        With writeBehind, each package is queued on its channel as in handlePackage. Otherwise the packages of each
+        channel are written together, taking the ArchiverLock once per channel rather than once per package.
+        """
+        if self.readonly:
+            return
+        if self.writeBehind:
+            for package in packages:
+                self.handlePackage(package)
+            return
+        byChannel = {}
+        for package in packages:
+            try:
+                self._prepareChannel(package)
+                byChannel.setdefault(package.source, []).append(package)
+            except Exception as e:
+                self.logger.error(f'Directory Archiver Encountered an error: {e}')
+        for channelName, channelPackages in byChannel.items():
+            with self.ArchiverLock:
+                try:
+                    self._writeBatch(channelName, channelPackages)
                 except Exception as e:
                     self.logger.error(f'Directory Archiver Encountered an error: {e}')
-                finally:
-                    self.logger.disabled=False
+
+    def _prepareChannel(self, package):
+        """Make the structural changes a package needs before it is written: handle commands/events, create its channel."""
+        if package.channelType == ChannelType.Command:
+            self._handleCommand(package)
+        if package.channelType == ChannelType.Event:
+            with self.ArchiverLock:
+                self._handleEvent(package)
+        cio = self.channelMap.get(package.source)
+        if cio is None or not package.channelType in cio.getChannelTypes():
+            md = None
+            if package.channelType == ChannelType.Data:
+                md = package.metadata
+            if package.channelType == ChannelType.Metadata and (cu.isMetadata(package.payload) or type(package.payload) is dict):
+                md = {k: type(package.payload[k]) for k in package.payload.keys()}
+            # silencing this thread as a way to avoid infinite recursion when logging a log.
+            with self.ArchiverLock, self.logFilter.writingLog(package.channelType == ChannelType.Log):
+                self.createChannel(package.source, channelType=package.channelType, metadata=md, timestamp=package.timestamp)
+
+    def _writeBatch(self, channelName, packages):
+        """Target of the write pool. Writes a batch of queued packages of one channel."""
+        cio = self.channelMap.get(channelName)
+        if cio is None:
+            raise ChannelExistsError(f'No channel named {channelName} to write to.')
+        isLog = any(package.channelType == ChannelType.Log for package in packages)
+        with self.logFilter.writingLog(isLog):
+            cio.writePackages(packages, structureLock=self.ArchiverLock)
 
     def _handleCommand(self, package):
         # todo: flesh this out, see if there is anything that needs to be done here.
@@ -473,24 +696,31 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
     def _repeatedSave(self):
         """ Target of the repeated save thread. Will save directory config information every interval."""
         self.logger.debug(f'Dumping Directory Archiver Archive Info...')
-        with self.ArchiverLock:
-            try:
-                    if not self.isTimeToStop(): # isTimeToStop comes from FrameworkObject base class.
-                        self._saveDAConfig()
-                    else:
-                        self._closeAll()
-            except Exception as e:
-                self.logger.error(f'Error when performing repeated save action on Directory Archiver: {e}')
+        try:
+            if not self.isTimeToStop(): # isTimeToStop comes from FrameworkObject base class.
+                self._saveDAConfig() # takes the ArchiverLock only while copying the record.
+            else:
+                with self.ArchiverLock:
+                    self._closeAll()
+        except Exception as e:
+            self.logger.error(f'Error when performing repeated save action on Directory Archiver: {e}')
+
+    def _repeatedFlush(self):
+        """ Target of the repeated flush thread. Writes any buffered rows that have been pending longer than their maxAge."""
+        try:
+            self.flush(force=False)
+        except Exception as e:
+            self.logger.error(f'Error when performing repeated flush action on Directory Archiver: {e}')
 
     def _rolloverCheck(self):
         """ Checks to see if it is time to rollover. If it is, enact the rollover for the archiver. """
         self.logger.debug(f'Checking Rollover for Directory Archiver')
         with self.ArchiverLock:
             rolloverNow = self.rolloverManager.checkRollover()
-            if rolloverNow:
-                # todo: put exception handling here too.
-                self.logger.debug(f'Rollover Manager indicates it is time for rollover. Initiating _rollover method.')
-                self._rollover()
+        if rolloverNow:
+            # todo: put exception handling here too.
+            self.logger.debug(f'Rollover Manager indicates it is time for rollover. Initiating _rollover method.')
+            self._rollover()
 
     def _rollover(self):
         """
@@ -529,6 +759,38 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         # 2) For each channel in channel map, keep the old archived and take the most recent entries as the first entry into new channelIO objects.
         # 3)
         rolloverStartTS = tu.nowEpoch()
+        if not self.readonly:
+            closedArchivePath = self.archivePath
+            # let the writers finish their current batches, then hold them off until the new channels exist. Queued
+            # packages are written to the new archive. The writers are paused before taking the ArchiverLock, as a
+            # batch in progress may need it.
+            self.writePool.pause()
+            try:
+                self._rolloverLocked(rolloverStartTS)
+            finally:
+                self.writePool.resume()
+            if self.compressClosed and not closedArchivePath == self.archivePath:
+                self._startCompaction(closedArchivePath)
+
+    def _startCompaction(self, archivePath):
+        """Compress a closed archive on a background thread. Nothing writes to it after the rollover."""
+        def compact():
+            try:
+                self.compactionStats.append(compactArchive(archivePath, self.compressLevel, logger=self.logger))
+            except Exception as e:
+                self.logger.error(f'Could not compress closed archive {archivePath}: {e}')
+        compactor = threading.Thread(target=compact, name=f'{self.name}-compaction', daemon=True)
+        self._compactionThreads = [t for t in self._compactionThreads if t.is_alive()] + [compactor]
+        compactor.start()
+
+    def waitForCompaction(self, timeout=None):
+        """Wait for the compaction of closed archives to finish. Returns False if one is still running after timeout."""
+        for compactor in list(self._compactionThreads):
+            compactor.join(timeout)
+        return not any(t.is_alive() for t in self._compactionThreads)
+
+    def _rolloverLocked(self, rolloverStartTS):
+        """Helper of _rollover that swaps in the new archive directory and channels, while the writers are paused."""
         if not self.readonly:
             with self.ArchiverLock:
                 # acquire all the individual locks from the formatters
@@ -602,6 +864,8 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         :param maxTS:
         :return:
         """
+        # make sure rows queued for this channel are on disk before reading them.
+        self.writePool.drain(channel)
         channel = self.channelMap.get(channel)
         if not channel is None:
             # return channel.formatter.read(minTS, maxTS)
@@ -616,6 +880,23 @@ class DirectoryArchiver(Archiver, ThreadedDestination):
         else:
             return None
 
+    def iterRead(self, channel, channelType=ChannelType.Data, minTS=MIN_EPOCH, maxTS=MAX_EPOCH,
+                 chunkSize=READ_CHUNK_ROWS, asDF=False, prefetch=DEFAULT_PREFETCH):
+        """ Read a channel in chunks rather than all at once, for reads too large to hold in memory.
+
+        :param chunkSize: most rows in a chunk.
+        :param asDF: yield DataFrames instead of ColumnReadings (which behave as lists of row dicts).
+        :param prefetch: chunks read ahead on a separate thread while the caller works on the current one. 0 reads
+            each chunk only when it is asked for.
+        :return: an iterator over the chunks, in time order. Empty if there is no such channel.
+        """
+        self.writePool.drain(channel)
+        channelIO = self.channelMap.get(channel)
+        if channelIO is None:
+            return iter([])
+        return readAhead(channelIO.iterRead(channelType, minTS, maxTS, chunkSize, asDF), prefetch,
+                         name=f'Archiver\'{self.name}\'-read-{channel}')
+
     # todo: re-evaluate if this is necessary after changing read.
     def readConfig(self, name, readingTimestamp = MAX_EPOCH):
         self.logger.debug(f'Reading config for timestamp {readingTimestamp}')
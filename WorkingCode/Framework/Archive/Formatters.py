@@ -1,17 +1,34 @@
+import bisect
+import csv
+import io
+import json
+import locale
 import logging
 import os
+import struct
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Sequence
 from datetime import datetime
 from threading import RLock
 
 import dask.dataframe as dd
+import numpy as np
 import pandas as pd
+from Framework.Archive.ColdStorage import BLOCK_IDX_EXT, indexPath, openSegment, segmentExists, segmentPath
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Metadata import METADATA_TYPE_MAP, Metadata
-from Utils import ClassUtils as cu, Encoding as enc, TimeUtils as tu
+from Utils import ClassUtils as cu, Encoding as enc, FileUtils as fUtils, TimeUtils as tu
 from Utils.TimeUtils import MIN_EPOCH, MAX_EPOCH
 
 DEFAULT_IDXLIMIT = 100
+CHANNEL_IDX_EXT = '.idx'
+DASK_WINDOW_ROWS = 100000 # rows per partition of a dask dataframe built from an index window.
+TAIL_READ_BYTES = 4096 # bytes read back from the end of a csv to find its last row.
+DEFAULT_FLUSH_ROWS = 100 # number of pending rows that will force a write buffer to flush.
+DEFAULT_FLUSH_AGE = 1.0 # seconds that a row may sit in a write buffer before it is flushed.
+# encoding used by open() in text mode. Write buffers encode with the same codec so files stay byte for byte identical.
+FILE_ENCODING = locale.getpreferredencoding(False)
 # todo: get rid of index formatter and just use csv.
 
 def isNew(path, mode):
@@ -30,6 +47,142 @@ def isNew(path, mode):
 
 IDX_METADATA = {'timestamp': 'float', 'offset': 'int', 'count': 'int'}
 
+
+class FlushPolicy():
+    """ Describes when a WriteBuffer pushes its pending rows to disk.
+
+    :param maxRows: flush once this many rows are pending. A value of 1 writes every row immediately.
+    :param maxAge: flush once the oldest pending row has waited this many seconds.
+    :param fsync: call os.fsync after every flush, so rows survive a power loss and not only a process crash.
+    """
+    def __init__(self, maxRows=DEFAULT_FLUSH_ROWS, maxAge=DEFAULT_FLUSH_AGE, fsync=False):
+        self.maxRows = max(int(maxRows), 1)
+        self.maxAge = float(maxAge)
+        self.fsync = bool(fsync)
+
+    def toDict(self):
+        return {'maxRows': self.maxRows, 'maxAge': self.maxAge, 'fsync': self.fsync}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.toDict()})"
+
+    @staticmethod
+    def fromDef(policyDef):
+        """Create a FlushPolicy from either an existing FlushPolicy, a dictionary of kwargs, or None (default policy)."""
+        if isinstance(policyDef, FlushPolicy):
+            return policyDef
+        if policyDef is None:
+            return FlushPolicy()
+        return FlushPolicy(**policyDef)
+
+
+UNBUFFERED = FlushPolicy(maxRows=1, maxAge=0)
+DURABLE = FlushPolicy(maxRows=1, maxAge=0, fsync=True)
+
+"""
+Default durability for each channel type. High rate channels (data, logs) are batched, while low rate channels that
+record what the operators did (events, commands, responses) are written and fsynced row by row. Any channel type not in
+this map is written unbuffered. The Directory Archiver can override these per channel type with its flushPolicies kwarg.
+"""
+DEFAULT_FLUSH_POLICIES = {
+    ChannelType.Data: FlushPolicy(),
+    ChannelType.Log: FlushPolicy(),
+    ChannelType.Event: DURABLE,
+    ChannelType.Command: DURABLE,
+    ChannelType.Response: DURABLE,
+}
+
+
+class WriteBuffer():
+    """ An append only file that stays open and batches rows according to a FlushPolicy.
+
+    The file is opened lazily on the first flush and may be closed and reopened any number of times. Text is translated
+    and encoded the same way that open(path, 'a') would, so files written with a buffer are identical to files written
+    with print. Not thread safe on its own; the owning formatter is expected to hold its lock while using the buffer.
+
+    :param newline: same meaning as the open() argument; '' writes newlines untranslated, None translates to os.linesep.
+    """
+    def __init__(self, path, flushPolicy=None, newline=None):
+        self.path = path
+        self.flushPolicy = FlushPolicy.fromDef(flushPolicy)
+        self.newline = os.linesep if newline is None else newline
+        self._flo = None
+        self._pending = []
+        self._pendingBytes = 0
+        self._oldestPending = None
+        self._flushedSize = None
+
+    def _open(self):
+        if self._flo is None:
+            self._flo = open(self.path, 'ab')
+            self._flushedSize = self._flo.seek(0, os.SEEK_END)
+
+    def setPath(self, path):
+        if not path == self.path:
+            self.close()
+            self.path = path
+            self._flushedSize = None
+
+    def isOpen(self):
+        return not self._flo is None
+
+    def pending(self):
+        return len(self._pending)
+
+    def tell(self):
+        """Offset in bytes at which the next written row will start, including rows that have not been flushed yet."""
+        if self._flushedSize is None:
+            self._flushedSize = os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+        return self._flushedSize + self._pendingBytes
+
+    def write(self, text):
+        """Append text (translated and encoded like a text mode file) or bytes (written as is)."""
+        if type(text) is bytes:
+            data = text
+        else:
+            if self.newline and not self.newline == '\n':
+                text = text.replace('\n', self.newline)
+            data = text.encode(FILE_ENCODING)
+        if not self._pending:
+            self._oldestPending = time.monotonic()
+        self._pending.append(data)
+        self._pendingBytes += len(data)
+        if self.isDue():
+            self.flush()
+
+    def isDue(self, now=None):
+        if not self._pending:
+            return False
+        if len(self._pending) >= self.flushPolicy.maxRows:
+            return True
+        if now is None:
+            now = time.monotonic()
+        return now - self._oldestPending >= self.flushPolicy.maxAge
+
+    def flush(self, force=True):
+        """Write all pending rows to disk. If force is False, only write them if the flush policy says they are due."""
+        if not self._pending or not (force or self.isDue()):
+            return
+        self.tell() # make sure the flushed size is known before the pending rows are cleared.
+        self._open()
+        self._flo.write(b''.join(self._pending))
+        self._flo.flush()
+        if self.flushPolicy.fsync:
+            os.fsync(self._flo.fileno())
+        self._flushedSize += self._pendingBytes
+        self._pending = []
+        self._pendingBytes = 0
+        self._oldestPending = None
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._flo:
+                self._flo.close()
+                self._flo = None
+
+
 def toConverterVect(metadata):
     # TODO: assign a default if the value doesn't exist in the metadata keys vector
     mdKeys = metadata.keys()
@@ -52,6 +205,103 @@ def toConverterVect(metadata):
         return list(map(lambda x: METADATA_TYPE_MAP[x], mdVals))
 
 
+COLUMN_DECODER = 'columns'
+ROW_DECODER = 'rows'
+DECODE_CHUNK_ROWS = 100000 # rows parsed at a time by the column decoder.
+READ_CHUNK_ROWS = 100000 # rows in each chunk yielded by iterRead.
+# numpy dtype that the column decoder parses each converter type into. Other converters are applied to the raw strings.
+DECODER_DTYPES = {
+    int: 'int64',
+    float: 'float64',
+    str: object
+}
+
+
+class ColumnReading(Sequence):
+    """ The rows of a read, stored as numpy columns.
+
+    Behaves as a list of row dicts ({fieldName: value}), but the dicts are only built when they are accessed, so
+    callers that work on whole columns (column(), toDF()) never pay for them.
+    """
+    def __init__(self, columns, fieldNames=None):
+        self.fieldNames = list(fieldNames) if fieldNames else list(columns.keys())
+        self.columns = columns
+        self._lists = None
+
+    def _getLists(self):
+        if self._lists is None:
+            self._lists = [self.columns[fieldName].tolist() for fieldName in self.fieldNames]
+        return self._lists
+
+    def __len__(self):
+        if not self.fieldNames:
+            return 0
+        return len(self.columns[self.fieldNames[0]])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ColumnReading({fieldName: col[item] for fieldName, col in self.columns.items()}, self.fieldNames)
+        return dict(zip(self.fieldNames, (values[item] for values in self._getLists())))
+
+    def __iter__(self):
+        fieldNames = self.fieldNames
+        for row in zip(*self._getLists()):
+            yield dict(zip(fieldNames, row))
+
+    def __eq__(self, other):
+        if isinstance(other, (ColumnReading, list)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'ColumnReading({len(self)} rows of {self.fieldNames})'
+
+    def column(self, fieldName):
+        return self.columns[fieldName]
+
+    def toList(self):
+        return list(self)
+
+    def toDF(self):
+        return pd.DataFrame(self.columns, columns=self.fieldNames)
+
+    @staticmethod
+    def concat(readings):
+        """Join ColumnReadings with the same fields into one."""
+        if len(readings) == 1:
+            return readings[0]
+        fieldNames = readings[0].fieldNames
+        return ColumnReading({fieldName: np.concatenate([reading.columns[fieldName] for reading in readings])
+                              for fieldName in fieldNames}, fieldNames)
+
+
+def rechunk(pieces, chunkSize=READ_CHUNK_ROWS):
+    """ Regroup an iterable of readings (ColumnReadings, DataFrames or lists of row dicts) into readings of chunkSize
+    rows. Only the last one may be shorter, or one before a change in the type of reading."""
+    pending, pendingRows = [], 0
+    def join(pending):
+        if isinstance(pending[0], pd.DataFrame):
+            return pending[0] if len(pending) == 1 else pd.concat(pending, ignore_index=True)
+        if isinstance(pending[0], ColumnReading):
+            return ColumnReading.concat(pending)
+        return [row for piece in pending for row in piece]
+    for piece in pieces:
+        if pending and not type(piece) is type(pending[0]):
+            yield join(pending)
+            pending, pendingRows = [], 0
+        start = 0
+        while start < len(piece):
+            stop = start + min(chunkSize - pendingRows, len(piece) - start)
+            pending.append(piece.iloc[start:stop] if isinstance(piece, pd.DataFrame) else piece[start:stop])
+            pendingRows += stop - start
+            start = stop
+            if pendingRows >= chunkSize:
+                yield join(pending)
+                pending, pendingRows = [], 0
+    if pending:
+        yield join(pending)
+
+
 # note: metadata is really only used for CSV formatter, to define the fields when writing.
 class Formatter(ABC):
 
@@ -90,18 +340,55 @@ class Formatter(ABC):
     def setPath(self, path):
         self.path=path
 
-    def importPath(self, channelIO, channelType, readOnly, timestamp, path=None):
-        if path and os.path.exists(path):
+    def flush(self, force=True):
+        """Push any buffered rows to disk. If force is False, only rows that are due per the flush policy are written."""
+        pass
+
+    def importFlushPolicy(self, channelIO, channelType, flushPolicy=None):
+        if not flushPolicy is None:
+            return FlushPolicy.fromDef(flushPolicy)
+        if cu.isChannelIO(channelIO):
+            return channelIO.getFlushPolicy(channelType)
+        return DEFAULT_FLUSH_POLICIES.get(channelType, UNBUFFERED)
+
+    def writeRows(self, rows):
+        """Write several rows. Formatters that can write a list of rows under one lock acquisition override this."""
+        for row in rows:
+            self.writeRow(row)
+
+    def writeBlock(self, block):
+        """Write the samples of a BlockPayload. Formatters that store columns override this to skip the rows."""
+        self.writeRows(block.rows())
+
+    def timeSpan(self, path=None):
+        """Return the (first, last) timestamps of the rows in the file, or (None, None) if they are not known."""
+        return None, None
+
+    def iterRead(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, chunkSize=READ_CHUNK_ROWS, asDF=False, path=None):
+        """ Yield the rows between minTS and maxTS in chunks of chunkSize rows.
+
+        Formatters of data files override this to only hold one chunk in memory at a time. By default, the whole read
+        is done at once and then split up.
+        """
+        reading = self.read(minTS, maxTS, path=path)
+        if isinstance(reading, (list, ColumnReading)):
+            yield from rechunk([reading], chunkSize)
+        elif reading:
+            yield reading
+
+    def importPath(self, channelIO, channelType, readOnly, timestamp, path=None, ext=None):
+        if path and segmentExists(path):
             absPath = path
         elif cu.isChannelIO(channelIO):
-            absPath = channelIO.newAbsolutePath(channelType, timestamp=timestamp, create=not (readOnly))
+            absPath = channelIO.newAbsolutePath(channelType, timestamp=timestamp, create=not (readOnly), ext=ext)
         else:
             absPath = None
         return absPath
 
 class IndexedCSVFormatter(Formatter):
-    def __init__(self, name, channelType, metadata, channelIO, idxLimit=DEFAULT_IDXLIMIT, readOnly = False, timestamp=None, path=None, idxCsvPath=None, **kwargs):
+    def __init__(self, name, channelType, metadata, channelIO, idxLimit=DEFAULT_IDXLIMIT, readOnly = False, timestamp=None, path=None, idxCsvPath=None, flushPolicy=None, decoder=COLUMN_DECODER, **kwargs):
         self.name = name
+        self.decoder = decoder
         self.idxName = name + "Idx"
         self.handleMetadata(metadata)
         self.idxKeys = IDX_METADATA.keys()
@@ -112,14 +399,21 @@ class IndexedCSVFormatter(Formatter):
 
         self.csvPath, self.idxPath = self.importPaths(channelType, timestamp, readOnly, path, idxCsvPath)
         self.lock = RLock()
+        self._idxCache = {} # {idxPath: (size, timestamps, offsets)}, reloaded when the index grows.
 
         self.readOnly = readOnly
+        self.flushPolicy = self.importFlushPolicy(channelIO, channelType, flushPolicy)
+        # the csv and idx files are kept open for the lifetime of the formatter, and closed when the manifest record ends.
+        self.csvBuffer = WriteBuffer(self.csvPath, self.flushPolicy)
+        self.idxBuffer = WriteBuffer(self.idxPath, self.flushPolicy)
 
         if not self.readOnly:
             self.writeHeaders()
 
     def setPath(self, path):
-        self.csvPath = path
+        with self.lock:
+            self.csvPath = path
+            self.csvBuffer.setPath(path)
 
     def importPaths(self, channelType, timestamp, readOnly, path=None, idxCsvPath=None):
         csvPath = self.importPath(self.channelIO, channelType, readOnly, timestamp, path)
@@ -181,9 +475,11 @@ class IndexedCSVFormatter(Formatter):
 
     def delete(self):
         with self.lock:
+            self.csvBuffer.close()
+            self.idxBuffer.close()
             if os.path.exists(self.csvPath) and not self.readOnly:
                 os.remove(self.csvPath)
-            if os.path.exists(self.csvPath) and not self.readOnly:
+            if os.path.exists(self.idxPath) and not self.readOnly:
                 os.remove(self.idxPath)
 
     def ext(self):
@@ -192,33 +488,89 @@ class IndexedCSVFormatter(Formatter):
     def writeRow(self, d):
         with self.lock:
             if not self.readOnly:
-                with open(self.csvPath, "a") as csvFLO:
-                    prevOffset = csvFLO.tell()
-                    keylist = list(self.csvKeys)
-                    # TODO: Change this to work with partially complete data readings.
-                    try:
-                        if type(d) is list:
-                            for singleRow in d:
-                                self.writeRow(singleRow)
-                        else:
-                            row = ",".join(map(lambda x: str(d[x]), keylist))
-                            print(row, file=csvFLO)
-                            csvFLO.flush()
-                    except Exception as e:
-                        logging.debug("Error in CSV Indexer writerow: {}. "
-                                      "\n\trow to write: {}".format(e, d))
+                if type(d) is list:
+                    for singleRow in d:
+                        self.writeRow(singleRow)
+                    return
+                prevOffset = self.csvBuffer.tell()
+                # TODO: Change this to work with partially complete data readings.
+                try:
+                    row = ",".join(map(lambda x: str(d[x]), self.csvKeys))
+                    self.csvBuffer.write(row + '\n')
+                except Exception as e:
+                    logging.debug("Error in CSV Indexer writerow: {}. "
+                                  "\n\trow to write: {}".format(e, d))
+                    return
 
                 self.idxCount += 1
                 if (self.idxCount % self.idxLimit) == 0:
                     idxDat = {'timestamp': d['timestamp'], 'offset': prevOffset, 'count': self.idxCount}
                     row = ",".join(map(lambda x: str(idxDat[x]), self.idxKeys))
-                    with open(self.idxPath, "a") as idxFLO:
-                        print(row, file=idxFLO)
-                        idxFLO.flush()
+                    # flush the csv first so an index record never points past the end of the csv on disk.
+                    self.csvBuffer.flush()
+                    self.idxBuffer.write(row + '\n')
                     logging.debug("channel: {}, index record: {}".format(self.name, row))
 
+    def writeRows(self, rows):
+        self.writeRow(list(rows))
+
+    def flush(self, force=True):
+        with self.lock:
+            if force or self.csvBuffer.isDue() or self.idxBuffer.isDue():
+                self.csvBuffer.flush()
+                self.idxBuffer.flush()
+
     def close(self):
-        pass
+        with self.lock:
+            self.csvBuffer.close()
+            self.idxBuffer.close()
+
+    def timeSpan(self, path=None):
+        """ Return the (first, last) timestamps of the rows in the csv, or (None, None) if it has none.
+
+        Only the start and the end of the file are read. Header rows are told apart from rows by their timestamp field,
+        which is not a number.
+        """
+        with self.lock:
+            self.flush()
+            csvPath = path if path else self.csvPath
+            if not csvPath or not segmentExists(csvPath):
+                return None, None
+            with openSegment(csvPath, 'rb') as csvFile:
+                header = csvFile.readline().decode(FILE_ENCODING).strip().split(',')
+                if not 'timestamp' in header:
+                    return None, None
+                tsCol = header.index('timestamp')
+                def rowTS(line):
+                    fields = line.decode(FILE_ENCODING).strip().split(',')
+                    if not len(fields) == len(header):
+                        return None
+                    try:
+                        return float(fields[tsCol])
+                    except ValueError:
+                        return None
+                first = None
+                for line in csvFile:
+                    first = rowTS(line)
+                    if first is not None:
+                        break
+                if first is None:
+                    return None, None
+                size = csvFile.seek(0, os.SEEK_END)
+                window = TAIL_READ_BYTES
+                while True:
+                    start = max(0, size - window)
+                    csvFile.seek(start)
+                    lines = csvFile.read().split(b'\n')
+                    if start:
+                        lines = lines[1:] # the read began part way through a line.
+                    for line in reversed(lines):
+                        last = rowTS(line)
+                        if last is not None:
+                            return first, last
+                    if not start:
+                        return first, first
+                    window *= 4
 
     def _trimHeaders(self, sFile):
         firstRow = sFile.readline()
@@ -227,32 +579,129 @@ class IndexedCSVFormatter(Formatter):
             removeRows.append(sFile.readline())
         return firstRow, removeRows
 
-    def read(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, path=None, asDF=False, asDask=False):
+    def _getIdxPath(self, csvPath):
+        """Return the path of the index written alongside csvPath, or None if there isn't one."""
+        if csvPath == self.csvPath and self.idxPath and os.path.exists(self.idxPath):
+            return self.idxPath
+        idxPath = os.path.splitext(csvPath)[0] + CHANNEL_IDX_EXT
+        if os.path.exists(idxPath):
+            return idxPath
+        return None
+
+    def _readIndex(self, idxPath):
+        """Return the (timestamps, offsets) of an index file, cached until the index grows."""
+        idxSize = os.path.getsize(idxPath)
+        cached = self._idxCache.get(idxPath)
+        if cached and cached[0] == idxSize:
+            return cached[1], cached[2]
+        timestamps, offsets = [], []
+        with open(idxPath, 'r') as idxFile:
+            rdr = csv.DictReader(idxFile)
+            for line in rdr:
+                try:
+                    timestamps.append(float(line['timestamp']))
+                    offsets.append(int(line['offset']))
+                except (TypeError, ValueError):
+                    continue # partially written index record.
+        self._idxCache[idxPath] = (idxSize, timestamps, offsets)
+        return timestamps, offsets
+
+    def _indexWindow(self, csvPath, header, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """ Use the index to find the byte window of csvPath that holds the rows between minTS and maxTS.
+
+        The window starts at the last indexed row before minTS and ends at the first indexed row after maxTS, so the
+        rows in it still need to be filtered by timestamp. Returns (None, None) if there is no usable index, in which
+        case the whole file must be scanned.
+
+        :return: (startOffset, endOffset), where endOffset is None if the window runs to the end of the file.
+        """
+        if minTS <= MIN_EPOCH and maxTS >= MAX_EPOCH:
+            return None, None
+        idxPath = self._getIdxPath(csvPath)
+        if not idxPath or not 'timestamp' in header:
+            return None, None
+        try:
+            timestamps, offsets = self._readIndex(idxPath)
+        except Exception as e:
+            logging.debug(f'Could not read index {idxPath}, reading {csvPath} without it: {e}')
+            return None, None
+        if not timestamps:
+            return None, None
+        startPos = bisect.bisect_left(timestamps, minTS) - 1
+        endPos = bisect.bisect_right(timestamps, maxTS)
+        start = offsets[startPos] if startPos >= 0 else None
+        end = offsets[endPos] if endPos < len(offsets) else None
+        # make sure the index belongs to this file. A stale or foreign index falls back to a full scan.
+        tsCol = header.index('timestamp')
+        with openSegment(csvPath, 'rb') as csvFile:
+            for pos in {startPos, endPos}:
+                if 0 <= pos < len(offsets):
+                    csvFile.seek(offsets[pos])
+                    fields = csvFile.readline().decode(FILE_ENCODING).strip().split(',')
+                    try:
+                        if not float(fields[tsCol]) == timestamps[pos]:
+                            return None, None
+                    except (IndexError, ValueError):
+                        return None, None
+        return start, end
+
+    def _readWindowDF(self, csvPath, header, skipRows, start, end, minTS, maxTS):
+        """Read only the byte window [start, end) of the csv into a DataFrame, trimmed to minTS/maxTS."""
+        with openSegment(csvPath, 'rb') as csvFile:
+            if start is None:
+                # window begins at the first row: skip the field names and added header rows.
+                csvFile.readline()
+                for i in range(0, skipRows):
+                    csvFile.readline()
+            else:
+                csvFile.seek(start)
+            window = csvFile.read() if end is None else csvFile.read(end - csvFile.tell())
+        if not window.strip():
+            return pd.DataFrame(columns=header)
+        df = pd.read_csv(io.BytesIO(window), header=None, names=header, encoding=FILE_ENCODING)
+        return df[(df['timestamp'] >= minTS) & (df['timestamp'] <= maxTS)].reset_index(drop=True)
+
+    def read(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, path=None, asDF=False, asDask=False, decoder=None):
+        """ Read the rows between minTS and maxTS.
+
+        :param decoder: COLUMN_DECODER (default) decodes blocks of rows into numpy columns and returns a ColumnReading,
+            ROW_DECODER converts one row at a time and returns a list of dicts. Ignored when asDF or asDask.
+        """
         with self.lock:
+            self.flush()
             if not path:
                 csvPath = self.csvPath
             else:
                 csvPath = path
-            if not os.path.exists(csvPath):
+            if not segmentExists(csvPath):
                 return []
 
             if asDF or asDask:
-                i=1
-                for fieldName, savedHeaderRow in self.addedHeaderRows.items():
-                    i+=1
-                l = [i for i in range(1,i+1)]
+                # skip the added header rows (type, units, etc) that follow the field names.
+                l = [i for i in range(1, len(self.addedHeaderRows) + 1)]
+                if minTS > MIN_EPOCH or maxTS < MAX_EPOCH:
+                    # only load the rows within the index window, rather than the whole file.
+                    with openSegment(csvPath, 'r') as sFile:
+                        header = sFile.readline().strip().split(',')
+                    if 'timestamp' in header:
+                        start, end = self._indexWindow(csvPath, header, minTS, maxTS)
+                        df = self._readWindowDF(csvPath, header, len(l), start, end, minTS, maxTS)
+                        if asDask:
+                            return dd.from_pandas(df, chunksize=DASK_WINDOW_ROWS)
+                        return df
                 if asDF:
-                    df = pd.read_csv(csvPath, skiprows=l)
+                    # a compressed file is a plain gzip file to pandas.
+                    df = pd.read_csv(segmentPath(csvPath), skiprows=l)
                     return df
                 if asDask:
                     # df = dd.read_csv(csvPath, skiprows=l)
-                    df = dd.read_csv(csvPath, skiprows=l, sample=8192000) # added to try to get around following issue:
+                    # gzip files can not be split into partitions, so a compressed file is read as one.
+                    blocksize = 'default' if segmentPath(csvPath) == csvPath else None
+                    df = dd.read_csv(segmentPath(csvPath), skiprows=l, sample=8192000, blocksize=blocksize) # added to try to get around following issue:
                     # ValueError: Mismatched dtypes found in `pd.read_csv`/`pd.read_table`. Seems that increasing sample size helps.
                     return df
             else:
-                with open(csvPath, "r") as sFile:
-                    retList = []
-
+                with openSegment(csvPath, "r") as sFile:
                     # remove the first row, the 'header'
                     row, additionalHeaders = self._trimHeaders(sFile)
                     header = list(row.strip().split(','))
@@ -262,54 +711,503 @@ class IndexedCSVFormatter(Formatter):
                     for singleItem in header:
                         if not singleItem in normMD.keys():
                             normMD[singleItem] = {'type':str} # default reading is string if there is no more information.
-                    # for singleName, md in self.metadata.items():
-                    #     if not singleName in header:
-                    #         normMD.pop(singleName)
-                    csvKeys = normMD.keys()
+                    csvKeys = list(normMD.keys())
                     csvConverterVect = toConverterVect(normMD)
 
-                    row = sFile.readline() # get the first non header row.
-                    while row:
-                        fields = row.strip().split(',')
+                    start, end = None, None
+                    if 'timestamp' in header:
+                        start, end = self._indexWindow(csvPath, header, minTS, maxTS)
+                        if start is not None:
+                            sFile.seek(start) # skip straight to the last indexed row before minTS.
+
+                    if decoder is None:
+                        decoder = self.decoder
+                    if decoder == COLUMN_DECODER and sorted(header) == sorted(csvKeys) and 'timestamp' in header:
                         try:
-                            if len(fields) == len(csvKeys):
-                                combined = dict(zip(header, fields))
-                                orderedFields = list(combined.get(csvKey,'') for csvKey in csvKeys)
-                                outRow = dict(zip(csvKeys, map(lambda x: x[0](x[1]), zip(csvConverterVect, orderedFields))))
-                                ts = outRow['timestamp']
-                                if ts < minTS:
-                                    pass
-                                elif ts > maxTS:
-                                    break
-                                else:
-                                    retList.append(outRow)
-                                # TODO: Speak with code writer about intent of the following lines of code.
-                            # if not path:
-                            #     outRow = dict(zip(self.csvKeys, map(lambda x: x[0](x[1]), zip(self.csvConverterVect, fields))))
-                            #     ts = outRow['timestamp']
-                            #     if ts < minTS:
-                            #         continue
-                            #     if ts > maxTS:
-                            #         break
-                            # else:
-                            #     outRow = dict(zip(header, fields))
+                            source = sFile
+                            if end is not None:
+                                # only the rows up to the first indexed row after maxTS need to be parsed.
+                                with openSegment(csvPath, 'rb') as windowFile:
+                                    windowFile.seek(start if start is not None else 0)
+                                    if start is None:
+                                        for i in range(0, len(additionalHeaders) + 1):
+                                            windowFile.readline()
+                                    source = io.TextIOWrapper(io.BytesIO(windowFile.read(end - windowFile.tell())),
+                                                              encoding=FILE_ENCODING)
+                            return self._readColumns(source, header, csvKeys, csvConverterVect, minTS, maxTS)
                         except ValueError as e:
-                            # line is missing fields (IE trying to convert empty string to float/int/etc).
-                            logging.exception(e)
-                            pass
-                        except Exception as e:
-                            logging.exception(e)
-                        row = sFile.readline()
-                return retList
+                            # some rows are incomplete or do not match their types. Fall back to reading row by row,
+                            # which skips those rows.
+                            logging.debug(f'Could not decode {csvPath} by columns, reading by rows instead: {e}')
+                            sFile.seek(start if start is not None else 0)
+                            if start is None:
+                                self._trimHeaders(sFile)
+                    return self._readRows(sFile, header, csvKeys, csvConverterVect, minTS, maxTS)
+
+    def _iterColumns(self, sFile, header, csvKeys, csvConverterVect, minTS=MIN_EPOCH, maxTS=MAX_EPOCH,
+                     chunkRows=DECODE_CHUNK_ROWS):
+        """ Decode the rows of sFile (from its current position) in blocks of typed numpy columns.
+
+        Yields a ColumnReading per block of chunkRows rows that has rows between minTS and maxTS, and stops at the
+        first block that passes maxTS. Raises ValueError if a row can not be converted to its type.
+        """
+        dtypes = {}
+        for fieldName, converter in zip(csvKeys, csvConverterVect):
+            # bools and other converters are applied to the raw strings after parsing.
+            dtypes[fieldName] = DECODER_DTYPES.get(converter, object)
+        try:
+            # only 'nan' in float columns is missing data, other fields keep their text as the row converters would.
+            naValues = {fieldName: ['nan', 'NaN'] for fieldName, dtype in dtypes.items() if dtype == 'float64'}
+            reader = pd.read_csv(sFile, header=None, names=header, dtype=dtypes, keep_default_na=False,
+                                 na_values=naValues, chunksize=chunkRows, on_bad_lines='skip', engine='c',
+                                 float_precision='round_trip')
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for chunk in reader:
+                ts = chunk['timestamp'].to_numpy()
+                over = np.flatnonzero(ts > maxTS)
+                if over.size:
+                    chunk = chunk.iloc[:over[0]]
+                    ts = ts[:over[0]]
+                chunk = chunk[ts >= minTS]
+                if len(chunk):
+                    columns = {}
+                    for fieldName, converter in zip(csvKeys, csvConverterVect):
+                        col = chunk[fieldName].to_numpy()
+                        if not converter in DECODER_DTYPES:
+                            col = np.array([converter(val) for val in col], dtype=object)
+                        columns[fieldName] = col
+                    yield ColumnReading(columns, csvKeys)
+                if over.size:
+                    break
+
+    def _readColumns(self, sFile, header, csvKeys, csvConverterVect, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """ Decode the rows of sFile (from its current position) in blocks of typed numpy columns.
+
+        Stops at the first block that passes maxTS. Raises ValueError if a row can not be converted to its type.
+        :return: ColumnReading, which only builds row dicts when iterated.
+        """
+        blocks = list(self._iterColumns(sFile, header, csvKeys, csvConverterVect, minTS, maxTS))
+        if blocks:
+            return ColumnReading.concat(blocks)
+        return ColumnReading({fieldName: np.empty(0, dtype=DECODER_DTYPES.get(converter, object))
+                              for fieldName, converter in zip(csvKeys, csvConverterVect)}, csvKeys)
+
+    def _iterRows(self, sFile, header, csvKeys, csvConverterVect, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """Decode the rows of sFile (from its current position) one at a time, yielding a dict per row."""
+        row = sFile.readline() # get the first non header row.
+        while row:
+            fields = row.strip().split(',')
+            try:
+                if len(fields) == len(csvKeys):
+                    combined = dict(zip(header, fields))
+                    orderedFields = list(combined.get(csvKey,'') for csvKey in csvKeys)
+                    outRow = dict(zip(csvKeys, map(lambda x: x[0](x[1]), zip(csvConverterVect, orderedFields))))
+                    ts = outRow['timestamp']
+                    if ts < minTS:
+                        pass
+                    elif ts > maxTS:
+                        break
+                    else:
+                        yield outRow
+            except ValueError as e:
+                # line is missing fields (IE trying to convert empty string to float/int/etc).
+                logging.exception(e)
+                pass
+            except Exception as e:
+                logging.exception(e)
+            row = sFile.readline()
+
+    def _readRows(self, sFile, header, csvKeys, csvConverterVect, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """Decode the rows of sFile (from its current position) one at a time into a list of dicts."""
+        return list(self._iterRows(sFile, header, csvKeys, csvConverterVect, minTS, maxTS))
+
+    def iterRead(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, chunkSize=READ_CHUNK_ROWS, asDF=False, path=None):
+        """ Yield the rows between minTS and maxTS in chunks of chunkSize rows (the last may be shorter).
+
+        Only one chunk of the file is parsed at a time, so memory is bounded by the chunk size rather than the size of
+        the read. The rows are decoded as in read: ColumnReadings (or lists of row dicts, for files with rows that do
+        not match their types), or DataFrames if asDF. The formatter is not locked while iterating; rows written
+        meanwhile may or may not be included.
+        """
+        with self.lock:
+            self.flush()
+            csvPath = path if path else self.csvPath
+            if not csvPath or not segmentExists(csvPath):
+                return
+        yield from rechunk(self._iterPieces(csvPath, minTS, maxTS, chunkSize, asDF), chunkSize)
+
+    def _iterPieces(self, csvPath, minTS, maxTS, chunkSize, asDF):
+        with openSegment(csvPath, 'r') as sFile:
+            row, additionalHeaders = self._trimHeaders(sFile)
+            dataStart = sFile.tell()
+            header = list(row.strip().split(','))
+            if not 'timestamp' in header:
+                return
+            start, end = self._indexWindow(csvPath, header, minTS, maxTS)
+            if start is not None:
+                sFile.seek(start) # skip straight to the last indexed row before minTS.
+            else:
+                start = dataStart
+            if asDF:
+                with pd.read_csv(sFile, header=None, names=header, chunksize=chunkSize) as reader:
+                    for chunk in reader:
+                        ts = chunk['timestamp']
+                        yield chunk[(ts >= minTS) & (ts <= maxTS)].reset_index(drop=True)
+                        if (ts > maxTS).any():
+                            break
+                return
+
+            normMD = Metadata(**self.metadata)
+            for singleItem in header:
+                if not singleItem in normMD.keys():
+                    normMD[singleItem] = {'type':str} # default reading is string if there is no more information.
+            csvKeys = list(normMD.keys())
+            csvConverterVect = toConverterVect(normMD)
+            yielded = 0
+            if self.decoder == COLUMN_DECODER and sorted(header) == sorted(csvKeys):
+                try:
+                    for reading in self._iterColumns(sFile, header, csvKeys, csvConverterVect, minTS, maxTS, chunkSize):
+                        yielded += len(reading)
+                        yield reading
+                    return
+                except ValueError as e:
+                    # some rows do not match their types. Carry on row by row from the first row not yet yielded.
+                    logging.debug(f'Could not decode {csvPath} by columns, reading by rows instead: {e}')
+                    sFile.seek(start)
+            rows = self._iterRows(sFile, header, csvKeys, csvConverterVect, minTS, maxTS)
+            for i in range(0, yielded):
+                next(rows, None)
+            chunk = []
+            for outRow in rows:
+                chunk.append(outRow)
+                if len(chunk) >= chunkSize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+
+BLOCK_MAGIC = b'NPBLK1\n'
+BLOCK_HEADER = struct.Struct('<Qdd') # rows in block, first timestamp, last timestamp.
+BLOCK_IDX_METADATA = {'timestamp': 'float', 'endTimestamp': 'float', 'offset': 'int', 'count': 'int'}
+DEFAULT_STR_WIDTH = 64 # bytes given to each string field. Longer strings are truncated, at a character boundary.
+NUMPY_TYPE_MAP = {
+    int: '<i8',
+    float: '<f8',
+    bool: '?',
+    str: f'S{DEFAULT_STR_WIDTH}'
+}
+
+
+def fitUTF8(value, width):
+    """Encode value as utf-8 in at most width bytes, dropping whole characters from the end if it is longer."""
+    encoded = str(value).encode('utf-8')
+    if len(encoded) <= width:
+        return encoded
+    return encoded[:width].decode('utf-8', 'ignore').encode('utf-8')
+
+
+def toBlockSchema(metadata):
+    """ Convert metadata to a list of (fieldName, numpy dtype string), in field order."""
+    mdKeys = list(metadata.keys())
+    return list(zip(mdKeys, map(lambda x: NUMPY_TYPE_MAP.get(x, NUMPY_TYPE_MAP[str]), toConverterVect(metadata))))
+
+
+class NumpyBlockFormatter(Formatter):
+    """ A formatter that stores Data channel readings as typed, fixed width column blocks.
+
+    File layout (.npb):
+        BLOCK_MAGIC
+        one line of json: the schema, [[fieldName, numpy dtype], ...] taken from the metadata.
+        blocks, each being a BLOCK_HEADER followed by every column of the block in schema order (count values each).
+
+    A block is written every time the write buffer is flushed, according to the channel's flush policy. Alongside the
+    block file, an index (.blk.idx) records the time span, offset, and row count of every block, so reads only touch the
+    blocks that overlap the requested time range. Reads are a frombuffer per column; no text is parsed.
+    """
+    def __init__(self, name, channelType, metadata, channelIO, readOnly=False, timestamp=None, path=None,
+                 idxCsvPath=None, flushPolicy=None, **kwargs):
+        self.name = name
+        self.channelIO = channelIO
+        self.readOnly = readOnly
+        self.lock = RLock()
+        self.handleMetadata(metadata)
+        self.blockPath = self.importPath(channelIO, channelType, readOnly, timestamp, path, ext='.npb')
+        self.idxPath = self.importPath(channelIO, ChannelType.Index, readOnly, timestamp, idxCsvPath, ext=BLOCK_IDX_EXT)
+        if self.idxPath is None and self.blockPath:
+            self.idxPath = indexPath(self.blockPath)
+        self.flushPolicy = self.importFlushPolicy(channelIO, channelType, flushPolicy)
+        # rows are held here until the flush policy says they are due, then they are written as a single block.
+        self._pendingRows = []
+        self._oldestPending = None
+        # blocks are already batched, so the buffers write through, syncing to disk if the channel's policy asks to.
+        writeThrough = FlushPolicy(maxRows=1, maxAge=0, fsync=self.flushPolicy.fsync)
+        self.blockBuffer = WriteBuffer(self.blockPath, writeThrough)
+        self.idxBuffer = WriteBuffer(self.idxPath, writeThrough)
+        if not self.readOnly:
+            self.writeHeaders()
+
+    def handleMetadata(self, metadata=None):
+        if not type(metadata) is dict and not cu.isMetadata(metadata):
+            metadata = {}
+        self.metadata = Metadata(**metadata)
+        self.schema = toBlockSchema(self.metadata)
+        self.fieldNames = [fieldName for fieldName, dtype in self.schema]
+
+    def ext(self):
+        return 'npb'
+
+    def getPath(self):
+        return self.blockPath
+
+    def setPath(self, path):
+        with self.lock:
+            self.blockPath = path
+            self.blockBuffer.setPath(path)
+
+    def toDict(self):
+        d = {
+            'path': self.blockPath,
+            'metadata': self.metadata.toDict(),
+            'formatter': type(self).__name__
+        }
+        return d
+
+    def writeHeaders(self):
+        with self.lock:
+            if self.blockPath and isNew(self.blockPath, "a"):
+                with open(self.blockPath, 'wb') as blockFLO:
+                    blockFLO.write(BLOCK_MAGIC)
+                    blockFLO.write(json.dumps(self.schema).encode('utf-8') + b'\n')
+            if self.idxPath and isNew(self.idxPath, "a"):
+                with open(self.idxPath, "w") as idxFLO:
+                    print(",".join(BLOCK_IDX_METADATA.keys()), file=idxFLO)
+
+    def writeRow(self, d):
+        with self.lock:
+            if not self.readOnly:
+                if type(d) is list:
+                    for singleRow in d:
+                        self.writeRow(singleRow)
+                    return
+                try:
+                    row = tuple(d[fieldName] for fieldName in self.fieldNames)
+                except Exception as e:
+                    logging.debug(f"Error in block formatter writerow: {e}. \n\trow to write: {d}")
+                    return
+                if not self._pendingRows:
+                    self._oldestPending = time.monotonic()
+                self._pendingRows.append(row)
+                if len(self._pendingRows) >= self.flushPolicy.maxRows:
+                    self.flush()
+
+    def _isDue(self):
+        if not self._pendingRows:
+            return False
+        return len(self._pendingRows) >= self.flushPolicy.maxRows or \
+               time.monotonic() - self._oldestPending >= self.flushPolicy.maxAge
+
+    def _encodeBlock(self, columns):
+        arrays = []
+        for (fieldName, dtype), column in zip(self.schema, columns):
+            if dtype.startswith('S') and not getattr(column, 'dtype', None) == np.dtype(dtype):
+                width = np.dtype(dtype).itemsize
+                column = [fitUTF8(val, width) for val in column]
+            arrays.append(np.asarray(column, dtype=dtype))
+        count = len(arrays[0]) if arrays else 0
+        if 'timestamp' in self.fieldNames and count:
+            ts = arrays[self.fieldNames.index('timestamp')]
+            firstTS, lastTS = float(ts.min()), float(ts.max())
+        else:
+            firstTS, lastTS = float('nan'), float('nan')
+        header = BLOCK_HEADER.pack(count, firstTS, lastTS)
+        return header + b''.join(arr.tobytes() for arr in arrays), firstTS, lastTS, count
+
+    def _writeBlock(self, columns):
+        block, firstTS, lastTS, count = self._encodeBlock(columns)
+        if not count:
+            return
+        offset = self.blockBuffer.tell()
+        self.blockBuffer.write(block)
+        self.idxBuffer.write(f'{firstTS},{lastTS},{offset},{count}\n')
+
+    def writeColumns(self, columns):
+        """ Write whole columns ({fieldName: sequence}, IE a DataFrame) as one block, bypassing the row buffer.
+
+        Any pending rows are flushed first so that blocks stay in the order they were written."""
+        with self.lock:
+            if not self.readOnly:
+                self.flush()
+                self._writeBlock([columns[fieldName] for fieldName in self.fieldNames])
+
+    def writeRows(self, rows):
+        self.writeRow(list(rows))
+
+    def writeBlock(self, block):
+        """ Write the samples of a BlockPayload. A block of at least the flush policy's maxRows samples that has every
+        field of the schema is written as its own block, straight from its columns; others join the pending rows."""
+        if block.nSamples >= self.flushPolicy.maxRows and all(fieldName in block for fieldName in self.fieldNames):
+            self.writeColumns(block)
+        else:
+            self.writeRows(block.rows())
+
+    def flush(self, force=True):
+        with self.lock:
+            if self.readOnly or not self._pendingRows or not (force or self._isDue()):
+                return
+            rows = self._pendingRows
+            self._pendingRows = []
+            self._oldestPending = None
+            self._writeBlock(list(zip(*rows)))
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.blockBuffer.close()
+            self.idxBuffer.close()
+
+    def delete(self):
+        with self.lock:
+            self.blockBuffer.close()
+            self.idxBuffer.close()
+            self._pendingRows = []
+            if not self.readOnly:
+                for p in [self.blockPath, self.idxPath]:
+                    if p and os.path.exists(p):
+                        os.remove(p)
+
+    def _readSchema(self, blockFLO):
+        magic = blockFLO.readline()
+        if not magic == BLOCK_MAGIC:
+            raise ValueError(f'File {blockFLO.name} is not a block file.')
+        schema = json.loads(blockFLO.readline())
+        return schema, blockFLO.tell()
+
+    def _blockSpans(self, blockFLO, dataStart, idxPath):
+        """ Return [(firstTS, lastTS, offset, count)] of every block, from the index if it exists or the block headers if not."""
+        if idxPath and os.path.exists(idxPath) and os.path.getsize(idxPath):
+            idx = np.loadtxt(idxPath, delimiter=',', skiprows=1, ndmin=2)
+            return [(r[0], r[1], int(r[2]), int(r[3])) for r in idx]
+        spans = []
+        offset = dataStart
+        blockFLO.seek(0, os.SEEK_END)
+        fileEnd = blockFLO.tell()
+        while offset + BLOCK_HEADER.size <= fileEnd:
+            blockFLO.seek(offset)
+            count, firstTS, lastTS = BLOCK_HEADER.unpack(blockFLO.read(BLOCK_HEADER.size))
+            spans.append((firstTS, lastTS, offset, count))
+            offset = offset + BLOCK_HEADER.size + count * self._rowSize
+        return spans
+
+    def timeSpan(self, path=None):
+        """Return the (first, last) timestamps of the rows in the block file, from its index or block headers."""
+        with self.lock:
+            self.flush()
+            blockPath, idxPath = self._paths(path)
+            if not blockPath or not segmentExists(blockPath):
+                return None, None
+            with openSegment(blockPath, 'rb') as blockFLO:
+                schema, dataStart = self._readSchema(blockFLO)
+                self._rowSize = sum(np.dtype(dtype).itemsize for fieldName, dtype in schema)
+                spans = self._blockSpans(blockFLO, dataStart, idxPath)
+            if not spans:
+                return None, None
+            return float(min(span[0] for span in spans)), float(max(span[1] for span in spans))
+
+    def _iterBlocks(self, blockPath, idxPath, minTS=MIN_EPOCH, maxTS=MAX_EPOCH):
+        """ Yield ({fieldName: column}, names) for each block with rows between minTS and maxTS, trimmed to them.
+
+        The blocks to read are taken from the index (or headers) when iteration starts. Blocks written after that
+        are not read.
+        """
+        with openSegment(blockPath, 'rb') as blockFLO:
+            schema, dataStart = self._readSchema(blockFLO)
+            dtypes = [np.dtype(dtype) for fieldName, dtype in schema]
+            names = [fieldName for fieldName, dtype in schema]
+            rowSize = sum(dt.itemsize for dt in dtypes)
+            self._rowSize = rowSize
+            bounded = minTS > MIN_EPOCH or maxTS < MAX_EPOCH
+            for firstTS, lastTS, offset, count in self._blockSpans(blockFLO, dataStart, idxPath):
+                if lastTS < minTS or firstTS > maxTS:
+                    continue
+                blockFLO.seek(offset + BLOCK_HEADER.size)
+                raw = blockFLO.read(count * rowSize)
+                cols = {}
+                colStart = 0
+                for name, dt in zip(names, dtypes):
+                    cols[name] = np.frombuffer(raw, dtype=dt, count=count, offset=colStart)
+                    colStart += count * dt.itemsize
+                    if dt.kind == 'S':
+                        cols[name] = np.char.decode(cols[name], 'utf-8')
+                if 'timestamp' in cols and bounded:
+                    mask = (cols['timestamp'] >= minTS) & (cols['timestamp'] <= maxTS)
+                    cols = {name: col[mask] for name, col in cols.items()}
+                yield cols, names
+
+    def _paths(self, path=None):
+        blockPath = path if path else self.blockPath
+        idxPath = self.idxPath if (not path or path == self.blockPath) else indexPath(path)
+        return blockPath, idxPath
+
+    def read(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, path=None, asDF=False, asDask=False):
+        with self.lock:
+            self.flush()
+            blockPath, idxPath = self._paths(path)
+            if not blockPath or not segmentExists(blockPath):
+                return []
+            blocks = list(self._iterBlocks(blockPath, idxPath, minTS, maxTS))
+            if blocks:
+                names = blocks[0][1]
+                cols = {name: np.concatenate([block[name] for block, n in blocks]) for name in names}
+            else:
+                with openSegment(blockPath, 'rb') as blockFLO:
+                    schema, dataStart = self._readSchema(blockFLO)
+                names = [fieldName for fieldName, dtype in schema]
+                cols = {}
+                for name, dtype in schema:
+                    cols[name] = np.empty(0, dtype=dtype)
+                    if cols[name].dtype.kind == 'S':
+                        cols[name] = np.char.decode(cols[name], 'utf-8')
+            if asDF or asDask:
+                df = pd.DataFrame(cols, columns=names)
+                if asDask:
+                    return dd.from_pandas(df, npartitions=1)
+                return df
+            return ColumnReading(cols, names)
+
+    def iterRead(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, chunkSize=READ_CHUNK_ROWS, asDF=False, path=None):
+        """ Yield the rows between minTS and maxTS in chunks of chunkSize rows (the last may be shorter), as
+        ColumnReadings, or DataFrames if asDF. Blocks are read one at a time, without holding the formatter's lock."""
+        with self.lock:
+            self.flush()
+            blockPath, idxPath = self._paths(path)
+            if not blockPath or not segmentExists(blockPath):
+                return
+        def pieces():
+            for cols, names in self._iterBlocks(blockPath, idxPath, minTS, maxTS):
+                if asDF:
+                    yield pd.DataFrame(cols, columns=names)
+                else:
+                    yield ColumnReading(cols, names)
+        yield from rechunk(pieces(), chunkSize)
 
 
 class NullFormatter(Formatter):
-    def __init__(self, name, channelType, metadata, channelIO, readOnly = False, timestamp=None, path=None):
+    def __init__(self, name, channelType, metadata, channelIO, readOnly = False, timestamp=None, path=None, flushPolicy=None):
         self.metadata = metadata
         self.lock = RLock()
         self.readOnly = readOnly
         self.channelIO = channelIO
         self.path = self.importPath(self.channelIO, channelType, readOnly, timestamp, path)
+        self.flushPolicy = self.importFlushPolicy(channelIO, channelType, flushPolicy)
+        self.buffer = WriteBuffer(self.path, self.flushPolicy)
+
+    def setPath(self, path):
+        with self.lock:
+            self.path = path
+            self.buffer.setPath(path)
 
     def toDict(self):
         if cu.isMetadata(self.metadata):
@@ -331,31 +1229,37 @@ class NullFormatter(Formatter):
     def writeRow(self, d, newline=''):
         with self.lock:
             if not self.readOnly:
-                with open(self.path, "a") as flo:
-                    print(d, file=flo, end=newline)
+                self.buffer.write(f'{d}{newline}')
 
     def delete(self):
         with self.lock:
             if not self.readOnly:
+                self.buffer.close()
                 if os.path.exists(self.path):
                     os.remove(self.path)
 
+    def flush(self, force=True):
+        with self.lock:
+            self.buffer.flush(force)
+
     def close(self):
-        pass
+        with self.lock:
+            self.buffer.close()
 
     def read(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, path=None):
         with self.lock:
+            self.buffer.flush()
             if not path:
                 path = self.path
-            if os.path.exists(path):
-                with open(path, 'r') as flo:
+            if segmentExists(path):
+                with openSegment(path, 'r') as flo:
                     return flo.read()
 
 
 class LoggerFormatter(NullFormatter):
 
-    def __init__(self, name, channelType, metadata, channelIO, readOnly = False, timestamp=None, path=None):
-        NullFormatter.__init__(self, name, channelType, metadata, channelIO, readOnly=readOnly, timestamp=timestamp, path=path)
+    def __init__(self, name, channelType, metadata, channelIO, readOnly = False, timestamp=None, path=None, flushPolicy=None):
+        NullFormatter.__init__(self, name, channelType, metadata, channelIO, readOnly=readOnly, timestamp=timestamp, path=path, flushPolicy=flushPolicy)
 
     def writeRow(self, d, newline='\n'):
         if not self.readOnly:
@@ -394,10 +1298,12 @@ class JSONFormatter(Formatter):
         return self.ext
 
     def writeRow(self, d):
+        # serialize before touching the file, then swap it in whole so the file is never left half written.
+        flo = io.StringIO()
+        enc.restrictedJSONDump(d, flo, indent=4)
         with self.lock:
             if not self.readOnly:
-                with open(self.path, "w", newline="") as flo:
-                    enc.restrictedJSONDump(d, flo, indent=4)
+                fUtils.atomicWrite(self.path, flo.getvalue(), newline="")
 
     def close(self):
         pass
@@ -412,8 +1318,8 @@ class JSONFormatter(Formatter):
         with self.lock:
             if not path:
                 path = self.path
-            if os.path.exists(path):
-                with open(path, "r") as flo:
+            if segmentExists(path):
+                with openSegment(path, "r") as flo:
                     try:
                         pls = enc.restrictedJSONLoad(flo)
                         return pls
@@ -426,8 +1332,15 @@ class LineJSONFormatter(JSONFormatter):
     # Line formatter will write an object to a json file line by line, unprettyfied, and will save it with a corresponding
     # timestamp. restrictedJSONLoad/dump will honor the enums found in the Utils.Encoding SAFE_ENUMS dict.
     # TODO: Expand this functionality to handle other types of enums (dynamically?)
-    def __init__(self, name, channelType, metadata, channelIO, readOnly=False, timestamp=None, path=None):
+    def __init__(self, name, channelType, metadata, channelIO, readOnly=False, timestamp=None, path=None, flushPolicy=None):
         JSONFormatter.__init__(self, name, channelType, metadata, channelIO, readOnly=readOnly, timestamp=timestamp, path=path)
+        self.flushPolicy = self.importFlushPolicy(channelIO, channelType, flushPolicy)
+        self.buffer = WriteBuffer(self.path, self.flushPolicy, newline='')
+
+    def setPath(self, path):
+        with self.lock:
+            self.path = path
+            self.buffer.setPath(path)
 
     def writeRow(self, j, ts=None):
         with self.lock:
@@ -438,17 +1351,32 @@ class LineJSONFormatter(JSONFormatter):
                     else:
                         ts = tu.nowEpoch()
                 tsDict = {'ts':ts, 'j':j}
-                with open(self.path, 'a', newline='') as flo:
-                    enc.restrictedJSONDump(tsDict, flo)
+                self.buffer.write(enc.restrictedJSONDumps(tsDict) + '\n')
+
+    def flush(self, force=True):
+        with self.lock:
+            self.buffer.flush(force)
+
+    def close(self):
+        with self.lock:
+            self.buffer.close()
+
+    def delete(self):
+        with self.lock:
+            if not self.readOnly:
+                self.buffer.close()
+                if os.path.exists(self.path):
+                    os.remove(self.path)
 
     def read(self, minTS=MIN_EPOCH, maxTS=MAX_EPOCH, path=None):
         # TODO: Honor mints/maxts. Maybe not read all the lines?
         # TODO: Think about returning a generator object for streaming type DATA
         with self.lock:
+            self.buffer.flush()
             if not path:
                 path = self.path
-            if os.path.exists(path):
-                with open(path, 'r', newline='') as flo:
+            if segmentExists(path):
+                with openSegment(path, 'r', newline='') as flo:
                     lines = flo.readlines()
                     corrLines = []
                     for line in lines:
@@ -458,4 +1386,9 @@ class LineJSONFormatter(JSONFormatter):
                         if minTS <= ts and maxTS >= ts:
                             corrLines.append(j)
                     return corrLines
-            return None
\ No newline at end of file
+            return None
+
+
+# formatter classes by name, used to restore the formatter of a manifest record from its saved configuration.
+FORMATTERS = {fmtClass.__name__: fmtClass for fmtClass in [IndexedCSVFormatter, NumpyBlockFormatter, NullFormatter,
+                                                          LoggerFormatter, JSONFormatter, LineJSONFormatter]}
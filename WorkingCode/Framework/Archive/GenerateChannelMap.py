@@ -2,9 +2,12 @@ import csv
 import json
 import os
 
+from Framework.Archive.ColdStorage import plainName, segmentExists
 from Framework.BaseClasses.Channels import ChannelType as ct
 from Utils import TimeUtils as tu
 
+# formatters of files that are not written with the default formatter of their channel type.
+extFormatters = {'.npb': 'NumpyBlockFormatter'}
 folderKeys = {ct.Data: 'data', ct.Event: 'events', ct.Metadata: 'metadata', ct.Config:'config', ct.Command:'commands', ct.Log:'logs', ct.Manifest: "manifests"}
 
 def mdFromManifest(manifestPath, metadataPath, longChannel):
@@ -45,7 +48,7 @@ def manifestsExist(archivePath):
 def preExistingChanMap(archivePath):
     raise NotImplementedError
 
-def addLineToManifest(manList, md, fileName, startTS):
+def addLineToManifest(manList, md, fileName, startTS, formatter=None):
     startDate, startTime = tu.EpochtoDT(startTS).strftime('%m/%d/%Y-%H:%M:%S').split('-')
     if len(manList) > 0:
         recentRec = manList[-1]
@@ -59,9 +62,27 @@ def addLineToManifest(manList, md, fileName, startTS):
              "metadata": md,
              "path": fileName
          }}
+    if formatter:
+        rec['Formatter']['formatter'] = formatter
     manList.append(rec)
 
 
+def parseFileName(longChannel, default=tu.MIN_EPOCH):
+    """ Split a file name (without extension) into the channel name and the timestamp the file was started at, IE
+    'MET-1.LJ-1_1581316070' -> ('MET-1.LJ-1', 1581316070.0). Returns (longChannel, default) if there is no timestamp."""
+    try:
+        # parse the channel name from the file name, using "_" as the separator. Expecting timestamp to be the last value.
+        chanPieces = longChannel.split('_')
+        startTS = chanPieces[-1]
+        chanPieces.remove(startTS)
+        startTS = float(startTS)
+        channelName = "_".join(chanPieces)
+    except ValueError:
+        # no timestamp is on this file.
+        channelName = longChannel
+        startTS = default
+    return channelName, startTS
+
 def makeMapFromFiles(archivePath):
     archStart = tu.MIN_EPOCH
     folderTypes = {k: {"name": folderKeys[k], 'path': os.path.join(os.path.abspath(os.path.join(archivePath, folderKeys[k])))} for k in folderKeys}
@@ -70,23 +91,16 @@ def makeMapFromFiles(archivePath):
 
     for channelType, channelFolder in folderTypes.items():
         folderPath = channelFolder['path']
-        for file in os.listdir(folderPath):
+        # compressed files are listed under the name of the file they hold.
+        for file in sorted(set(filter(None, map(plainName, os.listdir(folderPath))))):
             fileName = os.path.join(folderPath, file)
             longChannel, ext = os.path.splitext(file)
             if "idx" in ext:
                 continue # skip any file extensions with "idx" in them.
+            if ext == '.csv' and segmentExists(os.path.join(folderPath, longChannel + '.npb')):
+                continue # the csv was converted to a block file, which is read instead.
 
-            try:
-                # parse the channel name from the file name, using "_" as the separator. Expecting timestamp to be the last value.
-                chanPieces = longChannel.split('_')
-                startTS = chanPieces[-1]
-                chanPieces.remove(startTS)
-                startTS = float(startTS)
-                channelName = "_".join(chanPieces)
-            except ValueError:
-                # no timestamp is on this file.
-                channelName = longChannel
-                startTS = archStart
+            channelName, startTS = parseFileName(longChannel, archStart)
 
             if not channelName in channelMap:
                 channelMap[channelName] = {"channelName": channelName, "typeMap": {}}
@@ -101,7 +115,7 @@ def makeMapFromFiles(archivePath):
 
             metadataPath = folderTypes[ct.Metadata]['path']
             mdFilepath, md = mdFromFile(metadataPath, longChannel)
-            addLineToManifest(tMap[channelType]['manifest']['_manifest'], md, fileName, startTS)
+            addLineToManifest(tMap[channelType]['manifest']['_manifest'], md, fileName, startTS, extFormatters.get(ext))
     return channelMap
 
 def getChannelMap(archivePath):
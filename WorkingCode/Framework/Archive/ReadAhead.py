@@ -0,0 +1,72 @@
+import queue
+import threading
+
+"""
+.. _read-ahead:
+
+#################
+Read Ahead
+#################
+
+Runs a chunked read (IE ChannelIO.iterRead) on its own thread, keeping up to depth chunks ready ahead of the caller.
+The caller processes one chunk while the next ones are read from disk, and memory stays bounded by depth chunks.
+"""
+
+DEFAULT_PREFETCH = 2 # chunks read ahead of the caller.
+PUT_WAIT = .5 # seconds the reader waits on a full queue before checking if the caller stopped iterating.
+
+_DONE = object()
+
+
+class _Failure():
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def readAhead(iterable, depth=DEFAULT_PREFETCH, name='read-ahead'):
+    """ Iterate over iterable, with its items produced on a separate thread up to depth items ahead.
+
+    Exceptions raised by iterable are raised to the caller when it reaches them. If the caller stops early (breaks or
+    closes the generator), the reading thread stops at its next item. A depth of 0 or less iterates in the calling
+    thread, without reading ahead.
+    """
+    if not depth or depth <= 0:
+        yield from iterable
+        return
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PUT_WAIT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close and stopped.is_set():
+                close()
+
+    reader = threading.Thread(target=produce, name=name, daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,250 @@
+import logging
+import threading
+import time
+from collections import deque
+
+"""
+.. _write-behind:
+
+#################
+Write Behind
+#################
+
+Queues packages per channel so that the thread handing packages to an archiver does not wait on the disk. Each channel
+queue is drained by exactly one writer thread (channels are assigned to the writers in turn as they are first seen),
+which keeps the rows of a channel in order without needing a lock per channel. A writer takes everything pending on a
+channel, up to maxBatch packages, and hands it to the archiver as one batch.
+"""
+
+DEFAULT_WRITERS = 2
+DEFAULT_MAX_BATCH = 1000 # packages taken from a channel queue in one batch.
+WRITER_IDLE_WAIT = 1 # seconds a writer waits for new packages before checking if it should stop.
+
+
+class ChannelQueue():
+    """ Pending packages of one channel, and the counters used to monitor it.
+
+    Packages are kept in a deque, whose append and popleft are atomic, so putting a package never takes a lock.
+    """
+    def __init__(self, name, maxDepth=None):
+        self.name = name
+        self.maxDepth = maxDepth
+        self.pending = deque() # (time enqueued, package)
+        self.writer = None # index of the writer thread that drains this queue.
+        self.inFlight = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.highWater = 0
+        self.batches = 0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self.totalLatency = 0.0
+
+    def depth(self):
+        return len(self.pending)
+
+    def put(self, package):
+        """Queue package. Returns False (and counts the drop) if the queue is at its max depth."""
+        depth = len(self.pending)
+        if self.maxDepth and depth >= self.maxDepth:
+            self.dropped += 1
+            return False
+        self.pending.append((time.monotonic(), package))
+        self.enqueued += 1
+        if depth + 1 > self.highWater:
+            self.highWater = depth + 1
+        return True
+
+    def take(self, maxBatch):
+        """Remove and return up to maxBatch pending (time enqueued, package) pairs."""
+        batch = []
+        try:
+            while len(batch) < maxBatch:
+                batch.append(self.pending.popleft())
+        except IndexError:
+            pass # queue is empty.
+        return batch
+
+    def recordBatch(self, batch, ok=True):
+        """Update the counters after batch has been written. Latency is from the oldest package being queued."""
+        latency = time.monotonic() - batch[0][0]
+        self.batches += 1
+        self.lastLatency = latency
+        self.maxLatency = max(self.maxLatency, latency)
+        self.totalLatency += latency
+        if ok:
+            self.written += len(batch)
+        else:
+            self.errors += len(batch)
+
+    def getStats(self):
+        return {
+            'depth': self.depth(),
+            'highWater': self.highWater,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'batches': self.batches,
+            'lastLatency': self.lastLatency,
+            'maxLatency': self.maxLatency,
+            'meanLatency': self.totalLatency / self.batches if self.batches else 0.0
+        }
+
+
+class WriteBehindPool():
+    """ Per channel queues drained by a small pool of writer threads.
+
+    :param name: used to name the writer threads.
+    :param writeBatch: callable(channelName, packages) that writes a list of packages of one channel.
+    :param nWriters: number of writer threads.
+    :param maxQueueDepth: packages a channel may have pending before new packages are dropped. None is unbounded.
+    :param maxBatch: most packages handed to writeBatch at once.
+    """
+    def __init__(self, name, writeBatch, nWriters=DEFAULT_WRITERS, maxQueueDepth=None, maxBatch=DEFAULT_MAX_BATCH,
+                 logger=None):
+        self.name = name
+        self.writeBatch = writeBatch
+        self.nWriters = max(1, int(nWriters))
+        self.maxQueueDepth = maxQueueDepth
+        self.maxBatch = maxBatch
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.queues = {} # channelName: ChannelQueue
+        self._assigned = [[] for i in range(0, self.nWriters)] # channel queues drained by each writer.
+        self._wake = [threading.Event() for i in range(0, self.nWriters)]
+        self._threads = []
+        self._lock = threading.Lock() # only taken to add a channel queue or start the writers.
+        self._cond = threading.Condition() # signals the end of every batch, for drain and pause.
+        self._inFlight = 0
+        self._paused = False
+        self._stop = False
+
+    def _getQueue(self, channelName):
+        q = self.queues.get(channelName)
+        if q is None:
+            with self._lock:
+                q = self.queues.get(channelName)
+                if q is None:
+                    q = ChannelQueue(channelName, self.maxQueueDepth)
+                    q.writer = len(self.queues) % self.nWriters
+                    # replace rather than append, so the writer can iterate its list without holding the lock.
+                    self._assigned[q.writer] = [*self._assigned[q.writer], q]
+                    self.queues[channelName] = q
+        return q
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop = False
+            for i in range(0, self.nWriters):
+                t = threading.Thread(target=self._run, args=(i,), name=f'{self.name}-writer-{i}', daemon=True)
+                self._threads.append(t)
+                t.start()
+
+    def isRunning(self):
+        return bool(self._threads)
+
+    def put(self, channelName, package):
+        """Queue package to be written to channelName. Returns False if it was dropped because the queue is full."""
+        if not self._threads:
+            self.start()
+        q = self._getQueue(channelName)
+        if not q.put(package):
+            return False
+        self._wake[q.writer].set()
+        return True
+
+    def _run(self, writerIdx):
+        wake = self._wake[writerIdx]
+        while not self._stop:
+            wake.wait(WRITER_IDLE_WAIT)
+            wake.clear()
+            self._drainAssigned(writerIdx)
+        self._drainAssigned(writerIdx) # write anything that was queued before stopping.
+
+    def _drainAssigned(self, writerIdx):
+        """Write batches from the queues of a writer until they are all empty."""
+        busy = True
+        while busy:
+            busy = False
+            for q in self._assigned[writerIdx]:
+                if not q.pending:
+                    continue
+                with self._cond:
+                    while self._paused and not self._stop:
+                        self._cond.wait()
+                    batch = q.take(self.maxBatch)
+                    if not batch:
+                        continue
+                    self._inFlight += 1
+                    q.inFlight = True
+                ok = True
+                try:
+                    self.writeBatch(q.name, [package for enqueued, package in batch])
+                except Exception as e:
+                    ok = False
+                    self.logger.error(f'Write behind pool {self.name} could not write {len(batch)} packages to channel {q.name}: {e}')
+                finally:
+                    q.recordBatch(batch, ok)
+                    with self._cond:
+                        q.inFlight = False
+                        self._inFlight -= 1
+                        self._cond.notify_all()
+                busy = busy or bool(q.pending)
+
+    def _isDrained(self, channelName=None):
+        if channelName is None:
+            return self._inFlight == 0 and not any(q.pending for q in list(self.queues.values()))
+        q = self.queues.get(channelName)
+        return q is None or (not q.pending and not q.inFlight)
+
+    def drain(self, channelName=None, timeout=None):
+        """ Wait until everything queued (on channelName, or on every channel if None) has been written.
+
+        :return: True if drained, False if timed out.
+        """
+        if not self._threads or self._paused or threading.current_thread() in self._threads:
+            return self._isDrained(channelName)
+        with self._cond:
+            return self._cond.wait_for(lambda: self._isDrained(channelName), timeout)
+
+    def pause(self):
+        """Stop the writers from taking new batches, and wait for the batches being written to finish."""
+        with self._cond:
+            self._paused = True
+            self._cond.wait_for(lambda: self._inFlight == 0)
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+        for wake in self._wake:
+            wake.set()
+
+    def stop(self, timeout=None):
+        """Write everything that is queued and stop the writers."""
+        self.resume()
+        self.drain(timeout=timeout)
+        self._stop = True
+        with self._cond:
+            self._cond.notify_all()
+        for wake in self._wake:
+            wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def getStats(self):
+        channels = {name: q.getStats() for name, q in list(self.queues.items())}
+        return {
+            'writers': self.nWriters,
+            'depth': sum(c['depth'] for c in channels.values()),
+            'dropped': sum(c['dropped'] for c in channels.values()),
+            'errors': sum(c['errors'] for c in channels.values()),
+            'written': sum(c['written'] for c in channels.values()),
+            'maxLatency': max([c['maxLatency'] for c in channels.values()], default=0.0),
+            'channels': channels
+        }
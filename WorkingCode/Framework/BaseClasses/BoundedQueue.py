@@ -0,0 +1,189 @@
+import time
+from collections import deque, OrderedDict
+from queue import Queue, Full
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Sentinel import Sentinel
+from Utils import ClassUtils as cu
+
+"""
+.. _bounded-queue:
+
+#################
+Bounded Queue
+#################
+
+Input queue of a QueuedDestination, with a capacity and a policy for what happens when a package arrives while it is
+full:
+
+    BLOCK: the sender waits for room (back pressure). put_nowait raises queue.Full.
+    DROP_OLDEST: the package that has waited longest is dropped to make room.
+    DROP_NEWEST: the arriving package is dropped.
+    COALESCE: a data package replaces the one from the same source that is still waiting, if there is one, so the
+        consumer only sees the latest reading of each source (IE a display). Other packages, and data packages holding
+        a block of rows (which would lose all but the last block's rows), are queued as usual, and the oldest item is
+        dropped when there is no room.
+
+A Sentinel always gets in, so a full queue can still be ended. A capacity of 0 is unbounded (with any policy but
+COALESCE this is a plain queue.Queue).
+
+Drops and the deepest the queue has been (high water) are counted, see getStats. The reporter, if given, is called
+with the stats when the queue first fills to each of REPORT_LEVELS of its capacity, and when packages are dropped, at
+most once every REPORT_INTERVAL seconds.
+"""
+
+BLOCK = 'block'
+DROP_OLDEST = 'dropOldest'
+DROP_NEWEST = 'dropNewest'
+COALESCE = 'coalesce'
+OVERFLOW_POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE]
+REPORT_LEVELS = [.5, .9, 1.0] # fractions of capacity at which the high water mark is reported.
+REPORT_INTERVAL = 10.0 # seconds between reports of dropped packages.
+GUI_QUEUE_SIZE = 10000 # packages waiting for the GUI to update, used with COALESCE by the GUI interfaces.
+
+
+def coalesceKey(item):
+    """Key under which an item coalesces with earlier items, or None if it never does (anything but a data package of
+    one row)."""
+    if cu.isPackage(item) and item.channelType == ChannelType.Data and not cu.isBlock(item.payload):
+        return item.source
+    return None
+
+
+class BoundedQueue(Queue):
+    def __init__(self, maxsize=0, policy=BLOCK, name=None, reporter=None):
+        if not policy in OVERFLOW_POLICIES:
+            raise ValueError(f'Overflow policy of queue {name} must be one of {OVERFLOW_POLICIES}, is {policy}.')
+        self.policy = policy
+        self.name = name
+        self.reporter = reporter
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.highWater = 0
+        self._reportedLevel = 0
+        self._lastDropReport = None
+        self._unreportedDrops = 0
+        super().__init__(maxsize)
+
+    # storage. COALESCE keeps items in an OrderedDict so the waiting package of a source can be found and replaced.
+    def _init(self, maxsize):
+        if self.policy == COALESCE:
+            self.queue = OrderedDict()
+        else:
+            self.queue = deque()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        if self.policy == COALESCE:
+            key = coalesceKey(item)
+            self.queue[key if key is not None else ('unique', id(item))] = item
+        else:
+            self.queue.append(item)
+
+    def _get(self):
+        if self.policy == COALESCE:
+            return self.queue.popitem(last=False)[1]
+        return self.queue.popleft()
+
+    def _dropOldest(self):
+        """Drop the item that has waited longest, other than a Sentinel. Returns False if there is none."""
+        if self.policy == COALESCE:
+            for key, item in self.queue.items():
+                if not isinstance(item, Sentinel):
+                    del self.queue[key]
+                    return True
+            return False
+        for i, item in enumerate(self.queue):
+            if not isinstance(item, Sentinel):
+                del self.queue[i]
+                return True
+        return False
+
+    def put(self, item, block=True, timeout=None):
+        """ Queue item, applying the overflow policy if the queue is full.
+
+        :return: True if item was queued, False if it was dropped (DROP_NEWEST). Raises queue.Full under BLOCK if
+            there is no room within timeout, or at once if not block.
+        """
+        report = None
+        with self.not_full:
+            queued = True
+            if self.policy == COALESCE and coalesceKey(item) in self.queue:
+                self.queue[coalesceKey(item)] = item # replaces the waiting package, keeping its place.
+                self.coalesced += 1
+                self.enqueued += 1
+                return True
+            full = self.maxsize > 0 and not isinstance(item, Sentinel) and self._qsize() >= self.maxsize
+            if full and self.policy == BLOCK:
+                if not block:
+                    raise Full
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._qsize() >= self.maxsize:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Full
+                    self.not_full.wait(remaining)
+            elif full and self.policy == DROP_NEWEST:
+                queued = False
+            elif full:
+                queued = self._dropOldest()
+                if queued:
+                    self._countDrop()
+            if queued:
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.enqueued += 1
+                self.not_empty.notify()
+                depth = self._qsize()
+                if depth > self.highWater:
+                    self.highWater = depth
+            else:
+                self._countDrop()
+            report = self._dueReport()
+        if report and self.reporter:
+            self.reporter(report)
+        return queued
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def _countDrop(self):
+        self.dropped += 1
+        self._unreportedDrops += 1
+
+    def _dueReport(self):
+        """Return the stats if they are due to be reported, see the module notes. Called holding the queue's mutex."""
+        if not self.maxsize:
+            return None
+        level = max((lvl for lvl in REPORT_LEVELS if self.highWater >= lvl * self.maxsize), default=0)
+        now = time.monotonic()
+        dropsDue = self._unreportedDrops and (self._lastDropReport is None or
+                                              now - self._lastDropReport >= REPORT_INTERVAL)
+        if not (level > self._reportedLevel or dropsDue):
+            return None
+        self._reportedLevel = max(level, self._reportedLevel)
+        stats = self._stats()
+        stats['newDrops'] = self._unreportedDrops
+        if dropsDue:
+            self._lastDropReport = now
+            self._unreportedDrops = 0
+        return stats
+
+    def _stats(self):
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'capacity': self.maxsize,
+            'depth': self._qsize(),
+            'highWater': self.highWater,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced
+        }
+
+    def getStats(self):
+        with self.mutex:
+            return self._stats()
@@ -19,6 +19,7 @@ class CommandLevels(Enum):
 
 class CommandPayload(Payload):
     __bases__ = [Payload]
+    __slots__ = []
     """sets values for payloads within command packages"""
     def __init__(self, commandLevel=CommandLevels.Noncritical, onBehalfOfID=None, commandID=None, destination=None,
                  source=None, sourceMethod=None, command=None, args=[], kws={}, timestamp=None, **kwargs):
@@ -60,6 +61,7 @@ class CommandPayload(Payload):
 
 class ResponsePayload(Payload):
     """sets values for payloads within response packages"""
+    __slots__ = []
     def __init__(self, source=None, destination=None, ret=None, commandID=None, responseLevel=None, ts=None,
                        **kwargs):
         if ts == None:
@@ -191,6 +193,18 @@ class CommandClass(ThreadedDestination, LoggingObject, ABC):
             logging.log(level=logging.INFO, msg="No Command Manager set for {}. Cannot send package.".format(self.getName()))
         pass
 
+    async def _emitCommandAsync(self, package, timeout=None):
+        """ Send a command and await its response without blocking the event loop, so one thread (IE the GUI's) can
+        have many commands outstanding at once. Returns the response's return value, or False if there was none."""
+        if self.commandManager:
+            self.commandManager.accept(package)
+            responsePkg = await self.commandManager.getResponseAsync(package, timeout)
+            if cu.isPackage(responsePkg):
+                return responsePkg.payload['ret']
+            return responsePkg
+        else:
+            logging.log(level=logging.INFO, msg="No Command Manager set for {}. Cannot send package.".format(self.getName()))
+
     def createCommandPackage(self, sourceFunction, destination, destinationCommand, args=[], kwargs={},
                              commandLevel=CommandLevels.Immediate):
         """
@@ -1,15 +1,21 @@
-import time
+import logging
 from abc import ABC, abstractmethod
-from queue import Queue
+from queue import Queue, Empty
 from threading import Thread, RLock
 
+from Framework.BaseClasses.BoundedQueue import BoundedQueue, BLOCK
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Events import EventPayload, EventTypes
 from Framework.BaseClasses.LoggingObject import LoggingObject
 from Framework.BaseClasses.NamedObject import NamedObject
+from Framework.BaseClasses.Package import Package
 from Framework.BaseClasses.Sentinel import Sentinel
 from Framework.BaseClasses.StartStop import Initiator, Terminator
 from Utils import ClassUtils as cu
 from Utils import Exceptions as ex
 
+DEFAULT_MAX_BATCH = 256 # packages taken from the input queue at once by a ThreadedDestination.
+IDLE_WAIT = 1.0 # seconds an idle ThreadedDestination waits on its input queue before checking tdTerminate again.
 
 class Destination(NamedObject, ABC):
     def __init__(self, **kwargs):
@@ -29,27 +35,66 @@ class Destination(NamedObject, ABC):
 
 
 class QueuedDestination(Destination):
-    def __init__(self, inputQueue=None, **kwargs):
+    """ A destination that queues the packages it accepts.
+
+    :param queueSize: capacity of the input queue, 0 for unbounded.
+    :param overflowPolicy: what happens to a package that arrives when the input queue is full, one of the policies in
+        BoundedQueue (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE).
+    """
+    def __init__(self, inputQueue=None, queueSize=0, overflowPolicy=BLOCK, **kwargs):
         super().__init__(**kwargs)
+        self.queueSize = queueSize
+        self.overflowPolicy = overflowPolicy
         self.inputQueue=None
         self.setInputQueue(inputQueue)
 
     def setInputQueue(self, inputQueue=None, overwrite=False):
         if self.inputQueue is None or overwrite or inputQueue is self.inputQueue:
-            self.inputQueue = inputQueue if isinstance(inputQueue, Queue) is None else Queue()
+            if not isinstance(inputQueue, Queue):
+                inputQueue = BoundedQueue(self.queueSize, self.overflowPolicy, name=self.getName(),
+                                          reporter=self._reportQueue)
+            self.inputQueue = inputQueue
         else:
             raise ex.ResourceAllocationError(f'Cannot allocate new input queue to {self.getName()} as one already exists and overwrite is set to False.')
 
+    def getQueueStats(self):
+        """Return the depth, high water mark and drop counts of the input queue, see BoundedQueue.getStats."""
+        if isinstance(self.inputQueue, BoundedQueue):
+            return self.inputQueue.getStats()
+        return {'name': self.getName(), 'depth': self.inputQueue.qsize()}
+
+    def _reportQueue(self, stats):
+        """Warn that the input queue is filling up or dropping packages, in the log and as an event if there is an
+        event manager to send it to."""
+        msg = (f'Input queue of {self.getName()} ({stats["policy"]}, capacity {stats["capacity"]}) has reached a depth '
+               f'of {stats["highWater"]}; {stats["newDrops"]} packages dropped since the last report, '
+               f'{stats["dropped"]} in total.')
+        logger = getattr(self, 'logger', None) or logging.getLogger(__name__)
+        logger.warning(msg)
+        eventManager = getattr(self, 'eventManager', None)
+        if cu.isEventManager(eventManager) and not eventManager is self:
+            payload = EventPayload(source=self.getName(), eventType=EventTypes.QueueOverload, msg=msg,
+                                   queueStats=stats)
+            eventManager.accept(Package(source=self.getName(), payload=payload, channelType=ChannelType.Event))
+
     def _accept(self, package):
         # note that this Queued destination needs a way to get things off of the queue and call "handleIncomingPackage" on them.
         self.inputQueue.put(package)
 
 class ThreadedDestination(QueuedDestination, LoggingObject, Terminator, Thread, Initiator):
-    def __init__(self, name=None, blocking=False, daemon=True, **kwargs):
+    """ A destination that handles its packages on its own thread.
+
+    The thread blocks on the input queue until a package is put on it, then takes every package queued since (up to
+    maxBatch) and hands them to handlePackages at once, so an idle destination does not wake up and a busy one does
+    not pay for a wake up per package. end() queues a Sentinel; the packages queued before it are handled before the
+    thread stops.
+    """
+    def __init__(self, name=None, blocking=False, daemon=True, maxBatch=DEFAULT_MAX_BATCH, **kwargs):
         Thread.__init__(self, name=name, daemon=daemon)
         super().__init__(name=name, **kwargs)
         self.tdTerminate = False
         self.TDLock = RLock()
+        self.maxBatch = max(1, int(maxBatch))
         self.setBlocking(blocking)
         self._accept = self._acceptHandle
 
@@ -66,19 +111,54 @@ class ThreadedDestination(QueuedDestination, LoggingObject, Terminator, Thread,
 
     def run(self):
         self._accept = self._acceptQueue
-        while not self.tdTerminate:
+        while True:
+            batch, ended = self._takeBatch()
+            if batch:
+                with self.TDLock:
+                    self.handlePackages(batch)
+            if ended or (self.tdTerminate and not batch):
+                break
+        # packages that were put after the Sentinel, by senders that had not yet seen end().
+        batch, ended = self._takeBatch(wait=False)
+        while batch:
             with self.TDLock:
-                try:
-                    if not self.inputQueue.empty():
-                        pkg = self.inputQueue.get(block=self.blocking)
-                        if pkg and not isinstance(pkg, Sentinel):
-                            self.handlePackage(pkg)
-                except Exception as e:
-                    self.logger.exception(e)
-            time.sleep(.001)
+                self.handlePackages(batch)
+            batch, ended = self._takeBatch(wait=False)
+
+    def _takeBatch(self, wait=True):
+        """ Wait for a package (up to IDLE_WAIT seconds), then take the packages queued behind it, up to maxBatch.
+
+        :return: (packages, True if a Sentinel was reached). Packages after a Sentinel are left on the queue.
+        """
+        batch = []
+        try:
+            pkg = self.inputQueue.get(timeout=IDLE_WAIT) if wait else self.inputQueue.get_nowait()
+            while True:
+                if isinstance(pkg, Sentinel):
+                    return batch, True
+                if pkg:
+                    batch.append(pkg)
+                if len(batch) >= self.maxBatch:
+                    break
+                pkg = self.inputQueue.get_nowait()
+        except Empty:
+            pass
+        return batch, False
+
+    def handlePackages(self, packages):
+        """ Handle a batch of packages taken from the input queue, in the order they were queued.
+
+        Calls handlePackage on each one. Subclasses that can handle many packages together more cheaply than one at a
+        time may override this.
+        """
+        for pkg in packages:
+            try:
+                self.handlePackage(pkg)
+            except Exception as e:
+                self.logger.exception(e)
 
     def _acceptQueue(self, package):
         self.inputQueue.put(package)
 
     def _acceptHandle(self, package):
-        self.handlePackage(package)
\ No newline at end of file
+        self.handlePackage(package)
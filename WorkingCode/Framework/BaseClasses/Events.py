@@ -23,9 +23,11 @@ class EventTypes(Enum):
     ExperimentStart = auto()
     ExperimentEnd = auto()
     ExperimentEdit = auto()
+    QueueOverload = auto()
 
 class EventPayload(Payload):
     __bases__ = [Payload]
+    __slots__ = []
     def __init__(self, source=None, eventType=EventTypes.Default, timestamp=None, msg="", namespace=None, **kwargs):
         if not eventType in EventTypes:
             logging.info(f"EventPayload given incorrect EventType: {eventType}. Changed to Default")
@@ -8,7 +8,7 @@ from Framework.BaseClasses.Registration.FrameworkRegistration import FrameworkOb
 from Utils import ClassUtils as cu
 
 
-class Proxy_Base(ThreadedDestination, FrameworkObject, ABC):
+class Proxy_Base(FrameworkObject, ThreadedDestination, ABC):
     pass
 
 class DataManager_Base(ThreadedDestination, FrameworkObject, ABC):
@@ -3,7 +3,7 @@ import threading
 import time
 from abc import ABC, abstractmethod
 
-from Applications.TimsVan.Communication import ProxySerializer as ps, SimplifiedProxyHeader as ph
+from Framework.Proxy import ProxySerializer as ps, SimplifiedProxyHeader as ph
 
 
 class Connector(ABC, threading.Thread):
@@ -29,7 +29,7 @@ class Connector(ABC, threading.Thread):
             packet = (packet,)
         for singlePacket in packet:
             if type(singlePacket) in (bytes, bytearray):
-                if len(packet[ph.HEADER_SIZE:]) > self.maxBytes:
+                if len(singlePacket) - ph.HEADER_SIZE > self.maxBytes:
                     splitPackets = ps.splitPackets(singlePacket, self.maxBytes)
                     for partialPacket in splitPackets:
                         self._send(partialPacket)
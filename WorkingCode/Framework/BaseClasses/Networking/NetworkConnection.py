@@ -1,7 +1,7 @@
 import logging
 from abc import ABC, abstractmethod
 
-from Applications.TimsVan.Communication import ProxySerializer as ps, SimplifiedProxyHeader as ph
+from Framework.Proxy import ProxySerializer as ps, SimplifiedProxyHeader as ph
 
 
 class NetworkConnection(ABC):
@@ -20,7 +20,7 @@ class NetworkConnection(ABC):
             packet = (packet,)
         for singlePacket in packet:  # send all packets in a group (list, set, tuple)
             if type(singlePacket) in (bytes, bytearray):
-                if len(packet[ph.HEADER_SIZE:]) > self.maxBytes:  #split packets if packet length > maxBytes
+                if len(singlePacket) - ph.HEADER_SIZE > self.maxBytes:  #split packets if packet length > maxBytes
                     splitPackets = ps.splitPackets(singlePacket, self.maxBytes)
                     for partialPacket in splitPackets:
                         self._sendSinglePacket(partialPacket)
@@ -1,6 +1,6 @@
 import datetime
+import itertools
 from collections.abc import MutableMapping
-from threading import RLock
 
 from Framework.BaseClasses.Channels import ChannelType
 from Utils import ClassUtils as cu
@@ -8,24 +8,26 @@ from Utils import TimeUtils as tu
 
 
 class Package:
-    packageID = 0
-    lock = RLock()
     """ A class intended to instill uniformity throughout the framework for how the deliverable dictionary is accessed.
 
     self.source: a string containing the name of the object from which the payload was collected.
     self.timestamp: an epoch time representation of the time at which the payload was collected or the time at which the
         payload object was instantiated if no timestamp was provided.
-    self.payload: the deliverable 
+    self.payload: the deliverable
+
+    Every reading a reader takes becomes a Package, so the class is slotted (no per instance __dict__) and packageIDs
+    come from an itertools.count, whose next() is atomic under the GIL, instead of a counter behind a lock.
     """
+    __slots__ = ['channelType', 'timestamp', 'source', 'metadata', 'metadataKey', 'packageID', 'payload']
+    _packageIDs = itertools.count()
+
     def __init__(self, source=None, timestamp=None, payload=None, metadata=None, channelType=ChannelType.Other, mdKey=None, **kwargs):
         self.channelType = channelType
         self.timestamp = timestamp if timestamp else tu.nowEpoch()
         self.source = source
         self.metadata = metadata
         self.metadataKey = mdKey
-        with Package.lock:
-            self.packageID = Package.packageID
-            Package.packageID += 1
+        self.packageID = next(Package._packageIDs)
         self.payload = payload
 
     def toDict(self):
@@ -51,52 +53,55 @@ class Package:
 # class Payload(ABC, MutableMapping):
 class Payload(MutableMapping):
     # __bases__ = [object, MutableMapping]
+    """ Inheriting from the Payload Base Class is necessary for any payload to be considered a 'payload' by the class utils
+
+    Values are stored once, in self.map. Keys can also be read as attributes (payload.commandID); a key that is not in
+    the map reads as None. source and timestamp are properties over the map, so they are always in step with it.
+    """
+    __slots__ = ['map', 'metadata']
 
-    # Inheriting from the Payload Base Class is necessary for any payload to be considered a 'payload' by the class utils
     def __init__(self, source, timestamp=None, metadata=None, **kwargs):
         if timestamp is None:
             # default to now epoch.
             timestamp = tu.nowEpoch()
-        if type(timestamp) is datetime.datetime:
+        elif type(timestamp) is datetime.datetime:
             # Expecting timestamp in epoch (float)
             timestamp = tu.DTtoEpoch(timestamp)
-        if timestamp is None:
-            timestamp = tu.nowEpoch()
-        self.map = {}
-        self.source = source
+            if timestamp is None:
+                timestamp = tu.nowEpoch()
         self.metadata = metadata
-        self.timestamp = timestamp
-        self.map['source'] = source
-        self.map['timestamp'] = timestamp
-        for kw, value in kwargs.items():
-            self.map[kw] = value
-            # done so that you can access the value as an attribute.
-            self.__dict__[kw] = value
+        self.map = {'source': source, 'timestamp': timestamp, **kwargs}
+
+    @property
+    def source(self):
+        return self.map.get('source')
+
+    @source.setter
+    def source(self, value):
+        self.map['source'] = value
+
+    @property
+    def timestamp(self):
+        return self.map.get('timestamp')
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.map['timestamp'] = value
 
     def __delitem__(self, key):
-        if key in self.map.keys():
-            del self.map[key]
-        if key =='source':
-            del self.source
-        if key == 'timestamp':
-            del self.timestamp
+        self.map.pop(key, None)
 
     def __getattr__(self, item):
-        try:
-            return MutableMapping.__getattribute__(self, item)
-        except AttributeError as e:
-            return None
+        # only called when item is not a slot, property or method. Dunder lookups (IE __setstate__ while unpickling,
+        # before map is set) must fail as usual.
+        if item == 'map' or item.startswith('__'):
+            raise AttributeError(item)
+        return self.map.get(item)
 
     def __getitem__(self, item):
         return self.map[item]
 
     def __setitem__(self, key, value):
-        if key in self.map.keys():
-            del self[key]
-        if key == 'source':
-            self.source = value
-        if key == 'timestamp':
-            self.timestamp = value
         self.map[key] = value
 
     def __iter__(self):
@@ -130,6 +135,75 @@ class Payload(MutableMapping):
     def toDict(self):
         return self.map
 
+class BlockPayload(Payload):
+    """ Several samples of one source, held as columns: {'timestamp': [t0, t1, ...], 'FM-1': [v0, v1, ...], ...}.
+
+    A reader that takes samples faster than they should each be routed (IE a batch of readings from one request) sends
+    them as one Data package carrying a BlockPayload, so the routing, locking and serialization of a package are paid
+    once per block rather than once per sample. The package's timestamp is that of the first sample.
+
+    As a mapping, the keys are the field names and the values their columns (lists, or numpy arrays), so len() is the
+    number of fields; the number of samples is nSamples. Consumers that work per sample iterate rows().
+    """
+    __slots__ = ['blockSource']
+
+    def __init__(self, source, columns, metadata=None):
+        self.blockSource = source
+        self.metadata = metadata
+        self.map = dict(columns)
+
+    @classmethod
+    def fromRows(cls, source, rows, metadata=None):
+        """ Build a block from a list of sample dicts. A field missing from some samples is None in those samples."""
+        rows = [row for row in rows if row]
+        if not rows:
+            return cls(source, {}, metadata)
+        fieldNames = list(rows[0].keys())
+        if any(not len(row) == len(fieldNames) or not all(key in row for key in fieldNames) for row in rows):
+            fieldNames = list(dict.fromkeys(key for row in rows for key in row.keys()))
+            columns = {key: [row.get(key) for row in rows] for key in fieldNames}
+        else:
+            columns = {key: [row[key] for row in rows] for key in fieldNames}
+        return cls(source, columns, metadata)
+
+    @property
+    def source(self):
+        return self.blockSource
+
+    @source.setter
+    def source(self, value):
+        self.blockSource = value
+
+    @property
+    def timestamp(self):
+        ts = self.map.get('timestamp')
+        return ts[0] if ts is not None and len(ts) else None
+
+    @property
+    def nSamples(self):
+        for column in self.map.values():
+            return len(column)
+        return 0
+
+    def column(self, fieldName):
+        return self.map[fieldName]
+
+    def rows(self):
+        """Return the samples as a list of dicts, one per sample."""
+        fieldNames = list(self.map.keys())
+        columns = [column.tolist() if hasattr(column, 'tolist') else column for column in self.map.values()]
+        return [dict(zip(fieldNames, values)) for values in zip(*columns)]
+
+    def toDict(self):
+        return {fieldName: column.tolist() if hasattr(column, 'tolist') else list(column)
+                for fieldName, column in self.map.items()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.blockSource}, {self.nSamples} samples of {list(self.map.keys())})"
+
+    def __str__(self):
+        return repr(self)
+
 def main():
     pl = Payload('One', 123.45)
     pl['dest'] = 'There'
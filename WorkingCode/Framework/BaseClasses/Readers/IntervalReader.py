@@ -6,12 +6,19 @@ from Utils import ClassUtils as cu
 
 
 class IntervalReader(Reader):
-    def __init__(self, name, dataManager=None, readPipe=None, readInterval=1, **kwargs):
+    """ A reader whose read() is called every readInterval seconds by a ReadPipe, which sends each reading to the
+    dataManager. With a batchSize above 1, batchSize readings are sent together as one block package, see ReadPipe.
+
+    Reads are run by scheduler, a ReadScheduler, or the shared one if it is None, so one timer thread drives the reads of
+    every IntervalReader."""
+    def __init__(self, name, dataManager=None, readPipe=None, readInterval=1, batchSize=1, scheduler=None, **kwargs):
         Reader.__init__(self, name=name, **kwargs)
         if not cu.isDataManager(dataManager) and not dataManager is None:
             raise TypeError(f'Interval reader named {self.getName()} expects dataManager to be of type DataManager or None, not'
                             f'{type(dataManager)}.')
         self.dataManager = dataManager
+        self.batchSize = batchSize
+        self.scheduler = scheduler
         if cu.isReadPipe(readPipe):
             self.readPipe = readPipe
         else:
@@ -22,7 +29,8 @@ class IntervalReader(Reader):
         if cu.isReadPipe(readpipe):
             self.readPipe = readpipe
         else:
-            self.readPipe = rp(self.getName() + '-ReadPipe', source=self, destination=destination, freq=readInterval)
+            self.readPipe = rp(self.getName() + '-ReadPipe', source=self, destination=destination, freq=readInterval,
+                               batchSize=self.batchSize, scheduler=self.scheduler)
 
     def start(self):
         self._setupReadPipe(self.readPipe, self.readInterval, self.dataManager)
@@ -1,4 +1,8 @@
+import asyncio
 import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeout
 from threading import RLock, Event
 
 import Framework.BaseClasses.Commands as cmd
@@ -13,6 +17,10 @@ from Utils.ClassUtils import isCommandClass, isArchiver, isProxy
 
 __docformat__ = 'reStructuredText'
 
+TRANSACTION_TTL = 300.0 # seconds a transaction is kept, waiting for its response or in the cache after it.
+MAX_CACHED_TRANSACTIONS = 1000 # completed transactions kept for late getResponse calls. The oldest are dropped first.
+EXPIRE_INTERVAL = 10.0 # seconds between passes that expire stale transactions.
+
 class CommandManager(Framework.BaseClasses.Manager.CommandManager_Base, ThreadedDestination):
     """ Handles commands and responses """
     def __init__(self, archiver, processStopper=None, name=None, requestTimeout = 1.0, **kwargs):
@@ -30,7 +38,11 @@ class CommandManager(Framework.BaseClasses.Manager.CommandManager_Base, Threaded
         # Metadata for command generators and processors.
         self.commandClasses = {}
         self.transactions = {}
-        self.cachedTransactions = {}
+        self.cachedTransactions = OrderedDict()
+        # commandID: (Future completed with the response package, time it was created). Only commands that someone
+        # is waiting on with getResponse have one.
+        self.responseFutures = {}
+        self._lastExpiry = time.monotonic()
         self.commandID = 0
 
         self.requestTimeout = requestTimeout
@@ -143,32 +155,87 @@ class CommandManager(Framework.BaseClasses.Manager.CommandManager_Base, Threaded
         package = Package(source=self.name, channelType=ChannelType.Response, payload=payload)
         return package
 
+    def _responseFuture(self, commandID):
+        """Return a Future that is completed with the response package of commandID (at once, if it is cached)."""
+        with self.lock:
+            transaction = self.cachedTransactions.get(commandID)
+            if transaction:
+                future = Future()
+                future.set_result(transaction['responsePackage'])
+                return future
+            entry = self.responseFutures.get(commandID)
+            if entry is None:
+                entry = self.responseFutures[commandID] = (Future(), time.monotonic())
+            return entry[0]
+
     def getResponse(self, commandPackage, timeout=None):
-        t = tu.nowEpoch()
-        commandPl = commandPackage.payload
-        commandID = commandPl.commandID
-        transaction = None
+        """ Wait for the response to a command package.
+
+        :param timeout: seconds to wait, requestTimeout if None.
+        :return: the response package, or False if none arrived within timeout.
+        """
+        commandID = commandPackage.payload.commandID
         if timeout is None:
             timeout=self.requestTimeout # 2 second timeout by default if nt specified. .
-        while not tu.nowEpoch() - t > timeout and not transaction:
-            transaction = self.cachedTransactions.get(commandID, None)
-        if transaction:
-            response = transaction['responsePackage']
-            return response
-        else:
+        try:
+            return self._responseFuture(commandID).result(timeout)
+        except (FutureTimeout, CancelledError):
             #TODO: log that a response wasn't received?
             return False
 
+    async def getResponseAsync(self, commandPackage, timeout=None):
+        """ Wait for the response to a command package without blocking the event loop, so many commands can be
+        awaited at once (IE with asyncio.gather) from one thread.
+
+        :return: the response package, or False if none arrived within timeout.
+        """
+        commandID = commandPackage.payload.commandID
+        if timeout is None:
+            timeout = self.requestTimeout
+        future = self._responseFuture(commandID)
+        try:
+            # shielded, so a timeout here does not cancel the future other waiters of the command share.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            return False
+        except (asyncio.CancelledError, CancelledError):
+            # an awaited future that _expireTransactions cancels raises asyncio's CancelledError, not concurrent's.
+            if future.cancelled():
+                return False # expired, see _expireTransactions.
+            raise
+
+    def _expireTransactions(self, force=False):
+        """Drop transactions and waits older than TRANSACTION_TTL, at most once every EXPIRE_INTERVAL seconds."""
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self._lastExpiry < EXPIRE_INTERVAL:
+                return
+            self._lastExpiry = now
+            oldest = now - TRANSACTION_TTL
+            for commandID in [cID for cID, t in self.transactions.items() if t.get('issued', now) < oldest]:
+                self.transactions.pop(commandID)['status'] = cmd.CommandStatus.Failed
+            while self.cachedTransactions:
+                commandID, transaction = next(iter(self.cachedTransactions.items()))
+                if transaction.get('completed', now) >= oldest:
+                    break
+                self.cachedTransactions.popitem(last=False)
+            for commandID in [cID for cID, (f, created) in self.responseFutures.items() if created < oldest]:
+                self.responseFutures.pop(commandID)[0].cancel()
+
     def issueCommand(self, package):
         """Send package to destination."""
 
         tid = package.payload['commandID']
 
         # Keep track in an internal dictionary of the command package and a response, if any. Status is that the command has been received.
-        currentTransaction = self.transactions[tid] = {}
+        self._expireTransactions()
+        currentTransaction = {}
         currentTransaction['commandPackage'] = package
         currentTransaction['responsePackage'] = None
         currentTransaction['status'] = cmd.CommandStatus.Received
+        currentTransaction['issued'] = time.monotonic()
+        with self.lock:
+            self.transactions[tid] = currentTransaction
         commandPL = package.payload
 
         commandDest = commandPL['destination']
@@ -190,7 +257,7 @@ class CommandManager(Framework.BaseClasses.Manager.CommandManager_Base, Threaded
         """
         Sends a response to the source.
 
-        Removes commandID from cachedTransactions.
+        Removes commandID from transactions.
 
         adds package to transaction['responsePackage']
 
@@ -198,16 +265,24 @@ class CommandManager(Framework.BaseClasses.Manager.CommandManager_Base, Threaded
 
         archives package
 
-        caches transaction
+        caches transaction, and completes the future of anyone waiting on it in getResponse.
         """
         responsePayload = package.payload
         #In this context, onBehalfOfID is the ID corresponding to the commandID of the command that needs this response.
         commandID = responsePayload['commandID']
-        transaction = self.transactions[commandID]
-        transaction['responsePackage'] = package
         self.archive(package)
-        transaction = self.transactions.pop(commandID)
-        self.cachedTransactions[commandID] = transaction
+        with self.lock:
+            # the command may have been issued through another command manager (IE over the proxy).
+            transaction = self.transactions.pop(commandID, None) or {'commandPackage': None}
+            transaction['responsePackage'] = package
+            transaction['status'] = cmd.CommandStatus.Completed
+            transaction['completed'] = time.monotonic()
+            self.cachedTransactions[commandID] = transaction
+            while len(self.cachedTransactions) > MAX_CACHED_TRANSACTIONS:
+                self.cachedTransactions.popitem(last=False)
+            entry = self.responseFutures.pop(commandID, None)
+        if entry and not entry[0].done():
+            entry[0].set_result(package)
         if self.proxy:
             self.proxy.accept(package)
 
@@ -5,6 +5,7 @@ from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Destination import ThreadedDestination
 from Framework.BaseClasses.Manager import DataManager_Base as dm
 from Framework.Manager.ObjectManager import ObjectManager
+from Framework.Manager.Routing import RoutingTable, ALL_PUBLISHERS
 from Utils import ClassUtils as cu
 
 
@@ -15,6 +16,8 @@ class DataManager(dm, ThreadedDestination):
         dm.__init__(self, name)
         self.subscriptions = {}
         self.subRecords = []
+        # subscriptions compiled into a tuple of subscribers per publisher, rebuilt by subscribe.
+        self.routing = RoutingTable(name, logger=self.logger)
         self.registerArchiver(archiver)
         ObjectManager.registerObject(self)
         if processStopper:
@@ -64,29 +67,32 @@ class DataManager(dm, ThreadedDestination):
         if subscriberObjName is None:
             subscriberObjName = subscriberObject.getName()
         if publisherName is None:
-            publisherName = 'SOME_KEY_FOR_ALL_PUBLISHERS'
-        if not publisherName in self.subscriptions.keys():
-            self.subscriptions[publisherName] = {}
-        # TODO: add check here for duplicate/conflicting subscriber
-        self.subscriptions[publisherName][subscriberObjName] = subscriberObject
-        subRecord = {subscriberObjName: {
-            'publisher': publisherName
-        }}
-        self.subRecords.append(subRecord)
+            publisherName = ALL_PUBLISHERS
+        with self.routing.lock:
+            if not publisherName in self.subscriptions.keys():
+                self.subscriptions[publisherName] = {}
+            # TODO: add check here for duplicate/conflicting subscriber
+            self.subscriptions[publisherName][subscriberObjName] = subscriberObject
+            subRecord = {subscriberObjName: {
+                'publisher': publisherName
+            }}
+            self.subRecords.append(subRecord)
+            self._compileRoutes()
+
+    def _compileRoutes(self):
+        """Rebuild the routing table: the subscribers of each publisher, followed by the subscribers to all publishers."""
+        allPubs = list(self.subscriptions.get(ALL_PUBLISHERS, {}).items())
+        routes = {publisher: [*subs.items(), *allPubs] for publisher, subs in self.subscriptions.items()}
+        routes[ALL_PUBLISHERS] = allPubs
+        self.routing.compile(routes)
+
+    def getDeliveryStats(self):
+        """Return the deliveries to each subscriber, see RoutingTable.getStats."""
+        return self.routing.getStats()
 
     def handlePackage(self, package):
         if package.channelType == ChannelType.Data:
             self.publish(package)
 
     def publish(self, package):
-        publisher = package.source
-
-        pubs = self.subscriptions.get(publisher, {})
-        allPubs = self.subscriptions.get('SOME_KEY_FOR_ALL_PUBLISHERS', {})
-        allSubs = set()
-        for singleSub in pubs.values():
-            allSubs.add(singleSub)
-        for singleSub in allPubs.values():
-            allSubs.add(singleSub)
-        for sub in allSubs:
-            sub.accept(package)
\ No newline at end of file
+        self.routing.deliver(self.routing.route(package.source, ALL_PUBLISHERS), package)
\ No newline at end of file
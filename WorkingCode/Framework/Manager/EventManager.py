@@ -5,6 +5,7 @@ from Framework.BaseClasses.Events import EventTypes
 # from Framework.Archive.DirectoryArchiver import DirectoryArchiver
 from Framework.BaseClasses.Manager import EventManager_Base as em
 from Framework.Manager.ObjectManager import ObjectManager
+from Framework.Manager.Routing import RoutingTable, ALL_PUBLISHERS
 from Utils import ClassUtils as cu
 
 
@@ -28,6 +29,8 @@ class EventManager(em):
         # self.pubSub = {}
         self.subRecords = []
         self.subscriptions = {}
+        # subscriptions compiled into a tuple of subscribers per (eventType, publisher), rebuilt by subscribe.
+        self.routing = RoutingTable(name, logger=self.logger)
 
         self.archiver = None
         self.registerArchiver(archiver)
@@ -73,52 +76,59 @@ class EventManager(em):
         if objName is None:
             objName = obj.name
         if publisher is None:
-            publisher = 'SOME_KEY_FOR_ALL_PUBLISHERS'
+            publisher = ALL_PUBLISHERS
         if events is None:
             # subscribe to all events from a publisher no events are supplied.
             events = [event for event in EventTypes]
         if type(events) is list and len(events) == 0:
             events = [event for event in EventTypes]
-        for singleEvent in events:
-            # second key level is eventType.
-            if self.subscriptions.get(singleEvent, None) is None:
-                self.subscriptions[singleEvent] = {}
-            # third key level is publisher.
-            if self.subscriptions[singleEvent].get(publisher, None) is None:
-                self.subscriptions[singleEvent][publisher] = {}
-            # TODO: add check here for duplicate/conflicting subscriber
-            self.subscriptions[singleEvent][publisher][objName] = obj
-        subRecord = {objName: {
-            'publisher': publisher,
-            'events': events
-        }}
-        self.subRecords.append(subRecord)
+        with self.routing.lock:
+            for singleEvent in events:
+                # second key level is eventType.
+                if self.subscriptions.get(singleEvent, None) is None:
+                    self.subscriptions[singleEvent] = {}
+                # third key level is publisher.
+                if self.subscriptions[singleEvent].get(publisher, None) is None:
+                    self.subscriptions[singleEvent][publisher] = {}
+                # TODO: add check here for duplicate/conflicting subscriber
+                self.subscriptions[singleEvent][publisher][objName] = obj
+            subRecord = {objName: {
+                'publisher': publisher,
+                'events': events
+            }}
+            self.subRecords.append(subRecord)
+            self._compileRoutes()
         # TODO: Add checks for event types, and maybe publishers.
 
+    def _compileRoutes(self):
+        """ Rebuild the routing table. The route of (eventType, publisher) holds the subscribers to that event type from
+        that publisher, followed by the subscribers to that event type from all publishers."""
+        routes = {}
+        for eventType, publishers in self.subscriptions.items():
+            allPubs = list(publishers.get(ALL_PUBLISHERS, {}).items())
+            for publisher, subs in publishers.items():
+                routes[(eventType, publisher)] = [*subs.items(), *allPubs]
+            routes[(eventType, ALL_PUBLISHERS)] = allPubs
+        self.routing.compile(routes)
+
+    def getDeliveryStats(self):
+        """Return the deliveries to each subscriber, see RoutingTable.getStats."""
+        return self.routing.getStats()
+
     def publish(self, package):
         # Pubilsh a package to a subscriber if the subscriber is listening for events from that publisher AND EITHER
         # A) The event type is in the subscription pool of listening events from that publisher or
         # B) the event pool is empty (signalling that every event should be listened to).
 
         self.archive(package)
-        pkgSource = package.source
-        pld = package.payload
-        event = package.payload
-        publisher = package.source
-        eventType = event.eventType
+        eventType = package.payload.eventType
 
-        if pld.eventType == EventTypes.Shutdown:
+        if eventType == EventTypes.Shutdown:
             self.logger.info(f'Shutdown event received by EventManager {self.getName()}; Setting global process stopper signal.')
             stopper = ObjectManager.getStopper()
             stopper.set()
 
-        # TODO: add checks regarding the outcome of the get method.
-        pldType = self.subscriptions.get(eventType, {})
-        pub = pldType.get(publisher, {})
-        allPublish = self.subscriptions.get('SOME_KEY_FOR_ALL_PUBLISHERS', {})
-        uniqueSubs = set([*list(pub.values()), *list(allPublish.values())])
-        for sub in uniqueSubs:
-            sub.accept(package)
+        self.routing.deliver(self.routing.route((eventType, package.source), (eventType, ALL_PUBLISHERS)), package)
 
     def archive(self, package):
         if self.archiver:
@@ -0,0 +1,110 @@
+import logging
+import time
+from threading import RLock
+
+"""
+.. _routing:
+
+#################
+Routing
+#################
+
+Subscriptions of the Data and Event managers are compiled into a routing table: a dict from a route key (IE a
+publisher name, or an (eventType, publisher) pair) to the tuple of subscribers that receive its packages. The table
+is rebuilt whole and swapped in when a subscription is added, so publishing is one dict lookup and a loop over a
+tuple, and never sees a table that is half updated.
+
+Deliveries are counted and timed per subscriber, see RoutingTable.getStats.
+"""
+
+ALL_PUBLISHERS = 'SOME_KEY_FOR_ALL_PUBLISHERS'
+SLOW_DELIVERY = .01 # seconds a subscriber's accept may take before the delivery is counted as slow.
+
+
+class DeliveryStats():
+    """Counters of the deliveries to one subscriber."""
+    __slots__ = ['delivered', 'failed', 'slow', 'totalTime', 'maxTime']
+
+    def __init__(self):
+        self.delivered = 0
+        self.failed = 0
+        self.slow = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+
+    def toDict(self):
+        return {
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'slow': self.slow,
+            'meanTime': self.totalTime / self.delivered if self.delivered else 0.0,
+            'maxTime': self.maxTime
+        }
+
+
+class RoutingTable():
+    """ Immutable routes from a key to a tuple of (subscriberName, subscriber, DeliveryStats), replaced whole by compile.
+
+    :param name: name of the owner, for logging.
+    :param slowDelivery: deliveries that take longer than this many seconds are counted as slow, and logged.
+    """
+    def __init__(self, name, slowDelivery=SLOW_DELIVERY, logger=None):
+        self.name = name
+        self.slowDelivery = slowDelivery
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.lock = RLock()
+        self._routes = {}
+        self._stats = {} # subscriberName: DeliveryStats. Kept across compiles.
+
+    def compile(self, routes):
+        """ Swap in new routes.
+
+        :param routes: {key: iterable of (subscriberName, subscriber)}. A subscriber listed more than once under a key
+            receives each package once.
+        """
+        with self.lock:
+            compiled = {}
+            for key, subscribers in routes.items():
+                unique = {}
+                for subName, sub in subscribers:
+                    if not id(sub) in unique:
+                        stats = self._stats.get(subName)
+                        if stats is None:
+                            stats = self._stats[subName] = DeliveryStats()
+                        unique[id(sub)] = (subName, sub, stats)
+                compiled[key] = tuple(unique.values())
+            self._routes = compiled
+
+    def route(self, key, fallbackKey=None):
+        """Return the subscribers of key, or of fallbackKey if key has no route of its own."""
+        routes = self._routes
+        subscribers = routes.get(key)
+        if subscribers is None:
+            subscribers = routes.get(fallbackKey, ())
+        return subscribers
+
+    def deliver(self, subscribers, package):
+        """Call accept(package) on each of subscribers, as returned by route. A subscriber that raises does not stop
+        the delivery to the others."""
+        for subName, sub, stats in subscribers:
+            start = time.perf_counter()
+            try:
+                sub.accept(package)
+            except Exception as e:
+                stats.failed += 1
+                self.logger.exception(f'{self.name} could not deliver package from {package.source} to {subName}: {e}')
+                continue
+            # only packages accepted count as delivered, and only their times make up meanTime.
+            elapsed = time.perf_counter() - start
+            stats.delivered += 1
+            stats.totalTime += elapsed
+            if elapsed > stats.maxTime:
+                stats.maxTime = elapsed
+            if elapsed > self.slowDelivery:
+                stats.slow += 1
+                self.logger.debug(f'{self.name}: subscriber {subName} took {elapsed * 1000:.1f} ms to accept a package.')
+
+    def getStats(self):
+        """Return {subscriberName: {delivered, failed, slow, meanTime, maxTime}}, times in seconds."""
+        with self.lock:
+            return {subName: stats.toDict() for subName, stats in self._stats.items()}
@@ -1,10 +1,10 @@
 import logging
-import time
-from threading import Thread
+from threading import RLock
 
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Destination import ThreadedDestination
-from Framework.BaseClasses.Package import Package
+from Framework.BaseClasses.Package import Package, BlockPayload
+from Framework.Pipes.ReadScheduler import getSharedScheduler
 from Utils import ClassUtils as cu
 
 
@@ -14,8 +14,11 @@ class ReadPipe(ThreadedDestination):
 
     For this read pipe to work properly, destination must be a Destination and source must be a reader (have a 'read' method).
 
-    Calling start on this read pipe will enter it into threaded mode. The runReading() method will run until end() is called,
-    in which case terminate will be set to True and the runReading will end.
+    Calling start on this read pipe will enter it into threaded mode. read() is then run every freq seconds (which may be
+    below a second) by a ReadScheduler, the shared one unless scheduler is given, until end() is called or the process
+    is stopped. Reads are on an absolute cadence, so a slow read does not push the following reads back; see
+    ReadScheduler for how overruns are handled, and getScheduleStats. If the source has a pollingEngine, the engine
+    reads it instead, on one job with the other sources of the same interval.
 
     Additionally, this class is a Destination, which means it inherits Destination.run(). This run() method will take packages
     off of the incoming inputQueue which have been added by the accept() method in the base class of Destination. It will
@@ -23,9 +26,13 @@ class ReadPipe(ThreadedDestination):
     as the read() packages.
 
     'Source' and 'Destination' must be a 'Reader' and 'Destination' subclass respectively  for proper functionality,
-    and the start() method must be executed after instantiation for the run and runReading() methods to run in their own threads."""
+    and the start() method must be executed after instantiation for the run and read() methods to run in their own threads.
+
+    A reading that is a list of samples is sent as one package with a BlockPayload. With a batchSize above 1, the
+    readings of batchSize reads are also sent together as a block (so a sample waits up to batchSize*freq seconds before
+    it is sent); whatever is left over is sent when the pipe ends."""
     insts = 0
-    def __init__(self, name=None, source=None, destination=None, freq=1, **kwargs):
+    def __init__(self, name=None, source=None, destination=None, freq=1, batchSize=1, scheduler=None, **kwargs):
         name = name if name else "ReadPipe_{}".format(ReadPipe.insts)
         ThreadedDestination.__init__(self, name=name)
         ReadPipe.insts += 1
@@ -34,8 +41,13 @@ class ReadPipe(ThreadedDestination):
         sourceSet = self.setSource(source)
         destSet = self.setDestination(destination)
         self.freq = freq
+        self.batchSize = batchSize
+        self._batch = []
+        self.readLock = RLock()
+        self.scheduler = scheduler
+        self.readJob = None
+        self.pollingEngine = None
         self.terminate = False
-        self.readThread = Thread(target=self.runReading, name=''.join([self.getName(), '_readThread']))
 
     def handlePackage(self, package):
         """ A method that is called by the base class Destination. Will forward any incoming packages on to destination.
@@ -80,50 +92,93 @@ class ReadPipe(ThreadedDestination):
         # End Proposed alternate functionality #
         if not self.source or not self.destination:
             return False
+        with self.readLock:
+            return self._read()
+
+    def _read(self):
         try:
-            payload = self.source.read()
-            if payload is list:
-                for singlePayload in payload:
-                    package = Package(source=self.source.getName(), channelType=ChannelType.Data, payload=singlePayload)
-                    self.destination.accept(package)
+            return self.handleReading(self.source.read())
+        except Exception as e:
+            logging.error(e)
+
+    def handleReading(self, payload):
+        """Send a reading of the source, batching it if batchSize is above 1. Also used by a polling engine, which
+        reads the source itself."""
+        with self.readLock:
+            if isinstance(payload, list):
+                self._batch.extend(payload)
             elif payload:
-                package = Package(source=self.source.getName(), channelType=ChannelType.Data, payload=payload)
-                self.destination.accept(package)
-            else:
-                pass
+                if self.batchSize > 1:
+                    self._batch.append(payload)
+                else:
+                    self._send(payload)
+            if self._batch and (isinstance(payload, list) or len(self._batch) >= self.batchSize):
+                self.flushBatch()
             return payload
+
+    def flushBatch(self):
+        """Send the samples that are waiting to be batched as one block package."""
+        with self.readLock:
+            samples, self._batch = self._batch, []
+        if samples:
+            self._send(BlockPayload.fromRows(self.source.getName(), samples))
+
+    def _send(self, payload):
+        package = Package(source=self.source.getName(), timestamp=self._payloadTimestamp(payload),
+                          channelType=ChannelType.Data, payload=payload)
+        self.destination.accept(package)
+
+    @staticmethod
+    def _payloadTimestamp(payload):
+        """The timestamp of a reading, which a block package takes from its first sample. None for the time it is sent."""
+        if cu.isBlock(payload):
+            return payload.timestamp
+        return None
+
+    def _scheduledRead(self):
+        """Target of the read job. Reads, or ends the job once the pipe has been ended or the process is stopping."""
+        if self.terminate or self.isTimeToStop():
+            self._endReading()
+            return
+        self.read()
+
+    def _endReading(self):
+        job, self.readJob = self.readJob, None
+        if self.pollingEngine:
+            self.pollingEngine.removePipe(self)
+        elif job:
+            self.scheduler.cancel(job)
+        try:
+            self.flushBatch()
         except Exception as e:
             logging.error(e)
 
-    def runReading(self):
-        """Main target of the read thread. Runs read() on an interval continuously until
+    def getScheduleStats(self):
+        """Return the tick stats of the read job (see ReadScheduler.getStats), or None if it is not running."""
+        job = self.readJob
+        if job is None:
+            return None
+        return {'interval': job.interval, **job.stats.toDict()}
 
-        While running, the ReadPipe will read data from the source (an IntervalReader) and wrap it in a custom Package class.
-        Wait for a time, then do the same thing.
-        Returns
-        -------
+    def run(self):
+        """ Schedule read() to run every freq seconds. Also starts the Destination run loop
+        (taking packages off of the input queue and calling handlePackage on them when required).
 
+        :return:
         """
-        # Proposed namespace manager context management functionality.
-        # with NamespaceManager(self.name) as nsForThread:
-        #     while not self.terminate:
-        #         self.read()
-        #         time.sleep(self.freq)
         if not cu.isReader(self.source):
             logging.error(f'Read Pipe {self.getName()} cannot run main read loop as source {self.source} is not a Reader.')
         if not cu.isDestination(self.destination):
             logging.error(f'Read Pipe {self.getName()} cannot run main read loop as destination {self.destination} is not a Destination.')
-        while not self.isTimeToStop():
-            self.read()
-            time.sleep(self.freq)
-
-    def run(self):
-        """ Start the thread which will enact the read() method continuously. Also starts the Destination run loop
-        (taking packages off of the input queue and calling handlePackage on them when required).
-
-        :return:
-        """
-        self.readThread.start()
+        engine = getattr(self.source, 'pollingEngine', None)
+        if engine:
+            # the engine polls the source along with the other readers on this interval, see PollingEngine.
+            self.pollingEngine = engine
+            self.readJob = engine.addPipe(self)
+        else:
+            if self.scheduler is None:
+                self.scheduler = getSharedScheduler()
+            self.readJob = self.scheduler.schedule(self.getName(), self.freq, self._scheduledRead)
         ThreadedDestination.run(self)
 
     def end(self):
@@ -131,8 +186,10 @@ class ReadPipe(ThreadedDestination):
 
         Setting terminate to True here will stop the main run() loop and exit that thread. Additionally, Destination.end()
         does the same thing (sets terminate to True) so the terminate is redundant (but good practise for clarity).
+        The read job is cancelled, and samples still waiting to be batched are sent.
 
         :return:
         """
         ThreadedDestination.end(self)
         self.terminate = True
+        self._endReading()
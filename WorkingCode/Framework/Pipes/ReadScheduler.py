@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+.. _read-scheduler:
+
+#################
+Read Scheduler
+#################
+
+Runs the reads of many ReadPipes from one timer thread. Each job fires on an absolute cadence taken from the
+monotonic clock, start + n * interval, so the time a read takes does not push the following reads back (sleeping
+for the interval after each read makes the period interval + read time, and the timestamps drift).
+
+The timer thread only keeps time; reads are run by a pool of worker threads, so a slow Modbus round trip on one reader
+does not hold up the others. A job never has two reads running at once:
+
+    overrun: a read that took longer than the job's interval.
+    missed tick: a tick at which the job's previous read was still running, or that had already passed by the time the
+        scheduler got to it. Missed ticks are skipped, not run late back to back, so the cadence is kept.
+
+Overruns and missed ticks are counted per job along with how late reads start (actual - scheduled), and the recent
+(scheduled, actual) epoch timestamps are kept, see getStats. When a job overruns or misses ticks it is logged as a
+warning, and passed to the reporter if one was given, at most once every REPORT_INTERVAL seconds per job.
+"""
+
+DEFAULT_WORKERS = 16 # threads that run reads. When more jobs than this are reading at once, the rest wait for a thread.
+MIN_INTERVAL = .001 # seconds. Shortest interval a job may be scheduled at.
+HISTORY_LENGTH = 100 # (scheduled, actual) timestamps kept per job.
+REPORT_INTERVAL = 10.0 # seconds between reports of the overruns of one job.
+
+
+class TickStats():
+    """Counters of the ticks of one job. Times are seconds."""
+    __slots__ = ['fired', 'missed', 'overruns', 'failed', 'totalLate', 'maxLate', 'maxDuration', 'history']
+
+    def __init__(self):
+        self.fired = 0
+        self.missed = 0
+        self.overruns = 0
+        self.failed = 0
+        self.totalLate = 0.0
+        self.maxLate = 0.0
+        self.maxDuration = 0.0
+        self.history = deque(maxlen=HISTORY_LENGTH)
+
+    def toDict(self):
+        return {
+            'fired': self.fired,
+            'missed': self.missed,
+            'overruns': self.overruns,
+            'failed': self.failed,
+            'meanLate': self.totalLate / self.fired if self.fired else 0.0,
+            'maxLate': self.maxLate,
+            'maxDuration': self.maxDuration,
+            'history': list(self.history)
+        }
+
+
+class ScheduledJob():
+    """ A callback that a ReadScheduler runs every interval seconds. Returned by ReadScheduler.schedule."""
+    def __init__(self, name, interval, callback, start):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.start = start # monotonic time of tick 0.
+        self.startEpoch = time.time() - (time.monotonic() - start) # the same instant, as an epoch timestamp.
+        self.tick = 0
+        self.firedAt = None # monotonic time the running (or last) read was due.
+        self.running = False
+        self.cancelled = False
+        self.stats = TickStats()
+        self._lastReport = None
+        self._reported = (0, 0) # (overruns, missed) at the last report.
+
+    def dueAt(self, tick):
+        return self.start + tick * self.interval
+
+    def toEpoch(self, monotonic):
+        return self.startEpoch + (monotonic - self.start)
+
+    def cancel(self):
+        """Stop scheduling the job. A read that is running is left to finish."""
+        self.cancelled = True
+
+
+class ReadScheduler():
+    """ One timer thread that fires many jobs on their own cadence, running their callbacks on a worker pool.
+
+    :param reporter: if given, called with the stats of a job (see getStats) when it overruns or misses ticks.
+    """
+    def __init__(self, name='ReadScheduler', maxWorkers=DEFAULT_WORKERS, reporter=None, logger=None):
+        self.name = name
+        self.maxWorkers = maxWorkers
+        self.reporter = reporter
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.jobs = {}
+        self._heap = [] # (due, seq, job), seq breaking ties in the order jobs were scheduled.
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = None
+        self._stopped = False
+
+    def schedule(self, name, interval, callback, startDelay=0.0):
+        """ Run callback() every interval seconds, the first time after startDelay seconds.
+
+        :return: the ScheduledJob, which is stopped with cancel.
+        """
+        if interval < MIN_INTERVAL:
+            raise ValueError(f'Scheduler {self.name} cannot run job {name} every {interval} seconds, the shortest '
+                             f'interval is {MIN_INTERVAL}.')
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f'Scheduler {self.name} has been stopped.')
+            job = ScheduledJob(name, interval, callback, time.monotonic() + startDelay)
+            self.jobs[name] = job
+            heapq.heappush(self._heap, (job.start, next(self._seq), job))
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix=f'{self.name}-worker')
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def cancel(self, job):
+        with self._cond:
+            job.cancel()
+            if self.jobs.get(job.name) is job:
+                del self.jobs[job.name]
+            self._cond.notify()
+
+    def stop(self):
+        """Cancel every job and end the timer thread. Reads that are running are left to finish."""
+        with self._cond:
+            self._stopped = True
+            for job in self.jobs.values():
+                job.cancel()
+            self.jobs = {}
+            self._heap = []
+            self._cond.notify()
+        if self._pool:
+            self._pool.shutdown(wait=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    # cancelled jobs are dropped when they come up rather than searched for in cancel.
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._stopped:
+                    return
+                due, seq, job = heapq.heappop(self._heap)
+                self._fire(job, due, now)
+                heapq.heappush(self._heap, (job.dueAt(job.tick), next(self._seq), job))
+
+    def _fire(self, job, due, now):
+        """Start the read of job's due tick, unless the last one is still running, and move job on to its next tick."""
+        if job.running:
+            job.stats.missed += 1
+            self._checkReport(job)
+        else:
+            job.running = True
+            self._pool.submit(self._execute, job, due)
+        job.tick += 1
+        if job.dueAt(job.tick) <= now:
+            # the scheduler got here late; skip the ticks that have already passed.
+            skipped = int((now - job.dueAt(job.tick)) // job.interval) + 1
+            job.tick += skipped
+            job.stats.missed += skipped
+            self._checkReport(job)
+
+    def _execute(self, job, due):
+        actual = time.monotonic()
+        stats = job.stats
+        job.firedAt = due
+        try:
+            job.callback()
+        except Exception as e:
+            stats.failed += 1
+            self.logger.exception(f'Scheduler {self.name}: job {job.name} raised {e!r}')
+        finally:
+            duration = time.monotonic() - actual
+            late = actual - due
+            stats.fired += 1
+            stats.totalLate += late
+            stats.maxLate = max(stats.maxLate, late)
+            stats.maxDuration = max(stats.maxDuration, duration)
+            stats.history.append((job.toEpoch(due), job.toEpoch(actual)))
+            if duration > job.interval:
+                stats.overruns += 1
+            job.running = False
+        if duration > job.interval:
+            self._checkReport(job)
+
+    def _checkReport(self, job):
+        now = time.monotonic()
+        with self._cond:
+            counts = (job.stats.overruns, job.stats.missed)
+            if counts == job._reported or (job._lastReport is not None and now - job._lastReport < REPORT_INTERVAL):
+                return
+            newOverruns, newMissed = counts[0] - job._reported[0], counts[1] - job._reported[1]
+            job._lastReport, job._reported = now, counts
+        self.logger.warning(f'Scheduler {self.name}: job {job.name} (every {job.interval} s) overran {newOverruns} '
+                            f'and missed {newMissed} ticks. Longest read took {job.stats.maxDuration:.3f} s.')
+        if self.reporter:
+            try:
+                self.reporter({'name': job.name, 'interval': job.interval, **job.stats.toDict()})
+            except Exception as e:
+                self.logger.exception(e)
+
+    def getStats(self, name=None):
+        """ Return {jobName: {fired, missed, overruns, failed, meanLate, maxLate, maxDuration, history}} of the
+        scheduled jobs, or the stats of the job named name. history is the recent (scheduled, actual) epoch timestamps."""
+        with self._cond:
+            if not name is None:
+                job = self.jobs.get(name)
+                return {'interval': job.interval, **job.stats.toDict()} if job else None
+            return {jobName: {'interval': job.interval, **job.stats.toDict()} for jobName, job in self.jobs.items()}
+
+
+_sharedScheduler = None
+_sharedLock = threading.Lock()
+
+
+def getSharedScheduler():
+    """The scheduler that ReadPipes use unless they are given one."""
+    global _sharedScheduler
+    with _sharedLock:
+        if _sharedScheduler is None:
+            _sharedScheduler = ReadScheduler('SharedReadScheduler')
+        return _sharedScheduler
@@ -1,28 +1,42 @@
 import logging
-import pickle
 import queue
 import socket
 import threading
 
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import Package
 from Framework.Proxy import ProxySerializer as ps
 # from Framework.Proxy.LoRa import
-from Framework.Proxy import SimplifiedProxyHeader as ph
-from Framework.Proxy.TCP import TCPListener, TCPConnection
+from Framework.Proxy.TCP import AsyncTCP, TCPListener, TCPConnection
+from Framework.Proxy.TCP.StreamFramer import LENGTH
 
 TCP_MAX_BYTES = 8192
 CONN_GET_TIMEOUT = 1
 CONNECTION_TIMEOUT = 1
+THREADS = 'threads' # a TCPConnection, with its own threads, per connection.
+ASYNCIO = 'asyncio' # every connection in one AsyncTCP.NetworkLoop.
+TRANSPORTS = (THREADS, ASYNCIO)
+PROXY_SOURCE_ID = 0 # sourceID of the packages a proxy sends of its own, as the source map.
 
 class NetworkInterface:
     """
      - Maps whole network regardless of type of connection (loRa or TCP)
      - maps sourceNames to their connections
+     - encodes packages as binary packets (ProxySerializer.BinaryCodec), with one codec per connection. TCP connections
+       are length framed, as the packets are binary.
+     - sends each new connection the sourceName: sourceID map, as a ProxyCommand package from proxyName.
+     - transport picks how TCP connections are run: THREADS, as TCPListener and TCPConnection, or ASYNCIO, as
+       AsyncTCPListener and AsyncTCPConnection in networkLoop (AsyncTCP.getSharedLoop() when None). Either way new
+       connections come off conQueue, and are sent to and received from alike.
 
     """
     def __init__(self, name, proxyName,
                  namespace=None,
                  tcpListenAddress:tuple=None, tcpJoinAddress:tuple=None,
-                 loRaListener=None, loRaJoinAddress=None):
+                 loRaListener=None, loRaJoinAddress=None,
+                 transport=THREADS, networkLoop=None):
+        if transport not in TRANSPORTS:
+            raise ValueError(f'Unknown transport {transport}, expecting one of {TRANSPORTS}')
         self.name = name
         self.proxyName = proxyName
         self.namespace = namespace
@@ -37,11 +51,23 @@ class NetworkInterface:
         self.networkConnection = None  # The connection to a network
         self.connections = {}  # connections to *THIS* network
         self.sources = {}
+        self.codecs = {}  # connection: BinaryCodec of the packets sent and received on it.
+        self.transport = transport
+        self.networkLoop = None
+        if transport == ASYNCIO:
+            self.networkLoop = networkLoop or AsyncTCP.getSharedLoop()
+        self.terminate = False
+        self.tcpListener = None
+        self.connectionThread = None
 
         self.conQueue = queue.Queue()  # All new connections pushed to this queue to be handled one at a time
         # setup listeners
-        if self.tcpListenAddress and self.tcpJoinAddress:
-            self.tcpListener = TCPListener.TCPListener(proxyName, proxyName+"_TCPListener", tcpListenAddress, self.conQueue)
+        if self.tcpListenAddress and self.transport == ASYNCIO:
+            self.tcpListener = AsyncTCP.AsyncTCPListener(proxyName, proxyName+"_TCPListener", tcpListenAddress,
+                                                         self.conQueue, framing=LENGTH, networkLoop=self.networkLoop)
+        elif self.tcpListenAddress:
+            self.tcpListener = TCPListener.TCPListener(proxyName, proxyName+"_TCPListener", tcpListenAddress, self.conQueue,
+                                                      framing=LENGTH)
         if self.loRaListener:
             # self.loRaListener = LoRaListener.LoRaListener(proxyName, proxyName+"_LoRaListener", loRaListener, self.conQueue)
             pass
@@ -61,7 +87,8 @@ class NetworkInterface:
 
     def start(self):
         self.listen()
-        self.connectionThread.start()
+        if self.connectionThread:
+            self.connectionThread.start()
 
     def listen(self):
         """starts listener thread"""
@@ -72,26 +99,49 @@ class NetworkInterface:
 
     def close(self):
         try:
-            self.listener.close()
+            if self.tcpListener:
+                self.tcpListener.close()
         except Exception:
             logging.info(f"Listener for TCPNetwork Manager {self.name} already closed")
 
     def end(self):
         """terminates listener thread and closes server"""
-        self.close()
         self.terminate = True
+        self.conQueue.put(None)  # wakes connectionThread.
+        self.close()
+        for connection in [self.networkConnection, *[con['connection'] for con in self.connections.values()]]:
+            if connection:
+                connection.end()
 
 
     def sendPackageTo(self, package, destinationName):
-        payloadBytearrays = self.encodePackage(package)
         destinationConnection = self.getConnectionFromName(destinationName)
-        for payloadBytearray in payloadBytearrays:
-            sent = destinationConnection.send(payloadBytearray)
-        pass
-
-    def encodePackage(self, package):
-        # ps.getPacketFromPackage()
-        raise NotImplementedError
+        if destinationConnection is None:
+            return False
+        try:
+            packets = self.encodePackage(package, destinationConnection)
+        except ps.SerializeTypeError as e:
+            logging.error(f'Network Manager {self.name} could not send package to {destinationName}: {e}')
+            return False
+        sent = True
+        for packet in packets:
+            sent = destinationConnection.send(packet) and sent
+        return sent
+
+    def getCodec(self, connection):
+        codec = self.codecs.get(connection)
+        if codec is None:
+            codec = self.codecs[connection] = ps.BinaryCodec()
+        return codec
+
+    def encodePackage(self, package, connection):
+        """ :returns: the packets that carry package over connection. The source of the package must be registered. """
+        sourceID = self.sources[package.source]['sourceID']
+        return self.getCodec(connection).encode(package, sourceID)
+
+    def decodePacket(self, packet, connection):
+        """ :returns: the package in a packet received on connection, or None if the packet was metadata. """
+        return self.getCodec(connection).decode(packet)
 
     def receivePacket(self, fromConnection, packet):
         """ put onto package receive queue handler in proxy Interface """
@@ -105,19 +155,24 @@ class NetworkInterface:
         while not self.terminate:
             try:
                 newConnection = self.conQueue.get(timeout=CONN_GET_TIMEOUT)
+                if newConnection is None:
+                    continue
                 self.registerConnection(newConnection, newConnection.conName)
-                bSources = pickle.dumps(self.getSourceMap())
-                header = ph.defaultHeader(sourceID=0, packetID=self.getPktID(),
-                                          channelType=ph.CONV_CHANNEL_TYPE[ph.ChannelType.ProxyCommand],
-                                          packetType=ph.PacketTypes.newSourceMap.value)
-                bHeader = ph.dictToBytes(header)
-                newConnection.send(bHeader+bSources)
+                self.sendSourceMap(newConnection)
 
             except queue.Empty:
                 pass
             except Exception as e:
                 logging.error(f'Network Manager {self.name} could not add new network connection due to exception {e}')
 
+    def sendSourceMap(self, connection):
+        """ Sends the source map (see getSourceMap) over connection, encoded by its codec. """
+        package = Package(source=self.proxyName, payload=self.getSourceMap(), channelType=ChannelType.ProxyCommand)
+        sent = True
+        for packet in self.getCodec(connection).encode(package, PROXY_SOURCE_ID):
+            sent = connection.send(packet) and sent
+        return sent
+
     def getConnectionFromName(self, sourceName):
         try:
             conName = self.sources[sourceName]['connection']
@@ -148,6 +203,11 @@ class NetworkInterface:
         """
         Need to send handshake and get connection approval verification of some sort before adding connection
         """
+        if self.transport == ASYNCIO:
+            # todo: authenticate, once listeners answer handshakes.
+            self.networkConnection = AsyncTCP.getAsyncNetworkConnection(self.proxyName, self.namespace, joinAddress,
+                                                                        framing=LENGTH, networkLoop=self.networkLoop)
+            return self.networkConnection is not None
         try:
             newS = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             newS.settimeout(CONNECTION_TIMEOUT)
@@ -160,7 +220,7 @@ class NetworkInterface:
                 if len(handshake) > 0:
                     handshakeData = ps.decodeHandshakePacket(handshake)
                     if handshakeData:
-                        self.networkConnection = TCPConnection.TCPConnection(self.proxyName, None, newS, self.recvQueue)
+                        self.networkConnection = TCPConnection.TCPConnection(self.proxyName, None, newS, framing=LENGTH)
                         # todo: add something here to connect with other network. Likely request information about its connections? Other networking?
                         return True
                     else:
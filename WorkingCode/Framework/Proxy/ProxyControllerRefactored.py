@@ -3,20 +3,19 @@ import logging
 import pickle
 import queue
 import threading
-from enum import Enum
 from typing import Optional
 
 from Framework.Archive.DirectoryArchiver import DirectoryArchiver
 from Framework.BaseClasses import Events
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Destination import Destination
-from Framework.BaseClasses.Manager import Proxy
+from Framework.BaseClasses.Manager import Proxy_Base
 from Framework.BaseClasses.Package import Package
 from Framework.BaseClasses.Worker import Worker
 from Framework.Manager.CommandManager import CommandManager
 from Framework.Manager.DataManager import DataManager
 from Framework.Manager.EventManager import EventManager
-from Framework.Proxy import ProxyHeader as ph
+from Framework.Proxy import SimplifiedProxyHeader as ph
 from Framework.Proxy import ProxySerializer as ps
 from Framework.Proxy.Listeners import ListenerFactory as lf
 from Utils import ClassUtils as cu
@@ -59,7 +58,7 @@ _EXAMPLE_INTERFACES = {
 }
 
 # API
-class ProxyController(Proxy, Worker, Destination):
+class ProxyController(Proxy_Base, Worker, Destination):
 
     def __init__(self,
                  archiver: Optional[DirectoryArchiver] = None,
@@ -69,8 +68,11 @@ class ProxyController(Proxy, Worker, Destination):
                  name: str = None,
                  interfaces = []
                  ):
-        Destination.__init__(self, name)
-        Worker.__init__(self, archiver, commandManager, dataManager, eventManager, name)
+        super().__init__(name=name, archiver=archiver, commandManager=commandManager, dataManager=dataManager,
+                         eventManager=eventManager)
+        self.localSources = set()  # names of the sources on this proxy's side of the network.
+        self.subscriptions = {}
+        self.networkConnection = None
         # Register with Managers and ask for sources and subscriptions where applicable.
         self.eventManager = None
         self.dataManager = None
@@ -123,7 +125,7 @@ class ProxyController(Proxy, Worker, Destination):
     def start(self):
         self.startListening()
         # self.packetGrabber.start()
-        Destination.start(self)
+        Proxy_Base.start(self)
 
     def startListening(self):
         for interfaceName, interface in self.interfaces.items():
@@ -139,7 +141,7 @@ class ProxyController(Proxy, Worker, Destination):
 
     def end(self):
         """ Terminates all threads """
-        Destination.end(self)
+        Proxy_Base.end(self)
         self.terminate = True
         self.closeAll()
 
@@ -165,7 +167,7 @@ class ProxyController(Proxy, Worker, Destination):
 
     def makeInterface(self, factKWs):
         try:
-            factKWs['proxyName'] = self.name
+            factKWs['proxyName'] = self.getName()
             l = lf.makeInterface(**factKWs)
             return l
         except lf.CreationException:
@@ -392,55 +394,22 @@ class ProxyController(Proxy, Worker, Destination):
             self.sendPacket(bHeader + bSources, con)
 
     def sendPackageToSource(self, package: Package, sourceName, destinationName):
-        """
-        TODO: What if package.payload is not a dictionary?
+        """ Sends package through the interface that knows destinationName, which encodes it for the connection
+        (see NetworkInterface.sendPackageTo).
 
-        :param destinationName: sourceName in self.sources
+        :param destinationName: sourceName in the sources of one of self.interfaces
         :param package: Package object
         :return: True/False if package sent
         """
-        try:
-            # print('sendPackageToSource', self.name, 'to', destinationName, package.channelType)
-            # print(self.sources, self.connections)
-            networkManager = self.getConnectionFromName(destinationName)
-            # con is the actual connetion object (socket/loRa radio device) responsible for sending data to/from the remote proxy.
-            destinationID = self.sources[destinationName]['sourceID']
-
-            retries = PACKAGE_SEND_RETRIES
-            sent = False
-            while not sent and retries < PACKAGE_NUM_RETRIES:
-                sent = networkManager.sendPackageTo(package, destinationName)
-                retries = retries - 1
-            if not sent:
-                # handle the case where the package isn't sent
-                logging.error(f'Proxy named {self.name} could not send package to destination named {destinationName}'
-                              f'over network connection {networkManager}. ')
-                return False
-            else:
-                # handle the case where the package is sent.
-                return True
-
-
-            # TODO: This metadata/data handling/translating should be handled by the interface not the proxy.
-            md, fmt = ps.makeMetadataPayloadFmt(ps.sortedPayload(package.payload))
-            packets = []  # list of packets to send
-            if md != self.sources[destinationName]['metadata']:  # does metadata need to be sent
-                packet = ps.getMetadataPacketFromPackage(self.sources[sourceName]['sourceID'], destinationID,
-                                                         self.getPktID(), package, metadata=md, fmt=fmt)
-                packets.append(packet)
-                self.sources[destinationName]['metadata'] = md
-                self.sources[destinationName]['fmt'] = fmt
-            packetType = 0  # default to Data
-            for value in package.payload.values():
-                if type(value) not in (str, float, int, bool, type(None)) and not isinstance(value, Enum):
-                    # packetType is set to 2 if package has complicated data structures. Tells proxy to just pickle it, otherwise it's 0
-                    packetType = 2
-            packet = ps.getPacketFromPackage(self.sources[sourceName]['sourceID'], destinationID, self.getPktID(),
-                                             package, packetType, fmt)
-            packets.append(packet)
-            return networkManager.send(packets)
-        except Exception as msg:
-            logging.warning('Cannot Send Package to ' + destinationName + ", pkg=" + str(package.payload) + '\nmsg=' + str(msg))
+        for interface in self.interfaces.values():
+            if destinationName in interface.sources:
+                sent = interface.sendPackageTo(package, destinationName)
+                if not sent:
+                    logging.error(f'Proxy named {self.getName()} could not send package to destination named {destinationName} '
+                                  f'through interface {interface.name}.')
+                return sent
+        logging.error(f'Proxy named {self.getName()} has no interface to destination named {destinationName}.')
+        return False
 
     def sendPacketToSource(self, packet, source):
         destName = "NONE"
@@ -638,12 +607,14 @@ class ProxyController(Proxy, Worker, Destination):
             self.sendPacket(packet, self.networkConnection)
 
 
-_PACKET_METHODS = {
-    ph.PacketTypes.data.value: ProxyController._anyData,
-    ph.PacketTypes.metadata.value: ProxyController._metadata,
-    ph.PacketTypes.pickleData.value: ProxyController._anyData,
-    ph.PacketTypes.newSourceMap.value: ProxyController._newSourceMap,
-    ph.PacketTypes.registerNewSources.value: ProxyController._registerNewSources,
-    ph.PacketTypes.removeSources.value: ProxyController._removeSources,
-    ph.PacketTypes.conStatus.value: ProxyController._conStatus
-}
\ No newline at end of file
+# The packet types are no longer in the header (see SimplifiedProxyHeader), nor is handleConnectionPackets above in
+# use; packages are decoded by the NetworkInterface (see ProxySerializer.BinaryCodec).
+# _PACKET_METHODS = {
+#     ph.PacketTypes.data.value: ProxyController._anyData,
+#     ph.PacketTypes.metadata.value: ProxyController._metadata,
+#     ph.PacketTypes.pickleData.value: ProxyController._anyData,
+#     ph.PacketTypes.newSourceMap.value: ProxyController._newSourceMap,
+#     ph.PacketTypes.registerNewSources.value: ProxyController._registerNewSources,
+#     ph.PacketTypes.removeSources.value: ProxyController._removeSources,
+#     ph.PacketTypes.conStatus.value: ProxyController._conStatus
+# }
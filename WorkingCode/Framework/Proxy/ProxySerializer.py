@@ -1,8 +1,47 @@
+import binascii
+import itertools
 import pickle
+import struct
+import time
+from collections import OrderedDict
+from threading import RLock
 
 import Framework.Proxy.SimplifiedProxyHeader as ph
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import BlockPayload, Package
+from Utils import ClassUtils as cu
 from Utils import Encoding as en
 
+"""
+.. _proxy-serializer:
+
+#################
+Proxy Serializer
+#################
+
+Packages cross proxy links in one of two encodings. serialize/deserialize write a package as a line of JSON, which
+handles any payload. BinaryCodec writes it as SimplifiedProxyHeader packets, which is what should be used where bytes
+are scarce, as on LoRa where every byte is airtime.
+
+The binary encoding relies on readers sending the same keys with values of the same types reading after reading. The
+first package from a source is preceded by a metadata packet holding the source's name, its payload keys and the struct
+format of their values (see makeMetadataPayloadFmt), which the receiving codec caches by sourceID. Each following
+package is then a data packet of only its timestamp and values, packed with that format. The metadata is sent again
+whenever a source's keys or value types change (or a string value changes length). A payload that holds anything other
+than bools, ints, floats and strings goes as a JSON packet instead. A BlockPayload goes as a block packet of its own,
+with its columns packed whole.
+
+The payload of every packet starts with RECORD_PREFIX (packetType, sourceID, channelType):
+
+    DATA_PACKET: struct packed timestamp and values, in the order of the source's metadata.
+    METADATA_PACKET: JSON {'source': sourceName, 'fields': [[key, structCode], ...]}
+    JSON_PACKET: the package as serialize writes it, without the newline.
+    BLOCK_PACKET: BLOCK_PREFIX (timestamp, description size), then the JSON description {'source': package source,
+        'blockSource': BlockPayload source, 'samples': n, 'fields': [[key, code], ...], 'json': {key: column}}, then
+        the columns whose code is a struct code, each packed as n values. Columns of other values have the code
+        JSON_COLUMN and are in the description's 'json'.
+"""
+
 TYPE_MAP = {
     "char":   "c",
     'None':   "c",  # null char b'\x00'
@@ -20,9 +59,31 @@ TYPE_MAP = {
     'STRING': 's'  # char[]
 }
 
+DATA_PACKET = 0
+METADATA_PACKET = 1
+JSON_PACKET = 2
+BLOCK_PACKET = 3
+BLOCK_PREFIX = struct.Struct('<dI') # package timestamp, size of the block description.
+BLOCK_CODES = ('d', 'q', '?') # struct codes of the block columns that are packed.
+JSON_COLUMN = 'json' # code of a block column sent in the description, as its values are not all of one packed type.
+RECORD_PREFIX = struct.Struct('<BHB') # packetType, sourceID, channelType value.
+RECORD_ENDIAN = '<'
+TIMESTAMP_CODE = 'd'
+MAX_PACKET_ID = 0xFFFFFFFF # packetIDs are unsigned ints in the header and wrap around.
+MAX_PAYLOAD_SIZE = 0xFFFF # largest payloadSize the header can hold.
+INT64_RANGE = range(-2**63, 2**63)
+MAX_FRAGMENTS = 255 # packets a packet can be split into; packetNum and totalPackets are single bytes.
+REASSEMBLY_TIMEOUT = 10.0 # seconds a Reassembler waits for the rest of a split packet.
+REASSEMBLY_MAX_BYTES = 1 << 20 # bytes of incomplete packets a Reassembler holds at most.
+
+
 class SerializeTypeError(Exception):
     pass
 
+
+class MissingMetadata(Exception):
+    pass
+
 def getType(val, longname=False):  #if none is returned, convert val to a string (likely unknown enum)
     ret=''
     length=''
@@ -98,14 +159,222 @@ def makeRepeaterDicts(package, radioID):
 def getRepeaterDict(bytes):
     return pickle.loads(bytes)
 
-# making packet from
-def makePacket(packetType, sourceID, destinationID, packetID, packetNum, totalPackets, channelType, payloadSize,
-               checksum):
-    header = ph.defaultHeader()
+def makePacket(packetID, payload):
+    """ Return payload behind a SimplifiedProxyHeader holding packetID and the payload size, as a single packet (packetNum
+    and totalPackets 1) to be split by splitPackets if it is too large for a link."""
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise SerializeTypeError(f'Cannot make a packet of {len(payload)} bytes, the largest payload is {MAX_PAYLOAD_SIZE}')
+    packet = bytearray(ph.defaultHeader(packetID=packetID, payloadSize=len(payload)))
+    packet += payload
+    ph.PacketAccess.setChecksum(packet, ph.calcChecksum(packet))
+    return bytes(packet)
+
+def getRecordType(val):
+    """ Return the struct code a value is packed with in a data packet, or None if it cannot be. Unlike getType, the
+    code depends only on the type of the value (and the length of a string), so it stays the same reading to reading."""
+    valType = type(val)
+    if valType is float:
+        return 'd'
+    if valType is int:
+        return 'q' if val in INT64_RANGE else None
+    if valType is bool:
+        return '?'
+    if valType is str:
+        return f'{len(val.encode())}s'
+    return None
+
+def makeMetadataPayloadFmt(payload):
+    """ Return (metadata, fmt) of a payload: metadata is an OrderedDict of its keys to the struct codes of their values,
+    and fmt the struct format of a data record, the timestamp followed by the values. (None, None) if the payload cannot
+    be packed, and has to be sent as JSON."""
+    metadata = OrderedDict()
+    for key, val in payload.items():
+        code = getRecordType(val)
+        if code is None or type(key) is not str:
+            return None, None
+        metadata[key] = code
+    return metadata, getFmtFromMetadata(metadata)
+
+def getFmtFromMetadata(metadata):
+    return ''.join([RECORD_ENDIAN, TIMESTAMP_CODE, *metadata.values()])
+
+class BinaryCodec():
+    """ Encodes packages as packets for one link, and decodes the packets received from the other end of it. See the
+    module documentation for the format.
+
+    Each end of a link needs its own codec, as it tracks which metadata has been sent and received over that link. If
+    the link is reestablished, call reset so the metadata is sent again.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.sent = {}  # sourceID: (keys, codes, Struct) last sent as metadata.
+        self.received = {}  # sourceID: (sourceName, keys, Struct, indexes of string values)
+        self._packetIDs = itertools.count(1)
+
+    def reset(self):
+        with self.lock:
+            self.sent = {}
+            self.received = {}
+
+    def nextPacketID(self):
+        return next(self._packetIDs) & MAX_PACKET_ID
+
+    def encode(self, package, sourceID):
+        """ Return the list of packets that carry package from the source with sourceID: a data packet, preceded by a
+        metadata packet if the source's format has not been sent yet, or a single JSON packet.
+
+        :raises SerializeTypeError: if a packet would hold more than MAX_PAYLOAD_SIZE bytes. A package is never split
+            over several packets, as the receiving end would need every fragment to decode any of it.
+        """
+        payload = package.payload
+        channelType = package.channelType.value
+        if cu.isBlock(payload):
+            return [self._makeRecordPacket(package, BLOCK_PACKET, sourceID, channelType, encodeBlock(package))]
+        packable = isinstance(payload, dict) or cu.isPayload(payload)
+        if packable:
+            keys = tuple(payload.keys())
+            values = tuple(payload.values())
+            codes = tuple(map(getRecordType, values))
+            packable = None not in codes and all(type(key) is str for key in keys)
+        if not packable:
+            body = serialize(package.toDict(), newLine=False)
+            return [self._makeRecordPacket(package, JSON_PACKET, sourceID, channelType, body)]
+        packets = []
+        values = [value.encode() if type(value) is str else value for value in values]
+        with self.lock:
+            sent = self.sent.get(sourceID)
+            if sent is None or sent[0] != keys or sent[1] != codes:
+                metadata = OrderedDict(zip(keys, codes))
+                record = struct.Struct(getFmtFromMetadata(metadata))
+                body = en.restrictedJSONDumps({'source': package.source, 'fields': list(metadata.items())}, toBytes=True)
+                packets.append(self._makeRecordPacket(package, METADATA_PACKET, sourceID, channelType, body))
+                body = record.pack(package.timestamp, *values)
+                packets.append(self._makeRecordPacket(package, DATA_PACKET, sourceID, channelType, body))
+                # only once both packets are made, so a package that is too large does not count as sent metadata.
+                self.sent[sourceID] = (keys, codes, record)
+                return packets
+            record = sent[2]
+        body = record.pack(package.timestamp, *values)
+        packets.append(self._makeRecordPacket(package, DATA_PACKET, sourceID, channelType, body))
+        return packets
+
+    def _makeRecordPacket(self, package, packetType, sourceID, channelType, body):
+        payload = RECORD_PREFIX.pack(packetType, sourceID, channelType) + body
+        if len(payload) > MAX_PAYLOAD_SIZE:
+            raise SerializeTypeError(f'Package from source {package.source} needs a packet of {len(payload)} bytes, '
+                                     f'more than the largest payload of {MAX_PAYLOAD_SIZE}')
+        return makePacket(self.nextPacketID(), payload)
+
+    def decode(self, packet):
+        """ Return the Package carried by a packet made by encode, or None for a metadata packet, whose format is kept
+        for the data packets of its source that follow.
+
+        :raises MissingMetadata: for a data packet from a source whose metadata has not been received.
+        """
+        offset = ph.HEADER_FMT_DICT[ph.DATA_KEY]['offset']
+        packetType, sourceID, channelType = RECORD_PREFIX.unpack_from(packet, offset)
+        offset += RECORD_PREFIX.size
+        if packetType == DATA_PACKET:
+            received = self.received.get(sourceID)
+            if received is None:
+                raise MissingMetadata(f'Received data from sourceID {sourceID} before its metadata.')
+            sourceName, keys, record, strings = received
+            timestamp, *values = record.unpack_from(packet, offset)
+            for i in strings:
+                values[i] = values[i].decode()
+            return Package(source=sourceName, timestamp=timestamp, payload=dict(zip(keys, values)),
+                           channelType=ChannelType(channelType))
+        body = bytes(packet[offset:])
+        if packetType == METADATA_PACKET:
+            metadata = en.restrictedJSONLoads(body)
+            keys = tuple(key for key, code in metadata['fields'])
+            codes = [code for key, code in metadata['fields']]
+            record = struct.Struct(getFmtFromMetadata(OrderedDict(zip(keys, codes))))
+            strings = [i for i, code in enumerate(codes) if code.endswith('s')]
+            with self.lock:
+                self.received[sourceID] = (metadata['source'], keys, record, strings)
+            return None
+        if packetType == BLOCK_PACKET:
+            return decodeBlock(body, channelType)
+        if packetType == JSON_PACKET:
+            pkgDict = deserialize(body)
+            return Package(source=pkgDict['source'], timestamp=pkgDict['timestamp'], payload=pkgDict['payload'],
+                           channelType=pkgDict['channelType'])
+        raise SerializeTypeError(f'Unknown packetType {packetType} from sourceID {sourceID}')
+
+def getColumnCode(column):
+    """ Return the struct code every value of a block column is packed with, or JSON_COLUMN if they are not all of one
+    type that packs (see BLOCK_CODES). """
+    codes = set(map(getRecordType, column))
+    if len(codes) == 1:
+        code, = codes
+        if code in BLOCK_CODES:
+            return code
+    return JSON_COLUMN if column else BLOCK_CODES[0]
+
+def encodeBlock(package):
+    """ Return the body of the block packet of a package carrying a BlockPayload, see the module documentation. """
+    block = package.payload
+    columns = block.toDict()
+    nSamples = block.nSamples
+    fields = []
+    jsonColumns = {}
+    packed = []
+    for key, column in columns.items():
+        code = getColumnCode(column)
+        fields.append([key, code])
+        if code == JSON_COLUMN:
+            jsonColumns[key] = column
+        else:
+            packed.append(struct.pack(f'{RECORD_ENDIAN}{nSamples}{code}', *column))
+    description = en.restrictedJSONDumps({'source': package.source, 'blockSource': block.source, 'samples': nSamples,
+                                          'fields': fields, 'json': jsonColumns}, toBytes=True)
+    return b''.join([BLOCK_PREFIX.pack(package.timestamp, len(description)), description, *packed])
+
+def decodeBlock(body, channelType):
+    """ Return the Package, carrying a BlockPayload, of the body of a block packet. """
+    timestamp, size = BLOCK_PREFIX.unpack_from(body)
+    offset = BLOCK_PREFIX.size
+    description = en.restrictedJSONLoads(body[offset:offset + size])
+    offset += size
+    nSamples = description['samples']
+    columns = {}
+    for key, code in description['fields']:
+        if code == JSON_COLUMN:
+            columns[key] = description['json'][key]
+        else:
+            column = struct.Struct(f'{RECORD_ENDIAN}{nSamples}{code}')
+            columns[key] = list(column.unpack_from(body, offset))
+            offset += column.size
+    return Package(source=description['source'], timestamp=timestamp,
+                   payload=BlockPayload(description['blockSource'], columns), channelType=ChannelType(channelType))
 
 
 ###### CHONKER? #######
 
+def iterFragments(packet, maxBytes):
+    """ Yield (header, payload) of each fragment of a packet whose payload is at most maxBytes long, the payloads being
+    memoryview slices of packet. A packet small enough is yielded as it is, with an empty header.
+
+    :param packet: a whole packet (totalPackets 1), header and payload.
+    :param maxBytes: maximum bytes of payload per fragment, not counting the header.
+    """
+    dataSize = len(packet) - ph.HEADER_SIZE
+    if dataSize <= maxBytes:
+        yield b'', memoryview(packet)
+        return
+    totalPackets = -(-dataSize // maxBytes)
+    if totalPackets > MAX_FRAGMENTS:
+        raise SerializeTypeError(f'Cannot split {dataSize} bytes into {MAX_FRAGMENTS} packets of {maxBytes} bytes')
+    packetID = ph.PacketAccess.getPacketID(packet)
+    with memoryview(packet) as view:
+        for packetNum in range(1, totalPackets + 1):
+            start = ph.HEADER_SIZE + (packetNum - 1) * maxBytes
+            payload = view[start:start + maxBytes]
+            header = bytearray(ph.defaultHeader(packetID, packetNum, totalPackets, len(payload)))
+            header = ph.PacketAccess.setChecksum(header, binascii.crc_hqx(payload, ph.calcChecksum(header)))
+            yield header, payload
+
 def splitPackets(packet, maxBytes):
     """
     splits packet into list of smaller packets with headers depending on maximum size in bytes
@@ -113,34 +382,7 @@ def splitPackets(packet, maxBytes):
     :param maxBytes: maximum bytes of payload, not header+payload
     :return: list of packets
     """
-    sendPackets = []
-    headSize = ph.HEADER_SIZE
-    dataSize = len(packet[ph.HEADER_SIZE:])
-    hDict = ph.bytesToDict(packet)
-    if dataSize > maxBytes:
-        numFullPackets = int(dataSize / maxBytes)
-        lastPackSize = dataSize - (numFullPackets * maxBytes)
-        hDict['totalPackets'] = numFullPackets
-        if lastPackSize > 0:
-            hDict['totalPackets'] += 1
-        for i in range(numFullPackets):
-            i += 1
-            hDict['packetNum'] = i
-            hDict['packetSize'] = maxBytes
-            headBytes = ph.dictToBytes(hDict)
-            startI=headSize + (i - 1) * maxBytes
-            endI=(headSize+i*maxBytes)
-            sendPackets.append(headBytes + packet[startI:endI])
-
-        if lastPackSize>0:  # If packet size does not divide evenly by maxBytes
-            hDict['packetNum'] = numFullPackets+1
-            hDict['totalPackets'] = numFullPackets+1
-            hDict['packetSize'] = lastPackSize
-            headBytes = ph.dictToBytes(hDict)
-            sendPackets.append(headBytes + packet[headSize + numFullPackets * maxBytes:])
-    else:
-        sendPackets.append(packet)
-    return sendPackets
+    return [b''.join([header, payload]) for header, payload in iterFragments(packet, maxBytes)]
 
 
 def combinePackets(packets: list):
@@ -149,14 +391,90 @@ def combinePackets(packets: list):
     :param packets: list of packet bytes ordered by packetNum
     :return: single packet bytes
     """
-    hDict = ph.bytesToDict(packets[-1])
-    packetData = bytearray()
-    for packet in packets:
-        packetData += packet[ph.HEADER_SIZE:]
-    hDict['packetSize'] = len(packetData)
-    hDict['totalPackets'] = 1
-    hDict['packetNum'] = 1
-    return ph.dictToBytes(hDict)+packetData
+    packetID = ph.PacketAccess.getPacketID(packets[0])
+    return makePacket(packetID, b''.join([memoryview(packet)[ph.HEADER_SIZE:] for packet in packets]))
+
+
+class Reassembler():
+    """ Puts the packets split by splitPackets back together, keeping the fragments received of each packetID until the
+    rest arrive.
+
+    Fragments are held as memoryviews of the packets received, and copied once, when the packet is complete. A packet
+    whose fragments have not all arrived within timeout seconds of the first is dropped, as are the oldest incomplete
+    packets while the fragments held take more than maxBytes. Packets that fail their checksum are dropped, and so are
+    fragments of a packetID completed less than timeout seconds ago, which are duplicates.
+    """
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT, maxBytes=REASSEMBLY_MAX_BYTES):
+        self.timeout = timeout
+        self.maxBytes = maxBytes
+        self.pending = OrderedDict()  # packetID: [first arrival, totalPackets, bytes held, [payload or None]], oldest first.
+        self.completed = OrderedDict()  # packetID: time completed, oldest first.
+        self.bytesHeld = 0
+        self.duplicates = 0
+        self.corrupt = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def add(self, packet, now=None):
+        """ :returns: the whole packet once packet and the other fragments of its packetID have all been added, otherwise
+        None. A packet that was not split is returned straight away."""
+        if not ph.checkChecksum(packet):
+            self.corrupt += 1
+            return None
+        totalPackets = ph.PacketAccess.getTotalPackets(packet)
+        if totalPackets <= 1:
+            return packet
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        packetID = ph.PacketAccess.getPacketID(packet)
+        packetNum = ph.PacketAccess.getPacketNum(packet)
+        if packetID in self.completed:
+            self.duplicates += 1
+            return None
+        partial = self.pending.get(packetID)
+        if partial is not None and partial[1] != totalPackets:
+            # the ID has wrapped around onto a stale packet.
+            self._drop(packetID)
+            partial = None
+        if partial is None:
+            partial = self.pending[packetID] = [now, totalPackets, 0, [None] * totalPackets]
+        if not 1 <= packetNum <= totalPackets:
+            self.corrupt += 1
+            return None
+        fragments = partial[3]
+        if fragments[packetNum - 1] is None:
+            payload = memoryview(packet)[ph.HEADER_SIZE:]
+            fragments[packetNum - 1] = payload
+            partial[2] += len(payload)
+            self.bytesHeld += len(payload)
+        else:
+            self.duplicates += 1
+        if None not in fragments:
+            self._drop(packetID)
+            self.completed[packetID] = now
+            return makePacket(packetID, b''.join(fragments))
+        while self.bytesHeld > self.maxBytes and len(self.pending) > 1:
+            self._drop(next(iter(self.pending)))
+            self.evicted += 1
+        return None
+
+    def _expire(self, now):
+        while self.pending:
+            packetID, partial = next(iter(self.pending.items()))
+            if now - partial[0] < self.timeout:
+                break
+            self._drop(packetID)
+            self.expired += 1
+        while self.completed:
+            packetID, completed = next(iter(self.completed.items()))
+            if now - completed < self.timeout:
+                break
+            del self.completed[packetID]
+
+    def _drop(self, packetID):
+        partial = self.pending.pop(packetID)
+        self.bytesHeld -= partial[2]
+
 
 ############## Authenticator ##############
 
@@ -195,16 +513,8 @@ def _packageSize(package):
 
 if __name__ == '__main__':
     data = pickle.dumps(12345)
-    head = ph.dictToBytes(ph.defaultHeader(payloadSize=len(data), packetNum=1, totalPackets=1))
-
-    # print('data', data)
-    initial = head+data
-    # print("initial", initial)
+    initial = makePacket(1, data)
     b = splitPackets(initial, 2)
-    # print(b)
-    combined = combinePackets(b)
-    # print('combined   ', combined)
-    # print('header', head, '\nsplit', b, '\ncombined', combined)
-    # print("data equal = ", initial[ph.HEADER_SIZE:], initial[ph.HEADER_SIZE:] == data)
-    # print("header equal", combined[:ph.HEADER_SIZE] == initial[:ph.HEADER_SIZE])
+    reassembler = Reassembler()
+    combined = [reassembler.add(packet) for packet in b][-1]
     print("ProxySerializer passes?", combined == initial)
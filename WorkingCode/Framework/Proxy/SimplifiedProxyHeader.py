@@ -1,8 +1,9 @@
+import binascii
 import functools
 import struct as s
 from collections import OrderedDict
 
-CHECKSUM_POLYNOMIAL = 1011
+CHECKSUM_INIT = 0xFFFF # initial value of the CRC-16/CCITT-FALSE checksum.
 
 
 # class PacketTypes(Enum):
@@ -71,16 +72,18 @@ HEADER_FMT_DICT = OrderedDict({
     PACKET_NUM_KEY: {"fmt": "B", "offset": 4},
     TOTAL_PKT_KEY: {"fmt": "B", "offset": 5},
     PAYLOAD_SIZE_KEY: {"fmt": "H", "offset": 6},  #only the size after the header (IE of this payload)
-    CHECKSUM_KEY: {'fmt': "B", "offset": 8}, #checksum pf header only.
-    DATA_KEY: {'fmt': None, 'offset': 9}
+    CHECKSUM_KEY: {'fmt': "H", "offset": 8}, # CRC-16 of the header and payload, see calcChecksum.
+    DATA_KEY: {'fmt': None, 'offset': 10}
 })
 
 ENDIAN = '<'
-HEADER_FMT = ENDIAN+'IBBHB'
-HEADER_SIZE = s.calcsize(HEADER_FMT)  # 14 bytes
+HEADER_FMT = ENDIAN+'IBBHH'
+HEADER_SIZE = s.calcsize(HEADER_FMT)  # 10 bytes
+CHECKSUM_OFFSET = HEADER_FMT_DICT[CHECKSUM_KEY]['offset']
+CHECKSUM_END = CHECKSUM_OFFSET + s.calcsize(HEADER_FMT_DICT[CHECKSUM_KEY]['fmt'])
 
 def newChecksum(func):
-    @functools.wraps
+    @functools.wraps(func)
     def newMethod(packet, value):
         packet = func(packet, value)
         newChecksum = calcChecksum(packet)
@@ -99,8 +102,8 @@ class PacketAccess:
             raise IndexError(f'Could not unpack header from buffer, packet is too small (size {len(packet)}, need at least {HEADER_SIZE}')
         return header # header is the corresponding values of the fields.
 
-    @newChecksum
     @staticmethod
+    @newChecksum
     def setPayload(packet, data):
         header = PacketAccess.getHeader(packet)
 
@@ -127,8 +130,7 @@ class PacketAccess:
             return pld
 
     @staticmethod
-    @newChecksum
-    def setPacketID(packet):
+    def getPacketID(packet):
         return getValue(packet, PACKET_ID_KEY)
 
     @staticmethod
@@ -171,27 +173,24 @@ class PacketAccess:
     def setChecksum(packet, checksum):
         return setValue(packet, CHECKSUM_KEY, checksum)
 
-# TODO: make checksum calc and checks
 def calcChecksum(input):
-    """ Based on the CRC (cycle redundancy check) Example found here:
-
-    https://en.wikipedia.org/wiki/Cyclic_redundancy_check
+    """ The CRC-16 (CCITT-FALSE: polynomial 0x1021, initial value 0xFFFF) of a packet, header and payload, leaving out the
+    checksum field itself. See https://en.wikipedia.org/wiki/Cyclic_redundancy_check
 
-    expecting an input in bytearray or bytes format. Input is to be the entire packet (header and payload included) and
-    will be trimmed of the payload/existing checksum. IE the checksum is only the checksum of the header in the payload.
+    binascii.crc_hqx computes the CRC a byte at a time from a 256 entry table, in C.
 
-    :param input:
-    :return:
+    :param input: the entire packet as bytes, bytearray or memoryview.
+    :return: the checksum, an int that fits the header's checksum field.
     """
     PacketAccess.getHeader(input)
-    div = CHECKSUM_POLYNOMIAL
-    remainder = 0
-    return remainder
+    with memoryview(input) as packet:
+        crc = binascii.crc_hqx(packet[:CHECKSUM_OFFSET], CHECKSUM_INIT)
+        return binascii.crc_hqx(packet[CHECKSUM_END:], crc)
 
 def checkChecksum(packet):
+    """Whether the checksum in packet's header matches its contents."""
     checksum = PacketAccess.getChecksum(packet)
     calcedChecksum = calcChecksum(packet)
-    # Note: could also verify by appending the remainder (checksum) to the packet header and running checksum on that, expecting a remainder of 0.
     return checksum == calcedChecksum
 
 def partialPacketInfoFromBytes(bytes):
@@ -202,13 +201,13 @@ def setValue(packet, key, value):
     try:
         if type(packet) == bytes:
             packet = bytearray(packet)
-        s.pack_into(HEADER_FMT_DICT[key]['fmt'], packet, HEADER_FMT_DICT[key]['offset'], value)
+        s.pack_into(ENDIAN + HEADER_FMT_DICT[key]['fmt'], packet, HEADER_FMT_DICT[key]['offset'], value)
     except s.error as msg:
         print(f"Cannot set value {value} for packet {packet} due to following error: ", msg)
     return packet
 
 def getValue(packet, key):
-    return s.unpack_from(HEADER_FMT_DICT[key]['fmt'], packet, HEADER_FMT_DICT[key]['offset'])[0]
+    return s.unpack_from(ENDIAN + HEADER_FMT_DICT[key]['fmt'], packet, HEADER_FMT_DICT[key]['offset'])[0]
 
 def defaultHeader(packetID=0, packetNum=1, totalPackets=1, payloadSize=0, checksum=0):
     d = OrderedDict({
@@ -230,9 +229,9 @@ def bytesToDict(bytes):
     return ret
 
 def dictToHeader(hDict):
-    newHeader = bytes(HEADER_SIZE)
+    newHeader = bytearray(HEADER_SIZE)
     for key, val in hDict.items():
         offset = HEADER_FMT_DICT[key]['offset']
         fmt = HEADER_FMT_DICT[key]['fmt']
-        s.pack_into(fmt, newHeader, offset, val)
-    return newHeader
\ No newline at end of file
+        s.pack_into(ENDIAN + fmt, newHeader, offset, val)
+    return bytes(newHeader)
\ No newline at end of file
@@ -0,0 +1,454 @@
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+from Framework.BaseClasses.Networking.NetworkConnection import NetworkConnection
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy.TCP import TCPJoiner
+from Framework.Proxy.TCP.StreamFramer import FrameError, MAX_FRAME_SIZE, NEWLINE, StreamFramer
+from Framework.Proxy.TCP.TCPConnection import SEND_BATCH_BYTES, SEND_BATCH_DELAY, SEND_TIMEOUT, TCP_MAX_BYTES, \
+    SendStats, framePackets
+
+"""
+.. _async-tcp:
+
+#################
+Async TCP
+#################
+
+A TCPConnection holds two threads, and a TCPListener one more, each waking every second to check whether it should
+stop. That is fine for a handful of proxies, but the threads, and the time to shut them all down, grow with every
+connection. The classes here carry the same packets with the same framing over asyncio instead: one NetworkLoop thread
+runs the event loop that every AsyncTCPListener and AsyncTCPConnection given to it shares, however many connections
+there are.
+
+The rest of the framework keeps calling them from its own threads, as it does TCPListener and TCPConnection:
+
+    * AsyncTCPConnection.send can be called from any thread. The packets are framed by the caller, gathered for up to
+      batchDelay seconds or batchBytes bytes, and written with one transport.write in the loop, as the send thread of a
+      TCPConnection does with one sendall. send(wait=True) blocks the caller until they have been written.
+    * Packets received are put on the connection's recv queue, or given to handler(connection, packet) in the loop
+      thread when there is one, which then must not block.
+    * Connections accepted by an AsyncTCPListener are put on its connection queue, and can be taken off it with
+      accept(timeout) from any thread.
+
+Both ends of a link must use the same framing, so an AsyncTCPConnection can talk to a TCPConnection.
+"""
+
+CONNECT_TIMEOUT = 5 # seconds to wait for a connection to a listener, or for the network loop to do something asked of it.
+LISTEN_BACKLOG = 100 # connection requests an AsyncTCPListener holds before accepting them.
+
+
+class NetworkLoop():
+    """ An asyncio event loop running in its own daemon thread, for the listeners and connections of one or more
+    proxies.
+
+    :param name: name of the loop thread.
+    """
+    def __init__(self, name='NetworkLoop'):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def inLoop(self):
+        """Whether this is called from the loop thread."""
+        return threading.current_thread() is self.thread
+
+    def isRunning(self):
+        return self.thread.is_alive() and not self.loop.is_closed()
+
+    def call(self, callback, *args):
+        """Call callback(*args) in the loop thread, soon. Can be called from any thread."""
+        if self.inLoop():
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coro, timeout=CONNECT_TIMEOUT):
+        """ Run a coroutine in the loop from another thread and return its result, waiting up to timeout seconds.
+
+        :raises TimeoutError: if it did not finish in time, in which case it is cancelled.
+        """
+        if self.inLoop():
+            raise RuntimeError(f'{self.name} cannot wait on a coroutine from its own thread')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout=CONNECT_TIMEOUT):
+        """Stop the loop and wait for its thread to end. Anything left open in it is dropped."""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if not self.inLoop():
+            self.thread.join(timeout)
+            if not self.thread.is_alive():
+                self.loop.close()
+
+
+_sharedLoop = None
+_sharedLoopLock = threading.Lock()
+
+
+def getSharedLoop():
+    """:returns: the NetworkLoop the listeners and connections use unless they are given one, starting it if needed."""
+    global _sharedLoop
+    with _sharedLoopLock:
+        if _sharedLoop is None or not _sharedLoop.isRunning():
+            _sharedLoop = NetworkLoop('SharedNetworkLoop')
+        return _sharedLoop
+
+
+class AsyncTCPConnection(NetworkConnection, asyncio.BufferedProtocol):
+    def __init__(self, proxyName, conName, networkLoop=None, namespace=None, framing=NEWLINE, maxFrame=MAX_FRAME_SIZE,
+                 batchBytes=SEND_BATCH_BYTES, batchDelay=SEND_BATCH_DELAY, handler=None, onConnect=None):
+        """
+
+        A connection run by a NetworkLoop, with the interface of a TCPConnection. It is made either by an
+        AsyncTCPListener for each connection it accepts, or by getAsyncNetworkConnection to join a listener.
+
+        :param conName: name of the other end. When None, it is set to 'host:port' of the other end once connected.
+        :param networkLoop: NetworkLoop the connection runs in, getSharedLoop() when None.
+        :param framing: StreamFramer.NEWLINE (JSON lines) or StreamFramer.LENGTH (length prefixed bytes), as for a
+            TCPConnection.
+        :param batchBytes: packets sent are written together, up to about this many bytes per write.
+        :param batchDelay: seconds a packet waits for more to write with when less than batchBytes are pending.
+        :param handler: called as handler(connection, packet) in the loop thread for every packet received, instead of
+            putting it on the recv queue.
+        :param onConnect: called as onConnect(connection) in the loop thread once connected.
+
+        """
+        NetworkConnection.__init__(self, proxyName, conName, maxBytes=TCP_MAX_BYTES, namespace=namespace)
+        self.name = f'{proxyName}_{conName}'
+        self.networkLoop = networkLoop or getSharedLoop()
+        self.batchBytes = batchBytes
+        self.batchDelay = batchDelay
+        self.handler = handler
+        self.onConnect = onConnect
+        self.transport = None
+        self.joinAddress = None
+        self.destAddress = None  # address joined, to rejoin. None for accepted connections.
+
+        self._sendIDs = itertools.count(1)
+        self._acks = {}  # sendID: [threading.Event set once written, whether it was], of the sends waited on.
+        self.sendStats = SendStats()
+        self.framer = StreamFramer(framing, maxFrame)
+        self.reassembler = ps.Reassembler()
+
+        self.lock = threading.RLock()
+        self._pending = []  # (sendID, frames, size, time queued) not yet written.
+        self._pendingBytes = 0
+        self._scheduled = False  # a flush is due within batchDelay.
+        self._urgent = False  # a flush is due as soon as the loop gets to it.
+        self._timer = None
+        self._paused = False  # the transport's write buffer is full, see pause_writing.
+        self._recvQueue = queue.Queue()
+
+    # asyncio.BufferedProtocol, called in the loop thread.
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connected = True
+        self.joinAddress = transport.get_extra_info('peername')
+        if self.conName is None and self.joinAddress:
+            self.conName = f'{self.joinAddress[0]}:{self.joinAddress[1]}'
+            self.name = f'{self.proxyName}_{self.conName}'
+        if self.onConnect:
+            self.onConnect(self)
+
+    def get_buffer(self, sizehint):
+        return self.framer.getBuffer()
+
+    def buffer_updated(self, nbytes):
+        try:
+            frames = self.framer.received(nbytes)
+        except FrameError as e:
+            logging.error(f'{self.name} lost the packet boundaries of its stream, closing: {e}')
+            self.transport.close()
+            return
+        for frame in frames:
+            self._putFrame(frame)
+
+    def eof_received(self):
+        logging.info(f'{self.name} was closed by the other end.')
+        return False
+
+    def connection_lost(self, exc):
+        self.connected = False
+        self.transport = None
+        if exc:
+            logging.warning(f'{self.name} lost its connection due to error {exc}')
+        with self.lock:
+            batch, self._pending, self._pendingBytes = self._pending, [], 0
+            self._scheduled = self._urgent = False
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        self._finish(batch, False)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._flush()
+
+    # NetworkConnection
+    def start(self):
+        """Nothing to start; the connection runs in its network loop from the moment it is made."""
+        pass
+
+    def send(self, packet, wait=False, timeout=SEND_TIMEOUT):
+        """ Queue a packet, or a list of packets, to be written in the network loop, as TCPConnection.send does.
+
+        :param wait: if True, wait until the packets have been written to the transport, for up to timeout seconds.
+            Called from the loop thread (IE by a handler) they are written before send returns instead, unless the
+            transport has paused writing: send then returns False, and the packets stay pending until it resumes.
+        :return: whether the packets were queued, or with wait, whether they were written.
+        """
+        if self.terminate or self.transport is None:
+            logging.error(f'Cannot send packet on the TCP interface {self.name} as the connection is closed.')
+            return False
+        frames = framePackets(self.framer, packet, self.maxBytes, self.name)
+        if frames is None:
+            return False
+        sendID = next(self._sendIDs)
+        inLoop = self.networkLoop.inLoop()
+        if wait and not inLoop:
+            ack = self._acks[sendID] = [threading.Event(), False]
+        size = sum(map(len, frames))
+        with self.lock:
+            self._pending.append((sendID, frames, size, time.monotonic()))
+            self._pendingBytes += size
+            if wait or self._pendingBytes >= self.batchBytes or self.batchDelay <= 0:
+                schedule = self._flush if not self._urgent else None
+                self._urgent = True
+            else:
+                schedule = self._armFlush if not self._scheduled else None
+                self._scheduled = True
+        if inLoop and wait:
+            return self._flush()
+        if schedule:
+            self.networkLoop.call(schedule)
+        if not wait:
+            return True
+        ack[0].wait(timeout)
+        self._acks.pop(sendID, None)
+        return ack[1]
+
+    def getRecvQueue(self):
+        return self._recvQueue
+
+    def getStats(self):
+        """ :returns: the stats of TCPConnection.getStats. syscalls counts the transport writes, and queue latency is
+        the time a packet waited between send and the write."""
+        with self.lock:
+            return {'queued': len(self._pending), **self.sendStats.toDict()}
+
+    def _armFlush(self):
+        if self._timer is None and self._scheduled:
+            self._timer = self.networkLoop.loop.call_later(self.batchDelay, self._flush)
+
+    def _flush(self):
+        """Write everything pending with one transport.write. Runs in the loop thread.
+
+        :returns: whether it was written, or True if there was nothing to write. False while the transport has paused
+            writing; what is pending is written, and counted, once resume_writing flushes it."""
+        with self.lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._scheduled = self._urgent = False
+            if self._paused and self.transport is not None:
+                return not self._pending
+            batch, self._pending, self._pendingBytes = self._pending, [], 0
+        if not batch:
+            return True
+        frames = [frame for sendID, itemFrames, size, queued in batch for frame in itemFrames]
+        start = time.monotonic()
+        written = False
+        if self.transport is not None and not self.transport.is_closing():
+            try:
+                self.transport.write(b''.join(frames))
+                written = True
+            except Exception as msg:
+                logging.error(f'{self.name} cannot send packet to destination {self.joinAddress} due to error {msg}')
+        with self.lock:
+            stats = self.sendStats
+            stats.syscalls += 1
+            if written:
+                stats.bytes += sum(size for sendID, itemFrames, size, queued in batch)
+                stats.packets += len(batch)
+                stats.frames += len(frames)
+                for sendID, itemFrames, size, queued in batch:
+                    stats.totalLatency += start - queued
+                    stats.maxLatency = max(stats.maxLatency, start - queued)
+        self._finish(batch, written)
+        return written
+
+    def _finish(self, batch, written):
+        if not written and batch:
+            with self.lock:
+                self.sendStats.failed += len(batch)
+        for sendID, itemFrames, size, queued in batch:
+            ack = self._acks.get(sendID)
+            if ack:
+                ack[1] = written
+                ack[0].set()
+
+    def _putFrame(self, frame):
+        """Decode a frame as TCPConnection._putFrame does, and hand the packet to the handler or the recv queue."""
+        if self.framer.framing != NEWLINE:
+            packet = self.reassembler.add(frame)
+            if packet is None:
+                return
+        else:
+            try:
+                packet = json.loads(frame)
+            except ValueError:
+                logging.warning(f'{self.name} received an invalid packet: {frame[:64]}')
+                return
+        if self.handler is None:
+            self._recvQueue.put(packet)
+            return
+        try:
+            self.handler(self, packet)
+        except Exception:
+            logging.exception(f'{self.name} could not handle a packet received')
+
+    def _sendSinglePacket(self, packet):
+        return self.send(packet)
+
+    def _recv(self):
+        """Packets are received by buffer_updated, in the network loop."""
+        pass
+
+    def getStatus(self):
+        transport = self.transport
+        return transport is not None and not transport.is_closing()
+
+    def rejoin(self, timeout=CONNECT_TIMEOUT):
+        """ Connect again to the address joined. Accepted connections cannot rejoin.
+
+        :return: whether it connected.
+        """
+        if self.destAddress is None:
+            return False
+        self.framer.reset()
+        try:
+            self.networkLoop.run(self.networkLoop.loop.create_connection(lambda: self, *self.destAddress), timeout)
+            return True
+        except Exception as e:
+            logging.error(f'{self.name} could not connect to network address {self.destAddress} due to exception: {e}')
+            return False
+
+    def close(self):
+        """Write whatever is pending and close the connection. Can be called from any thread."""
+        if self.networkLoop.isRunning():
+            self.networkLoop.call(self._close)
+
+    def _close(self):
+        self._flush()
+        if self.transport is not None:
+            self.transport.close()
+
+    def end(self):
+        self.terminate = True
+        self.close()
+
+
+class AsyncTCPListener():
+    """
+    Accepts connections in a NetworkLoop, as TCPListener does in its own thread. Each connection accepted is an
+    AsyncTCPConnection, put on connectionQueue once connected. Like TCPListener, it accepts any peer: there is no proxy
+    handshake on this transport yet (see NetworkInterface.joinTCPNetwork).
+
+    :param listenAddress: (host, port) to listen on. Port 0 listens on any free port, and listenAddress is set to the
+        port chosen by start.
+    :param connectionQueue: queue for the connections accepted, a new one when None. See accept.
+    :param framing: StreamFramer framing of the connections accepted, which must match that of the joining end.
+    :param handler: handler of the connections accepted, see AsyncTCPConnection.
+    :param connectionKwargs: passed on to each AsyncTCPConnection, as batchDelay.
+    """
+    def __init__(self, proxyName, listenerName, listenAddress, connectionQueue=None, framing=NEWLINE, networkLoop=None,
+                 handler=None, **connectionKwargs):
+        self.name = listenerName
+        self.proxyName = proxyName
+        self.conQueue = connectionQueue if connectionQueue is not None else queue.Queue()
+        self.listenAddress = listenAddress
+        self.framing = framing
+        self.networkLoop = networkLoop or getSharedLoop()
+        self.handler = handler
+        self.connectionKwargs = connectionKwargs
+        self.listen = False
+        self.server = None
+
+    def start(self):
+        """starts listening, in the network loop"""
+        loop = self.networkLoop.loop
+        try:
+            self.server = self.networkLoop.run(loop.create_server(self._makeConnection, *self.listenAddress,
+                                                                  backlog=LISTEN_BACKLOG, reuse_address=True))
+        except OSError:
+            logging.error(f'Listener {self.name} could not bind to address {self.listenAddress}')
+            return False
+        except Exception as e:
+            logging.error(f'Listener {self.name} could not start listening due to following exception: {e}')
+            return False
+        self.listenAddress = self.server.sockets[0].getsockname()[:2]
+        self.listen = True
+        logging.info(f'{self.name} starting server: listening on ({self.listenAddress})')
+        return True
+
+    def _makeConnection(self):
+        return AsyncTCPConnection(self.proxyName, None, self.networkLoop, framing=self.framing, handler=self.handler,
+                                  onConnect=self.conQueue.put, **self.connectionKwargs)
+
+    def accept(self, timeout=None):
+        """ Take the next connection accepted off the connection queue. Can be called from any thread.
+
+        :raises queue.Empty: if there was none within timeout seconds.
+        """
+        return self.conQueue.get(timeout=timeout)
+
+    def close(self):
+        """closes listener server. The connections it accepted stay open."""
+        self.listen = False
+        if self.server is not None and self.networkLoop.isRunning():
+            self.networkLoop.call(self.server.close)
+        self.server = None
+
+    def end(self):
+        """closes listener server"""
+        self.close()
+
+
+def getAsyncNetworkConnection(proxyName, namespace, joinAddress, conName=None, framing=NEWLINE, networkLoop=None,
+                              timeout=CONNECT_TIMEOUT, **connectionKwargs):
+    """
+    Join the listener at joinAddress, (host, port) or 'host:port', as TCPJoiner.getTCPNetworkConnection does.
+    framing must match that of the listener joined.
+
+    :return: the AsyncTCPConnection, connected, or None if it could not connect.
+    """
+    if type(joinAddress) == str:
+        joinAddress = TCPJoiner.getAddress(joinAddress)
+    if conName is None:
+        conName = f'{joinAddress[0]}:{joinAddress[1]}'
+    connection = AsyncTCPConnection(proxyName, conName, networkLoop, namespace=namespace, framing=framing,
+                                    **connectionKwargs)
+    connection.destAddress = tuple(joinAddress)
+    if not connection.rejoin(timeout):
+        return None
+    return connection
@@ -0,0 +1,179 @@
+import struct
+
+"""
+.. _stream-framer:
+
+#################
+Stream Framer
+#################
+
+TCP is a stream of bytes; the messages written on one side reach the other side cut and joined at arbitrary points. A
+recv can return part of a message, or the end of one and several more. StreamFramer turns the stream back into the
+messages (frames) it was written as. It is used by every TCPConnection, the ones a TCPListener accepts and the ones
+joined to a network alike, so both ends of a link always agree on the framing.
+
+Two framings are supported:
+
+    NEWLINE: each frame is followed by b'\\n', as ProxySerializer.serialize writes JSON. Frames cannot contain b'\\n'.
+    LENGTH: each frame is preceded by its length as a 4 byte big endian unsigned int. Frames can hold any bytes.
+
+Bytes are received straight into one bytearray per connection (socket.recv_into, or asyncio through getBuffer and
+received), which is reused for every recv.
+Complete frames are copied out of it, and the start of an incomplete frame is moved to the front of the buffer when it
+runs out of room, so nothing is lost between recvs. The buffer grows only when a single frame does not fit, and no
+frame may be longer than maxFrame bytes: a NEWLINE frame that is too long is dropped up to its newline and counted,
+while a LENGTH frame that is too long raises FrameError, as the rest of the stream cannot be trusted.
+"""
+
+NEWLINE = 'newline'
+LENGTH = 'length'
+FRAMINGS = (NEWLINE, LENGTH)
+DELIMITER = b'\n'
+LENGTH_PREFIX = struct.Struct('>I')
+MAX_FRAME_SIZE = 1 << 20 # bytes. Largest frame a StreamFramer accepts unless told otherwise.
+RECV_SIZE = 8192 # bytes read from the socket per recv at most.
+
+
+class FrameError(Exception):
+    pass
+
+
+class StreamFramer():
+    """ Splits the bytes received on a stream socket into frames.
+
+    :param framing: NEWLINE or LENGTH.
+    :param maxFrame: length in bytes of the largest frame accepted, not counting the delimiter or length prefix.
+    """
+    def __init__(self, framing=NEWLINE, maxFrame=MAX_FRAME_SIZE):
+        if framing not in FRAMINGS:
+            raise ValueError(f'Unknown framing {framing}, expecting one of {FRAMINGS}')
+        self.framing = framing
+        self.maxFrame = maxFrame
+        self.framesReceived = 0
+        self.framesDropped = 0
+        self._buffer = bytearray(2 * RECV_SIZE)
+        self._start = 0 # index of the first byte not yet framed.
+        self._end = 0 # index after the last byte received.
+        self._scanned = 0 # NEWLINE: index up to which the pending bytes are known to hold no delimiter.
+        self._skipping = False # NEWLINE: dropping the rest of a frame that was too long.
+
+    def frame(self, payload):
+        """ Return payload as it is written to the stream. A NEWLINE payload that already ends in b'\\n' (see
+        ProxySerializer.serialize) is returned as it is."""
+        if self.framing == LENGTH:
+            if len(payload) > self.maxFrame:
+                raise FrameError(f'Cannot send a frame of {len(payload)} bytes, the largest is {self.maxFrame}')
+            return b''.join([LENGTH_PREFIX.pack(len(payload)), payload])
+        if payload[-1:] == DELIMITER:
+            return payload
+        return b''.join([payload, DELIMITER])
+
+    def recvFrom(self, sock):
+        """ Receive once from sock and return the frames it completed, which can be none.
+
+        :return: a list of bytes, or None when the other end has closed the connection.
+        """
+        self._reserve()
+        with memoryview(self._buffer) as view:
+            received = sock.recv_into(view[self._end:], RECV_SIZE)
+        if not received:
+            return None
+        self._end += received
+        return self._split()
+
+    def getBuffer(self):
+        """Return the free end of the buffer to receive into, as asyncio.BufferedProtocol.get_buffer does. Pass the number
+        of bytes written to it to received."""
+        self._reserve()
+        return memoryview(self._buffer)[self._end:]
+
+    def received(self, nbytes):
+        """Return the frames completed by nbytes written into the buffer returned by getBuffer."""
+        self._end += nbytes
+        return self._split()
+
+    def feed(self, data):
+        """Add bytes received some other way, returning the frames they completed."""
+        frames = []
+        with memoryview(data) as data:
+            while len(data):
+                self._reserve()
+                n = min(len(data), len(self._buffer) - self._end)
+                self._buffer[self._end:self._end + n] = data[:n]
+                self._end += n
+                data = data[n:]
+                frames.extend(self._split())
+        return frames
+
+    def pending(self):
+        """Number of bytes received that are not yet part of a complete frame."""
+        return self._end - self._start
+
+    def reset(self):
+        """Drop the bytes of any incomplete frame, as when the connection is reopened."""
+        self._start = self._end = self._scanned = 0
+        self._skipping = False
+
+    def _reserve(self):
+        """Make room for RECV_SIZE bytes after the pending bytes, moving them to the front of the buffer and growing it
+        only if they still take more than half of it."""
+        if len(self._buffer) - self._end >= RECV_SIZE:
+            return
+        pending = self._end - self._start
+        if self._start:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._scanned -= self._start
+            self._start, self._end = 0, pending
+        if len(self._buffer) - pending < RECV_SIZE:
+            self._buffer.extend(bytes(len(self._buffer)))
+
+    def _split(self):
+        if self.framing == LENGTH:
+            return self._splitLength()
+        return self._splitNewline()
+
+    def _splitNewline(self):
+        frames = []
+        buffer = self._buffer
+        while True:
+            index = buffer.find(DELIMITER, max(self._start, self._scanned), self._end)
+            if index < 0:
+                self._scanned = self._end
+                if self._end - self._start > self.maxFrame:
+                    # too long already; drop what there is and skip ahead to the delimiter.
+                    if not self._skipping:
+                        self._skipping = True
+                        self.framesDropped += 1
+                    self._start = self._scanned = self._end
+                break
+            if self._skipping:
+                self._skipping = False
+            elif index - self._start > self.maxFrame:
+                self.framesDropped += 1
+            else:
+                frames.append(bytes(buffer[self._start:index]))
+            self._start = index + 1
+        if self._start == self._end:
+            self._start = self._end = self._scanned = 0
+        self.framesReceived += len(frames)
+        return frames
+
+    def _splitLength(self):
+        frames = []
+        buffer = self._buffer
+        prefixSize = LENGTH_PREFIX.size
+        while self._end - self._start >= prefixSize:
+            size = LENGTH_PREFIX.unpack_from(buffer, self._start)[0]
+            if size > self.maxFrame:
+                self.framesDropped += 1
+                self.reset()
+                raise FrameError(f'Received a frame of {size} bytes, the largest allowed is {self.maxFrame}')
+            frameEnd = self._start + prefixSize + size
+            if frameEnd > self._end:
+                break
+            frames.append(bytes(buffer[self._start + prefixSize:frameEnd]))
+            self._start = frameEnd
+        if self._start == self._end:
+            self._start = self._end = 0
+        self.framesReceived += len(frames)
+        return frames
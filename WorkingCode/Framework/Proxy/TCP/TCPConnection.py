@@ -1,3 +1,4 @@
+import itertools
 import json
 import logging
 import queue
@@ -9,24 +10,86 @@ from Framework.BaseClasses.Networking.NetworkConnection import NetworkConnection
 from Framework.Proxy import ProxySerializer as ps
 from Framework.Proxy import SimplifiedProxyHeader as ph
 from Framework.Proxy.TCP import TCPJoiner
+from Framework.Proxy.TCP.StreamFramer import FrameError, LENGTH, MAX_FRAME_SIZE, NEWLINE, StreamFramer
 
 MAX_NUM_RETRIES = 5
 SOCKET_TIMEOUT = 1
 TCP_MAX_BYTES = 8192
 SEND_TIMEOUT = 1
 RECV_TIMEOUT = 1
+SEND_BATCH_BYTES = 65536 # bytes the send thread gathers into one write.
+SEND_BATCH_DELAY = .002 # seconds a packet may wait on the send queue for more packets to write with.
+
+
+class SendStats():
+    """Counters of what a TCPConnection has sent. Times are seconds."""
+    __slots__ = ['started', 'bytes', 'packets', 'frames', 'syscalls', 'failed', 'totalLatency', 'maxLatency']
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.packets = 0
+        self.frames = 0
+        self.syscalls = 0
+        self.failed = 0
+        self.totalLatency = 0.0
+        self.maxLatency = 0.0
+
+    def toDict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'bytes': self.bytes,
+            'packets': self.packets,
+            'frames': self.frames,
+            'syscalls': self.syscalls,
+            'failed': self.failed,
+            'bytesPerSecond': self.bytes / elapsed if elapsed > 0 else 0.0,
+            'framesPerSyscall': self.frames / self.syscalls if self.syscalls else 0.0,
+            'meanQueueLatency': self.totalLatency / self.packets if self.packets else 0.0,
+            'maxQueueLatency': self.maxLatency
+        }
+
+
+def framePackets(framer, packet, maxBytes, name):
+    """ :returns: the frames that carry a packet, or list of packets, on a stream, or None if they are not bytes. With
+    LENGTH framing, packets whose payload is longer than maxBytes are split (see ProxySerializer.splitPackets); NEWLINE
+    packets are JSON and sent whole."""
+    if type(packet) in (bytes, bytearray):
+        packet = [packet]
+    elif type(packet) not in (list, set, tuple):
+        logging.error(f'{name} unable to send data; expecting data to be of type bytes or bytearray or a list of bytes or bytearrays. Instead got {type(packet)}')
+        return None
+    frames = []
+    for singlePacket in packet:
+        if type(singlePacket) not in (bytes, bytearray):
+            logging.error(f'{name} unable to send data; expecting data to be of type bytes or bytearray or a list of bytes or bytearrays. Instead got {type(singlePacket)}')
+            return None
+        if framer.framing == LENGTH:
+            frames.extend(framer.frame(fragment) for fragment in ps.splitPackets(singlePacket, maxBytes))
+        else:
+            frames.append(framer.frame(singlePacket))
+    return frames
+
 
 class TCPConnection(NetworkConnection):
-    def __init__(self, proxyName, conName, socket, maxNumRetries = MAX_NUM_RETRIES, namespace=None):
+    def __init__(self, proxyName, conName, socket, maxNumRetries = MAX_NUM_RETRIES, namespace=None, framing=NEWLINE,
+                 maxFrame=MAX_FRAME_SIZE, batchBytes=SEND_BATCH_BYTES, batchDelay=SEND_BATCH_DELAY):
         """
 
         A class to help manage a connection from an established socket. It will take packets from this connection and
         forward them to a recv queue to be parsed by the main proxy object.
 
+        :param framing: how packets are delimited on the stream, StreamFramer.NEWLINE (JSON lines) or
+            StreamFramer.LENGTH (length prefixed bytes). Both ends of the connection must use the same framing.
+        :param maxFrame: largest packet in bytes that will be received.
+        :param batchBytes: packets queued by send are written together, up to about this many bytes per write.
+        :param batchDelay: seconds the send thread waits for more packets when less than batchBytes are queued, as
+            Nagle's algorithm does. 0 writes whatever is queued straight away.
+
         """
         NetworkConnection.__init__(self, proxyName, conName, maxBytes=TCP_MAX_BYTES, namespace=namespace)
         # connector has self.connected, self.maxBytes, and self.terminate
-        self.name = proxyName + "_" + conName
+        self.name = f'{proxyName}_{conName}'
 
         # allocate socket resources.
         self.socket:sock.socket = socket
@@ -40,10 +103,15 @@ class TCPConnection(NetworkConnection):
             maxNumRetries = MAX_NUM_RETRIES
         self.maxNumRetries = maxNumRetries
         self.sendTimeout = SEND_TIMEOUT
+        self.batchBytes = batchBytes
+        self.batchDelay = batchDelay
+        self.destAddress = None
 
-        self.outgoingPktID = 1
-        self.unsentPackets = set()  # stores received packages by packageID
-        self.receivedPackets = {}
+        self._sendIDs = itertools.count(1)
+        self._acks = {}  # sendID: [threading.Event set once written, whether it was], of the sends waited on.
+        self.sendStats = SendStats()
+        self.framer = StreamFramer(framing, maxFrame)
+        self.reassembler = ps.Reassembler()
 
         # Allocating Threading resources
         self.lock = threading.RLock()
@@ -59,6 +127,7 @@ class TCPConnection(NetworkConnection):
 
     def end(self):
         self.terminate = True  # ends recvThread and sendThread.
+        self._sendQueue.put(None)  # wakes sendThread.
         self.close()
 
     def connect(self, destAddress):
@@ -85,73 +154,168 @@ class TCPConnection(NetworkConnection):
             numRetries -= 1
 
 
-    def verifySend(self, packet):
-        sent = False
-        sendBegin = time.time()
-        while time.time() - sendBegin < SEND_TIMEOUT:
-            sent = packet in self.unsentPackets
-            if sent:
-                break
-        return sent
+    def send(self, packet, wait=False, timeout=SEND_TIMEOUT):
+        """ Queue a packet, or a list of packets, to be written by the send thread. The packets are expected to be
+        serialized as per ProxySerializer (IE header and payload, or a line of JSON).
 
-
-    def send(self, packet):
-        # This packet is expected to be the serialized packet as per proxySerializer. IE it has a header (ProxyHeader header) and payload.
-        if not self.terminate:
-            self.unsentPackets.add(packet)
-            self._sendQueue.put(packet)
-        else:
+        :param wait: if True, wait until the packets have been written to the socket, for up to timeout seconds.
+        :return: whether the packets were queued, or with wait, whether they were written.
+        """
+        if self.terminate:
             logging.error(f'Cannot put packet on queue for the TCP interface {self.name} as the connection is closed.')
-        return self.verifySend(packet)
+            return False
+        frames = self._frame(packet)
+        if frames is None:
+            return False
+        sendID = next(self._sendIDs)
+        if wait:
+            ack = self._acks[sendID] = [threading.Event(), False]
+        self._sendQueue.put((sendID, frames, sum(map(len, frames)), time.monotonic()))
+        if not wait:
+            return True
+        ack[0].wait(timeout)
+        self._acks.pop(sendID, None)
+        return ack[1]
 
     def getRecvQueue(self):
         return self._recvQueue
 
+    def getStats(self):
+        """ :returns: {bytes, packets, frames, syscalls, failed, bytesPerSecond, framesPerSyscall, meanQueueLatency,
+        maxQueueLatency} of the packets sent since the connection was made. Queue latency is the time a packet waited
+        between send and the write that sent it."""
+        with self.lock:
+            return {'queued': self._sendQueue.qsize(), **self.sendStats.toDict()}
+
     def _send(self):
+        """Target of the send thread. Will run until termination is set to True.
+
+        Takes everything on the send queue, waiting up to batchDelay after the first packet was queued for more while
+        there is less than batchBytes, and writes it all at once (see _writeRetrying)."""
         while not self.terminate and self.socket:
             try:
-                sendingPacket = self._sendQueue.get(timeout=SEND_TIMEOUT)
-                sent = self._sendPackets(sendingPacket)
-                if sent:
-                    self.unsentPackets.remove(sendingPacket)
-                return True
+                batch = [self._sendQueue.get(timeout=SEND_TIMEOUT)]
             except queue.Empty:
-                # nothing in the queue, so nothing to be done.
-                pass
-            except Exception as e:
-                logging.error(f'TCP interface {self.name} could not send packet due to exception {e}')
-                return False
-
+                continue
+            if batch[0] is None:
+                continue
+            size = batch[0][2]
+            deadline = batch[0][3] + self.batchDelay
+            while size < self.batchBytes:
+                try:
+                    item = self._sendQueue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._sendQueue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    break
+                batch.append(item)
+                size += item[2]
+            self._sendBatch(batch)
+
+    def _sendBatch(self, batch):
+        frames = [frame for sendID, itemFrames, size, queued in batch for frame in itemFrames]
+        start = time.monotonic()
+        written = self._writeRetrying(b''.join(frames))
+        with self.lock:
+            stats = self.sendStats
+            if written:
+                stats.bytes += sum(size for sendID, itemFrames, size, queued in batch)
+                stats.packets += len(batch)
+                stats.frames += len(frames)
+                for sendID, itemFrames, size, queued in batch:
+                    stats.totalLatency += start - queued
+                    stats.maxLatency = max(stats.maxLatency, start - queued)
+            else:
+                stats.failed += len(batch)
+        for sendID, itemFrames, size, queued in batch:
+            ack = self._acks.get(sendID)
+            if ack:
+                ack[1] = written
+                ack[0].set()
+
+    def _frame(self, packet):
+        return framePackets(self.framer, packet, self.maxBytes, self.name)
 
     def _sendPackets(self, packet: list or set or tuple or bytes or bytearray):
-        """ A method to send a single packet or array of packets to the destination as specified by socket.
+        """ A method to send a single packet or array of packets to the destination as specified by socket, from the
+        calling thread rather than the send thread.
 
         These packets must be ALREADY ENCODED pacets (IE header + payload)
 
         """
-        sentAll = True
-        packetsToSend = []
-        if type(packet) in (bytes, bytearray):
-            packetsToSend = [packet]
-        elif type(packet) in [list, set, tuple]:
-            for singlePacket in packet:
-                if type(singlePacket) in (bytes, bytearray):
-                    if len(packet) > self.maxBytes:
-                        splitPackets = ps.splitPackets(singlePacket, self.maxBytes)
-                        packetsToSend = [*packetsToSend, *splitPackets]
-                else:
-                    logging.error(f'{self.name} unable to send data; expecting data to be of type bytes or bytearray or a list of bytes or bytearrays. Instead got {type(packet)}')
+        frames = self._frame(packet)
+        if frames is None:
+            return False
+        return self._writeRetrying(b''.join(frames))
+
+    def _writeRetrying(self, data):
+        """ Write bytes already framed to the socket. After a timeout the write carries on where it stopped, up to
+        maxNumRetries times.
+
+        A socket that fails may have taken part of data, and the other end would read whatever follows out of frame, so
+        data is never written again on it. A connection made by connect writes data again from the start over a new
+        socket (see _reconnect); any other connection is ended, as is one that gives up part way through data.
+
+        :return: whether all of data was written.
+        """
+        view = memoryview(data)
+        written = 0
+        numRetries = self.maxNumRetries
+        while written < len(view):
+            try:
+                with self.lock:
+                    self.sendStats.syscalls += 1
+                written += self.socket.send(view[written:])
+                continue
+            except sock.timeout:
+                error = 'timed out'
+            except Exception as e:
+                error = e
+                if not self._reconnect():
+                    self._abandon(f'could not send to destination {self.joinAddress} due to error {e}')
                     return False
-        for singlePacket in packetsToSend:
-            sent = False
-            numRetries = self.maxNumRetries
-            while not sent and numRetries >= 0:
-                sent = self._sendSinglePacket(singlePacket)
-            if not sent:
-                logging.error(f'Couldn\'t send one or all of packets in {packet} to destination {self.socket.getpeername()}')
-                sentAll = False
+                written = 0
+            numRetries -= 1
+            if numRetries < 0 or self.terminate:
                 break
-        return sentAll
+        else:
+            return True
+        if written:
+            self._abandon(f'wrote {written} of {len(view)} bytes before giving up ({error})')
+        else:
+            logging.error(f'{self.name} couldn\'t send {len(view)} bytes to destination {self.joinAddress}: {error}')
+        return False
+
+    def _reconnect(self):
+        """ Replace the socket by a new one to destAddress, which only a connection made by connect has. """
+        if self.destAddress is None or self.terminate:
+            return False
+        with self.lock:
+            try:
+                self.socket.close()
+                self.socket = sock.create_connection(self.destAddress, timeout=SOCKET_TIMEOUT)
+            except OSError as e:
+                logging.error(f'{self.name} could not reconnect to {self.destAddress} due to error {e}')
+                return False
+            self.framer.reset()
+        logging.warning(f'{self.name} reconnected to {self.destAddress}')
+        return True
+
+    def _abandon(self, reason):
+        """ End a connection whose stream can no longer be framed, and shut its socket down so the other end sees it
+        close. """
+        logging.error(f'{self.name} ending connection: {reason}')
+        self.terminate = True
+        try:
+            self.socket.shutdown(sock.SHUT_RDWR)
+        except OSError:
+            pass
 
     def _sendSinglePacket(self, packet):
         """ A method that sends ALREADY ENCODED/SERIALIZED packets (IE header+serialized bytes) to the destination specified by the socket.
@@ -160,44 +324,47 @@ class TCPConnection(NetworkConnection):
         :return:
         """
         # Overwriting the base class method of _send. _send is called by the base class send method.
-        try:
-            self.socket.sendall(packet)
-            return True
-        except OSError:  # this socket lost is closed
-            # self.socket.connect(self.clientAddress)
-            self.connect(self.destAddress)
-        except BrokenPipeError:  # other socket is closed
-            pass
-        except Exception as msg:
-            logging.error(f'{self.name} cannot send packet to destination {self.socket.getpeername()} due to error {msg}')
-        return False
+        return self._writeRetrying(self.framer.frame(packet))
 
     def _recv(self):
-        """Target of the receive thread. Will run until termination is set to True.
+        """Target of the receive thread. Will run until termination is set to True, or the other end closes the socket.
 
-        This method will receive bytes off of the socket, the size of ProxyHeader Header Size. If the bytes are a header,
-        then the rest of the payload can be received in accordance to the length described by the header.
+        Bytes received are split into packets by self.framer, however the stream cut them. NEWLINE packets are JSON and
+        are put on the recv queue decoded, LENGTH packets are put on it as bytes.
 
         Will receive information from one and only one socket, the self socket."""
         while not self.terminate and self.socket:
             try:
-                pBytes = self.socket.recv(4096)  # size header
-                if len(pBytes) > 0:
-                    # logging.debug(self.name+" received bytes "+str(pBytes))
-                    firstPacketIndex = pBytes.index(b'\n')
-                    if not firstPacketIndex:
-                        logging.warning("Invalid packet received: "+str(pBytes))
-                    while firstPacketIndex:
-                        pDict = json.loads(pBytes[:firstPacketIndex])
-                        self._recvQueue.put(pDict)
-                        firstPacketIndex = pBytes.index(b'\n')
+                frames = self.framer.recvFrom(self.socket)
+            except sock.timeout:
+                continue
+            except FrameError as e:
+                logging.error(f'{self.name} lost the packet boundaries of its stream, closing: {e}')
+                self.close()
+                break
             except OSError as e:
-                pass
-                # timed out
-                # self.end()
-            except Exception as e:
-                # logging.warning("Error in recv for " + self.name)
-                pass
+                if self.terminate:
+                    break
+                logging.warning(f'{self.name} could not receive due to error {e}')
+                time.sleep(RECV_TIMEOUT)
+                continue
+            if frames is None:
+                logging.info(f'{self.name} was closed by the other end.')
+                self.connected = False
+                break
+            for frame in frames:
+                self._putFrame(frame)
+
+    def _putFrame(self, frame):
+        if self.framer.framing != NEWLINE:
+            packet = self._handleIncomingPacket(frame)
+            if packet is not None:
+                self._recvQueue.put(packet)
+            return
+        try:
+            self._recvQueue.put(json.loads(frame))
+        except ValueError:
+            logging.warning(f'{self.name} received an invalid packet: {frame[:64]}')
 
     def _recvData(self, bufferSize):
         bData = b''
@@ -210,40 +377,13 @@ class TCPConnection(NetworkConnection):
 
     def _handleIncomingPacket(self, packet):
         """
-        Some assumptions made when handling all these packages:
-        1) the packets all agree on the total packet number sent.
-            - Will have to ensure that the packets, when split, all agree.
-        2) No packets have an incorrect packetID number.
-            - This will
-        3) The packet headers are all in the correct format.
-            - Can mitigate errors with correct sending methods (TCP should handle) as well as a good checksum.
-        4) No later messages share packet ID's
-            - What to do and how to handle rollovers? Clean up received packets?
+        Passes a packet received to the reassembler, which checks its checksum and holds the fragments of split packets
+        by packetID until all have arrived.
 
         :param packet:
-        :return: A WHOLE Packet
+        :return: A WHOLE Packet, or None while fragments of it are still missing (or it was corrupt).
         """
-        pktID = ph.PacketAccess.getPacketID(packet)
-        pktNum = ph.PacketAccess.getPacketNum(packet)
-        totalPkts = ph.PacketAccess.getTotalPackets(packet)
-        if totalPkts == 1:
-            return packet
-
-        if not self.receivedPackets.get(pktID):
-            self.receivedPackets[pktID] = {pktID: packet}
-        else:
-            self.receivedPackets[pktID][pktID] = packet
-
-        if len(self.receivedPackets[pktID]) == totalPkts:
-            packets = self.receivedPackets.pop(pktID)
-            orderedPackets = []
-            for i in range(1, totalPkts+1):
-                orderedPackets.append(packets[i])
-            return ps.combinePackets(orderedPackets)
-
-        if pktNum == totalPkts and len(self.receivedPackets[pktID]) != totalPkts:
-            logging.warning(f"Missing packet number {pktNum} with packet ID {pktID}")
-
+        return self.reassembler.add(packet)
 
     def flushRecv(self):
         # TODO: Implement this method.
@@ -266,6 +406,7 @@ class TCPConnection(NetworkConnection):
 
     def rejoin(self):
         self.socket:sock.socket = TCPJoiner.getTCPNetworkSocket(self.proxyName, self.namespace, self.joinAddress)
+        self.framer.reset()
 
     def close(self):
         with self.lock:
@@ -3,6 +3,7 @@ import socket
 import time
 
 from Framework.Proxy.TCP import TCPConnection
+from Framework.Proxy.TCP.StreamFramer import NEWLINE
 
 TCP_MAX_BYTES = 8192
 MAX_SEND_RETRIES = 5
@@ -12,14 +13,15 @@ class FailedToConnect(Exception):
     pass
 
 
-def getTCPNetworkConnection(proxyName, namespace, joinAddress, maxJoinRetries=10, retryWaitSeconds=10, maxSendRetries=10):
+def getTCPNetworkConnection(proxyName, namespace, joinAddress, maxJoinRetries=10, retryWaitSeconds=10, maxSendRetries=10,
+                            framing=NEWLINE):
     """
-    called by proxyController when reading config
+    called by proxyController when reading config. framing must match that of the listener joined.
     """
     newSock, conName = initConnection(proxyName, namespace, joinAddress, maxJoinRetries, retryWaitSeconds)
     if newSock is None:
         return None
-    return TCPConnection.TCPConnection(proxyName, conName, newSock, maxSendRetries, namespace=namespace)
+    return TCPConnection.TCPConnection(proxyName, conName, newSock, maxSendRetries, namespace=namespace, framing=framing)
 
 def getTCPNetworkSocket(proxyName, namespace, joinAddress, maxJoinRetries=10, retryWaitSeconds=10, maxSendRetries=10):
     newSock, conName = initConnection(proxyName, namespace, joinAddress, maxJoinRetries, retryWaitSeconds)
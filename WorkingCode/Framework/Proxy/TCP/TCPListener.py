@@ -2,6 +2,7 @@ import logging
 import socket
 import threading
 
+from Framework.Proxy.TCP.StreamFramer import NEWLINE
 from Framework.Proxy.TCP.TCPConnection import TCPConnection
 
 TCP_MAX_BYTES = 8192
@@ -10,8 +11,10 @@ class TCPListener:
     """
     A class designed to listen for incoming requests to connect, and establish a connection once those requests come in.
 
+    :param framing: StreamFramer framing of the connections accepted, which must match that of the joining end.
     """
-    def __init__(self, proxyName, listenerName, listenAddress, connectionQueue, maxRetries=10, retryWaitSeconds=1, listenTimeout=5):
+    def __init__(self, proxyName, listenerName, listenAddress, connectionQueue, maxRetries=10, retryWaitSeconds=1, listenTimeout=5,
+                 framing=NEWLINE):
         self.name = listenerName
         self.proxyName = proxyName
         self.conQueue = connectionQueue
@@ -25,6 +28,7 @@ class TCPListener:
         self.maxRetries = int(maxRetries)
         self.retryWait = int(retryWaitSeconds)
         self.listenTimeout = int(listenTimeout)
+        self.framing = framing
 
     def start(self):
         """starts listener thread"""
@@ -60,7 +64,7 @@ class TCPListener:
                 connSock, addr = self.listenSocket.accept()
                 #TODO: need to make SURE this is a proxy connection and not some random or malicious connection
                 #todo: handshake and approval before socket is put into connection object
-                connection = TCPConnection(self.proxyName, None, connSock)
+                connection = TCPConnection(self.proxyName, None, connSock, framing=self.framing)
                 connection.start()
                 self.conQueue.put(connection)
             except socket.timeout:
@@ -0,0 +1,75 @@
+""" Benchmarks of reading data channels back out of an archive.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchArchiveRead -n 200000
+"""
+import os
+import tempfile
+import time
+
+from Framework.Archive.Formatters import IndexedCSVFormatter, COLUMN_DECODER, ROW_DECODER
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Utils import FileUtils as fUtils
+
+METADATA = Metadata(timestamp='float', pressure='float', temperature='float', flow='float', valve='int', name='string')
+
+
+def makeCSVFormatter(tdir, nRows):
+    csvPath = os.path.join(tdir, 'bench.csv')
+    idxPath = os.path.join(tdir, 'bench.idx')
+    for p in [csvPath, idxPath]:
+        open(p, 'w').close()
+    fmt = IndexedCSVFormatter('bench', ChannelType.Data, METADATA, None, path=csvPath, idxCsvPath=idxPath)
+    fmt.writeRow([{'timestamp': 1.6e9 + i, 'pressure': i * 0.25, 'temperature': 20 + i % 7, 'flow': i / 3,
+                   'valve': i % 2, 'name': f'dev{i % 10}'} for i in range(nRows)])
+    fmt.close()
+    return fmt
+
+
+def timeIt(func, repeat=3):
+    """Return the best time of repeat calls to func, and the number of rows it returned."""
+    best = None
+    for i in range(0, repeat):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    nRows = result if type(result) is int else len(result)
+    return best, nRows
+
+
+def benchDecoders(nRows):
+    with tempfile.TemporaryDirectory() as tdir:
+        fmt = makeCSVFormatter(tdir, nRows)
+        cases = {
+            'full read, row decoder': lambda: fmt.read(decoder=ROW_DECODER),
+            'full read, column decoder': lambda: fmt.read(decoder=COLUMN_DECODER),
+            'full read, column decoder + iterate rows': lambda: sum(1 for row in fmt.read(decoder=COLUMN_DECODER)),
+            '60s window, row decoder': lambda: fmt.read(1.6e9 + nRows / 2, 1.6e9 + nRows / 2 + 60, decoder=ROW_DECODER),
+            '60s window, column decoder': lambda: fmt.read(1.6e9 + nRows / 2, 1.6e9 + nRows / 2 + 60),
+        }
+        print(f'{nRows} rows, {os.path.getsize(fmt.csvPath)} bytes')
+        for name, func in cases.items():
+            elapsed, rowsRead = timeIt(func)
+            print(f'{name:45s} {elapsed * 1000:10.2f} ms {rowsRead:10d} rows {rowsRead / elapsed:14.0f} rows/s')
+
+
+ARGS_METADATA = {
+    'description': 'Archive read benchmarks',
+    'args': [
+        {'name_or_flags': ['-n', '--rows'],
+         'default': 100000,
+         'type': int,
+         'help': 'Number of rows in the benchmark file.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    benchDecoders(args.rows)
+
+
+if __name__ == '__main__':
+    main()
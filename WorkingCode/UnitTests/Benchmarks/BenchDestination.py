@@ -0,0 +1,149 @@
+""" Benchmark of ThreadedDestination hops: the latency a package picks up on each thread it passes through, and the CPU
+used by destinations that have nothing to do.
+
+The previous run loop, which polled the input queue every millisecond, is included for comparison.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchDestination
+"""
+import statistics
+import threading
+import time
+
+from Framework.BaseClasses.Destination import ThreadedDestination
+from Framework.BaseClasses.Package import Package
+from Framework.BaseClasses.Sentinel import Sentinel
+from Utils import FileUtils as fUtils
+
+
+class Hop(ThreadedDestination):
+    """Passes each package on to the next hop, or records its arrival if it is the last."""
+    def __init__(self, name, nextHop=None, arrived=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.nextHop = nextHop
+        self.arrived = arrived
+
+    def handlePackage(self, package):
+        if self.nextHop:
+            self.nextHop.accept(package)
+        else:
+            self.arrived(package)
+
+
+class PollingHop(Hop):
+    """Hop with the run loop ThreadedDestination used to have."""
+    def run(self):
+        self._accept = self._acceptQueue
+        while not self.tdTerminate:
+            with self.TDLock:
+                try:
+                    if not self.inputQueue.empty():
+                        pkg = self.inputQueue.get(block=self.blocking)
+                        if pkg and not isinstance(pkg, Sentinel):
+                            self.handlePackage(pkg)
+                except Exception as e:
+                    self.logger.exception(e)
+            time.sleep(.001)
+
+
+def buildChain(hopClass, nHops, arrived):
+    hops = []
+    nextHop = None
+    for i in reversed(range(0, nHops)):
+        nextHop = hopClass(f'{hopClass.__name__}-{i}', nextHop=nextHop, arrived=arrived)
+        hops.insert(0, nextHop)
+    for hop in hops:
+        hop.start()
+    return hops
+
+
+def endChain(hops):
+    for hop in hops:
+        hop.end()
+    for hop in hops:
+        hop.join(5)
+
+
+def benchLatency(hopClass, nHops, nPackages):
+    """Send packages through a chain of hops one at a time, and return the latency of each divided by the hops."""
+    done = threading.Event()
+    arrivals = []
+    def arrived(package):
+        arrivals.append(time.perf_counter() - package.payload)
+        done.set()
+    hops = buildChain(hopClass, nHops, arrived)
+    try:
+        for i in range(0, nPackages):
+            done.clear()
+            hops[0].accept(Package(source='bench', payload=time.perf_counter()))
+            done.wait(5)
+    finally:
+        endChain(hops)
+    return [latency / nHops for latency in arrivals]
+
+
+def benchIdle(hopClass, nHops, seconds):
+    """Return the CPU seconds used per wall second by nHops idle hops."""
+    hops = buildChain(hopClass, nHops, lambda package: None)
+    try:
+        time.sleep(.2)
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        time.sleep(seconds)
+        return (time.process_time() - cpu0) / (time.perf_counter() - wall0)
+    finally:
+        endChain(hops)
+
+
+def benchThroughput(hopClass, nHops, nPackages):
+    """Return packages per second through a chain of hops when they are sent as fast as possible."""
+    done = threading.Event()
+    count = [0]
+    def arrived(package):
+        count[0] += 1
+        if count[0] >= nPackages:
+            done.set()
+    hops = buildChain(hopClass, nHops, arrived)
+    try:
+        start = time.perf_counter()
+        for i in range(0, nPackages):
+            hops[0].accept(Package(source='bench', payload=i))
+        done.wait(60)
+        return count[0] / (time.perf_counter() - start)
+    finally:
+        endChain(hops)
+
+
+ARGS_METADATA = {
+    'description': 'ThreadedDestination hop latency benchmark',
+    'args': [
+        {'name_or_flags': ['-o', '--hops'],
+         'default': 5,
+         'type': int,
+         'help': 'Number of destinations each package passes through.'},
+        {'name_or_flags': ['-n', '--packages'],
+         'default': 500,
+         'type': int,
+         'help': 'Number of packages timed one at a time.'},
+        {'name_or_flags': ['-i', '--idle'],
+         'default': 50,
+         'type': int,
+         'help': 'Number of idle destinations whose CPU use is measured.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    print(f'{"run loop":>12s} {"hop p50":>10s} {"hop p99":>10s} {"pkgs/s":>10s} {"idle CPU":>10s}')
+    for hopClass in [Hop, PollingHop]:
+        latencies = sorted(benchLatency(hopClass, args.hops, args.packages))
+        p50 = statistics.median(latencies)
+        p99 = latencies[int(len(latencies) * .99) - 1]
+        rate = benchThroughput(hopClass, args.hops, args.packages * 20)
+        idle = benchIdle(hopClass, args.idle, 2)
+        label = 'blocking' if hopClass is Hop else 'polling'
+        print(f'{label:>12s} {p50 * 1e6:7.1f} us {p99 * 1e6:7.1f} us {rate:10.0f} {idle * 100:9.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+""" Benchmark of manifest record lookups, which run on every ChannelIO write and read.
+
+Lookup cost should stay flat as the number of records in a manifest grows.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchManifest
+"""
+import os
+import tempfile
+import time
+
+from Framework.Archive.ChannelIO import Manifest, ManifestRecord, manEpochToDT
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver
+from Utils import FileUtils as fUtils
+
+T0 = 1600000000.0
+
+
+def buildManifest(archiver, tdir, nRecords, interval=60):
+    man = Manifest(archiver, None, os.path.join(tdir, f'bench{nRecords}.manifest'), None)
+    for i in range(0, nRecords):
+        d, t = manEpochToDT(T0 + i * interval)
+        man.addManifestRecord(ManifestRecord(d, t))
+    return man, T0 + nRecords * interval
+
+
+def benchLookups(recordCounts, nLookups):
+    with tempfile.TemporaryDirectory() as tdir:
+        # readonly, so the manifests are not dumped to disk while they are built.
+        da = DirectoryArchiver(name='BenchManifest', baseDir=tdir, readonly=True)
+        try:
+            print(f'{"records":>8s} {"getManifestRecord":>20s} {"getManifestRecords":>20s}')
+            for nRecords in recordCounts:
+                man, lastTS = buildManifest(da, tdir, nRecords)
+                # the write path looks up the latest record.
+                t0 = time.perf_counter()
+                for i in range(0, nLookups):
+                    man.getManifestRecord(lastTS + i)
+                single = (time.perf_counter() - t0) / nLookups
+                t0 = time.perf_counter()
+                for i in range(0, nLookups):
+                    man.getManifestRecords(lastTS - 600, lastTS)
+                interval = (time.perf_counter() - t0) / nLookups
+                print(f'{nRecords:8d} {single * 1e6:17.2f} us {interval * 1e6:17.2f} us')
+        finally:
+            da.end()
+
+
+ARGS_METADATA = {
+    'description': 'Manifest lookup benchmark',
+    'args': [
+        {'name_or_flags': ['-n', '--lookups'],
+         'default': 20000,
+         'type': int,
+         'help': 'Number of lookups timed for each manifest size.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    benchLookups([10, 100, 1000, 10000], args.lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+""" Benchmark of extracting the values of a read from its Modbus responses: reads decoded per second for the full
+Alicat pin config (every readable register in alicatPins/pins_to_registers.csv) and a LabJack reading AIN0 to AIN13.
+
+The previous decoding, which built a format string and called extractData per register (Alicat) or per block, merging
+the results into a new dict each time, is included for comparison with BlockDecoder.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchModbusDecode
+"""
+import csv
+import random
+import struct
+import time
+
+from Applications.METECControl.Readers.AlicatMFCReader import PINS_LIST
+from Applications.METECControl.Readers.Modbus import Modbus
+from Applications.METECControl.Readers.ModbusFormat import BlockDecoder
+from Utils import FileUtils as fUtils
+
+MODBUS = Modbus('127.0.0.1', 502, name='bench')
+
+
+def alicatBlocks():
+    """{startAddr: {'registers': {addr: [name]}, 'types': {name: dataType}}} of the readable pins, split where there
+    is a gap or a block would pass MAX_READ_REG, as AlicatMFCReader.setBuffers does."""
+    with open(PINS_LIST) as pinFile:
+        pins = [row for row in csv.DictReader(pinFile) if 'R' in row['access']]
+    pins.sort(key=lambda pin: int(pin['start_address']))
+    blocks = {}
+    startAddr, end = None, None
+    for pin in pins:
+        addr = int(pin['start_address'])
+        numReg = MODBUS.getNumRegisters(pin['data_type'])
+        if startAddr is None or addr > end or addr + numReg - startAddr > MODBUS.MAX_READ_REG:
+            startAddr, end = addr, addr
+            blocks[startAddr] = {'registers': {}, 'types': {}}
+        blocks[startAddr]['registers'].setdefault(addr, []).append(pin['pin'])
+        blocks[startAddr]['types'][pin['pin']] = pin['data_type']
+        end = max(end, addr + numReg)
+    return blocks
+
+
+def makeResponse(numReg):
+    response = MODBUS.makeReadResponse(numReg)
+    MODBUS.setHeader(response, func=4)
+    response[MODBUS.RRESP_DATA_OFFSET:] = bytes(random.getrandbits(8) for i in range(0, 2 * numReg))
+    return response
+
+
+class LegacyAlicat():
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def decode(self, responses):
+        retData = {}
+        for startAddr, response in responses.items():
+            block = self.blocks[startAddr]
+            data = {}
+            for regAddr, regNames in block['registers'].items():
+                for regName in regNames:
+                    fmt = ">" + (2*(regAddr-startAddr))*"x" + MODBUS.TYPE_MAP[block['types'][regName]]
+                    data[regName] = MODBUS.extractData(fmt, response)
+                    if type(data[regName]) is tuple:
+                        data[regName] = data[regName][0]
+            if data:
+                retData = {**retData, **data}
+        return retData
+
+
+class LegacyLabJack():
+    def __init__(self, fmt, names):
+        self.fmt = fmt
+        self.names = names
+
+    def decode(self, responses):
+        ret = {}
+        for key, response in responses.items():
+            data = MODBUS.extractData(self.fmt, response)
+            if data:
+                ret = {**ret, **dict(zip(self.names, data))}
+        return ret
+
+
+class Decoders():
+    def __init__(self, decoders):
+        self.decoders = decoders
+
+    def decode(self, responses):
+        ret = {}
+        for key, response in responses.items():
+            data = self.decoders[key].decode(response)
+            if data:
+                ret.update(data)
+        return ret
+
+
+def sameReading(a, b):
+    """Whether two readings hold the same values. The random registers can hold NaN floats, which are compared by bits."""
+    return a.keys() == b.keys() and all(struct.pack('>d', a[k]) == struct.pack('>d', b[k]) for k in a)
+
+
+def bench(decoder, responses, seconds):
+    """Return reads decoded per second, and the last reading."""
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for i in range(0, 100):
+            reading = decoder.decode(responses)
+        n += 100
+    return n / (time.perf_counter() - start), reading
+
+
+ARGS_METADATA = {
+    'description': 'Modbus read decoding benchmark',
+    'args': [
+        {'name_or_flags': ['-s', '--seconds'],
+         'default': 2.0,
+         'type': float,
+         'help': 'Seconds each decoder is run for.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    blocks = alicatBlocks()
+    alicatResponses = {}
+    alicatDecoders = {}
+    for startAddr, block in blocks.items():
+        numReg = max(addr + MODBUS.getNumRegisters(block['types'][names[0]]) for addr, names in block['registers'].items()) - startAddr
+        alicatResponses[startAddr] = makeResponse(numReg)
+        alicatDecoders[startAddr] = BlockDecoder.fromRegisters(
+            startAddr, [(addr, block['types'][name], name) for addr, names in block['registers'].items() for name in names])
+    ainNames = [f'AIN{i}' for i in range(0, 14)]
+    ainFmt = '>' + 'f' * len(ainNames)
+    labJackResponses = {0: makeResponse(2 * len(ainNames))}
+    print(f'Alicat: {sum(len(b["types"]) for b in blocks.values())} registers in {len(blocks)} blocks. '
+          f'LabJack: {len(ainNames)} registers in 1 block.')
+    print(f'{"device":>8s} {"decoder":>14s} {"reads/s":>10s}')
+    for device, responses, legacy, new in [
+            ('Alicat', alicatResponses, LegacyAlicat(blocks), Decoders(alicatDecoders)),
+            ('LabJack', labJackResponses, LegacyLabJack(ainFmt, ainNames),
+             Decoders({0: BlockDecoder.fromFormat(ainFmt, ainNames)}))]:
+        legacyRate, legacyReading = bench(legacy, responses, args.seconds)
+        rate, reading = bench(new, responses, args.seconds)
+        same = sameReading(reading, legacyReading)
+        print(f'{device:>8s} {"extractData":>14s} {legacyRate:10.0f}')
+        print(f'{device:>8s} {"BlockDecoder":>14s} {rate:10.0f} x{rate / legacyRate:.1f}{"" if same else " MISMATCH"}')
+
+
+if __name__ == '__main__':
+    main()
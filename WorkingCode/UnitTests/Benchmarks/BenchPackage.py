@@ -0,0 +1,151 @@
+""" Benchmark of Package and Payload creation, the per reading cost of every reader: packages created per second and
+the memory each one holds, with a dict payload (as readers send) and with a Payload.
+
+The previous Package, which took a class wide lock for its packageID, and Payload, which stored each value in both its
+map and its __dict__, are included for comparison.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchPackage
+"""
+import threading
+import time
+import tracemalloc
+from collections.abc import MutableMapping
+from threading import RLock
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import Package, Payload
+from Utils import FileUtils as fUtils
+from Utils import TimeUtils as tu
+
+
+class LockedPackage:
+    """Package as it used to be."""
+    packageID = 0
+    lock = RLock()
+
+    def __init__(self, source=None, timestamp=None, payload=None, metadata=None, channelType=ChannelType.Other, mdKey=None, **kwargs):
+        self.channelType = channelType
+        self.timestamp = timestamp if timestamp else tu.nowEpoch()
+        self.source = source
+        self.metadata = metadata
+        self.metadataKey = mdKey
+        with LockedPackage.lock:
+            self.packageID = LockedPackage.packageID
+            LockedPackage.packageID += 1
+        self.payload = payload
+
+
+class DoubledPayload(MutableMapping):
+    """Payload as it used to be."""
+    def __init__(self, source, timestamp=None, metadata=None, **kwargs):
+        if timestamp is None:
+            timestamp = tu.nowEpoch()
+        self.map = {}
+        self.source = source
+        self.metadata = metadata
+        self.timestamp = timestamp
+        self.map['source'] = source
+        self.map['timestamp'] = timestamp
+        for kw, value in kwargs.items():
+            self.map[kw] = value
+            self.__dict__[kw] = value
+
+    def __delitem__(self, key):
+        del self.map[key]
+
+    def __getattr__(self, item):
+        try:
+            return MutableMapping.__getattribute__(self, item)
+        except AttributeError as e:
+            return None
+
+    def __getitem__(self, item):
+        return self.map[item]
+
+    def __setitem__(self, key, value):
+        self.map[key] = value
+
+    def __iter__(self):
+        return iter(self.map)
+
+    def __len__(self):
+        return len(self.map)
+
+
+def reading(i):
+    return {'timestamp': 1.0, 'FM-1': i * .1, 'PT-1': i * .2, 'TC-1': i * .3}
+
+
+def benchCreate(packageClass, payloadClass, nPackages):
+    """Return packages created per second. payloadClass None sends the reading dict itself as the payload."""
+    readings = [reading(i) for i in range(0, 100)]
+    start = time.perf_counter()
+    for i in range(0, nPackages):
+        r = readings[i % 100]
+        payload = payloadClass('bench', **r) if payloadClass else r
+        packageClass(source='bench', payload=payload, channelType=ChannelType.Data)
+    return nPackages / (time.perf_counter() - start)
+
+
+def benchThreads(packageClass, nThreads, nPackages):
+    """Return packages created per second by nThreads readers at once."""
+    def create():
+        for i in range(0, nPackages):
+            packageClass(source='bench', payload=i, channelType=ChannelType.Data)
+    threads = [threading.Thread(target=create) for i in range(0, nThreads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return nThreads * nPackages / (time.perf_counter() - start)
+
+
+def benchMemory(packageClass, payloadClass, nPackages):
+    """Return the bytes held by each package, payload included."""
+    readings = [reading(i) for i in range(0, 100)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for i in range(0, nPackages):
+        r = readings[i % 100]
+        payload = payloadClass('bench', **r) if payloadClass else r
+        kept.append(packageClass(source='bench', timestamp=1.0, payload=payload, channelType=ChannelType.Data))
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held / nPackages
+
+
+ARGS_METADATA = {
+    'description': 'Package creation benchmark',
+    'args': [
+        {'name_or_flags': ['-n', '--packages'],
+         'default': 200000,
+         'type': int,
+         'help': 'Number of packages created per run.'},
+        {'name_or_flags': ['-t', '--threads'],
+         'default': 4,
+         'type': int,
+         'help': 'Number of threads creating packages at once.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    print(f'{"package":>14s} {"payload":>14s} {"pkgs/s":>10s} {"bytes/pkg":>10s}')
+    for packageClass, payloadClass in [(LockedPackage, None), (Package, None),
+                                       (LockedPackage, DoubledPayload), (Package, Payload)]:
+        rate = benchCreate(packageClass, payloadClass, args.packages)
+        size = benchMemory(packageClass, payloadClass, args.packages // 10)
+        payloadName = payloadClass.__name__ if payloadClass else 'dict'
+        print(f'{packageClass.__name__:>14s} {payloadName:>14s} {rate:10.0f} {size:10.0f}')
+    print()
+    for packageClass in [LockedPackage, Package]:
+        rate = benchThreads(packageClass, args.threads, args.packages // args.threads)
+        print(f'{packageClass.__name__:>14s} {args.threads} threads {rate:10.0f} pkgs/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+""" Benchmark of the proxy wire encodings: bytes sent per package, and packages encoded and decoded per second, for
+readings as readers send them, with JSON lines (ProxySerializer.serialize) and with ProxySerializer.BinaryCodec.
+
+The binary sizes are of the data packets alone, as the metadata packet is sent once per source; the size of the
+metadata packet is printed separately.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchProxyCodec
+"""
+import time
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import Package
+from Framework.Proxy import ProxySerializer as ps
+from Utils import FileUtils as fUtils
+
+
+def alicatReading(i):
+    return {'timestamp': 1.0 + i, 'pressure': 14.7 + i * .01, 'temperature': 22.5, 'volumetricFlow': i * .1,
+            'massFlow': i * .09, 'setpoint': 5.0, 'gas': 'CH4', 'status': 0}
+
+
+def labJackReading(i):
+    return {'timestamp': 1.0 + i, **{f'AIN{n}': i * .001 + n for n in range(0, 14)}, 'DIO_STATE': i % 2**16}
+
+
+def makePackages(reading, n):
+    return [Package(source='bench', timestamp=1.0 + i, payload=reading(i), channelType=ChannelType.Data)
+            for i in range(0, n)]
+
+
+class JSONCodec():
+    def encode(self, package, sourceID):
+        return [ps.serialize(package.toDict())]
+
+    def decode(self, packet):
+        pkgDict = ps.deserialize(packet)
+        return Package(source=pkgDict['source'], timestamp=pkgDict['timestamp'], payload=pkgDict['payload'],
+                       channelType=pkgDict['channelType'])
+
+
+def bench(codecClass, packages, seconds):
+    """Return (bytes per package, packages encoded per second, packages decoded per second, first metadata bytes)."""
+    sender, receiver = codecClass(), codecClass()
+    first = sender.encode(packages[0], 1)
+    for packet in first:
+        receiver.decode(packet)
+    metadataBytes = sum(len(packet) for packet in first[:-1])
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        encoded = [sender.encode(package, 1) for package in packages]
+        n += len(packages)
+    encodeRate = n / (time.perf_counter() - start)
+    size = sum(len(packet) for packets in encoded for packet in packets) / len(packages)
+    packets = [packet for packets in encoded for packet in packets]
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for packet in packets:
+            receiver.decode(packet)
+        n += len(packets)
+    return size, encodeRate, n / (time.perf_counter() - start), metadataBytes
+
+
+ARGS_METADATA = {
+    'description': 'Proxy wire encoding benchmark',
+    'args': [
+        {'name_or_flags': ['-n', '--packages'],
+         'default': 1000,
+         'type': int,
+         'help': 'Number of different packages encoded per pass.'},
+        {'name_or_flags': ['-s', '--seconds'],
+         'default': 1.0,
+         'type': float,
+         'help': 'Seconds each codec encodes and decodes for.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    print(f'{"reading":>8s} {"codec":>8s} {"bytes/pkg":>10s} {"metadata":>9s} {"enc pkgs/s":>11s} {"dec pkgs/s":>11s}')
+    for name, reading in [('Alicat', alicatReading), ('LabJack', labJackReading)]:
+        packages = makePackages(reading, args.packages)
+        results = {}
+        for codecName, codecClass in [('JSON', JSONCodec), ('binary', ps.BinaryCodec)]:
+            size, encodeRate, decodeRate, metadataBytes = bench(codecClass, packages, args.seconds)
+            results[codecName] = size
+            print(f'{name:>8s} {codecName:>8s} {size:10.1f} {metadataBytes:9d} {encodeRate:11.0f} {decodeRate:11.0f}')
+        print(f'{name:>8s} binary packets are {results["binary"] / results["JSON"]:.0%} of the JSON size')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+""" Benchmark of the proxy TCP transports at many connections: TCPConnection, with its threads, against
+AsyncTCPListener and AsyncTCPConnection in one NetworkLoop.
+
+Each of --peers peers joins an echo server on loopback and sends --packets packets one at a time, waiting for each to
+come back, all peers at once from their own client thread. Reported are the time to connect every peer, the round trip
+latency, the CPU time used by the process (both ends run in it), the threads running, and the time to close it all.
+
+Run from the WorkingCode directory:
+    python -m UnitTests.Benchmarks.BenchProxyTransport
+"""
+import socket
+import statistics
+import threading
+import time
+
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy.TCP.AsyncTCP import AsyncTCPListener, NetworkLoop, getAsyncNetworkConnection
+from Framework.Proxy.TCP.StreamFramer import LENGTH
+from Framework.Proxy.TCP.TCPConnection import TCPConnection
+from Utils import FileUtils as fUtils
+
+LOCALHOST = '127.0.0.1'
+
+
+class ThreadedTransport():
+    name = 'threads'
+
+    def start(self, nPeers):
+        self.servers = []
+        self.echoThreads = []
+        self.listenSocket = socket.create_server((LOCALHOST, 0), backlog=nPeers)
+        address = self.listenSocket.getsockname()
+        self.peers = []
+        for i in range(0, nPeers):
+            peer = TCPConnection(f'peer{i}', 'server', socket.create_connection(address), framing=LENGTH, batchDelay=0)
+            connSock, addr = self.listenSocket.accept()
+            server = TCPConnection('server', None, connSock, framing=LENGTH, batchDelay=0)
+            for connection in [peer, server]:
+                connection.start()
+            # packets are taken off the recv queue of a TCPConnection, so echoing them takes a thread each.
+            echoThread = threading.Thread(target=self._echo, args=(server,))
+            echoThread.start()
+            self.peers.append(peer)
+            self.servers.append(server)
+            self.echoThreads.append(echoThread)
+
+    def _echo(self, server):
+        while not server.terminate:
+            try:
+                server.send(server.getRecvQueue().get(timeout=.1))
+            except Exception:
+                pass
+
+    def end(self):
+        for connection in self.peers + self.servers:
+            connection.end()
+        for connection in self.peers + self.servers:
+            connection.sendThread.join()
+            connection.socket.close()
+            connection.recvThread.join()
+        for thread in self.echoThreads:
+            thread.join()
+        self.listenSocket.close()
+
+
+class AsyncTransport():
+    name = 'asyncio'
+
+    def start(self, nPeers):
+        self.networkLoop = NetworkLoop('BenchNetworkLoop')
+        self.listener = AsyncTCPListener('server', 'server_listener', (LOCALHOST, 0), framing=LENGTH,
+                                         networkLoop=self.networkLoop, handler=lambda connection, packet: connection.send(packet),
+                                         batchDelay=0)
+        self.listener.start()
+        self.peers = [getAsyncNetworkConnection(f'peer{i}', None, self.listener.listenAddress, framing=LENGTH,
+                                                networkLoop=self.networkLoop, batchDelay=0) for i in range(0, nPeers)]
+        self.servers = [self.listener.accept(timeout=5) for peer in self.peers]
+
+    def end(self):
+        self.listener.end()
+        for connection in self.peers + self.servers:
+            connection.end()
+        while any(connection.getStatus() for connection in self.peers + self.servers):
+            time.sleep(.001)
+        self.networkLoop.stop()
+
+
+def pingPong(peer, n, payloadSize, rtts):
+    payload = bytes(payloadSize)
+    for i in range(0, n):
+        packet = ps.makePacket(i, payload)
+        start = time.perf_counter()
+        peer.send(packet)
+        peer.getRecvQueue().get(timeout=5)
+        rtts.append(time.perf_counter() - start)
+
+
+def bench(transport, nPeers, nPackets, payloadSize):
+    """Return a dict of the connect time, round trip percentiles, CPU time, threads, and shutdown time."""
+    threadsBefore = threading.active_count()
+    start = time.perf_counter()
+    transport.start(nPeers)
+    connectTime = time.perf_counter() - start
+    threads = threading.active_count() - threadsBefore
+    rtts = []
+    clients = [threading.Thread(target=pingPong, args=(peer, nPackets, payloadSize, rtts)) for peer in transport.peers]
+    cpuStart, start = time.process_time(), time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpuStart
+    start = time.perf_counter()
+    transport.end()
+    shutdown = time.perf_counter() - start
+    rtts.sort()
+    return {'connect': connectTime, 'threads': threads, 'p50': statistics.median(rtts),
+            'p99': rtts[int(len(rtts) * .99)], 'packets/s': len(rtts) / elapsed, 'cpuPerPacket': cpu / len(rtts),
+            'cpu': cpu, 'shutdown': shutdown}
+
+
+ARGS_METADATA = {
+    'description': 'Proxy TCP transport benchmark',
+    'args': [
+        {'name_or_flags': ['-p', '--peers'],
+         'default': 64,
+         'type': int,
+         'help': 'Number of connections to the echo server.'},
+        {'name_or_flags': ['-n', '--packets'],
+         'default': 200,
+         'type': int,
+         'help': 'Packets each peer sends and waits for.'},
+        {'name_or_flags': ['-b', '--bytes'],
+         'default': 100,
+         'type': int,
+         'help': 'Payload bytes of each packet.'}
+    ]
+}
+
+
+def main():
+    args = fUtils.getArgs(ARGS_METADATA)
+    print(f'{args.peers} peers, {args.packets} packets of {args.bytes} bytes each')
+    print(f'{"transport":>9s} {"connect s":>9s} {"threads":>7s} {"rtt p50 ms":>10s} {"rtt p99 ms":>10s} '
+          f'{"packets/s":>9s} {"cpu s":>6s} {"cpu us/pkt":>10s} {"shutdown s":>10s}')
+    for transport in [ThreadedTransport(), AsyncTransport()]:
+        r = bench(transport, args.peers, args.packets, args.bytes)
+        print(f'{transport.name:>9s} {r["connect"]:9.3f} {r["threads"]:7d} {r["p50"] * 1e3:10.3f} {r["p99"] * 1e3:10.3f} '
+              f'{r["packets/s"]:9.0f} {r["cpu"]:6.2f} {r["cpuPerPacket"] * 1e6:10.1f} {r["shutdown"]:10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from Framework.Archive.Catalog import ArchiveCatalog, CATALOG_NAME
+from Framework.Archive.Formatters import IndexedCSVFormatter, NumpyBlockFormatter, FlushPolicy
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+
+METADATA = Metadata(timestamp='float', val1='int', val2='float')
+T0 = 1600000000.0
+
+
+def makeRows(start, stop):
+    return [{'timestamp': T0 + i, 'val1': i, 'val2': i + .5} for i in range(start, stop)]
+
+
+def writeArchiveFile(baseDir, archiveName, channel, rows, formatter=IndexedCSVFormatter):
+    dataDir = os.path.join(baseDir, archiveName, 'data')
+    os.makedirs(dataDir, exist_ok=True)
+    base = os.path.join(dataDir, f'{channel}_{int(rows[0]["timestamp"])}')
+    ext = '.npb' if formatter is NumpyBlockFormatter else '.csv'
+    for p in [base + ext, base + '.idx']:
+        open(p, 'w').close()
+    fmt = formatter(channel, ChannelType.Data, METADATA, None, path=base + ext, idxCsvPath=base + '.idx',
+                    flushPolicy=FlushPolicy(maxRows=25, maxAge=1000))
+    fmt.writeRow(rows)
+    fmt.close()
+    return base + ext
+
+
+class TestCatalog(unittest.TestCase):
+    def test_ReadAcrossArchives(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            rows = makeRows(0, 300)
+            writeArchiveFile(tdir, '2020-09-13_00-00-00', 'MET-1.LJ-1', rows[0:100])
+            writeArchiveFile(tdir, '2020-09-14_00-00-00', 'MET-1.LJ-1', rows[100:200], NumpyBlockFormatter)
+            writeArchiveFile(tdir, '2020-09-15_00-00-00', 'MET-1.LJ-1', rows[200:300])
+            writeArchiveFile(tdir, '2020-09-15_00-00-00', 'MET-2.LJ-1', rows[0:10])
+            catalog = ArchiveCatalog(tdir, readers=2)
+            self.assertEqual(catalog.channels(), ['MET-1.LJ-1', 'MET-2.LJ-1'])
+            self.assertEqual(catalog.span('MET-1.LJ-1'), (T0, T0 + 299))
+            # only the files that overlap the range are read.
+            self.assertEqual([e['archive'] for e in catalog.files('MET-1.LJ-1', T0 + 150, T0 + 250)],
+                             ['2020-09-14_00-00-00', '2020-09-15_00-00-00'])
+            df = catalog.read('MET-1.LJ-1', T0 + 50, T0 + 250)
+            self.assertEqual(df['val1'].tolist(), list(range(50, 251)))
+            self.assertEqual(catalog.read('MET-1.LJ-1', T0 + 95, T0 + 105, asDF=False), rows[95:106])
+            self.assertEqual(len(catalog.read('MET-1.LJ-1')), 300)
+            self.assertEqual(len(catalog.read('MET-1.LJ-1', T0 + 1000, T0 + 2000)), 0)
+            chunks = list(catalog.iterChunks('MET-1.LJ-1', T0 + 50, T0 + 250, chunkSize=30))
+            self.assertTrue(all(len(chunk) <= 30 for chunk in chunks))
+            self.assertEqual([v for chunk in chunks for v in chunk['val1'].tolist()], list(range(50, 251)))
+
+    def test_PersistedIndex(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            writeArchiveFile(tdir, 'archive1', 'chan', makeRows(0, 50))
+            path = writeArchiveFile(tdir, 'archive2', 'chan', makeRows(50, 100))
+            catalog = ArchiveCatalog(tdir)
+            self.assertTrue(os.path.exists(os.path.join(tdir, CATALOG_NAME)))
+            # a new catalog loads the saved index, and only reindexes files that changed.
+            reopened = ArchiveCatalog(tdir, refresh=False)
+            self.assertEqual(reopened.entries, catalog.entries)
+            self.assertEqual(reopened.refresh(), 0)
+            fmt = IndexedCSVFormatter('chan', ChannelType.Data, METADATA, None, path=path,
+                                      idxCsvPath=os.path.splitext(path)[0] + '.idx')
+            fmt.writeRow(makeRows(100, 110))
+            fmt.close()
+            self.assertEqual(reopened.refresh(), 1)
+            self.assertEqual(reopened.span('chan'), (T0, T0 + 109))
@@ -0,0 +1,107 @@
+import gzip
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from Framework.Archive.ColdStorage import compressFile, openSegment, readFrames, isCompressed, decompressFile, \
+    compressedPath, plainName
+from Framework.Archive.Catalog import ArchiveCatalog
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver
+from Framework.Archive.Formatters import IndexedCSVFormatter, NumpyBlockFormatter
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Framework.BaseClasses.Package import Package
+from UnitTests.TestArchiver.TestFormatters import METADATA, makeRows, newCSVFormatter, newBlockFormatter
+
+
+class TestColdStorage(unittest.TestCase):
+    def test_FramedSeek(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            path = os.path.join(tdir, 'lines.log')
+            with open(path, 'w', newline='') as f:
+                f.write(''.join(f'line {i} {"x" * (i % 37)}\n' for i in range(0, 5000)))
+            with open(path, 'rb') as f:
+                plain = f.read()
+            stats = compressFile(path, frameBytes=4096)
+            self.assertTrue(isCompressed(path))
+            self.assertEqual(stats['bytesIn'], len(plain))
+            self.assertLess(stats['bytesOut'], stats['bytesIn'])
+            starts, frameOffsets, size, compressedSize = readFrames(path)
+            self.assertGreater(len(starts), 10)
+            self.assertTrue(all(plain[s - 1:s] == b'\n' for s in starts[1:])) # frames hold whole lines.
+            # still one ordinary gzip file.
+            with gzip.open(compressedPath(path), 'rb') as f:
+                self.assertEqual(f.read(), plain)
+            rand = random.Random(0)
+            with openSegment(path, 'rb') as f:
+                for i in range(0, 200):
+                    pos, n = rand.randrange(0, len(plain)), rand.randrange(1, 10000)
+                    f.seek(pos)
+                    self.assertEqual(f.read(n), plain[pos:pos + n])
+                self.assertEqual(f.seek(-10, os.SEEK_END), len(plain) - 10)
+                self.assertEqual(f.read(), plain[-10:])
+            with openSegment(path, 'r', newline='') as f:
+                self.assertEqual(f.readline(), 'line 0 \n')
+            decompressFile(path)
+            self.assertFalse(isCompressed(path))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), plain)
+        self.assertEqual(plainName('chan_1.csv.gz'), 'chan_1.csv')
+        self.assertIsNone(plainName('chan_1.csv.frames'))
+
+    def test_CompressedCSVRead(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, idxLimit=50)
+            rows = makeRows(0, 2000)
+            fmt.writeRow(rows)
+            fmt.close()
+            reads = lambda f: (f.read(), f.read(500, 1200), f.read(500, 1200, asDF=True).to_dict('records'),
+                               [r for chunk in f.iterRead(700, 1600, chunkSize=300) for r in chunk], f.timeSpan())
+            expected = reads(fmt)
+            compressFile(fmt.csvPath, frameBytes=2048)
+            self.assertFalse(os.path.exists(fmt.csvPath))
+            # frames begin at index offsets, so the index still finds rows in the compressed file.
+            starts = readFrames(fmt.csvPath)[0]
+            timestamps, offsets = fmt._readIndex(fmt.idxPath)
+            self.assertTrue(set(starts[1:]).issubset(offsets))
+            reader = IndexedCSVFormatter('chan', ChannelType.Data, METADATA, None, readOnly=True, path=fmt.csvPath,
+                                         idxCsvPath=fmt.idxPath)
+            self.assertEqual(reads(reader), expected)
+            self.assertEqual(reader.read(asDF=True).to_dict('records'), rows)
+
+    def test_CompressedBlockRead(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newBlockFormatter(tdir)
+            rows = makeRows(0, 3000)
+            fmt.writeRow(rows)
+            fmt.close()
+            expected = fmt.read(100, 2500).toList()
+            compressFile(fmt.blockPath, frameBytes=8192)
+            reader = NumpyBlockFormatter('chan', ChannelType.Data, METADATA, None, readOnly=True, path=fmt.blockPath,
+                                         idxCsvPath=fmt.idxPath)
+            self.assertEqual(reader.read(100, 2500).toList(), expected)
+            self.assertEqual(reader.timeSpan(), (0.0, 2999.0))
+
+    def test_ArchiverCompressClosed(self):
+        md = Metadata(timestamp='float', val1='int')
+        t0 = float(int(time.time())) # manifest records are kept to the microsecond.
+        with tempfile.TemporaryDirectory() as tdir:
+            da = DirectoryArchiver(name='compressClosed', baseDir=tdir, compressClosed=True)
+            da.createChannel('chan', ChannelType.Data, metadata=md, timestamp=t0)
+            for i in range(0, 500):
+                da.handlePackage(Package(source='chan', timestamp=t0 + i, payload={'timestamp': t0 + i, 'val1': i},
+                                         metadata=md, channelType=ChannelType.Data))
+            da.writePool.drain()
+            closedPath = da.getArchivePath()
+            da._rollover()
+            self.assertTrue(da.waitForCompaction(timeout=30))
+            stats = da.compactionStats[0]
+            self.assertGreater(stats['files'], 0)
+            self.assertGreater(stats['ratio'], 1)
+            dataFiles = os.listdir(os.path.join(closedPath, 'data'))
+            self.assertFalse(any(f.endswith('.csv') for f in dataFiles))
+            da.end()
+            catalog = ArchiveCatalog(closedPath, catalogPath=os.path.join(tdir, 'catalog.json'))
+            self.assertEqual(catalog.read('chan')['val1'].tolist(), list(range(0, 500)))
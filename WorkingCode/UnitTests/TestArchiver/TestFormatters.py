@@ -0,0 +1,286 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from Framework.Archive.Converters import csvToBlocks
+from Framework.Archive.Formatters import IndexedCSVFormatter, LineJSONFormatter, NumpyBlockFormatter, FlushPolicy, \
+    WriteBuffer, ColumnReading, DEFAULT_FLUSH_POLICIES, DEFAULT_STR_WIDTH, ROW_DECODER, rechunk
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Framework.BaseClasses.Package import BlockPayload
+
+METADATA = Metadata(timestamp='float', val1='int', val2='float')
+
+
+def makeRows(start, stop):
+    return [{'timestamp': float(i), 'val1': i, 'val2': i + .5} for i in range(start, stop)]
+
+
+def newCSVFormatter(tdir, flushPolicy=None, idxLimit=100):
+    csvPath = os.path.join(tdir, 'chan.csv')
+    idxPath = os.path.join(tdir, 'chan.idx')
+    for p in [csvPath, idxPath]:
+        open(p, 'w').close()
+    return IndexedCSVFormatter('chan', ChannelType.Data, METADATA, None, idxLimit=idxLimit, path=csvPath,
+                               idxCsvPath=idxPath, flushPolicy=flushPolicy)
+
+
+def newBlockFormatter(tdir, flushPolicy=None, metadata=METADATA):
+    blockPath = os.path.join(tdir, 'chan.npb')
+    idxPath = os.path.join(tdir, 'chan.blk.idx')
+    for p in [blockPath, idxPath]:
+        open(p, 'w').close()
+    return NumpyBlockFormatter('chan', ChannelType.Data, metadata, None, path=blockPath, idxCsvPath=idxPath,
+                               flushPolicy=flushPolicy)
+
+
+def dataLines(path):
+    with open(path) as f:
+        return f.read().splitlines()[2:] # skip the field names and the type header rows.
+
+
+class TestFormatters(unittest.TestCase):
+    def test_WriteBufferPolicy(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            path = os.path.join(tdir, 'buffered.txt')
+            buf = WriteBuffer(path, FlushPolicy(maxRows=3, maxAge=1000))
+            buf.write('one\n')
+            buf.write('two\n')
+            self.assertEqual(buf.pending(), 2)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(buf.tell(), len(('one\ntwo\n').replace('\n', os.linesep)))
+            buf.write('three\n')
+            self.assertEqual(buf.pending(), 0)
+            with open(path) as f:
+                self.assertEqual(f.read(), 'one\ntwo\nthree\n')
+            buf.write('four\n')
+            buf.close()
+            self.assertFalse(buf.isOpen())
+            with open(path) as f:
+                self.assertEqual(f.read().splitlines(), ['one', 'two', 'three', 'four'])
+
+    def test_WriteBufferAge(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            path = os.path.join(tdir, 'aged.txt')
+            buf = WriteBuffer(path, FlushPolicy(maxRows=1000, maxAge=0))
+            buf.write('immediately due\n')
+            self.assertEqual(buf.pending(), 0)
+            buf.close()
+
+    def test_CSVBatchedWrites(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, FlushPolicy(maxRows=10, maxAge=1000))
+            rows = makeRows(0, 15)
+            fmt.writeRow(rows[0:9])
+            self.assertEqual(dataLines(fmt.csvPath), [])
+            fmt.writeRow(rows[9:15])
+            self.assertEqual(len(dataLines(fmt.csvPath)), 10)
+            # reads see rows that are still pending in the buffer.
+            self.assertEqual(fmt.read(), rows)
+            fmt.writeRow(makeRows(15, 17))
+            fmt.close()
+            self.assertEqual(len(dataLines(fmt.csvPath)), 17)
+
+    def test_CSVIndexOffsets(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, FlushPolicy(maxRows=7, maxAge=1000), idxLimit=10)
+            fmt.writeRow(makeRows(1, 36))
+            fmt.close()
+            with open(fmt.idxPath) as idx:
+                records = idx.read().splitlines()[1:]
+            self.assertEqual(len(records), 3)
+            with open(fmt.csvPath, 'rb') as csvFile:
+                for record in records:
+                    ts, offset, count = record.split(',')
+                    csvFile.seek(int(offset))
+                    row = csvFile.readline().decode().strip().split(',')
+                    self.assertEqual(float(row[0]), float(ts))
+                    self.assertEqual(int(row[1]), int(count))
+
+    def test_CSVIndexedSeek(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, idxLimit=10)
+            rows = makeRows(0, 200)
+            fmt.writeRow(rows)
+            fmt.close()
+            header = list(METADATA.keys())
+            start, end = fmt._indexWindow(fmt.csvPath, header, 55.0, 72.5)
+            with open(fmt.csvPath, 'rb') as csvFile:
+                csvFile.seek(start)
+                self.assertEqual(float(csvFile.readline().split(b',')[0]), 49.0)
+                csvFile.seek(end)
+                self.assertEqual(float(csvFile.readline().split(b',')[0]), 79.0)
+            for minTS, maxTS in [(55.0, 72.5), (-5.0, 3.0), (0.0, 9.0), (190.5, 500.0), (300.0, 400.0)]:
+                expected = [row for row in rows if minTS <= row['timestamp'] <= maxTS]
+                self.assertEqual(fmt.read(minTS, maxTS), expected)
+                df = fmt.read(minTS, maxTS, asDF=True)
+                self.assertEqual(df['val1'].tolist(), [row['val1'] for row in expected])
+                self.assertEqual(fmt.read(minTS, maxTS, asDask=True).compute()['val1'].tolist(),
+                                 [row['val1'] for row in expected])
+            self.assertEqual(fmt.read(asDF=True)['val1'].tolist(), list(range(0, 200)))
+
+    def test_CSVStaleIndex(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, idxLimit=10)
+            rows = makeRows(0, 50)
+            fmt.writeRow(rows)
+            fmt.close()
+            with open(fmt.idxPath, 'a') as idx:
+                idx.write('1000.0,5,2000\n') # points at the middle of a row.
+            self.assertEqual(fmt._indexWindow(fmt.csvPath, list(METADATA.keys()), 1500.0, 2000.0), (None, None))
+            self.assertEqual(fmt.read(25.0, 30.0), rows[25:31])
+
+    def test_CSVColumnDecoder(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            md = Metadata(timestamp='float', count='int', name='string', flag=bool, val='float')
+            csvPath = os.path.join(tdir, 'chan.csv')
+            idxPath = os.path.join(tdir, 'chan.idx')
+            for p in [csvPath, idxPath]:
+                open(p, 'w').close()
+            fmt = IndexedCSVFormatter('chan', ChannelType.Data, md, None, idxLimit=7, path=csvPath, idxCsvPath=idxPath)
+            fmt.writeRow([{'timestamp': float(i), 'count': i, 'name': f'n{i}', 'flag': i % 2 == 0, 'val': i / 3}
+                          for i in range(0, 60)])
+            fmt.close()
+            for minTS, maxTS in [(-1.0, 100.0), (3.0, 17.5), (59.0, 59.0)]:
+                rows = fmt.read(minTS, maxTS, decoder=ROW_DECODER)
+                columns = fmt.read(minTS, maxTS)
+                self.assertIsInstance(columns, ColumnReading)
+                self.assertEqual(columns, rows)
+                self.assertEqual(columns.column('count').tolist(), [row['count'] for row in rows])
+            reading = fmt.read(10.0, 19.0)
+            self.assertEqual(reading[0], {'timestamp': 10.0, 'count': 10, 'name': 'n10', 'flag': True, 'val': 10 / 3})
+            self.assertEqual(reading[-2:], fmt.read(18.0, 19.0))
+            self.assertEqual(reading.toDF()['name'].tolist(), [f'n{i}' for i in range(10, 20)])
+            # rows that can not be decoded by columns are skipped, as when reading by rows.
+            with open(csvPath, 'a') as csvFile:
+                csvFile.write('60.0,,n60,True,1.0\n61.0,61,n61,False,2.0\n')
+            self.assertEqual(fmt.read(59.0, 61.0), fmt.read(59.0, 61.0, decoder=ROW_DECODER))
+            self.assertEqual(len(fmt.read(59.0, 61.0)), 2)
+
+    def test_DurableChannelTypes(self):
+        for channelType in [ChannelType.Event, ChannelType.Command, ChannelType.Response]:
+            self.assertTrue(DEFAULT_FLUSH_POLICIES[channelType].fsync)
+            self.assertEqual(DEFAULT_FLUSH_POLICIES[channelType].maxRows, 1)
+        with tempfile.TemporaryDirectory() as tdir:
+            path = os.path.join(tdir, 'events.json')
+            open(path, 'w').close()
+            fmt = LineJSONFormatter('events', ChannelType.Event, None, None, path=path)
+            fmt.writeRow({'eventType': 'test'}, ts=1.0)
+            with open(path) as f:
+                self.assertEqual(len(f.read().splitlines()), 1)
+            self.assertEqual(fmt.read(), [{'eventType': 'test'}])
+            fmt.close()
+
+    def test_BlockRoundTrip(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newBlockFormatter(tdir, FlushPolicy(maxRows=10, maxAge=1000))
+            rows = makeRows(0, 35)
+            fmt.writeRow(rows)
+            # reads see rows that are still pending in the buffer.
+            self.assertEqual(fmt.read(), rows)
+            fmt.close()
+            with open(fmt.idxPath) as idx:
+                self.assertEqual(len(idx.read().splitlines()[1:]), 4)
+            self.assertEqual(fmt.read(10.0, 22.0), rows[10:23])
+            self.assertEqual(fmt.read(100.0, 200.0), [])
+
+    def test_BlockPayloadWrites(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newBlockFormatter(tdir, FlushPolicy(maxRows=10, maxAge=1000))
+            rows = makeRows(0, 45)
+            fmt.writeBlock(BlockPayload.fromRows('chan', rows[:5])) # smaller than maxRows: joins the pending rows.
+            fmt.writeBlock(BlockPayload('chan', {key: np.array([row[key] for row in rows[5:45]])
+                                                  for key in ['timestamp', 'val1', 'val2']}))
+            fmt.close()
+            with open(fmt.idxPath) as idx:
+                # the pending rows were flushed ahead of the large block, which was written whole from its columns.
+                self.assertEqual([line.split(',')[-1] for line in idx.read().splitlines()[1:]], ['5', '40'])
+            self.assertEqual(fmt.read(), rows)
+            csvFmt = newCSVFormatter(tdir)
+            csvFmt.writeBlock(BlockPayload.fromRows('chan', rows))
+            csvFmt.close()
+            self.assertEqual(len(dataLines(csvFmt.csvPath)), 45)
+
+    def test_BlockReadDF(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            md = Metadata(timestamp='float', val1='int', name='string')
+            fmt = newBlockFormatter(tdir, FlushPolicy(maxRows=4, maxAge=1000), md)
+            rows = [{'timestamp': float(i), 'val1': i, 'name': f'dev{i}'} for i in range(10)]
+            fmt.writeRow(rows)
+            df = fmt.read(2.0, 7.0, asDF=True)
+            self.assertEqual(list(df.columns), ['timestamp', 'val1', 'name'])
+            self.assertEqual(df['val1'].tolist(), list(range(2, 8)))
+            self.assertEqual(df['name'].tolist(), [f'dev{i}' for i in range(2, 8)])
+            # without the index, blocks are found by walking the block headers.
+            os.remove(fmt.idxPath)
+            self.assertEqual(fmt.read(2.0, 7.0), rows[2:8])
+            fmt.close()
+
+    def test_CSVToBlocks(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, idxLimit=10)
+            rows = makeRows(0, 50)
+            fmt.writeRow(rows)
+            fmt.close()
+            with open(fmt.idxPath) as idxFile:
+                csvIndex = idxFile.read()
+            blockPath = csvToBlocks(fmt.csvPath, blockRows=16)
+            self.assertEqual(blockPath, os.path.join(tdir, 'chan.npb'))
+            blockFmt = NumpyBlockFormatter('chan', ChannelType.Data, None, None, readOnly=True, path=blockPath)
+            self.assertEqual(blockFmt.idxPath, os.path.join(tdir, 'chan.blk.idx'))
+            self.assertEqual(blockFmt.read(), rows)
+            self.assertEqual(blockFmt.read(20.0, 30.0, asDF=True)['val2'].tolist(), [i + .5 for i in range(20, 31)])
+            # the csv, kept as a fallback, keeps its own index.
+            with open(fmt.idxPath) as idxFile:
+                self.assertEqual(idxFile.read(), csvIndex)
+            self.assertEqual(fmt.read(20.0, 30.0), rows[20:31])
+
+    def test_BlockStringWidth(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            md = Metadata(timestamp='float', name='string')
+            fmt = newBlockFormatter(tdir, FlushPolicy(maxRows=1, maxAge=1000), md)
+            # 3 byte characters that do not fit the width evenly, so a byte cut would split the last one.
+            names = ['\u20ac' * 30, 'a' + '\u20ac' * 30, 'short']
+            fmt.writeRow([{'timestamp': float(i), 'name': name} for i, name in enumerate(names)])
+            read = [row['name'] for row in fmt.read()]
+            self.assertEqual(read, ['\u20ac' * 21, 'a' + '\u20ac' * 21, 'short'])
+            self.assertTrue(all(len(name.encode('utf-8')) <= DEFAULT_STR_WIDTH for name in read))
+            fmt.close()
+
+    def test_CSVIterRead(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newCSVFormatter(tdir, idxLimit=10)
+            rows = makeRows(0, 250)
+            fmt.writeRow(rows)
+            for minTS, maxTS in [(-1.0, 1000.0), (35.0, 182.5), (249.0, 300.0), (400.0, 500.0)]:
+                expected = [row for row in rows if minTS <= row['timestamp'] <= maxTS]
+                chunks = list(fmt.iterRead(minTS, maxTS, chunkSize=40))
+                self.assertTrue(all(len(chunk) == 40 for chunk in chunks[:-1]))
+                self.assertEqual([row for chunk in chunks for row in chunk], expected)
+                dfChunks = list(fmt.iterRead(minTS, maxTS, chunkSize=40, asDF=True))
+                self.assertEqual([v for df in dfChunks for v in df['val1'].tolist()], [row['val1'] for row in expected])
+            # rows that do not match their types are skipped, carrying on row by row from where the columns stopped.
+            fmt.writeRow(makeRows(250, 260))
+            fmt.close()
+            with open(fmt.csvPath, 'a') as csvFile:
+                csvFile.write('260.0,not an int,1.0\n261.0,261,261.5\n')
+            chunks = list(fmt.iterRead(100.0, 300.0, chunkSize=64))
+            self.assertEqual([row['val1'] for chunk in chunks for row in chunk], list(range(100, 260)) + [261])
+
+    def test_BlockIterRead(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            fmt = newBlockFormatter(tdir, FlushPolicy(maxRows=30, maxAge=1000))
+            rows = makeRows(0, 100)
+            fmt.writeRow(rows)
+            chunks = list(fmt.iterRead(10.0, 80.0, chunkSize=25))
+            self.assertEqual([len(chunk) for chunk in chunks], [25, 25, 21])
+            self.assertEqual([row for chunk in chunks for row in chunk], rows[10:81])
+            self.assertEqual(sum(len(df) for df in fmt.iterRead(chunkSize=7, asDF=True)), 100)
+            fmt.close()
+
+    def test_Rechunk(self):
+        pieces = [ColumnReading({'a': np.arange(0, n)}) for n in [3, 10, 0, 4]]
+        self.assertEqual([len(chunk) for chunk in rechunk(pieces, 5)], [5, 5, 5, 2])
+        self.assertEqual([len(chunk) for chunk in rechunk([[1, 2, 3], [4]], 2)], [2, 2])
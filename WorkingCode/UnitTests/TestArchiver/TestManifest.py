@@ -0,0 +1,136 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from Framework.Archive.ChannelIO import Manifest, ManifestRecord, manEpochToDT, manDTtoEpoch, readManifest
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Utils.TimeUtils import MIN_EPOCH, MAX_EPOCH
+
+T0 = 1600000000.0
+
+
+def newRecord(ts):
+    d, t = manEpochToDT(ts)
+    return ManifestRecord(d, t)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.da = DirectoryArchiver(name=f'manifest{id(self)}', baseDir=self.tdir.name, readonly=True)
+        self.man = Manifest(self.da, None, os.path.join(self.tdir.name, 'test.manifest'), None)
+        # added out of order, the manifest keeps them sorted.
+        self.records = {ts: newRecord(ts) for ts in [T0 + 200, T0, T0 + 100]}
+        for ts, rec in self.records.items():
+            self.man.addManifestRecord(rec)
+
+    def tearDown(self):
+        self.da.end()
+        self.tdir.cleanup()
+
+    def test_GetManifestRecord(self):
+        self.assertIsNone(self.man.getManifestRecord(T0 - 1))
+        self.assertIs(self.man.getManifestRecord(T0), self.records[T0])
+        self.assertIs(self.man.getManifestRecord(T0 + 99.5), self.records[T0])
+        self.assertIs(self.man.getManifestRecord(T0 + 100), self.records[T0 + 100])
+        self.assertIs(self.man.getManifestRecord(T0 + 1e6), self.records[T0 + 200])
+        self.assertEqual(self.records[T0].endTS(), T0 + 100)
+        self.assertEqual(self.records[T0 + 100].endTS(), T0 + 200)
+        self.assertEqual(self.records[T0 + 200].endTS(), MAX_EPOCH)
+
+    def test_GetManifestRecords(self):
+        rec = self.records
+        self.assertEqual(self.man.getManifestRecords(), [rec[T0], rec[T0 + 100], rec[T0 + 200]])
+        # a range within a single record returns the record that covers it.
+        self.assertEqual(self.man.getManifestRecords(T0 + 10, T0 + 20), [rec[T0]])
+        self.assertEqual(self.man.getManifestRecords(T0 + 50, T0 + 150), [rec[T0], rec[T0 + 100]])
+        self.assertEqual(self.man.getManifestRecords(T0 + 100, T0 + 100), [rec[T0 + 100]])
+        self.assertEqual(self.man.getManifestRecords(MIN_EPOCH, T0 - 1), [])
+        self.assertEqual(self.man.getManifestRecords(T0 + 500, MAX_EPOCH), [rec[T0 + 200]])
+
+    def test_LookupsWaitForAdd(self):
+        """Lookups take the lock addManifestRecord holds while it inserts into the start and record lists."""
+        results = {}
+        lookups = [threading.Thread(target=lambda: results.update(one=self.man.getManifestRecord(T0 + 350))),
+                   threading.Thread(target=lambda: results.update(many=self.man.getManifestRecords(T0 + 350)))]
+        with self.man.lock:
+            for thread in lookups:
+                thread.start()
+            time.sleep(.05)
+            self.assertEqual(results, {})
+            record = newRecord(T0 + 300)
+            self.man.addManifestRecord(record)
+        for thread in lookups:
+            thread.join(2)
+        self.assertEqual(results, {'one': record, 'many': [record]})
+
+    def test_DuplicateRecord(self):
+        self.assertTrue(self.man.addManifestRecord(self.records[T0]))
+        self.assertEqual(len(self.man.getManifestRecords()), 3)
+        with self.assertRaises(NotImplementedError):
+            self.man.addManifestRecord(newRecord(T0))
+
+
+class TestManifestPersistence(unittest.TestCase):
+    def test_JournalAndDump(self):
+        md = Metadata(timestamp='float', val1='int')
+        with tempfile.TemporaryDirectory() as tdir:
+            da = DirectoryArchiver(name='manifestJournal', baseDir=tdir, manifestJournal=True)
+            da.createChannel('chan', ChannelType.Data, metadata=md, timestamp=T0)
+            cio = da.channelMap['chan']
+            man = cio.getChannelInfo(ChannelType.Data)['manifest']
+            da._saveDAConfig()
+            self.assertFalse(man.isDirty())
+            self.assertFalse(os.path.exists(man.journalPath))
+            # unchanged manifests are neither rewritten nor reserialized.
+            self.assertFalse(man.dump())
+            before = cio.toDict()
+            cached = cio._dict
+            self.assertEqual(cio.toDict(), before)
+            self.assertIs(cio._dict, cached)
+            # the caller gets a copy, changing it does not change the cached dict.
+            before['channelName'] = 'changed'
+            list(before['typeMap'].values())[0]['manifest']['_manifest'].clear()
+            self.assertEqual(cio.toDict()['channelName'], 'chan')
+            self.assertEqual(len(list(cio.toDict()['typeMap'].values())[0]['manifest']['_manifest']), 1)
+            cio.updateChannel(T0 + 100, ChannelType.Data, newMetadata=md)
+            self.assertTrue(man.isDirty())
+            self.assertEqual(len(list(cio.toDict()['typeMap'].values())[0]['manifest']['_manifest']), 2)
+            self.assertIsNot(cio._dict, cached)
+            # the new record is in the journal until the next save rewrites the manifest.
+            self.assertTrue(os.path.exists(man.journalPath))
+            starts = lambda: [manDTtoEpoch(line['RecordDate'], line['RecordTime']) for line in readManifest(man.manifestPath)]
+            self.assertEqual(starts(), [T0, T0 + 100])
+            da._saveDAConfig()
+            self.assertFalse(os.path.exists(man.journalPath))
+            self.assertEqual(starts(), [T0, T0 + 100])
+            self.assertEqual([f for f in os.listdir(da.getArchivePath()) if f.endswith('.tmp')], [])
+            saved = da.channelMap[da.archiveConfigName].read(ChannelType.DirConfig)[0]['reading']['channelMap']['chan']
+            self.assertEqual(len(list(saved['typeMap'].values())[0]['manifest']['_manifest']), 2)
+            da.end()
+
+    def test_ConcurrentSaves(self):
+        """ Of two saves racing to write, the newer record is the one left on disk. """
+        with tempfile.TemporaryDirectory() as tdir:
+            da = DirectoryArchiver(name='concurrentSaves', baseDir=tdir)
+            configCio = da.channelMap[da.archiveConfigName]
+            saves, saveCount = [], da._saveCount
+            with da.saveLock:
+                # both saves take their record, then wait for the saveLock. Either may get it first.
+                for i in range(0, 2):
+                    da.archiveInfo['save'] = i
+                    saves.append(threading.Thread(target=da._saveDAConfig))
+                    saves[-1].start()
+                    start = time.time()
+                    while da._saveCount < saveCount + len(saves) and time.time() - start < 2:
+                        time.sleep(.001)
+            for save in saves:
+                save.join(2)
+            self.assertEqual(da._savedCount, da._saveCount)
+            saved = configCio.read(ChannelType.DirConfig)[0]['reading']['archiveInfo']
+            self.assertEqual(saved['save'], 1)
+            da.end()
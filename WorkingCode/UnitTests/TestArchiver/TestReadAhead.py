@@ -0,0 +1,64 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver
+from Framework.Archive.ReadAhead import readAhead
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Framework.BaseClasses.Package import Package
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_ReadAheadOrderAndDepth(self):
+        produced = []
+        def items():
+            for i in range(0, 20):
+                produced.append(i)
+                yield i
+        it = readAhead(items(), depth=3)
+        self.assertEqual(next(it), 0)
+        time.sleep(.1)
+        # one item handed out, three waiting in the queue and one blocked on putting.
+        self.assertLessEqual(len(produced), 5)
+        self.assertEqual(list(it), list(range(1, 20)))
+
+    def test_ReadAheadErrorsAndClose(self):
+        def failing():
+            yield 1
+            raise ValueError('bad chunk')
+        it = readAhead(failing(), depth=2)
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(ValueError):
+            next(it)
+        closed = threading.Event()
+        def endless():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+        it = readAhead(endless(), depth=2)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertTrue(closed.wait(5))
+
+    def test_ArchiverIterRead(self):
+        md = Metadata(timestamp='float', val1='int')
+        t0 = float(int(time.time()))
+        with tempfile.TemporaryDirectory() as tdir:
+            da = DirectoryArchiver(name='iterRead', baseDir=tdir)
+            da.createChannel('chan', ChannelType.Data, metadata=md, timestamp=t0)
+            for i in range(0, 500):
+                da.handlePackage(Package(source='chan', timestamp=t0 + i, payload={'timestamp': t0 + i, 'val1': i},
+                                         metadata=md, channelType=ChannelType.Data))
+            chunks = list(da.iterRead('chan', minTS=t0 + 50, maxTS=t0 + 449, chunkSize=64))
+            self.assertEqual([len(chunk) for chunk in chunks], [64] * 6 + [16])
+            self.assertEqual([row['val1'] for chunk in chunks for row in chunk], list(range(50, 450)))
+            dfs = list(da.iterRead('chan', chunkSize=200, asDF=True, prefetch=0))
+            self.assertEqual([len(df) for df in dfs], [200, 200, 100])
+            self.assertEqual(list(da.iterRead('noChannel')), [])
+            da.end()
@@ -0,0 +1,89 @@
+import logging
+import tempfile
+import threading
+import time
+import unittest
+
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver, LogWriteFilter
+from Framework.Archive.WriteBehind import WriteBehindPool
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Metadata import Metadata
+from Framework.BaseClasses.Package import Package
+
+
+class TestWriteBehind(unittest.TestCase):
+    def test_PoolOrderAndBatching(self):
+        written = {}
+        def writeBatch(channelName, packages):
+            written.setdefault(channelName, []).append(list(packages))
+        pool = WriteBehindPool('test', writeBatch, nWriters=2)
+        for i in range(0, 500):
+            for channel in ['a', 'b', 'c']:
+                pool.put(channel, i)
+        self.assertTrue(pool.drain(timeout=5))
+        for channel in ['a', 'b', 'c']:
+            batches = written[channel]
+            self.assertEqual([i for batch in batches for i in batch], list(range(0, 500)))
+        stats = pool.getStats()
+        self.assertEqual(stats['written'], 1500)
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['channels']['a']['enqueued'], 500)
+        pool.stop()
+
+    def test_PoolDropAndPause(self):
+        release = threading.Event()
+        written = []
+        def writeBatch(channelName, packages):
+            release.wait(5)
+            written.extend(packages)
+        pool = WriteBehindPool('test', writeBatch, nWriters=1, maxQueueDepth=3)
+        pool.put('a', 0)
+        time.sleep(.1) # let the writer take the first package and block in writeBatch.
+        results = [pool.put('a', i) for i in range(1, 6)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(pool.getStats()['dropped'], 2)
+        self.assertFalse(pool.drain('a', timeout=.1))
+        release.set()
+        pool.pause()
+        self.assertEqual(written, [0]) # the batch in progress finished, but no new batch was taken.
+        pool.resume()
+        self.assertTrue(pool.drain('a', timeout=5))
+        self.assertEqual(written, [0, 1, 2, 3])
+        pool.stop()
+
+    def test_ArchiverWriteBehind(self):
+        md = Metadata(timestamp='float', val1='int')
+        t0 = float(int(time.time())) # manifest records are kept to the microsecond.
+        with tempfile.TemporaryDirectory() as tdir:
+            da = DirectoryArchiver(name='writeBehind', baseDir=tdir)
+            da.createChannel('chan', ChannelType.Data, metadata=md, timestamp=t0)
+            for i in range(0, 300):
+                da.handlePackage(Package(source='chan', timestamp=t0 + i, payload={'timestamp': t0 + i, 'val1': i},
+                                         metadata=md, channelType=ChannelType.Data))
+            # reads wait for the queued rows of the channel to be written.
+            reading = da.read('chan')[0]
+            self.assertEqual([row['val1'] for row in reading], list(range(0, 300)))
+            stats = da.getWriteStats()
+            self.assertEqual(stats['channels']['chan']['written'], 300)
+            self.assertEqual(stats['dropped'], 0)
+            da.end()
+
+    def test_LogWriteFilterPerThread(self):
+        """ A thread writing a log only silences its own records, not those of the other writer threads. """
+        logFilter = LogWriteFilter()
+        record = logging.makeLogRecord({'msg': 'test'})
+        inside, other = [], []
+        def otherThread():
+            other.append(logFilter.filter(record))
+        with logFilter.writingLog():
+            with logFilter.writingLog(): # nested, as _prepareChannel is within handlePackage.
+                inside.append(logFilter.filter(record))
+            inside.append(logFilter.filter(record))
+            thread = threading.Thread(target=otherThread)
+            thread.start()
+            thread.join()
+        with logFilter.writingLog(False):
+            inside.append(logFilter.filter(record))
+        self.assertEqual(inside, [False, False, True])
+        self.assertEqual(other, [True])
+        self.assertTrue(logFilter.filter(record))
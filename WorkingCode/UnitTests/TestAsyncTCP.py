@@ -0,0 +1,155 @@
+import socket
+import statistics
+import threading
+import time
+import unittest
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import Package
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy.NetworkInterface import ASYNCIO, NetworkInterface
+from Framework.Proxy.TCP.AsyncTCP import AsyncTCPListener, NetworkLoop, getAsyncNetworkConnection
+from Framework.Proxy.TCP.StreamFramer import LENGTH
+from Framework.Proxy.TCP.TCPConnection import TCPConnection
+
+LOCALHOST = ('127.0.0.1', 0)
+
+
+def echo(connection, packet):
+    connection.send(packet)
+
+
+class TestAsyncTCP(unittest.TestCase):
+    def setUp(self):
+        self.threadsBefore = threading.active_count()
+        self.networkLoop = NetworkLoop('TestNetworkLoop')
+        self.listener = AsyncTCPListener('server', 'server_listener', LOCALHOST, framing=LENGTH,
+                                         networkLoop=self.networkLoop, handler=echo)
+        self.assertTrue(self.listener.start())
+
+    def tearDown(self):
+        self.listener.end()
+        self.networkLoop.stop()
+
+    def join(self, n, **kwargs):
+        peers = [getAsyncNetworkConnection(f'peer{i}', None, self.listener.listenAddress, framing=LENGTH,
+                                           networkLoop=self.networkLoop, **kwargs) for i in range(0, n)]
+        self.assertNotIn(None, peers)
+        accepted = [self.listener.accept(timeout=2) for peer in peers]
+        return peers, accepted
+
+    def test_ManyPeers(self):
+        nPeers, nPackets = 60, 20
+        peers, accepted = self.join(nPeers, batchDelay=0)
+        self.assertEqual(len({connection.conName for connection in accepted}), nPeers)
+        # one loop thread runs the listener and both ends of every connection.
+        self.assertEqual(threading.active_count(), self.threadsBefore + 1)
+        rtts = []
+        for i in range(0, nPackets):
+            for n, peer in enumerate(peers):
+                packet = ps.makePacket(i, f'{n}-{i}'.encode())
+                start = time.perf_counter()
+                self.assertTrue(peer.send(packet))
+                self.assertEqual(peer.getRecvQueue().get(timeout=2), packet)
+                rtts.append(time.perf_counter() - start)
+        self.assertLess(statistics.median(rtts), .05)
+        start = time.perf_counter()
+        for connection in peers + accepted:
+            connection.end()
+        while any(connection.getStatus() for connection in peers + accepted):
+            time.sleep(.001)
+        self.assertLess(time.perf_counter() - start, .5)
+        self.assertFalse(peers[0].send(ps.makePacket(1, b'closed')))
+
+    def test_Batching(self):
+        (peer,), (accepted,) = self.join(1, batchDelay=.01)
+        packets = [ps.makePacket(i, bytes(100)) for i in range(0, 200)] + [ps.makePacket(200, b'x' * 20000)]
+        for packet in packets[:-1]:
+            self.assertTrue(peer.send(packet))
+        self.assertTrue(peer.send(packets[-1], wait=True))
+        received = [peer.getRecvQueue().get(timeout=2) for packet in packets]
+        self.assertEqual(received, packets)
+        stats = peer.getStats()
+        self.assertEqual((stats['packets'], stats['frames'], stats['failed'], stats['queued']), (201, 203, 0, 0))
+        self.assertLess(stats['syscalls'], 5)
+        peer.end()
+        accepted.end()
+
+    def test_PausedSend(self):
+        """A handler's send, with wait, is not reported written while the transport has paused writing."""
+        (peer,), (accepted,) = self.join(1, batchDelay=0)
+        packet = ps.makePacket(1, b'paused')
+
+        async def sendPaused():
+            peer.pause_writing()
+            return peer.send(packet, wait=True), peer.getStats()
+
+        sent, stats = self.networkLoop.run(sendPaused(), timeout=2)
+        self.assertFalse(sent)
+        self.assertEqual((stats['packets'], stats['queued']), (0, 1))
+
+        async def resume():
+            peer.resume_writing()
+            return peer.getStats()
+
+        stats = self.networkLoop.run(resume(), timeout=2)
+        self.assertEqual((stats['packets'], stats['queued']), (1, 0))
+        self.assertEqual(peer.getRecvQueue().get(timeout=2), packet)
+        peer.end()
+        accepted.end()
+
+    def test_ThreadedPeer(self):
+        """An AsyncTCPConnection talks to a TCPConnection over the same framing."""
+        sock = socket.create_connection(self.listener.listenAddress)
+        peer = TCPConnection('threaded', 'server', sock, framing=LENGTH)
+        peer.start()
+        accepted = self.listener.accept(timeout=2)
+        packet = ps.makePacket(1, b'y' * 30000)
+        self.assertTrue(peer.send(packet))
+        self.assertEqual(peer.getRecvQueue().get(timeout=2), packet)
+        peer.end()
+        peer.sendThread.join(2)
+        peer.recvThread.join(2)
+        accepted.end()
+
+
+class TestNetworkInterfaceAsyncio(unittest.TestCase):
+    def test_SendPackage(self):
+        networkLoop = NetworkLoop('TestInterfaceLoop')
+        server = NetworkInterface('server', 'serverProxy', tcpListenAddress=LOCALHOST, transport=ASYNCIO,
+                                  networkLoop=networkLoop)
+        server.sources['LJ-1'] = {'sourceID': 3, 'connection': None}
+        server.start()
+        client = NetworkInterface('client', 'clientProxy', tcpJoinAddress=server.tcpListener.listenAddress,
+                                  transport=ASYNCIO, networkLoop=networkLoop)
+        self.assertIsNotNone(client.networkConnection)
+        # a new connection is sent the source map.
+        sourceMap = None
+        while sourceMap is None:
+            sourceMap = client.decodePacket(client.networkConnection.getRecvQueue().get(timeout=2), client.networkConnection)
+        self.assertEqual((sourceMap.source, sourceMap.channelType, sourceMap.payload),
+                         ('serverProxy', ChannelType.ProxyCommand, {'LJ-1': 3}))
+        start = time.perf_counter()
+        while not server.connections and time.perf_counter() - start < 2:
+            time.sleep(.01)
+        conName, = server.connections
+        client.sources['FM-1'] = {'sourceID': 1, 'connection': client.networkConnection.conName}
+        server.sources['FM-1'] = {'sourceID': 1, 'connection': conName}
+        package = Package(source='FM-1', timestamp=5.0, payload={'flow': 1.5})
+        self.assertTrue(client.sendPackageTo(package, 'FM-1'))
+        connection = server.getConnectionFromName('FM-1')
+        decoded = None
+        while decoded is None:
+            decoded = server.decodePacket(connection.getRecvQueue().get(timeout=2), connection)
+        self.assertEqual((decoded.source, decoded.timestamp, decoded.payload), ('FM-1', 5.0, {'flow': 1.5}))
+        start = time.perf_counter()
+        client.end()
+        server.end()
+        server.connectionThread.join(2)
+        self.assertLess(time.perf_counter() - start, .5)
+        self.assertFalse(server.connectionThread.is_alive())
+        networkLoop.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
+import asyncio
 import tempfile
 import threading
+import time
 import unittest
 
 from Framework.Archive.DirectoryArchiver import DirectoryArchiver
 from Framework.BaseClasses.Channels import ChannelType
 from Framework.BaseClasses.Commands import CommandClass, CommandMethod
+from Framework.Manager import CommandManager as cmModule
 from Framework.Manager.CommandManager import CommandManager
 from UnitTests import TestAll as TA
 from Utils import ClassUtils as cu
@@ -130,6 +133,97 @@ class TestCommandManager(unittest.TestCase):
                     self.assertEqual(cr['responsePackage'] in list(cm.transactions.get(cID, {}).values()), False)
 
 
+def respondLater(cm, commandPackage, delay, ret=True):
+    """Answer commandPackage from another thread after delay seconds, as a command class would."""
+    response = cm.createResponsePackage('responder', commandPackage.payload.source, ret, commandPackage.payload.commandID)
+    timer = threading.Timer(delay, cm.handlePackage, args=[response])
+    timer.start()
+    return timer
+
+
+class TestCommandResponses(unittest.TestCase):
+    def test_WaitWithoutSpinning(self):
+        cm = CommandManager(None, name='waitCM')
+        package = cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand')
+        respondLater(cm, package, .2)
+        cpu, wall = time.process_time(), time.perf_counter()
+        response = cm.getResponse(package, timeout=5)
+        wall = time.perf_counter() - wall
+        self.assertEqual(response.payload['ret'], True)
+        self.assertGreaterEqual(wall, .15)
+        self.assertLess(wall, 1)
+        self.assertLess(time.process_time() - cpu, wall / 2) # the caller slept while it waited.
+        commandID = package.payload.commandID
+        self.assertEqual(cm.cachedTransactions[commandID]['status'], cmModule.cmd.CommandStatus.Completed)
+        self.assertEqual(cm.responseFutures, {})
+        # a late getResponse is answered from the cache.
+        self.assertIs(cm.getResponse(package, timeout=0), response)
+
+    def test_Timeout(self):
+        cm = CommandManager(None, name='timeoutCM')
+        package = cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand')
+        start = time.perf_counter()
+        self.assertEqual(cm.getResponse(package, timeout=.1), False) # never answered.
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(asyncio.run(cm.getResponseAsync(package, timeout=.1)), False)
+        # the wait is still there for a response that arrives after the timeout.
+        respondLater(cm, package, 0).join()
+        self.assertEqual(cm.getResponse(package, timeout=0).payload['ret'], True)
+
+    def test_Async(self):
+        cm = CommandManager(None, name='asyncCM')
+        packages = [cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand') for i in range(0, 20)]
+        async def awaitAll():
+            for i, package in enumerate(packages):
+                respondLater(cm, package, .2, ret=i)
+            return await asyncio.gather(*[cm.getResponseAsync(package, timeout=5) for package in packages])
+        start = time.perf_counter()
+        responses = asyncio.run(awaitAll())
+        self.assertLess(time.perf_counter() - start, 1) # awaited together, not one after the other.
+        self.assertEqual([response.payload['ret'] for response in responses], list(range(0, 20)))
+
+    def test_Expiry(self):
+        cm = CommandManager(None, name='expiryCM')
+        for i in range(0, 3):
+            package = cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand')
+            respondLater(cm, package, 0).join()
+        pending = cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand')
+        cm.transactions[pending.payload.commandID] = {'commandPackage': pending, 'issued': time.monotonic()}
+        future = cm._responseFuture(pending.payload.commandID)
+        self.assertEqual(len(cm.cachedTransactions), 3)
+        ttl = cmModule.TRANSACTION_TTL
+        try:
+            cmModule.TRANSACTION_TTL = -1
+            cm._expireTransactions(force=True)
+        finally:
+            cmModule.TRANSACTION_TTL = ttl
+        self.assertEqual((cm.transactions, dict(cm.cachedTransactions), cm.responseFutures), ({}, {}, {}))
+        self.assertTrue(future.cancelled())
+        self.assertEqual(cm.getResponse(pending, timeout=.05), False)
+
+    def test_AsyncExpiry(self):
+        """A wait that expires while it is awaited returns False, and does not end the other waits gathered with it."""
+        cm = CommandManager(None, name='asyncExpiryCM')
+        expiring, answered = [cm.createCommandPackage('tester', 'test', 'responder', 'receiveTestCommand')
+                              for i in range(0, 2)]
+        async def expireOne():
+            await asyncio.sleep(.05)
+            future, created = cm.responseFutures[expiring.payload.commandID]
+            cm.responseFutures[expiring.payload.commandID] = (future, created - cmModule.TRANSACTION_TTL - 1)
+            cm._expireTransactions(force=True)
+            self.assertTrue(future.cancelled())
+            respondLater(cm, answered, 0)
+        async def awaitBoth():
+            waits = asyncio.gather(cm.getResponseAsync(expiring, timeout=5), cm.getResponseAsync(answered, timeout=5))
+            await expireOne()
+            return await waits
+        start = time.perf_counter()
+        expired, response = asyncio.run(awaitBoth())
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(expired, False)
+        self.assertEqual(response.payload['ret'], True)
+
+
 def commandIDThread(cm,ret):
     ret.append(cm.getCommandID())
     return ret
@@ -0,0 +1,60 @@
+import logging
+import unittest
+
+from Applications.METECControl.Readers.CorrectionFactor import CorrectionFactor
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import BlockPayload, Package
+
+DEVICE_INFO = {
+    'PT-1': {'item_type': 'Pressure Transducer', 'slope': '2', 'offset': '1'},
+    'TC-1': {'item_type': 'Thermocouple'}
+}
+
+
+class FakeMDGiver():
+    def getReaderMetadata(self):
+        return {'timestamp': 'float', 'PT-1': 'float', 'TC-1': 'float'}
+
+
+class Collector():
+    def __init__(self):
+        self.packages = []
+
+    def accept(self, package):
+        self.packages.append(package)
+
+
+def newCorrectionFactor():
+    """A CorrectionFactor without its managers or summary files, knowing the devices of reader LJ-1."""
+    cf = CorrectionFactor.__new__(CorrectionFactor)
+    cf.logger = logging.getLogger('TestCorrectionFactor')
+    cf.correctionTag = '_corr'
+    cf.mdMap = {'LJ-1': DEVICE_INFO}
+    cf.mdGivers = {'LJ-1': FakeMDGiver()}
+    cf.correctSources = {'LJ-1': True}
+    cf.dataManager = Collector()
+    return cf
+
+
+class TestCorrectionFactor(unittest.TestCase):
+    def test_Row(self):
+        cf = newCorrectionFactor()
+        cf.handlePackage(Package('LJ-1', timestamp=5.0, payload={'timestamp': 5.0, 'PT-1': 1.5, 'TC-1': 20.0},
+                                 channelType=ChannelType.Data))
+        package, = cf.dataManager.packages
+        self.assertEqual(package.source, 'LJ-1_corr')
+        self.assertEqual(package.payload, {'timestamp': 5.0, 'PT-1': 4.0, 'TC-1': 20.0})
+
+    def test_Block(self):
+        cf = newCorrectionFactor()
+        block = BlockPayload('LJ-1', {'timestamp': [5.0, 5.1, 5.2], 'PT-1': [1.5, 2.0, 2.5], 'TC-1': [20.0, 21.0, 22.0]})
+        cf.handlePackage(Package('LJ-1', timestamp=5.0, payload=block, channelType=ChannelType.Data))
+        package, = cf.dataManager.packages
+        self.assertIsInstance(package.payload, BlockPayload)
+        self.assertEqual((package.source, package.payload.source, package.timestamp), ('LJ-1_corr', 'LJ-1_corr', 5.0))
+        self.assertEqual(package.payload.toDict(), {'timestamp': [5.0, 5.1, 5.2], 'PT-1': [4.0, 5.0, 6.0],
+                                                    'TC-1': [20.0, 21.0, 22.0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+import unittest
+
+from Framework.BaseClasses.BoundedQueue import BoundedQueue, BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Destination import ThreadedDestination
+from Framework.BaseClasses.Package import BlockPayload, Package
+from Framework.BaseClasses.Sentinel import Sentinel
+
+
+class Collector(ThreadedDestination):
+    def __init__(self, name, release=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.release = release
+        self.handled = []
+        self.batches = []
+
+    def handlePackages(self, packages):
+        self.batches.append(len(packages))
+        super().handlePackages(packages)
+
+    def handlePackage(self, package):
+        if self.release:
+            self.release.wait(5)
+        if package.payload == 'bad':
+            raise ValueError('bad package')
+        self.handled.append(package.payload)
+
+
+class TestDestination(unittest.TestCase):
+    def test_BatchesAndSentinel(self):
+        release = threading.Event()
+        dest = Collector('batchCollector', release=release, maxBatch=100)
+        dest.start()
+        dest.accept(Package(source='test', payload=-1))
+        time.sleep(.1) # the first package is taken on its own and blocks the thread until released.
+        for i in range(0, 1000):
+            dest.accept(Package(source='test', payload='bad' if i == 500 else i))
+        dest.end()
+        release.set()
+        dest.join(5)
+        self.assertFalse(dest.is_alive())
+        # everything queued before end() is handled, in order, and a failing package does not stop the rest.
+        self.assertEqual(dest.handled, [-1] + [i for i in range(0, 1000) if not i == 500])
+        self.assertEqual(dest.batches[0], 1)
+        self.assertEqual(max(dest.batches), 100)
+        self.assertLessEqual(len(dest.batches), 12)
+        # after end(), packages are handled by the caller.
+        dest.accept(Package(source='test', payload='late'))
+        self.assertEqual(dest.handled[-1], 'late')
+
+    def test_WakeOnPut(self):
+        dest = Collector('wakeCollector')
+        dest.start()
+        time.sleep(.1)
+        start = time.perf_counter()
+        dest.accept(Package(source='test', payload=0))
+        while not dest.handled and time.perf_counter() - start < 1:
+            time.sleep(.0001)
+        self.assertEqual(dest.handled, [0])
+        self.assertLess(time.perf_counter() - start, .1)
+        dest.end()
+        dest.join(5)
+        self.assertFalse(dest.is_alive())
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    return items
+
+
+class TestBoundedQueue(unittest.TestCase):
+    def test_DropPolicies(self):
+        reports = []
+        oldest = BoundedQueue(3, DROP_OLDEST, name='oldest', reporter=reports.append)
+        newest = BoundedQueue(3, DROP_NEWEST, name='newest')
+        for i in range(0, 5):
+            oldest.put(i)
+            self.assertEqual(newest.put(i), i < 3)
+        oldest.put(Sentinel()) # always gets in.
+        items = drain(oldest)
+        self.assertEqual(items[:3], [2, 3, 4])
+        self.assertIsInstance(items[3], Sentinel)
+        self.assertEqual(drain(newest), [0, 1, 2])
+        stats = oldest.getStats()
+        self.assertEqual((stats['dropped'], stats['highWater'], stats['enqueued']), (2, 4, 6))
+        self.assertEqual(newest.getStats()['dropped'], 2)
+        # reported on reaching half and all of capacity, and on the first drop.
+        self.assertEqual([r['highWater'] for r in reports], [2, 3, 3])
+        self.assertEqual(reports[-1]['newDrops'], 1)
+
+    def test_Block(self):
+        q = BoundedQueue(2, BLOCK)
+        q.put(0)
+        q.put(1)
+        self.assertRaises(queue.Full, q.put_nowait, 2)
+        self.assertRaises(queue.Full, q.put, 2, timeout=.05)
+        threading.Timer(.1, q.get).start()
+        q.put(2, timeout=5) # waits until the timer makes room.
+        self.assertEqual(drain(q), [1, 2])
+
+    def test_Coalesce(self):
+        q = BoundedQueue(3, COALESCE)
+        data = lambda source, i: Package(source=source, payload={'i': i}, channelType=ChannelType.Data)
+        event = Package(source='a', payload={'i': 'event'}, channelType=ChannelType.Event)
+        q.put(data('a', 0))
+        q.put(data('b', 0))
+        q.put(data('a', 1)) # replaces a's waiting reading, in its place.
+        q.put(event) # other channel types are never coalesced.
+        self.assertEqual([(p.source, p.payload['i']) for p in drain(q)], [('a', 1), ('b', 0), ('a', 'event')])
+        for source in ['a', 'b', 'c', 'd']:
+            q.put(data(source, 2))
+        self.assertEqual([p.source for p in drain(q)], ['b', 'c', 'd'])
+        stats = q.getStats()
+        self.assertEqual((stats['coalesced'], stats['dropped']), (1, 1))
+
+    def test_CoalesceBlocks(self):
+        """ A block holds rows that later readings do not replace, so blocks are queued as usual. """
+        q = BoundedQueue(5, COALESCE)
+        block = lambda i: Package(source='a', channelType=ChannelType.Data,
+                                  payload=BlockPayload('a', {'timestamp': [i, i + .5], 'i': [i, i]}))
+        q.put(block(0))
+        q.put(Package(source='a', payload={'i': 1}, channelType=ChannelType.Data))
+        q.put(block(2))
+        q.put(Package(source='a', payload={'i': 3}, channelType=ChannelType.Data)) # replaces only the single reading.
+        self.assertEqual([list(p.payload['i']) if type(p.payload) is BlockPayload else p.payload['i'] for p in drain(q)],
+                         [[0, 0], 3, [2, 2]])
+        self.assertEqual(q.getStats()['coalesced'], 1)
+
+    def test_DestinationQueue(self):
+        release = threading.Event()
+        dest = Collector('boundedCollector', release=release, queueSize=10, overflowPolicy=DROP_OLDEST)
+        dest.start()
+        dest.accept(Package(source='test', payload=0))
+        time.sleep(.1) # the first package is taken on its own and blocks the thread until released.
+        for i in range(1, 100):
+            dest.accept(Package(source='test', payload=i))
+        release.set()
+        dest.end()
+        dest.join(5)
+        # the first package was taken before the queue filled; of the rest only the last 10 were kept.
+        self.assertEqual(dest.handled, [0] + list(range(90, 100)))
+        self.assertEqual(dest.getQueueStats()['dropped'], 89)
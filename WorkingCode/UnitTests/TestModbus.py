@@ -0,0 +1,86 @@
+import socket
+import struct
+import time
+import unittest
+
+from Applications.METECControl.Readers.Modbus import Modbus, takeFrames
+from Applications.METECControl.Readers.ModbusFormat import BlockDecoder
+from UnitTests.TestPollingEngine import FakeDevice, BLOCKS, NUM_REG, makeModbus, makeRequests
+
+
+def blockValues(modbus, response):
+    return list(modbus.extractData('>' + 'H' * NUM_REG, response))
+
+
+class TestModbus(unittest.TestCase):
+    def test_Pipelined(self):
+        for connType in [socket.SOCK_DGRAM, socket.SOCK_STREAM]:
+            device = FakeDevice(connType)
+            modbus = makeModbus(device, f'pipelined{connType}')
+            pairs = list(makeRequests(modbus).values())
+            modbus.sendRecv(*pairs[0]) # the TCP connection is set up.
+            answered = modbus.transact(pairs)
+            self.assertEqual(answered, [True] * len(BLOCKS))
+            for addr, (command, response) in zip(BLOCKS, pairs):
+                self.assertEqual(blockValues(modbus, response), [addr + i for i in range(0, NUM_REG)])
+                self.assertEqual(modbus.getTID(response), modbus.getTID(command))
+            modbus.disconnect()
+            device.stop()
+
+    def test_StaleAfterTimeout(self):
+        for connType in [socket.SOCK_DGRAM, socket.SOCK_STREAM]:
+            device = FakeDevice(connType, delay=.15)
+            modbus = makeModbus(device, f'stale{connType}')
+            modbus.timeout = .1
+            (first, firstResponse), (second, secondResponse) = list(makeRequests(modbus).values())[:2]
+            self.assertFalse(modbus.sendRecv(first, firstResponse))
+            device.delay = 0
+            # the answer to the first command comes in first, and is dropped rather than taken as the second's.
+            self.assertTrue(modbus.sendRecv(second, secondResponse))
+            self.assertEqual(blockValues(modbus, secondResponse), [BLOCKS[1] + i for i in range(0, NUM_REG)])
+            self.assertEqual(modbus.staleFrames, 1)
+            modbus.disconnect()
+            device.stop()
+
+    def test_SplitFrames(self):
+        device = FakeDevice(socket.SOCK_STREAM, mode='split')
+        modbus = makeModbus(device, 'splitFrames')
+        for i in range(0, 3):
+            pairs = list(makeRequests(modbus).values())
+            self.assertEqual(modbus.transact(pairs), [True] * len(BLOCKS))
+            self.assertEqual([blockValues(modbus, response)[0] for command, response in pairs], BLOCKS)
+        modbus.disconnect()
+        device.stop()
+
+    def test_TakeFrames(self):
+        frame = bytes([0, 1, 0, 0, 0, 5, 1, 3, 2, 0, 7])
+        buffer = bytearray(frame + frame + frame[:4])
+        frames, lostSync = takeFrames(buffer)
+        self.assertEqual((frames, lostSync), ([frame, frame], False))
+        self.assertEqual(buffer, bytearray(frame[:4])) # the partial frame is left for the next recv.
+        buffer += frame[4:]
+        self.assertEqual(takeFrames(buffer, 1)[0], [frame])
+        buffer = bytearray([0, 1, 0, 0, 255, 255, 1, 3])
+        self.assertEqual(takeFrames(buffer), ([], True))
+        self.assertEqual(buffer, bytearray())
+
+    def test_BlockDecoder(self):
+        modbus = Modbus('127.0.0.1', 502, name='decoder')
+        registers = [(10, 'UINT16', 'a'), (11, 'FLOAT32', 'b'), (15, 'INT16', 'c'), (15, 'UINT16', 'sameAsC'),
+                     (16, 'FLOAT32', 'd')]
+        response = modbus.makeReadResponse(8)
+        modbus.setHeader(response, func=4)
+        struct.pack_into('>Hfxxxxhf', response, modbus.RRESP_DATA_OFFSET, 7, 1.5, -2, 2.25)
+        decoder = BlockDecoder.fromRegisters(10, registers)
+        self.assertEqual(len(decoder.segments), 2) # sameAsC overlaps c.
+        expected = {}
+        for addr, dataType, name in registers:
+            fmt = '>' + 'x' * 2 * (addr - 10) + modbus.TYPE_MAP[dataType]
+            expected[name] = modbus.extractData(fmt, response)[0]
+        self.assertEqual(decoder.decode(response), expected)
+        self.assertEqual(expected['sameAsC'], 2**16 - 2)
+        labJack = BlockDecoder.fromFormat('>fxxf', ['AIN0', 'AIN2'])
+        struct.pack_into('>fxxf', response, modbus.RRESP_DATA_OFFSET, .5, .75)
+        self.assertEqual(labJack.decode(response), {'AIN0': .5, 'AIN2': .75})
+        modbus.setFUNC(response, 0x84) # an exception response.
+        self.assertIsNone(decoder.decode(response))
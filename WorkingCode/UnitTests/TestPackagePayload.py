@@ -4,7 +4,7 @@ import unittest
 
 from Framework.BaseClasses.Commands import CommandPayload
 from Framework.BaseClasses.Events import EventPayload
-from Framework.BaseClasses.Package import Package, Payload
+from Framework.BaseClasses.Package import Package, Payload, BlockPayload
 from Utils import ClassUtils as cu
 from Utils import TimeUtils as tu
 
@@ -68,3 +68,26 @@ class TestPayload(unittest.TestCase):
         self.assertEqual(cu.isPayload(ePld), True)
 
 
+    def test_StoredOnce(self):
+        pl = Payload('Third', 1.0, foo=1)
+        pl['foo'] = 2
+        pl.source = 'Fourth'
+        self.assertEqual((pl.foo, pl['source'], pl.missing), (2, 'Fourth', None)) # attributes read through to the map.
+        self.assertEqual(dict(pl), {'source': 'Fourth', 'timestamp': 1.0, 'foo': 2})
+        del pl['foo']
+        self.assertEqual(pl.foo, None)
+        self.assertFalse(hasattr(pl, '__dict__'))
+        self.assertFalse(hasattr(Package(payload=pl), '__dict__'))
+        self.assertEqual(Package(payload=pl).toDict()['payload'], {'source': 'Fourth', 'timestamp': 1.0})
+
+    def test_BlockPayload(self):
+        rows = [{'timestamp': 1.0, 'a': 1}, {'timestamp': 2.0, 'a': 2, 'b': 'x'}, {'timestamp': 3.0, 'a': 3}]
+        block = BlockPayload.fromRows('Fifth', rows)
+        self.assertTrue(cu.isBlock(block) and cu.isPayload(block))
+        self.assertEqual((block.source, block.timestamp, block.nSamples), ('Fifth', 1.0, 3))
+        self.assertEqual(block['a'], [1, 2, 3])
+        self.assertEqual(block['b'], [None, 'x', None]) # a field missing from some samples.
+        self.assertEqual(block.rows()[1], rows[1])
+        self.assertEqual(Package(payload=block).toDict()['payload'], {'timestamp': [1.0, 2.0, 3.0], 'a': [1, 2, 3],
+                                                                      'b': [None, 'x', None]})
+        self.assertFalse(BlockPayload.fromRows('Sixth', []))
@@ -0,0 +1,286 @@
+import gc
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+import unittest
+from threading import RLock
+
+from Applications.METECControl.Readers.Modbus import Modbus
+from Applications.METECControl.Readers.PollingEngine import PollingEngine
+from Framework.BaseClasses.Destination import Destination
+from Framework.BaseClasses.Readers.Reader import Reader
+from Framework.Pipes.ReadPipe import ReadPipe
+from Framework.Pipes.ReadScheduler import ReadScheduler
+
+BLOCKS = [0, 100, 200] # start addresses of the read blocks of each device.
+NUM_REG = 4
+
+
+class FakeDevice(threading.Thread):
+    """ A Modbus device on localhost that answers read commands with register i holding startAddr + i.
+
+    :param delay: seconds before each response.
+    :param mode: 'silent' never answers, 'stale' sends a response with a wrong TID before each real one, 'split' (TCP)
+        sends the responses to each recv as one stream cut in two.
+    """
+    def __init__(self, connType=socket.SOCK_DGRAM, delay=0, mode=None):
+        super().__init__(daemon=True)
+        self.connType = connType
+        self.delay = delay
+        self.mode = mode
+        self.answered = 0
+        self.sock = socket.socket(socket.AF_INET, connType)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.sock.settimeout(.05)
+        if connType == socket.SOCK_STREAM:
+            self.sock.listen(1)
+        self.stopped = False
+        self.start()
+
+    def respond(self, command):
+        response, startAddr, numRegs = Modbus.makeReadResponseFromCommand(command)
+        Modbus.addReadResponseData(response, '>' + 'H' * numRegs, [startAddr + i for i in range(0, numRegs)])
+        return bytes(response)
+
+    def run(self):
+        if self.connType == socket.SOCK_STREAM:
+            while not self.stopped:
+                try:
+                    conn, addr = self.sock.accept()
+                    break
+                except socket.timeout:
+                    continue
+            else:
+                return
+            conn.settimeout(.05)
+        while not self.stopped:
+            try:
+                if self.connType == socket.SOCK_STREAM:
+                    data = conn.recv(4096)
+                    if not data:
+                        return
+                    commands = [data[i:i+12] for i in range(0, len(data), 12)]
+                else:
+                    data, addr = self.sock.recvfrom(4096)
+                    commands = [data]
+            except socket.timeout:
+                continue
+            if self.mode == 'silent':
+                continue
+            responses = []
+            for command in commands:
+                time.sleep(self.delay)
+                if self.mode == 'stale':
+                    stale = bytearray(self.respond(command))
+                    struct.pack_into('>H', stale, 0, (struct.unpack_from('>H', command)[0] + 1000) % 2**16)
+                    responses.append(bytes(stale))
+                responses.append(self.respond(command))
+            self.answered += len(commands)
+            if self.connType == socket.SOCK_STREAM:
+                stream = b''.join(responses)
+                if self.mode == 'split':
+                    conn.sendall(stream[:len(stream) // 2 + 3])
+                    time.sleep(.005)
+                    stream = stream[len(stream) // 2 + 3:]
+                conn.sendall(stream)
+            else:
+                for response in responses:
+                    self.sock.sendto(response, addr)
+
+    def stop(self):
+        self.stopped = True
+        self.join(1)
+        self.sock.close()
+
+
+def serveDevices(specs, conn):
+    """Run FakeDevices of the given {connType, delay, mode} in this (child) process until told to stop."""
+    devices = [FakeDevice(**spec) for spec in specs]
+    conn.send([device.port for device in devices])
+    conn.recv()
+    for device in devices:
+        device.stop()
+
+
+class RemoteDevice():
+    """The address of a FakeDevice run by a DeviceProcess."""
+    def __init__(self, port, connType):
+        self.port = port
+        self.connType = connType
+
+
+class DeviceProcess():
+    """ FakeDevices run in a child process, so that, as real devices, they do not hold the GIL while the engine under
+    test sends. Used where the timing of the engine is tested. """
+    def __init__(self, specs):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=serveDevices, args=(specs, child), daemon=True)
+        self.process.start()
+        self.devices = [RemoteDevice(port, spec.get('connType', socket.SOCK_DGRAM))
+                        for port, spec in zip(self.conn.recv(), specs)]
+
+    def stop(self):
+        self.conn.send(None)
+        self.process.join(5)
+
+
+def makeModbus(device, name):
+    modbus = Modbus('127.0.0.1', device.port, connType=device.connType, name=name)
+    modbus.connect()
+    return modbus
+
+
+def makeRequests(modbus):
+    return {addr: (modbus.makeReadCommand(addr, NUM_REG), modbus.makeReadResponse(NUM_REG)) for addr in BLOCKS}
+
+
+def values(modbus, poll):
+    return {addr: list(modbus.extractData('>' + 'H' * NUM_REG, response)) if response else None
+            for addr, response in poll.responses.items()}
+
+
+class PolledReader(Reader):
+    """A reader of a FakeDevice that is read by a PollingEngine."""
+    def __init__(self, name, device, pollingEngine, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.modbus = makeModbus(device, name)
+        self.pollingEngine = pollingEngine
+        self.lock = RLock()
+        self.requests = makeRequests(self.modbus)
+
+    def getReaderMetadata(self, sourceName=None):
+        return {'timestamp': 'float', **{f'r{addr}': 'int' for addr in BLOCKS}}
+
+    def read(self):
+        raise NotImplementedError
+
+    def pollRequests(self):
+        return self.requests
+
+    def pollResult(self, responses, timestamp=None, error=None):
+        reading = {'timestamp': timestamp}
+        for addr, response in responses.items():
+            if response:
+                reading[f'r{addr}'] = self.modbus.extractData('>H', response)[0]
+        return reading
+
+
+class Collector(Destination):
+    def __init__(self, name):
+        super().__init__(name=name)
+        self.packages = []
+
+    def handlePackage(self, package):
+        self.packages.append(package)
+
+
+class TestPollingEngine(unittest.TestCase):
+    def test_Concurrent(self):
+        devices = [FakeDevice(delay=.01) for i in range(0, 20)]
+        engine = PollingEngine('concurrentEngine', timeout=1)
+        modbuses = [makeModbus(device, f'concurrent{i}') for i, device in enumerate(devices)]
+        start = time.perf_counter()
+        futures = [engine.submit(modbus, makeRequests(modbus)) for modbus in modbuses]
+        polls = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        engine.stop()
+        for device in devices:
+            device.stop()
+        for modbus, poll in zip(modbuses, polls):
+            self.assertEqual(values(modbus, poll), {addr: [addr + i for i in range(0, NUM_REG)] for addr in BLOCKS})
+        # one block after another, the 60 blocks would take .6 s; in parallel, the 3 blocks of one device.
+        self.assertLess(elapsed, .2)
+
+    def test_TimeoutsAndStale(self):
+        good, silent, stale = FakeDevice(), FakeDevice(mode='silent'), FakeDevice(mode='stale')
+        engine = PollingEngine('timeoutEngine', timeout=.05)
+        modbuses = [makeModbus(device, name) for device, name in [(good, 'good'), (silent, 'silent'), (stale, 'stale')]]
+        start = time.perf_counter()
+        polls = [future.result() for future in [engine.submit(modbus, makeRequests(modbus)) for modbus in modbuses]]
+        elapsed = time.perf_counter() - start
+        time.sleep(.01)
+        stats = engine.getStats()
+        engine.stop()
+        for device in [good, silent, stale]:
+            device.stop()
+        self.assertEqual(polls[1].unanswered(), BLOCKS)
+        self.assertEqual(values(modbuses[2], polls[2])[100], [100, 101, 102, 103]) # not the stale response.
+        self.assertEqual(polls[0].unanswered(), [])
+        self.assertLess(elapsed, .1) # the silent device costs one timeout, not one per block.
+        self.assertEqual(stats['silent']['timeouts'], 3)
+        self.assertEqual(stats['stale']['stale'], 3)
+        self.assertEqual(stats['good']['timeouts'], 0)
+
+    def test_TCPFrames(self):
+        device = FakeDevice(socket.SOCK_STREAM, mode='split')
+        engine = PollingEngine('tcpEngine', timeout=.5)
+        modbus = makeModbus(device, 'tcpDevice')
+        for i in range(0, 3):
+            poll = engine.poll(modbus, makeRequests(modbus))
+            self.assertEqual(values(modbus, poll), {addr: [addr + i for i in range(0, NUM_REG)] for addr in BLOCKS})
+        engine.stop()
+        modbus.disconnect()
+        device.stop()
+
+    def test_TickTiming(self):
+        """ Every device's commands go out within a few ms of the tick, the silent ones included. """
+        gc.collect()
+        deviceProcess = DeviceProcess([{'delay': .002, 'mode': 'silent' if i % 10 == 0 else None} for i in range(0, 30)])
+        scheduler = ReadScheduler('pollScheduler')
+        engine = PollingEngine('tickEngine', timeout=.03, scheduler=scheduler)
+        dest = Collector('pollCollector')
+        pipes = []
+        for i, device in enumerate(deviceProcess.devices):
+            reader = PolledReader(f'polled{i}', device, engine)
+            pipes.append(ReadPipe(f'polled{i}Pipe', source=reader, destination=dest, freq=.05))
+        for pipe in pipes:
+            pipe.start()
+        start = time.monotonic()
+        while time.monotonic() - start < 3 and not all(engine.getStats(f'polled{i}') and
+                                                       engine.getStats(f'polled{i}')['polls'] >= 10 for i in range(0, 30)):
+            time.sleep(.05)
+        for pipe in pipes:
+            pipe.end()
+            pipe.join(5)
+        stats = engine.getStats()
+        engine.stop()
+        scheduler.stop()
+        deviceProcess.stop()
+        self.assertEqual(engine.groups, {})
+        for i in range(0, 30):
+            self.assertIn(f'polled{i}', stats)
+            device = stats[f'polled{i}']
+            self.assertGreaterEqual(device['polls'], 10)
+            self.assertLess(device['maxLag'], .02)
+            self.assertLess(device['meanLag'], .005)
+        samples = [p.payload for p in dest.packages if p.source == 'polled1']
+        answered = [sample for sample in samples if 'r100' in sample]
+        self.assertTrue(answered)
+        self.assertTrue(all(sample['r100'] == 100 for sample in answered))
+        # readings are stamped when their commands went out, so they are a whole number of ticks apart give or take
+        # the lag. A tick is only skipped if the last one was still waiting on its timeout.
+        ticks = [sample['timestamp'] for sample in samples]
+        for a, b in zip(ticks, ticks[1:]):
+            self.assertGreaterEqual(round((b - a) / .05), 1)
+            self.assertLess(abs(b - a - round((b - a) / .05) * .05), .02)
+        self.assertTrue(all(p.payload.keys() == {'timestamp'} for p in dest.packages if p.source == 'polled0'))
+
+    def test_IOThreadFailure(self):
+        """ When the I/O thread fails, the polls that are out are finished with an error and later submits raise. """
+        device = FakeDevice(mode='silent')
+        engine = PollingEngine('failingEngine', timeout=5)
+        modbus = makeModbus(device, 'failing')
+        def newTID():
+            raise TypeError('not a TID')
+        modbus.newTID = newTID
+        poll = engine.submit(modbus, makeRequests(modbus)).result(1)
+        self.assertIsInstance(poll.error, RuntimeError)
+        engine._thread.join(1)
+        self.assertFalse(engine._thread.is_alive())
+        self.assertRaises(RuntimeError, engine.submit, modbus, makeRequests(modbus))
+        modbus.disconnect()
+        device.stop()
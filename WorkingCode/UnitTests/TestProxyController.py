@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from Framework.BaseClasses.Package import Package
+from Framework.Proxy.NetworkInterface import ASYNCIO, NetworkInterface
+from Framework.Proxy.ProxyControllerRefactored import ProxyController
+from Framework.Proxy.TCP.AsyncTCP import NetworkLoop
+
+LOCALHOST = ('127.0.0.1', 0)
+
+
+class TestProxyController(unittest.TestCase):
+    def setUp(self):
+        self.networkLoop = NetworkLoop('TestProxyControllerLoop')
+        self.proxy = ProxyController(name=f'TestProxyController_{self._testMethodName}', interfaces=[
+            {'module': 'Framework.Proxy.NetworkInterface', 'class': 'NetworkInterface', 'name': 'tcp',
+             'tcpListenAddress': LOCALHOST, 'transport': ASYNCIO, 'networkLoop': self.networkLoop}])
+        self.proxy.start()
+        self.interface = self.proxy.interfaces['tcp']
+        self.client = NetworkInterface('client', 'clientProxy', tcpJoinAddress=self.interface.tcpListener.listenAddress,
+                                       transport=ASYNCIO, networkLoop=self.networkLoop)
+        self.assertIsNotNone(self.client.networkConnection)
+        start = time.perf_counter()
+        while not self.interface.connections and time.perf_counter() - start < 2:
+            time.sleep(.01)
+        conName, = self.interface.connections
+        self.interface.sources['FM-1'] = {'sourceID': 1, 'connection': conName}
+        self.client.sources['FM-1'] = {'sourceID': 1, 'connection': self.client.networkConnection.conName}
+
+    def tearDown(self):
+        self.proxy.end()
+        self.client.end()
+        self.proxy.join(2)
+        self.interface.connectionThread.join(2)
+        self.networkLoop.stop()
+
+    def receive(self):
+        """ :returns: the next package the client receives, skipping metadata and source map packets. """
+        connection = self.client.networkConnection
+        while True:
+            packet = connection.getRecvQueue().get(timeout=2)
+            package = self.client.decodePacket(packet, connection)
+            if package is not None and package.source == 'FM-1':
+                return package
+
+    def test_SendPackage(self):
+        for i in range(0, 3):
+            package = Package(source='FM-1', timestamp=5.0 + i, payload={'flow': 1.5 * i, 'units': 'SLPM'})
+            self.assertTrue(self.proxy.sendPackageToSource(package, 'FM-1', 'FM-1'))
+            decoded = self.receive()
+            self.assertEqual((decoded.source, decoded.timestamp, decoded.payload), ('FM-1', 5.0 + i, package.payload))
+
+    def test_Unsendable(self):
+        tooLarge = Package(source='FM-1', payload={'text': 'x' * 70000})
+        self.assertFalse(self.proxy.sendPackageToSource(tooLarge, 'FM-1', 'FM-1'))
+        self.assertFalse(self.proxy.sendPackageToSource(Package(source='FM-1', payload={'a': 1.0}), 'FM-1', 'nowhere'))
+        package = Package(source='FM-1', timestamp=1.0, payload={'text': 'x'})
+        self.assertTrue(self.proxy.sendPackageToSource(package, 'FM-1', 'FM-1'))
+        self.assertEqual(self.receive().payload, package.payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import random
+import unittest
+
+import numpy as np
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Package import BlockPayload, Package, Payload
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy import SimplifiedProxyHeader as ph
+
+
+def packetType(packet):
+    return ps.RECORD_PREFIX.unpack_from(packet, ph.HEADER_SIZE)[0]
+
+
+class TestBinaryCodec(unittest.TestCase):
+    def roundTrip(self, sender, receiver, package, sourceID=1):
+        packets = sender.encode(package, sourceID)
+        decoded = [receiver.decode(packet) for packet in packets]
+        self.assertTrue(all(d is None for d in decoded[:-1]))
+        return packets, decoded[-1]
+
+    def test_DataRecords(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        types = []
+        for i in range(0, 5):
+            package = Package(source='FM-1', timestamp=1000.0 + i,
+                              payload={'flow': i * .5, 'count': -i * 2**40, 'open': i % 2 == 0, 'units': 'SLPM'},
+                              channelType=ChannelType.Data)
+            packets, decoded = self.roundTrip(sender, receiver, package)
+            types.append([packetType(packet) for packet in packets])
+            self.assertEqual((decoded.source, decoded.timestamp, decoded.channelType, decoded.payload),
+                             ('FM-1', package.timestamp, ChannelType.Data, package.payload))
+            self.assertEqual(type(decoded.payload['count']), int)
+        # metadata is sent once, with the first package only.
+        self.assertEqual(types, [[ps.METADATA_PACKET, ps.DATA_PACKET]] + 4 * [[ps.DATA_PACKET]])
+        self.assertLess(len(packets[0]), len(ps.serialize(package.toDict())) / 3)
+
+    def test_MetadataChanges(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        payloads = [{'a': 1.0, 'b': 'x'}, {'a': 1.0, 'b': 'xy'}, {'a': 1, 'b': 'xy'}, {'b': 'xy', 'a': 1}, {'b': 'xy', 'a': 2}]
+        types = []
+        for payload in payloads:
+            packets, decoded = self.roundTrip(sender, receiver, Package(source='s', payload=payload))
+            self.assertEqual(decoded.payload, payload)
+            self.assertEqual(list(decoded.payload), list(payload))
+            types.append(len(packets))
+        self.assertEqual(types, [2, 2, 2, 2, 1])
+        # sources are kept apart by sourceID.
+        packets, decoded = self.roundTrip(sender, receiver, Package(source='other', payload={'c': 3.0}), sourceID=2)
+        self.assertEqual(decoded.source, 'other')
+        packets, decoded = self.roundTrip(sender, receiver, Package(source='s', payload={'b': 'xy', 'a': 3}))
+        self.assertEqual((len(packets), decoded.source), (1, 's'))
+
+    def test_JSONFallback(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        for payload in [{'values': [1, 2, 3]}, {'missing': None}, {'big': 2**70}, {1: 1.0}, 'a string',
+                        Payload('src', timestamp=5.0, state=ChannelType.Event)]:
+            packets, decoded = self.roundTrip(sender, receiver, Package(source='s', payload=payload, channelType=ChannelType.Event))
+            self.assertEqual([packetType(packet) for packet in packets], [ps.JSON_PACKET])
+            self.assertEqual(decoded.channelType, ChannelType.Event)
+        self.assertEqual(decoded.payload, {'source': 'src', 'timestamp': 5.0, 'state': ChannelType.Event})
+
+    def test_Block(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        columns = {'timestamp': [1.0, 2.0, 3.0], 'flow': [.5, 1.5, 2.5], 'count': [1, 3, 2**40],
+                   'open': [True, False, True], 'mixed': [1, 2.0, None], 'units': ['SLPM', 'SLPM', 'SCCM']}
+        package = Package(source='FM-1_corr', timestamp=1.0, payload=BlockPayload('FM-1_corr', columns),
+                          channelType=ChannelType.Data)
+        packets, decoded = self.roundTrip(sender, receiver, package)
+        self.assertEqual([packetType(packet) for packet in packets], [ps.BLOCK_PACKET])
+        self.assertIsInstance(decoded.payload, BlockPayload)
+        self.assertEqual((decoded.source, decoded.payload.source, decoded.timestamp, decoded.channelType),
+                         ('FM-1_corr', 'FM-1_corr', 1.0, ChannelType.Data))
+        self.assertEqual(decoded.payload.toDict(), columns)
+        self.assertEqual(decoded.payload.rows(), package.payload.rows())
+        self.assertEqual([type(value) for value in decoded.payload.column('count')], [int] * 3)
+        sizes = []
+        numeric = BlockPayload('s', {'timestamp': np.arange(0, 100, dtype=float) + 1e9, 'v': np.arange(0, 100) / 3})
+        for block in [numeric, BlockPayload('s', {})]:
+            packets, decoded = self.roundTrip(sender, receiver, Package(source='s', timestamp=7.0, payload=block))
+            self.assertEqual((decoded.payload.toDict(), decoded.payload.nSamples), (block.toDict(), block.nSamples))
+            sizes.append(len(packets[0]))
+        # numeric columns are packed, rather than written as JSON.
+        self.assertLess(sizes[0], len(ps.serialize(numeric.toDict())))
+
+    def test_MissingMetadata(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        package = Package(source='s', payload={'a': 1.0})
+        sender.encode(package, 1)
+        self.assertRaises(ps.MissingMetadata, receiver.decode, sender.encode(package, 1)[0])
+        sender.reset()
+        packets, decoded = self.roundTrip(sender, receiver, package)
+        self.assertEqual(len(packets), 2)
+
+    def test_TooLarge(self):
+        sender, receiver = ps.BinaryCodec(), ps.BinaryCodec()
+        for payload in [{'text': 'x' * ps.MAX_PAYLOAD_SIZE}, {'values': list(range(0, 20000))}]:
+            self.assertRaises(ps.SerializeTypeError, sender.encode, Package(source='s', payload=payload), 1)
+        self.assertEqual(sender.sent, {})
+        packets, decoded = self.roundTrip(sender, receiver, Package(source='s', payload={'text': 'x'}))
+        self.assertEqual((len(packets), decoded.payload), (2, {'text': 'x'}))
+
+    def test_Header(self):
+        packets = ps.BinaryCodec().encode(Package(source='s', payload={'a': 1.0}), 1)
+        self.assertEqual([ph.getValue(packet, ph.PACKET_ID_KEY) for packet in packets], [1, 2])
+        for packet in packets:
+            self.assertEqual(ph.getValue(packet, ph.PAYLOAD_SIZE_KEY), len(packet) - ph.HEADER_SIZE)
+            self.assertEqual(ph.getValue(packet, ph.TOTAL_PKT_KEY), 1)
+
+
+class TestChecksum(unittest.TestCase):
+    def test_CRC(self):
+        packet = ps.makePacket(7, b'123456789')
+        self.assertTrue(ph.checkChecksum(packet))
+        self.assertNotEqual(ph.PacketAccess.getChecksum(packet), 0)
+        # every single bit flip, in the header or the payload, is caught.
+        for i in [i for i in range(0, len(packet)) if not ph.CHECKSUM_OFFSET <= i < ph.CHECKSUM_END]:
+            for bit in range(0, 8):
+                corrupt = bytearray(packet)
+                corrupt[i] ^= 1 << bit
+                self.assertFalse(ph.checkChecksum(corrupt))
+
+    def test_Setters(self):
+        packet = ph.PacketAccess.setPacketNum(bytearray(ps.makePacket(7, b'abc')), 2)
+        self.assertEqual(ph.PacketAccess.getPacketNum(packet), 2)
+        self.assertTrue(ph.checkChecksum(packet))
+
+
+class TestFragments(unittest.TestCase):
+    def makeSplit(self, packetID, size, maxBytes, seed=0):
+        packet = ps.makePacket(packetID, random.Random(seed).randbytes(size))
+        return packet, ps.splitPackets(packet, maxBytes)
+
+    def test_SplitReassemble(self):
+        rng = random.Random(3)
+        for size, maxBytes in [(0, 10), (10, 10), (11, 10), (1000, 7), (60000, 8192), (255 * 100, 100)]:
+            packet, fragments = self.makeSplit(size, size, maxBytes)
+            self.assertEqual(len(fragments), max(1, -(-size // maxBytes)))
+            for fragment in fragments:
+                self.assertTrue(ph.checkChecksum(fragment))
+                self.assertLessEqual(len(fragment) - ph.HEADER_SIZE, maxBytes)
+                self.assertEqual(ph.PacketAccess.getPayloadSize(fragment), len(fragment) - ph.HEADER_SIZE)
+            # out of order, with duplicates.
+            shuffled = fragments + rng.sample(fragments, len(fragments) // 2)
+            rng.shuffle(shuffled)
+            reassembler = ps.Reassembler()
+            whole = [p for p in [reassembler.add(fragment) for fragment in shuffled] if p is not None]
+            self.assertEqual(whole, [packet])
+            self.assertEqual(reassembler.bytesHeld, 0)
+            self.assertEqual(reassembler.duplicates, len(shuffled) - len(fragments) if len(fragments) > 1 else 0)
+        self.assertRaises(ps.SerializeTypeError, ps.splitPackets, ps.makePacket(1, bytes(256 * 100)), 100)
+
+    def test_Interleaved(self):
+        reassembler = ps.Reassembler()
+        splits = [self.makeSplit(i, 500, 64, seed=i) for i in range(1, 6)]
+        fragments = [f for fragmentNum in range(0, 8) for packet, split in splits for f in split[fragmentNum:fragmentNum + 1]]
+        whole = [p for p in [reassembler.add(fragment) for fragment in fragments] if p is not None]
+        self.assertEqual(whole, [packet for packet, split in splits])
+
+    def test_Corrupt(self):
+        reassembler = ps.Reassembler()
+        packet, fragments = self.makeSplit(1, 100, 30)
+        corrupt = bytearray(fragments[1])
+        corrupt[-1] ^= 1
+        self.assertEqual([reassembler.add(f) for f in [fragments[0], bytes(corrupt), *fragments[2:]]], [None] * 4)
+        self.assertEqual(reassembler.corrupt, 1)
+        self.assertEqual(reassembler.add(fragments[1]), packet)
+
+    def test_Limits(self):
+        reassembler = ps.Reassembler(timeout=5, maxBytes=250)
+        first, firstSplit = self.makeSplit(1, 100, 30)
+        second, secondSplit = self.makeSplit(2, 100, 30)
+        reassembler.add(firstSplit[0], now=0)
+        reassembler.add(secondSplit[0], now=4)
+        self.assertIsNone(reassembler.add(firstSplit[1], now=6)) # the first has timed out, and is started again.
+        self.assertEqual((reassembler.expired, len(reassembler.pending)), (1, 2))
+        for fragment in secondSplit[1:]:
+            whole = reassembler.add(fragment, now=7)
+        self.assertEqual(whole, second)
+        third, thirdSplit = self.makeSplit(3, 300, 30)
+        for fragment in thirdSplit[:-1]:
+            reassembler.add(fragment, now=7)
+        # holding more than maxBytes evicted the oldest incomplete packet.
+        self.assertEqual((reassembler.evicted, list(reassembler.pending)), (1, [3]))
+        self.assertEqual(reassembler.add(thirdSplit[-1], now=7), third)
+        self.assertEqual(reassembler.bytesHeld, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from Framework.Archive.DirectoryArchiver import DirectoryArchiver
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Destination import Destination
+from Framework.BaseClasses.Metadata import Metadata
+from Framework.BaseClasses.Readers.Reader import Reader
+from Framework.Pipes.ReadPipe import ReadPipe
+from Framework.Pipes.ReadScheduler import ReadScheduler, ScheduledJob
+from Utils import ClassUtils as cu
+
+METADATA = Metadata(timestamp='float', val1='int')
+
+
+class ListReader(Reader):
+    """Returns samplesPerRead samples per read, as a list if there is more than one."""
+    def __init__(self, name, samplesPerRead=1, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.samplesPerRead = samplesPerRead
+        self.count = 0
+
+    def getReaderMetadata(self, sourceName=None):
+        return METADATA
+
+    def read(self):
+        samples = []
+        for i in range(0, self.samplesPerRead):
+            samples.append({'timestamp': 1000.0 + self.count, 'val1': self.count})
+            self.count += 1
+        return samples if self.samplesPerRead > 1 else samples[0]
+
+
+class Collector(Destination):
+    def __init__(self, name):
+        super().__init__(name=name)
+        self.packages = []
+
+    def handlePackage(self, package):
+        self.packages.append(package)
+
+
+class TestReadPipe(unittest.TestCase):
+    def test_ListReadings(self):
+        dest = Collector('listCollector')
+        pipe = ReadPipe('listPipe', source=ListReader('listReader', samplesPerRead=10), destination=dest)
+        pipe.read()
+        pipe.read()
+        self.assertEqual(len(dest.packages), 2) # one package per read, not one per sample.
+        block = dest.packages[1].payload
+        self.assertTrue(cu.isBlock(block))
+        self.assertEqual(block.nSamples, 10)
+        self.assertEqual(block['val1'], list(range(10, 20)))
+        self.assertEqual(dest.packages[1].timestamp, 1010.0)
+
+    def test_BatchSize(self):
+        dest = Collector('batchCollector')
+        pipe = ReadPipe('batchPipe', source=ListReader('batchReader'), destination=dest, batchSize=4)
+        for i in range(0, 10):
+            pipe.read()
+        self.assertEqual([p.payload.nSamples for p in dest.packages], [4, 4])
+        pipe.flushBatch() # as when the pipe ends.
+        self.assertEqual([p.payload.nSamples for p in dest.packages], [4, 4, 2])
+        self.assertEqual([row['val1'] for p in dest.packages for row in p.payload.rows()], list(range(0, 10)))
+
+    def test_ArchiveBlocks(self):
+        with tempfile.TemporaryDirectory() as tdir:
+            for writeBehind in [True, False]:
+                da = DirectoryArchiver(name=f'blockArchiver{writeBehind}', baseDir=tdir, writeBehind=writeBehind)
+                readerName = f'blockReader{writeBehind}'
+                da.createChannel(readerName, ChannelType.Data, metadata=METADATA, timestamp=0.0)
+                pipe = ReadPipe(readerName + 'Pipe', source=ListReader(readerName, samplesPerRead=25), destination=da)
+                for i in range(0, 4):
+                    pipe.read()
+                reading = da.read(readerName)[0]
+                self.assertEqual([row['val1'] for row in reading], list(range(0, 100)))
+                da.end()
+
+
+class FakePool():
+    """Stands in for the scheduler's worker pool, recording the ticks it is given instead of running them."""
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, job, due):
+        self.submitted.append(due)
+
+
+def waitIdle(jobs, timeout=2):
+    """Wait for the reads of jobs to finish, after their scheduler has been stopped."""
+    start = time.monotonic()
+    while any(job.running for job in jobs) and time.monotonic() - start < timeout:
+        time.sleep(.005)
+
+
+class TestReadScheduler(unittest.TestCase):
+    def test_NoDrift(self):
+        """ However late the reads start, the ticks stay on start + n * interval, and no tick goes uncounted.
+
+        How late the reads are, and how many ticks are missed, depends on the load of the machine, so those are only
+        bounded loosely here. See test_FireSkipsPassedTicks for the exact skipping."""
+        scheduler = ReadScheduler('driftScheduler')
+        job = scheduler.schedule('slowRead', .02, lambda: time.sleep(.012))
+        time.sleep(.5)
+        scheduler.stop()
+        waitIdle([job])
+        stats = job.stats.toDict()
+        self.assertEqual(stats['fired'] + stats['missed'], job.tick)
+        self.assertGreaterEqual(job.tick, 20)
+        # sleeping for the interval after each read would have managed 16.
+        self.assertGreater(stats['fired'], 16 - stats['missed'])
+        self.assertLess(stats['meanLate'], .02)
+        scheduled = [s for s, a in stats['history']]
+        self.assertEqual(len(scheduled), stats['fired'])
+        for s in scheduled:
+            ticks = (s - scheduled[0]) / .02
+            self.assertAlmostEqual(ticks, round(ticks), places=4)
+
+    def test_FireSkipsPassedTicks(self):
+        """ _fire given the time, so the missed and skipped ticks are exact. """
+        scheduler = ReadScheduler('fireScheduler')
+        scheduler._pool = FakePool()
+        job = ScheduledJob('fireJob', .02, None, 100.0)
+        scheduler._fire(job, job.dueAt(0), 100.001)
+        self.assertEqual((job.tick, job.stats.missed, scheduler._pool.submitted), (1, 0, [100.0]))
+        # the read of tick 0 is still running at tick 1.
+        scheduler._fire(job, job.dueAt(1), 100.021)
+        self.assertEqual((job.tick, job.stats.missed, len(scheduler._pool.submitted)), (2, 1, 1))
+        # the scheduler gets to tick 2 after ticks 3 to 5 have passed.
+        job.running = False
+        scheduler._fire(job, job.dueAt(2), 100.105)
+        self.assertEqual((job.tick, job.stats.missed), (6, 4))
+        self.assertAlmostEqual(scheduler._pool.submitted[-1], 100.04)
+        self.assertGreater(job.dueAt(job.tick), 100.105)
+
+    def test_Overruns(self):
+        reports = []
+        scheduler = ReadScheduler('overrunScheduler', reporter=reports.append)
+        job = scheduler.schedule('overrunRead', .02, lambda: time.sleep(.05))
+        time.sleep(.3)
+        scheduler.stop()
+        stats = job.stats.toDict()
+        self.assertGreater(stats['overruns'], 0)
+        self.assertGreater(stats['missed'], 0)
+        # the reads never overlapped, and the ticks they covered were skipped.
+        self.assertLessEqual(stats['fired'], 7)
+        self.assertEqual(len(reports), 1) # reported at most once every REPORT_INTERVAL.
+        self.assertEqual(reports[0]['name'], 'overrunRead')
+
+    def test_SharedThread(self):
+        scheduler = ReadScheduler('sharedScheduler', maxWorkers=4)
+        counts = [0] * 50
+        def counter(i):
+            def count():
+                counts[i] += 1
+            return count
+        jobs = [scheduler.schedule(f'job{i}', .05, counter(i)) for i in range(0, 50)]
+        time.sleep(.3)
+        # one timer thread and the workers, counted by name so that threads of other tests do not matter.
+        threads = [t for t in threading.enumerate() if t.name.startswith('sharedScheduler')]
+        self.assertLessEqual(len(threads), 5)
+        scheduler.cancel(jobs[0])
+        waitIdle(jobs[:1]) # a read that had already been started is left to finish.
+        cancelledAt = counts[0]
+        time.sleep(.2)
+        scheduler.stop()
+        waitIdle(jobs)
+        self.assertEqual(counts[0], cancelledAt)
+        for count, job in zip(counts, jobs):
+            self.assertEqual(count, job.stats.fired)
+            self.assertEqual(job.stats.fired + job.stats.missed, job.tick)
+        self.assertTrue(all(job.tick >= 8 for job in jobs[1:]))
+        self.assertTrue(all(count >= 1 for count in counts[1:]))
+
+    def test_ReadPipeSchedule(self):
+        scheduler = ReadScheduler('pipeScheduler')
+        dest = Collector('scheduledCollector')
+        pipe = ReadPipe('scheduledPipe', source=ListReader('scheduledReader'), destination=dest, freq=.01,
+                        batchSize=3, scheduler=scheduler)
+        pipe.start()
+        time.sleep(.3)
+        stats = pipe.getScheduleStats()
+        pipe.end()
+        pipe.join(5)
+        self.assertFalse(pipe.is_alive())
+        self.assertGreaterEqual(stats['fired'], 20)
+        samples = [row['val1'] for p in dest.packages for row in p.payload.rows()]
+        self.assertEqual(samples, list(range(0, len(samples)))) # including the last, partial batch.
+        self.assertEqual(scheduler.getStats(), {})
+        scheduler.stop()
@@ -0,0 +1,86 @@
+import time
+import unittest
+
+from Framework.BaseClasses.Channels import ChannelType
+from Framework.BaseClasses.Events import EventTypes, EventPayload
+from Framework.BaseClasses.Package import Package
+from Framework.Manager.DataManager import DataManager
+from Framework.Manager.EventManager import EventManager
+from Framework.Manager.Routing import RoutingTable
+
+
+class Recipient():
+    def __init__(self, name, delay=0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.received = []
+
+    def getName(self):
+        return self.name
+
+    def accept(self, package):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ValueError('failed to accept')
+        self.received.append(package)
+
+
+def dataPackage(source):
+    return Package(source=source, payload={'timestamp': time.time()}, channelType=ChannelType.Data)
+
+
+def eventPackage(source, eventType):
+    return Package(source=source, payload=EventPayload(source=source, eventType=eventType), channelType=ChannelType.Event)
+
+
+class TestRouting(unittest.TestCase):
+    def test_RoutingTable(self):
+        a, b, slow, bad = Recipient('a'), Recipient('b'), Recipient('slow', delay=.02), Recipient('bad', fail=True)
+        table = RoutingTable('test', slowDelivery=.01)
+        table.compile({'pub1': [('a', a), ('b', b), ('a', a)], 'all': [('slow', slow), ('bad', bad), ('b', b)]})
+        routed = table.route('pub1', 'all')
+        self.assertIsInstance(routed, tuple)
+        self.assertEqual([subName for subName, sub, stats in routed], ['a', 'b'])
+        self.assertEqual(table.route('unknown', 'all'), table.route('all'))
+        self.assertEqual(table.route('unknown'), ())
+        table.deliver(table.route('pub2', 'all'), dataPackage('pub2'))
+        self.assertEqual(len(b.received), 1) # the failing subscriber did not stop delivery to the next.
+        stats = table.getStats()
+        self.assertEqual(stats['slow']['slow'], 1)
+        self.assertGreaterEqual(stats['slow']['maxTime'], .02)
+        self.assertEqual((stats['bad']['failed'], stats['bad']['delivered'], stats['bad']['meanTime']), (1, 0, 0.0))
+        self.assertEqual((stats['b']['failed'], stats['b']['delivered']), (0, 1))
+        self.assertEqual(stats['a']['delivered'], 0)
+
+    def test_DataManagerRoutes(self):
+        dm = DataManager(None, name='routingDataManager')
+        one, everything = Recipient('one'), Recipient('everything')
+        before = dm.routing.route('pub1', 'SOME_KEY_FOR_ALL_PUBLISHERS')
+        dm.subscribe(one, publisherName='pub1')
+        dm.subscribe(everything)
+        dm.subscribe(one, 'oneEverything') # the same object subscribed twice receives each package once.
+        self.assertEqual(before, ()) # routes already handed out are not changed by subscribe.
+        for source in ['pub1', 'pub2', 'pub1']:
+            dm.handlePackage(dataPackage(source))
+        self.assertEqual([p.source for p in one.received], ['pub1', 'pub2', 'pub1'])
+        self.assertEqual(len(everything.received), 3)
+        stats = dm.getDeliveryStats()
+        self.assertEqual(stats['one']['delivered'], 2)
+        self.assertEqual(stats['oneEverything']['delivered'], 1)
+        self.assertEqual(stats['everything']['delivered'], 3)
+
+    def test_EventManagerRoutes(self):
+        em = EventManager(None, name='routingEventManager')
+        connects, fromPub1, everything = Recipient('connects'), Recipient('fromPub1'), Recipient('everything')
+        em.subscribe(connects, events=[EventTypes.Connected])
+        em.subscribe(fromPub1, publisher='pub1')
+        em.subscribe(everything)
+        em.handlePackage(eventPackage('pub1', EventTypes.Connected))
+        em.handlePackage(eventPackage('pub2', EventTypes.Connected))
+        em.handlePackage(eventPackage('pub2', EventTypes.Disconnected))
+        self.assertEqual(len(connects.received), 2)
+        self.assertEqual(len(fromPub1.received), 1)
+        self.assertEqual(len(everything.received), 3)
+        self.assertEqual(em.getDeliveryStats()['everything']['delivered'], 3)
@@ -0,0 +1,126 @@
+import json
+import queue
+import random
+import socket
+import threading
+import unittest
+
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy.TCP.StreamFramer import FrameError, LENGTH, NEWLINE, RECV_SIZE, StreamFramer
+from Framework.Proxy.TCP.TCPConnection import TCPConnection
+
+
+def randomFrames(rng, framing, n, maxSize):
+    frames = []
+    for i in range(0, n):
+        size = rng.choice([0, 1, rng.randint(0, 64), rng.randint(0, maxSize)])
+        frame = rng.randbytes(size)
+        if framing == NEWLINE:
+            frame = frame.replace(b'\n', b' ')
+        frames.append(frame)
+    return frames
+
+
+def sendInChunks(rng, sock, stream):
+    """Write stream to sock cut at random points, as a busy link would deliver it."""
+    i = 0
+    while i < len(stream):
+        n = rng.choice([1, 2, 7, rng.randint(1, 3 * RECV_SIZE)])
+        sock.sendall(stream[i:i + n])
+        i += n
+    sock.shutdown(socket.SHUT_WR)
+
+
+def receiveAll(framer, sock):
+    frames = []
+    while True:
+        received = framer.recvFrom(sock)
+        if received is None:
+            return frames
+        frames.extend(received)
+
+
+class TestStreamFramer(unittest.TestCase):
+    def fuzz(self, framing, seed):
+        rng = random.Random(seed)
+        maxFrame = 3 * RECV_SIZE
+        frames = randomFrames(rng, framing, 300, maxFrame)
+        framer = StreamFramer(framing, maxFrame=maxFrame)
+        stream = b''.join(framer.frame(frame) for frame in frames)
+        a, b = socket.socketpair()
+        sender = threading.Thread(target=sendInChunks, args=(rng, a, stream))
+        sender.start()
+        received = receiveAll(framer, b)
+        sender.join()
+        a.close()
+        b.close()
+        self.assertEqual(received, frames)
+        self.assertEqual(framer.pending(), 0)
+        self.assertEqual(framer.framesReceived, len(frames))
+
+    def test_FuzzNewline(self):
+        for seed in range(0, 5):
+            self.fuzz(NEWLINE, seed)
+
+    def test_FuzzLength(self):
+        for seed in range(0, 5):
+            self.fuzz(LENGTH, seed)
+
+    def test_Feed(self):
+        framer = StreamFramer(NEWLINE)
+        self.assertEqual(framer.feed(b'{"a": 1}\n{"b"'), [b'{"a": 1}'])
+        self.assertEqual(framer.pending(), 4)
+        self.assertEqual(framer.feed(b': 2}\n\n{"c": 3}\n'), [b'{"b": 2}', b'', b'{"c": 3}'])
+        framer = StreamFramer(LENGTH)
+        stream = framer.frame(b'ab\ncd') + framer.frame(b'') + framer.frame(b'ef')
+        self.assertEqual([frame for i in range(0, len(stream)) for frame in framer.feed(stream[i:i+1])],
+                         [b'ab\ncd', b'', b'ef'])
+
+    def test_MaxFrame(self):
+        framer = StreamFramer(NEWLINE, maxFrame=10)
+        frames = framer.feed(b'short\n' + b'x' * 25)
+        frames += framer.feed(b'x' * 25 + b'\nafter\n' + b'y' * 11 + b'\nlast\n')
+        self.assertEqual(frames, [b'short', b'after', b'last'])
+        self.assertEqual(framer.framesDropped, 2)
+        framer = StreamFramer(LENGTH, maxFrame=10)
+        self.assertRaises(FrameError, framer.frame, b'x' * 11)
+        self.assertRaises(FrameError, framer.feed, StreamFramer(LENGTH).frame(b'x' * 11))
+
+
+class TestTCPConnectionRecv(unittest.TestCase):
+    def test_JSONLines(self):
+        rng = random.Random(1)
+        packets = [{'source': f'source{i}', 'timestamp': i * .5, 'values': list(range(0, rng.randint(0, 2000)))}
+                   for i in range(0, 200)]
+        a, b = socket.socketpair()
+        connection = TCPConnection('framerProxy', 'peer', b)
+        connection.recvThread.start()
+        stream = b''.join(json.dumps(packet).encode() + b'\n' for packet in packets)
+        sendInChunks(rng, a, stream)
+        received = [connection.getRecvQueue().get(timeout=2) for packet in packets]
+        connection.recvThread.join(2)
+        connection.terminate = True
+        a.close()
+        b.close()
+        self.assertEqual(received, packets)
+        self.assertFalse(connection.recvThread.is_alive())
+        self.assertRaises(queue.Empty, connection.getRecvQueue().get_nowait)
+
+    def test_SplitPackets(self):
+        a, b = socket.socketpair()
+        sender = TCPConnection('framerProxy', 'receiver', a, framing=LENGTH)
+        receiver = TCPConnection('framerProxy', 'sender', b, framing=LENGTH)
+        receiver.recvThread.start()
+        packets = [ps.makePacket(i, random.Random(i).randbytes(size)) for i, size in enumerate([10, 8192, 8193, 60000])]
+        self.assertTrue(sender._sendPackets(packets))
+        received = [receiver.getRecvQueue().get(timeout=2) for packet in packets]
+        receiver.terminate = True
+        a.close()
+        receiver.recvThread.join(2)
+        b.close()
+        self.assertEqual(received, packets)
+        self.assertEqual(receiver.framer.framesReceived, 1 + 1 + 2 + 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import select
+import socket
+import threading
+import time
+import unittest
+
+from Framework.Proxy import ProxySerializer as ps
+from Framework.Proxy.TCP.StreamFramer import LENGTH
+from Framework.Proxy.TCP.TCPConnection import TCPConnection
+
+
+def makePair(**kwargs):
+    """Return a sending and a receiving TCPConnection over a socket pair, with their threads started."""
+    a, b = socket.socketpair()
+    sender = TCPConnection('sendProxy', 'receiver', a, framing=LENGTH, **kwargs)
+    receiver = TCPConnection('sendProxy', 'sender', b, framing=LENGTH)
+    sender.start()
+    receiver.start()
+    return sender, receiver
+
+
+class StallingSocket():
+    """A socket that takes the first limit bytes sent, then times out."""
+    def __init__(self, socket, limit):
+        self.socket = socket
+        self.limit = limit
+
+    def send(self, data):
+        if self.limit <= 0:
+            raise socket.timeout('timed out')
+        sent = self.socket.send(data[:self.limit])
+        self.limit -= sent
+        return sent
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+def endPair(sender, receiver):
+    for connection in [sender, receiver]:
+        connection.end()
+    for connection in [sender, receiver]:
+        connection.sendThread.join(2)
+        connection.socket.close()
+        connection.recvThread.join(2)
+
+
+class TestTCPConnectionSend(unittest.TestCase):
+    def test_Batching(self):
+        sender, receiver = makePair()
+        nThreads, nPackets = 4, 500
+        packets = {t: [ps.makePacket(t * nPackets + i, f'{t}-{i}'.encode() * 10) for i in range(0, nPackets)]
+                   for t in range(0, nThreads)}
+        durations = []
+
+        def sendAll(t):
+            start = time.perf_counter()
+            results = [sender.send(packet) for packet in packets[t]]
+            durations.append(time.perf_counter() - start)
+            self.assertTrue(all(results))
+        threads = [threading.Thread(target=sendAll, args=(t,)) for t in range(0, nThreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        received = [receiver.getRecvQueue().get(timeout=2) for i in range(0, nThreads * nPackets)]
+        stats = sender.getStats()
+        endPair(sender, receiver)
+        # send queues without waiting for the packet to be written.
+        self.assertLess(max(durations), .5)
+        for t in range(0, nThreads):
+            self.assertEqual([packet for packet in received if packet in set(packets[t])], packets[t])
+        self.assertEqual((stats['packets'], stats['frames'], stats['failed'], stats['queued']),
+                         (nThreads * nPackets, nThreads * nPackets, 0, 0))
+        self.assertEqual(stats['bytes'], sum(len(packet) + 4 for t in packets for packet in packets[t]))
+        self.assertGreater(stats['framesPerSyscall'], 10)
+        self.assertGreater(stats['bytesPerSecond'], 0)
+
+    def test_Wait(self):
+        sender, receiver = makePair(batchDelay=.01)
+        start = time.perf_counter()
+        self.assertTrue(sender.send(ps.makePacket(1, b'x' * 20000), wait=True))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(receiver.getRecvQueue().get(timeout=1)), 20000 + 10)
+        stats = sender.getStats()
+        # split into 3 frames and written by one send, after waiting batchDelay for more.
+        self.assertEqual((stats['frames'], stats['syscalls']), (3, 1))
+        self.assertGreaterEqual(stats['maxQueueLatency'], .009)
+        self.assertLess(elapsed, .1)
+        self.assertEqual(sender._acks, {})
+        receiver.terminate = True
+        receiver.recvThread.join(2)
+        receiver.socket.close()
+        self.assertFalse(sender.send(ps.makePacket(2, b'y'), wait=True))
+        self.assertEqual(sender.getStats()['failed'], 1)
+        self.assertFalse(sender.send('not bytes'))
+        endPair(sender, receiver)
+
+    def test_PartialWriteEnds(self):
+        """A write that gives up part way through a batch ends the connection, rather than sending more after it."""
+        a, b = socket.socketpair()
+        sender = TCPConnection('sendProxy', 'receiver', StallingSocket(a, 1000), framing=LENGTH, maxNumRetries=1)
+        sender.start()
+        packet = ps.makePacket(1, bytes(5000))
+        self.assertFalse(sender.send(packet, wait=True))
+        self.assertTrue(sender.terminate)
+        self.assertFalse(sender.send(packet))
+        # the other end gets what was written, then sees the connection close.
+        b.settimeout(2)
+        received = b''
+        while data := b.recv(8192):
+            received += data
+        self.assertEqual(len(received), 1000)
+        sender.sendThread.join(2)
+        sender.recvThread.join(2)
+        self.assertFalse(sender.sendThread.is_alive())
+        a.close()
+        b.close()
+
+    def test_Reconnect(self):
+        """A connection with a destAddress (see connect) writes a failed batch again over a new socket, from the start."""
+        listenSocket = socket.create_server(('127.0.0.1', 0))
+        address = listenSocket.getsockname()
+        sender = TCPConnection('sendProxy', 'receiver', socket.create_connection(address), framing=LENGTH, batchDelay=0)
+        sender.destAddress = address
+        sender.start()
+        first, addr = listenSocket.accept()
+        first.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b'\x01\x00\x00\x00\x00\x00\x00\x00')
+        first.close()  # resets the connection.
+        packets = [ps.makePacket(i, bytes(range(0, 256)) * 40) for i in range(0, 20)]
+        for i, packet in enumerate(packets):
+            self.assertTrue(sender.send(packet, wait=True))
+            if select.select([listenSocket], [], [], .05)[0]:
+                break
+        second, addr = listenSocket.accept()
+        receiver = TCPConnection('receiveProxy', 'sender', second, framing=LENGTH)
+        receiver.start()
+        # the batch that failed arrives whole, in frame, on the new socket.
+        self.assertEqual(receiver.getRecvQueue().get(timeout=2), packets[i])
+        packet = ps.makePacket(100, b'after')
+        self.assertTrue(sender.send(packet, wait=True))
+        self.assertEqual(receiver.getRecvQueue().get(timeout=2), packet)
+        endPair(sender, receiver)
+        listenSocket.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
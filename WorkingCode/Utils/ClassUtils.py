@@ -123,6 +123,11 @@ def isPayload(obj):
     return isClass(obj, pkg.Payload)
 
 
+def isBlock(obj):
+    import Framework.BaseClasses.Package as pkg
+    return isClass(obj, pkg.BlockPayload)
+
+
 def isEvent(obj):
     import Framework.BaseClasses.Events as ev
     return isClass(obj, ev.EventPayload)
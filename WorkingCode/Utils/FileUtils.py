@@ -40,6 +40,23 @@ def getSize(dir):
         size = os.path.getsize(dir)
     return size
 
+def atomicWrite(path, text, newline=None, fsync=False):
+    """ Replace the contents of path with text. The text is written to a temporary file next to path which is then
+    renamed over it, so a reader (or a crash) never sees a partially written file.
+    """
+    tmpPath = path + '.tmp'
+    try:
+        with open(tmpPath, 'w', newline=newline) as tmpFile:
+            tmpFile.write(text)
+            if fsync:
+                tmpFile.flush()
+                os.fsync(tmpFile.fileno())
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
 def getNextTag(currentTag=''):
     """
     returns the next iteration of a unique tag intended to append to a directory name to make it unique.